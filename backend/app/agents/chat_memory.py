@@ -1,30 +1,358 @@
-from collections import defaultdict
-from typing import List, Dict, Tuple
+"""
+Per-conversation chat memory keyed by (business_id, customer_id).
+
+Each conversation is a ring buffer of at most CHAT_MEMORY_MAX_MESSAGES
+entries. Conversations idle for longer than CHAT_MEMORY_IDLE_TTL_SECONDS are
+evicted, and at most CHAT_MEMORY_MAX_CONVERSATIONS are kept (least recently
+used first out).
+
+CHAT_MEMORY_BACKEND selects where conversations live:
+- "memory" (default): this process only.
+- "redis": a list per conversation in REDIS_URL, shared by every worker.
+  Idle TTL is a key expiry; the global cap is left to Redis' maxmemory
+  policy. REDIS_URL=fakeredis:// uses fakeredis for local runs.
+- "sqlite": a table in CHAT_MEMORY_SQLITE_PATH, shared by workers on one host.
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
 from datetime import datetime
 
+from dotenv import load_dotenv
+from app.utils.metrics import metrics
+
+try:
+    import redis
+except ImportError:  # only needed for the redis backend
+    redis = None
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+CHAT_MEMORY_BACKEND = os.getenv("CHAT_MEMORY_BACKEND", "memory").lower()
+CHAT_MEMORY_MAX_MESSAGES = int(os.getenv("CHAT_MEMORY_MAX_MESSAGES", "20"))
+CHAT_MEMORY_IDLE_TTL_SECONDS = int(os.getenv("CHAT_MEMORY_IDLE_TTL_SECONDS", "86400"))
+CHAT_MEMORY_MAX_CONVERSATIONS = int(os.getenv("CHAT_MEMORY_MAX_CONVERSATIONS", "100000"))
+CHAT_MEMORY_SQLITE_PATH = os.getenv("CHAT_MEMORY_SQLITE_PATH", "data/chat_memory.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Idle conversations are swept every this many writes
+SWEEP_EVERY = 1000
+
+Key = Tuple[str, str]
+
+
+def _entry_size(entry: Dict) -> int:
+    return sys.getsizeof(entry) + sum(sys.getsizeof(v) for v in entry.values())
+
+
+class InMemoryBackend:
+    """OrderedDict of deques: LRU order doubles as idle order"""
+
+    name = "memory"
+
+    def __init__(self, max_messages: int, idle_ttl: int, max_conversations: int):
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self.max_conversations = max_conversations
+        self._lock = threading.Lock()
+        # key -> (ring buffer, last_seen)
+        self._conversations: "OrderedDict[Key, Tuple[Deque[Dict], float]]" = OrderedDict()
+        self._bytes = 0
+
+    def append(self, key: Key, entry: Dict):
+        now = time.time()
+        with self._lock:
+            buffer = self._live(key, now)
+            if buffer is None:
+                buffer = deque(maxlen=self.max_messages)
+            elif len(buffer) == buffer.maxlen:
+                self._bytes -= _entry_size(buffer[0])
+            buffer.append(entry)
+            self._bytes += _entry_size(entry)
+            self._conversations[key] = (buffer, now)
+            self._conversations.move_to_end(key)
+
+            while len(self._conversations) > self.max_conversations:
+                oldest = next(iter(self._conversations))
+                self._drop(oldest)
+                metrics.incr("chat_memory.evicted.lru")
+
+    def recent(self, key: Key, limit: int) -> List[Dict]:
+        with self._lock:
+            buffer = self._live(key, time.time())
+            if buffer is None:
+                return []
+            return list(buffer)[-limit:]
+
+    def clear(self, key: Key):
+        with self._lock:
+            self._drop(key)
+
+    def sweep(self):
+        """Evict every conversation idle for longer than the TTL"""
+        cutoff = time.time() - self.idle_ttl
+        with self._lock:
+            while self._conversations:
+                key, (_, last_seen) = next(iter(self._conversations.items()))
+                if last_seen >= cutoff:
+                    break
+                self._drop(key)
+                metrics.incr("chat_memory.evicted.idle")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "conversations": len(self._conversations),
+                "messages": sum(len(buffer) for buffer, _ in self._conversations.values()),
+                "bytes": self._bytes,
+            }
+
+    def _live(self, key: Key, now: float) -> Optional[Deque[Dict]]:
+        item = self._conversations.get(key)
+        if item is None:
+            return None
+        buffer, last_seen = item
+        if now - last_seen > self.idle_ttl:
+            self._drop(key)
+            metrics.incr("chat_memory.evicted.idle")
+            return None
+        return buffer
+
+    def _drop(self, key: Key):
+        item = self._conversations.pop(key, None)
+        if item is not None:
+            self._bytes -= sum(_entry_size(entry) for entry in item[0])
+
+
+class RedisBackend:
+    """One capped Redis list per conversation, expiring after the idle TTL"""
+
+    name = "redis"
+
+    def __init__(self, client, max_messages: int, idle_ttl: int, prefix: str = "waffy:chat:"):
+        self.client = client
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self.prefix = prefix
+
+    def _key(self, key: Key) -> str:
+        return f"{self.prefix}{key[0]}:{key[1]}"
+
+    def append(self, key: Key, entry: Dict):
+        name = self._key(key)
+        pipe = self.client.pipeline()
+        pipe.rpush(name, json.dumps(entry))
+        pipe.ltrim(name, -self.max_messages, -1)
+        pipe.expire(name, self.idle_ttl)
+        pipe.execute()
+
+    def recent(self, key: Key, limit: int) -> List[Dict]:
+        name = self._key(key)
+        pipe = self.client.pipeline()
+        pipe.lrange(name, -limit, -1)
+        pipe.expire(name, self.idle_ttl)
+        raw, _ = pipe.execute()
+        return [json.loads(item) for item in raw]
+
+    def clear(self, key: Key):
+        self.client.delete(self._key(key))
+
+    def sweep(self):
+        # Redis expires idle conversations on its own
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        # Counting keys would mean a SCAN over the whole keyspace; report server memory only
+        try:
+            used = int(self.client.info("memory").get("used_memory", 0))
+        except Exception:
+            used = 0
+        return {"bytes": used}
+
+
+class SQLiteBackend:
+    """Rows in a local SQLite file; WAL mode lets several workers share it"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_messages: int, idle_ttl: int, max_conversations: int):
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self.max_conversations = max_conversations
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                business_id TEXT NOT NULL,
+                customer_id TEXT NOT NULL,
+                entry TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_chat_messages_conversation ON chat_messages (business_id, customer_id, id);
+            CREATE TABLE IF NOT EXISTS chat_conversations (
+                business_id TEXT NOT NULL,
+                customer_id TEXT NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (business_id, customer_id)
+            );
+            CREATE INDEX IF NOT EXISTS ix_chat_conversations_last_seen ON chat_conversations (last_seen);
+        """)
+        self._conn.commit()
+
+    def append(self, key: Key, entry: Dict):
+        now = time.time()
+        with self._lock, self._conn:
+            if self._expired(key, now):
+                self._delete(key)
+                metrics.incr("chat_memory.evicted.idle")
+            self._conn.execute(
+                "INSERT INTO chat_messages (business_id, customer_id, entry) VALUES (?, ?, ?)",
+                (key[0], key[1], json.dumps(entry)),
+            )
+            self._conn.execute(
+                """DELETE FROM chat_messages WHERE business_id = ? AND customer_id = ? AND id NOT IN (
+                       SELECT id FROM chat_messages WHERE business_id = ? AND customer_id = ?
+                       ORDER BY id DESC LIMIT ?)""",
+                (key[0], key[1], key[0], key[1], self.max_messages),
+            )
+            self._conn.execute(
+                """INSERT INTO chat_conversations (business_id, customer_id, last_seen) VALUES (?, ?, ?)
+                   ON CONFLICT (business_id, customer_id) DO UPDATE SET last_seen = excluded.last_seen""",
+                (key[0], key[1], now),
+            )
+
+    def recent(self, key: Key, limit: int) -> List[Dict]:
+        now = time.time()
+        with self._lock, self._conn:
+            if self._expired(key, now):
+                self._delete(key)
+                metrics.incr("chat_memory.evicted.idle")
+                return []
+            rows = self._conn.execute(
+                """SELECT entry FROM chat_messages WHERE business_id = ? AND customer_id = ?
+                   ORDER BY id DESC LIMIT ?""",
+                (key[0], key[1], limit),
+            ).fetchall()
+            self._conn.execute(
+                "UPDATE chat_conversations SET last_seen = ? WHERE business_id = ? AND customer_id = ?",
+                (now, key[0], key[1]),
+            )
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def clear(self, key: Key):
+        with self._lock, self._conn:
+            self._delete(key)
+
+    def sweep(self):
+        """Evict idle conversations, then the least recently used beyond the cap"""
+        cutoff = time.time() - self.idle_ttl
+        with self._lock, self._conn:
+            idle = self._conn.execute(
+                "SELECT business_id, customer_id FROM chat_conversations WHERE last_seen < ?", (cutoff,)
+            ).fetchall()
+            overflow = self._conn.execute(
+                """SELECT business_id, customer_id FROM chat_conversations WHERE last_seen >= ?
+                   ORDER BY last_seen DESC LIMIT -1 OFFSET ?""",
+                (cutoff, self.max_conversations),
+            ).fetchall()
+            for key in idle + overflow:
+                self._delete(tuple(key))
+            if idle:
+                metrics.incr("chat_memory.evicted.idle", len(idle))
+            if overflow:
+                metrics.incr("chat_memory.evicted.lru", len(overflow))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            conversations = self._conn.execute("SELECT COUNT(*) FROM chat_conversations").fetchone()[0]
+            messages, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(entry)), 0) FROM chat_messages").fetchone()
+        return {"conversations": conversations, "messages": messages, "bytes": size}
+
+    def _expired(self, key: Key, now: float) -> bool:
+        row = self._conn.execute(
+            "SELECT last_seen FROM chat_conversations WHERE business_id = ? AND customer_id = ?", key
+        ).fetchone()
+        return row is not None and now - row[0] > self.idle_ttl
+
+    def _delete(self, key: Key):
+        self._conn.execute("DELETE FROM chat_messages WHERE business_id = ? AND customer_id = ?", key)
+        self._conn.execute("DELETE FROM chat_conversations WHERE business_id = ? AND customer_id = ?", key)
+
+
+def _redis_client(url: str):
+    if url.startswith("fakeredis://"):
+        import fakeredis
+        return fakeredis.FakeRedis()
+    if redis is None:
+        raise RuntimeError("redis package is not installed")
+    client = redis.Redis.from_url(url)
+    client.ping()
+    return client
+
+
+def create_backend(name: str = CHAT_MEMORY_BACKEND):
+    """Build the configured backend; falls back to in-process memory if it cannot be reached"""
+    try:
+        if name == "redis":
+            return RedisBackend(_redis_client(REDIS_URL), CHAT_MEMORY_MAX_MESSAGES, CHAT_MEMORY_IDLE_TTL_SECONDS)
+        if name == "sqlite":
+            return SQLiteBackend(CHAT_MEMORY_SQLITE_PATH, CHAT_MEMORY_MAX_MESSAGES,
+                                 CHAT_MEMORY_IDLE_TTL_SECONDS, CHAT_MEMORY_MAX_CONVERSATIONS)
+    except Exception as e:
+        logger.error(f"Chat memory backend '{name}' unavailable, using in-process memory: {e}")
+    return InMemoryBackend(CHAT_MEMORY_MAX_MESSAGES, CHAT_MEMORY_IDLE_TTL_SECONDS, CHAT_MEMORY_MAX_CONVERSATIONS)
+
+
 class ChatMemoryManager:
-    def __init__(self):
-        self.memory: Dict[Tuple[str, str], List[Dict]] = defaultdict(list)
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else create_backend()
+        self._writes = 0
 
     def add_message(self, business_id: str, customer_id: str, sender_type: str, message: str):
-        key = (business_id, customer_id)
-        self.memory[key].append({
+        key = (str(business_id), str(customer_id))
+        self.backend.append(key, {
             "sender_type": sender_type,
             "message": message,
             "timestamp": datetime.utcnow().isoformat()
         })
+        self._writes += 1
+        if self._writes % SWEEP_EVERY == 0:
+            self.sweep()
 
     def get_recent_messages(self, business_id: str, customer_id: str, limit: int = 10) -> List[Dict]:
-        key = (business_id, customer_id)
-        return self.memory[key][-limit:]
+        messages = self.backend.recent((str(business_id), str(customer_id)), limit)
+        metrics.incr("chat_memory.hit" if messages else "chat_memory.miss")
+        return messages
 
     def get_customer_messages(self, business_id: str, customer_id: str, limit: int = 10) -> List[str]:
-        key = (business_id, customer_id)
-        return [msg["message"] for msg in self.memory[key][-limit:] if msg["sender_type"] == "customer"]
+        return [msg["message"] for msg in self.get_recent_messages(business_id, customer_id, limit)
+                if msg["sender_type"] == "customer"]
 
     def clear_conversation(self, business_id: str, customer_id: str):
-        key = (business_id, customer_id)
-        self.memory[key] = []
+        self.backend.clear((str(business_id), str(customer_id)))
+
+    def sweep(self):
+        self.backend.sweep()
+        self.report()
+
+    def report(self) -> Dict[str, int]:
+        """Publish footprint gauges and return them"""
+        stats = self.backend.stats()
+        for name, value in stats.items():
+            metrics.set_gauge(f"chat_memory.{name}", value)
+        return stats
 
 # instantiate
 chat_memory = ChatMemoryManager()
@@ -0,0 +1,374 @@
+# app/agents/crm_sync.py
+
+"""
+Transactional outbox and background worker for CRM (HubSpot) sync.
+
+LoggerAgent no longer calls HubSpot while a message is being answered. It
+adds a crm_outbox row to the same transaction as the interaction and the
+order/issue/enquiry rows, and a CrmSyncWorker drains the outbox off the
+reply path:
+- rows are claimed in batches (FOR UPDATE SKIP LOCKED on Postgres, so several
+  app processes can run workers side by side)
+- each row carries an idempotency key (tenant + WhatsApp message id) that is
+  unique in the table, so a redelivered webhook never syncs twice
+- a batch is grouped by tenant; each group runs on one borrowed LoggerAgent,
+  oldest first; an event is not claimed while an earlier one for the same
+  customer is in flight or backing off, and a failure puts that customer's
+  later rows in the batch back, so each customer's events sync in order
+- any failed HubSpot step raises; the steps that did succeed are saved on the
+  row (completed_steps) and skipped on the retry, so a retried event does not
+  create a second ticket or order
+- failures are retried with exponential backoff and jitter; after
+  CRM_SYNC_MAX_ATTEMPTS the row is dead-lettered (status 'dead') and can be
+  requeued with `python -m app.agents.crm_sync --requeue-dead`
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import argparse
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import SessionLocal
+from app.models import CrmOutbox
+from app.state import MessageState
+from app.utils.metrics import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+CRM_SYNC_WORKER_ENABLED = os.getenv("CRM_SYNC_WORKER_ENABLED", "true").lower() == "true"
+CRM_SYNC_BATCH_SIZE = int(os.getenv("CRM_SYNC_BATCH_SIZE", "50"))
+CRM_SYNC_CONCURRENCY = int(os.getenv("CRM_SYNC_CONCURRENCY", "4"))
+CRM_SYNC_POLL_SECONDS = float(os.getenv("CRM_SYNC_POLL_SECONDS", "2"))
+CRM_SYNC_MAX_ATTEMPTS = int(os.getenv("CRM_SYNC_MAX_ATTEMPTS", "6"))
+CRM_SYNC_BACKOFF_BASE = float(os.getenv("CRM_SYNC_BACKOFF_BASE", "10"))
+CRM_SYNC_BACKOFF_MAX = float(os.getenv("CRM_SYNC_BACKOFF_MAX", "3600"))
+CRM_SYNC_LOCK_TIMEOUT = int(os.getenv("CRM_SYNC_LOCK_TIMEOUT", "600"))
+CRM_OUTBOX_RETENTION_DAYS = int(os.getenv("CRM_OUTBOX_RETENTION_DAYS", "7"))
+
+
+class CrmSyncError(Exception):
+    """A CRM sync step failed in a way that is worth retrying"""
+
+
+def idempotency_key(user_id: int, message_state, crm_type: str = "hubspot") -> str:
+    message_id = getattr(message_state, "message_id", None)
+    if not message_id:
+        # No WhatsApp id (e.g. a test message): fall back to a content hash
+        digest = hashlib.sha1(
+            f"{message_state.customer_id}|{message_state.timestamp}|{message_state.message}".encode()
+        ).hexdigest()
+        message_id = f"sha1:{digest}"
+    return f"{crm_type}:{user_id}:{message_id}"[:150]
+
+
+def _payload(message_state) -> str:
+    data = message_state.dict() if hasattr(message_state, "dict") else dict(message_state)
+    return json.dumps(data, default=str)
+
+
+def enqueue(db, user_id: int, message_state, crm_type: str = "hubspot") -> str:
+    """
+    Add a sync event to the caller's transaction and return its key.
+
+    Uses INSERT .. ON CONFLICT DO NOTHING on the idempotency key, so enqueuing
+    a message twice is harmless and never fails the caller's transaction.
+    """
+    key = idempotency_key(user_id, message_state, crm_type)
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    db.execute(insert(CrmOutbox).values(
+        user_id=user_id, idempotency_key=key, crm_type=crm_type, customer_id=message_state.customer_id,
+        payload=_payload(message_state), status="pending", attempts=0, next_attempt_at=datetime.utcnow(),
+        created_at=datetime.utcnow(),
+    ).on_conflict_do_nothing(index_elements=["idempotency_key"]))
+    return key
+
+
+def ensure_enqueued(db, user_id: int, message_state, crm_type: str = "hubspot", committed: bool = False) -> str:
+    """
+    Make sure the outbox row is committed and wake the worker.
+
+    committed=True means the caller's transaction (which enqueued the row) has
+    committed, so there is nothing to check; otherwise the pending row is
+    committed, and re-added on its own if that transaction was rolled back.
+    """
+    key = idempotency_key(user_id, message_state, crm_type)
+    if not committed:
+        db.commit()
+        if db.query(CrmOutbox.id).filter(CrmOutbox.idempotency_key == key).first() is None:
+            enqueue(db, user_id, message_state, crm_type)
+            db.commit()
+    metrics.incr("crm_sync.enqueued")
+    crm_sync_worker.notify()
+    return key
+
+
+def backoff_seconds(attempts: int) -> float:
+    ceiling = min(CRM_SYNC_BACKOFF_MAX, CRM_SYNC_BACKOFF_BASE * (2 ** max(attempts - 1, 0)))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+class CrmOutboxStore:
+    """Claim/complete/fail operations on the crm_outbox table"""
+
+    def __init__(self, session_factory=SessionLocal, max_attempts: int = CRM_SYNC_MAX_ATTEMPTS):
+        self.session_factory = session_factory
+        self.max_attempts = max_attempts
+
+    def claim(self, limit: int = CRM_SYNC_BATCH_SIZE) -> List[Dict]:
+        """Mark up to `limit` due rows as processing and return them oldest first"""
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            # An event waits while an earlier one for the same customer is in flight or backing off
+            earlier = aliased(CrmOutbox)
+            blocked = (
+                db.query(earlier.id)
+                .filter(
+                    earlier.user_id == CrmOutbox.user_id,
+                    earlier.customer_id == CrmOutbox.customer_id,
+                    earlier.id < CrmOutbox.id,
+                    or_(earlier.status == "processing",
+                        and_(earlier.status == "pending", earlier.next_attempt_at > now)),
+                )
+                .exists()
+            )
+            query = (
+                db.query(CrmOutbox)
+                .filter(CrmOutbox.status == "pending", CrmOutbox.next_attempt_at <= now, ~blocked)
+                .order_by(CrmOutbox.id)
+                .limit(limit)
+            )
+            if db.get_bind().dialect.name == "postgresql":
+                query = query.with_for_update(skip_locked=True)
+            rows = query.all()
+            claimed = []
+            for row in rows:
+                row.status = "processing"
+                row.locked_at = now
+                row.attempts += 1
+                claimed.append({
+                    "id": row.id, "user_id": row.user_id, "customer_id": row.customer_id,
+                    "payload": row.payload, "attempts": row.attempts, "created_at": row.created_at,
+                    "completed_steps": json.loads(row.completed_steps) if row.completed_steps else {},
+                })
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _update(self, outbox_id: int, **values):
+        db = self.session_factory()
+        try:
+            db.query(CrmOutbox).filter(CrmOutbox.id == outbox_id).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def complete(self, outbox_id: int):
+        self._update(outbox_id, status="done", processed_at=datetime.utcnow(), locked_at=None, last_error=None)
+
+    def fail(self, outbox_id: int, attempts: int, error: str, completed_steps: Optional[Dict] = None) -> bool:
+        """
+        Schedule a retry, or dead-letter after max_attempts. Returns True if it
+        will be retried. completed_steps is kept for the retry (or a requeue).
+        """
+        steps = json.dumps(completed_steps, default=str) if completed_steps else None
+        if attempts >= self.max_attempts:
+            self._update(outbox_id, status="dead", locked_at=None, last_error=error[:1000], completed_steps=steps)
+            return False
+        self._update(outbox_id, status="pending", locked_at=None, last_error=error[:1000], completed_steps=steps,
+                     next_attempt_at=datetime.utcnow() + timedelta(seconds=backoff_seconds(attempts)))
+        return True
+
+    def release(self, outbox_id: int, attempts: int):
+        """Put a claimed row back untouched (it was not attempted)"""
+        self._update(outbox_id, status="pending", locked_at=None, attempts=attempts - 1)
+
+    def recover_stale(self, older_than_seconds: int = CRM_SYNC_LOCK_TIMEOUT) -> int:
+        """Return rows left in 'processing' by a crashed worker to the queue"""
+        db = self.session_factory()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+            count = db.query(CrmOutbox).filter(
+                CrmOutbox.status == "processing", CrmOutbox.locked_at < cutoff
+            ).update({"status": "pending", "locked_at": None}, synchronize_session=False)
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    def prune(self, retention_days: int = CRM_OUTBOX_RETENTION_DAYS) -> int:
+        """Delete synced rows past the retention window (their keys stop deduplicating then)"""
+        db = self.session_factory()
+        try:
+            cutoff = datetime.utcnow() - timedelta(days=retention_days)
+            count = db.query(CrmOutbox).filter(
+                CrmOutbox.status == "done", CrmOutbox.processed_at < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    def requeue_dead(self, user_id: Optional[int] = None) -> int:
+        db = self.session_factory()
+        try:
+            query = db.query(CrmOutbox).filter(CrmOutbox.status == "dead")
+            if user_id is not None:
+                query = query.filter(CrmOutbox.user_id == user_id)
+            count = query.update({"status": "pending", "attempts": 0, "next_attempt_at": datetime.utcnow()},
+                                 synchronize_session=False)
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    def counts(self) -> Dict[str, int]:
+        db = self.session_factory()
+        try:
+            return dict(db.query(CrmOutbox.status, func.count(CrmOutbox.id)).group_by(CrmOutbox.status).all())
+        finally:
+            db.close()
+
+
+class CrmSyncWorker:
+    """Background task that drains the CRM outbox in batches"""
+
+    def __init__(self, store: CrmOutboxStore, batch_size: int = CRM_SYNC_BATCH_SIZE,
+                 concurrency: int = CRM_SYNC_CONCURRENCY, poll_seconds: float = CRM_SYNC_POLL_SECONDS):
+        self.store = store
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running = False
+
+    async def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        recovered = await asyncio.to_thread(self.store.recover_stale)
+        if recovered:
+            logger.info(f"Requeued {recovered} CRM sync events left in processing state")
+        self._task = asyncio.create_task(self._run())
+        logger.info("Started CRM sync worker")
+
+    async def stop(self):
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def notify(self):
+        """Wake the worker after an enqueue; safe to call from any thread"""
+        if self._loop is not None and self._wakeup is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        last_prune = 0.0
+        while self._running:
+            self._wakeup.clear()
+            try:
+                processed = await self.run_once()
+                if time.time() - last_prune > 3600:
+                    await asyncio.to_thread(self.store.prune)
+                    last_prune = time.time()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"CRM sync worker error: {e}")
+                processed = 0
+            if processed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run_once(self) -> int:
+        """Claim and process one batch; returns the number of rows claimed"""
+        rows = await asyncio.to_thread(self.store.claim, self.batch_size)
+        if not rows:
+            return 0
+        groups: Dict[int, List[Dict]] = OrderedDict()
+        for row in rows:
+            groups.setdefault(row["user_id"], []).append(row)
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def run_group(group):
+            async with limit:
+                await asyncio.to_thread(self._sync_tenant, group)
+
+        await asyncio.gather(*(run_group(group) for group in groups.values()))
+        return len(rows)
+
+    def _sync_tenant(self, rows: List[Dict]):
+        # Imported here: logger_agent imports this module to enqueue
+        from app.agents.logger_agent import logger_agents
+
+        failed_customers = set()
+        with logger_agents.borrow(rows[0]["user_id"]) as agent:
+            for row in rows:
+                if row["customer_id"] in failed_customers:
+                    # Keep this customer's events in order behind the failed one
+                    self.store.release(row["id"], row["attempts"])
+                    continue
+                started = time.perf_counter()
+                completed = row["completed_steps"]
+                try:
+                    if agent.hubspot_enabled:
+                        agent._send_to_hubspot(MessageState(**json.loads(row["payload"])), completed)
+                    else:
+                        logger.info(f"HubSpot no longer enabled for user {row['user_id']}; dropping event {row['id']}")
+                    self.store.complete(row["id"])
+                    metrics.incr("crm_sync.synced")
+                    metrics.observe("crm_sync.lag", time.time() - row["created_at"].timestamp()
+                                    if row["created_at"] else 0.0)
+                except Exception as e:
+                    failed_customers.add(row["customer_id"])
+                    retried = self.store.fail(row["id"], row["attempts"], str(e), completed)
+                    metrics.incr("crm_sync.retried" if retried else "crm_sync.dead_lettered")
+                    logger.error(f"CRM sync of event {row['id']} failed (attempt {row['attempts']}): {e}")
+                finally:
+                    metrics.observe("crm_sync.event", time.perf_counter() - started)
+
+
+# instantiate
+crm_outbox = CrmOutboxStore()
+crm_sync_worker = CrmSyncWorker(crm_outbox)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the CRM sync worker or manage the outbox")
+    parser.add_argument("--requeue-dead", action="store_true", help="move dead-lettered events back to pending")
+    parser.add_argument("--user-id", type=int, help="limit --requeue-dead to one user")
+    parser.add_argument("--status", action="store_true", help="print outbox counts by status")
+    args = parser.parse_args()
+
+    if args.requeue_dead:
+        print(f"Requeued {crm_outbox.requeue_dead(args.user_id)} dead-lettered events")
+    elif args.status:
+        print(crm_outbox.counts())
+    else:
+        async def main():
+            await crm_sync_worker.start()
+            await asyncio.Event().wait()
+        asyncio.run(main())
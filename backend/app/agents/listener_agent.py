@@ -1,55 +1,95 @@
 # app/agents/listener_agent.py
 
 from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import JSONResponse
 from app.state import MessageState
-import time, json, os
-import psycopg2
-from collections import defaultdict
-from utils.encryption import decrypt_value
+import time, json, os, asyncio
 from dotenv import load_dotenv
+from app.agents.work_queue import work_queue, WebhookWorkerPool, WEBHOOK_MAX_QUEUE_DEPTH
+from app.utils.metrics import metrics
+from app.utils.tenant_registry import tenant_registry
+from app.agents.chat_memory import chat_memory
+from app.utils.rate_limiter import rate_limiter
+from app.utils.message_dedup import message_dedup
+from app.utils import delivery_status
+from app.utils.conversation_lock import conversation_key
+from app.agents.crm_sync import crm_outbox
 
 # Load environment variables from .env file
 load_dotenv()
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-# In-memory rate limiter
-message_counter = defaultdict(list)
-
-MAX_MESSAGES_PER_MINUTE = 10  
-TIME_WINDOW_SECONDS = 60  
-
-#get verify token from database
-def fetch_verify_token_by_phone_number(phone_number_id):
-    print("Fetching credentials for phone_number_id from Waffy database:", phone_number_id)
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT whatsapp_verify_token
-        FROM user_settings
-        WHERE whatsapp_phone_number_id = %s
-    """, (phone_number_id,))
-    row = cursor.fetchone()
-    cursor.close()
-    conn.close()
-
-    if not row:
-        raise Exception("No verify token found for this phone_number_id")
-
-    return {
-        "VERIFY_TOKEN": decrypt_value(row[0]),
-    }
+
+def iter_change_values(data):
+    """Every change value in a webhook body, across all entries"""
+    for entry in data.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value")
+            if isinstance(value, dict):
+                yield value
+
+
+def message_states(value):
+    """A MessageState per inbound message in one change value; unsupported messages are skipped"""
+    metadata = value.get("metadata") or {}
+    contacts = {contact.get("wa_id"): contact for contact in value.get("contacts") or []}
+    states = []
+    for message in value.get("messages") or []:
+        try:
+            contact = contacts.get(message["from"]) or (value.get("contacts") or [{}])[0]
+            states.append(MessageState(
+                sender=message["from"],
+                customer_id=contact.get("wa_id", message["from"]),
+                customer_name=(contact.get("profile") or {}).get("name"),
+                message=message["text"]["body"],
+                message_id=message["id"],
+                timestamp=time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(int(message["timestamp"]))),
+                raw_timestamp_utc=int(message["timestamp"]),
+                message_type=message.get("type", "text"),
+                business_phone_number=metadata.get("display_phone_number"),
+                business_phone_id=metadata.get("phone_number_id")
+            ))
+        except (KeyError, TypeError, ValueError) as e:
+            metrics.incr("webhook.unsupported")
+            print(f"Skipping unsupported {message.get('type')} message {message.get('id')}: {e!r}")
+    return states
+
 
 def get_listener_router(graph):
     # Create a FastAPI router to handle webhook routes
     router = APIRouter()
 
+    # Pool of background workers that drain the durable queue through the graph
+    worker_pool = WebhookWorkerPool(graph, work_queue)
+
+    @router.on_event("startup")
+    async def start_webhook_workers():
+        await worker_pool.start()
+
+    @router.on_event("shutdown")
+    async def stop_webhook_workers():
+        await worker_pool.stop()
+
+    # ---- Pipeline metrics (queue depth, per-stage latency) ----
+    @router.get("/metrics")
+    async def get_pipeline_metrics():
+        metrics.set_gauge("queue.depth", await asyncio.to_thread(work_queue.depth))
+        metrics.set_gauge("queue.in_flight", await asyncio.to_thread(work_queue.in_flight))
+        await asyncio.to_thread(chat_memory.report)
+        try:
+            for status, count in (await asyncio.to_thread(crm_outbox.counts)).items():
+                metrics.set_gauge(f"crm_outbox.{status}", count)
+        except Exception as e:
+            print(f"Could not read CRM outbox counts: {e}")
+        return metrics.snapshot()
+
     # ---- Webhook Verification Endpoint ----
     @router.get("/webhook/{phone_number_id}")
     
     async def verify_webhook(phone_number_id: str, request: Request):
-        #get verify token from database
-        expected_token = fetch_verify_token_by_phone_number(phone_number_id)
-        VERIFY_TOKEN= expected_token["VERIFY_TOKEN"]
+        #get verify token from the tenant registry
+        tenant = await tenant_registry.aget(phone_number_id)
+        if not tenant:
+            raise HTTPException(status_code=404, detail="No verify token found for this phone_number_id")
+        VERIFY_TOKEN = tenant.verify_token
         # Extract query parameters from Facebook's verification request
         params = request.query_params
         # If the mode is 'subscribe' and the token matches, return the challenge code to verify
@@ -64,45 +104,90 @@ def get_listener_router(graph):
     # ---- Webhook Message Receiver Endpoint ----
     @router.post("/webhook/{phone_number_id}")
     async def receive_whatsapp_message(phone_number_id: str, request: Request):
-        data = await request.json()
-        try:
-            entry = data["entry"][0]["changes"][0]["value"]
-            message = entry["messages"][0]
-            contact = entry["contacts"][0]
-            metadata = entry["metadata"]
-
-            customer_id=contact["wa_id"]
-            current_time = time.time()
-            # RATE LIMIT CHECK
-            timestamps = message_counter[customer_id]
-            # Only keep timestamps in last 60 seconds
-            timestamps = [ts for ts in timestamps if current_time - ts < TIME_WINDOW_SECONDS]
-            timestamps.append(current_time)
-            message_counter[customer_id] = timestamps
-
-            if len(timestamps) > MAX_MESSAGES_PER_MINUTE:
-                raise HTTPException(status_code=429, detail="Too many messages, slow down.")
-
-             # ---- Populate structured state for processing ----
-            state = MessageState(
-                sender=message["from"],
-                customer_id=contact["wa_id"],
-                customer_name=contact["profile"]["name"],
-                message=message["text"]["body"],
-                message_id=message["id"],
-                timestamp=time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(int(message["timestamp"]))),
-                raw_timestamp_utc=int(message["timestamp"]),
-                message_type=message.get("type", "text"),
-                business_phone_number=metadata["display_phone_number"],
-                business_phone_id=metadata["phone_number_id"]
-            )
+        received_at = time.perf_counter()
 
-            result = graph.invoke(state)
-            print("Final result:\n", json.dumps(result, indent=2))
+        # Back-pressure: refuse new work while the queue is full so Meta retries later
+        depth = await asyncio.to_thread(work_queue.depth)
+        metrics.set_gauge("queue.depth", depth)
+        if depth >= WEBHOOK_MAX_QUEUE_DEPTH:
+            metrics.incr("queue.rejected")
+            return JSONResponse(status_code=503, content={"status": "busy"}, headers={"Retry-After": "30"})
 
-        except Exception as e:
-            print("Webhook Error:", e)
+        # RATE LIMIT CHECK, before the body is read or parsed: a tenant that has used up its window
+        retry_after = await rate_limiter.tenant_exhausted(phone_number_id)
+        if retry_after:
+            metrics.observe("webhook.ack", time.perf_counter() - received_at)
+            return JSONResponse(status_code=429, content={"detail": "Too many messages, slow down."},
+                                headers={"Retry-After": str(retry_after)})
+
+        body = await request.body()
 
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            print("Webhook Error: invalid JSON body:", e)
+            metrics.observe("webhook.ack", time.perf_counter() - received_at)
+            return {"status": "received"}
+
+        # A delivery can batch several entries, changes, messages and status receipts
+        states, statuses = [], []
+        for value in iter_change_values(data):
+            states.extend(message_states(value))
+            statuses.extend(delivery_status.parse_statuses(value))
+
+        # Status receipts: one upsert, no pipeline
+        if statuses:
+            try:
+                await delivery_status.aapply_statuses(statuses)
+            except Exception as e:
+                print("Webhook Error: could not store delivery statuses:", e)
+
+        # Drop redeliveries before they are queued (and reach the LLM)
+        claimed = await asyncio.gather(*(message_dedup.claim(s.message_id, s.business_phone_id) for s in states))
+        duplicates = claimed.count(False)
+        if duplicates:
+            metrics.incr("webhook.duplicate", duplicates)
+        states = [s for s, new in zip(states, claimed) if new]
+
+        # RATE LIMIT CHECK, per message: one noisy customer must not hold up the others in the same delivery.
+        # Over-limit messages are not queued; the delivery is answered 429 below so Meta retries it
+        retry_after = None
+        if states:
+            limits = await asyncio.gather(*(rate_limiter.check(phone_number_id, s.customer_id) for s in states))
+            limited = [s for s, wait in zip(states, limits) if wait]
+            if limited:
+                # Released so the retry queues them; the messages queued now are dropped as duplicates then
+                for s in limited:
+                    await message_dedup.release(s.message_id)
+                metrics.incr("rate_limit.deferred", len(limited))
+                print(f"Rate limited messages {[s.message_id for s in limited]}")
+                states = [s for s, wait in zip(states, limits) if not wait]
+                retry_after = max(wait for wait in limits if wait)
+
+        if states:
+            # Oldest first, so each customer's messages queue (and run) in the order they were sent
+            states.sort(key=lambda s: s.raw_timestamp_utc or 0)
+            try:
+                # Persist the messages and let the worker pool run the pipeline
+                # sqlite write (and fsync) off the event loop
+                job_ids = await asyncio.to_thread(
+                    work_queue.enqueue_many,
+                    [(s.dict(), conversation_key(s.business_phone_id, s.customer_id)) for s in states])
+                worker_pool.notify()
+                metrics.incr("queue.enqueued", len(job_ids))
+                print(f"Queued messages {[s.message_id for s in states]} as jobs {job_ids}")
+            except Exception as e:
+                print("Webhook Error:", e)
+                for s in states:
+                    await message_dedup.release(s.message_id)
+                states = []
+
+        metrics.observe("webhook.ack", time.perf_counter() - received_at)
+        if retry_after:
+            return JSONResponse(status_code=429, content={"detail": "Too many messages, slow down."},
+                                headers={"Retry-After": str(retry_after)})
+        if duplicates and not states:
+            return {"status": "duplicate"}
         return {"status": "received"}
 
     return router
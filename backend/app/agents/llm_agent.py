@@ -1,15 +1,15 @@
 import os
-import json
-import re
 from dotenv import load_dotenv
 from datetime import datetime
 from google import genai
 from google.genai import types
-from app.utils.category_map import DEFAULT_CATEGORIES, DEFAULT_PRIORITY_MAP, STANDARD_KEYS
-
-categories_str = ", ".join(DEFAULT_CATEGORIES)
-priority_map_str = "\n".join(f"- {k}: {v}" for k, v in DEFAULT_PRIORITY_MAP.items())
-schema_str = "\n".join(f"- {k}: {v}" for k, v in STANDARD_KEYS.items())
+from app.agents.llm_cache import llm_cache
+from app.agents.prompt_builder import prompt_builder, prefix_cache
+from app.agents.llm_output import (
+    LLMOutputError, RESULT_SCHEMA, COMBINED_RESULT_SCHEMA, batch_schema, parse_result, parse_json,
+    validate_result, repair_prompt, parse_stats,
+)
+from app.utils.tenant_profiles import tenant_profiles, ClassificationProfile, DEFAULT_PROFILE
 
 # === Load credentials and initialize client ===
 load_dotenv()
@@ -18,165 +18,371 @@ client = genai.Client(api_key=gemini_api_key)
 
 GEMINI_MODEL = "gemini-2.0-flash-lite"  # update to latest model if available
 
+# "combined": one request returns the safety verdict and the classification
+# "separate": is_safe() then analyze(), two round-trips per message
+LLM_SAFETY_MODE = os.getenv("LLM_SAFETY_MODE", "combined").lower()
+
+# Constrain classification answers to the result schema (JSON mode is always on)
+LLM_RESPONSE_SCHEMA_ENABLED = os.getenv("LLM_RESPONSE_SCHEMA_ENABLED", "true").lower() == "true"
+# Ask once more, at temperature 0, when an answer cannot be read even after repair
+LLM_REPAIR_RETRY_ENABLED = os.getenv("LLM_REPAIR_RETRY_ENABLED", "true").lower() == "true"
+
+# Finish reasons that mean Gemini itself refused to answer
+BLOCKING_FINISH_REASONS = {"SAFETY", "PROHIBITED_CONTENT", "BLOCKLIST", "SPII"}
+
+SAFETY_SETTINGS = [
+    types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH, threshold=types.HarmBlockThreshold.BLOCK_LOW_AND_ABOVE),
+    types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_HARASSMENT, threshold=types.HarmBlockThreshold.BLOCK_LOW_AND_ABOVE),
+    types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, threshold=types.HarmBlockThreshold.BLOCK_ONLY_HIGH),
+    types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, threshold=types.HarmBlockThreshold.BLOCK_LOW_AND_ABOVE),
+]
+
+# Result used when Gemini fails or returns something unparseable
+FALLBACK_RESULT = {
+    "category": "others",
+    "priority": "moderate",
+    "conversation_status": "continue",
+    "extracted_info": {}
+}
+
 class GeminiLLMAgent:
 
-    def is_safe(self, message: str) -> bool:
-        """Lightweight safety pre-check before full processing."""
-        safety_prompt = f"""
-                Is the following message harmful or inappropriate?
-                Examples of harmful content include:
-                - Hate speech
-                - Harassment
-                - Sexually explicit material
-                - Threats or violent language
+    def __init__(self, safety_mode: str = LLM_SAFETY_MODE):
+        self.safety_mode = safety_mode
 
-                Message:
-                "{message}"
+    @property
+    def combined_safety(self) -> bool:
+        return self.safety_mode == "combined"
 
-                Respond only with "Yes" if it's harmful, or "No" if it's safe.
-        """.strip()
+    def classify(self, message: str, context: list[str] = None, namespace: str | None = None) -> dict:
+        """
+        Safety check and classification in a single request.
+
+        Returns the analyze() result plus a boolean "harmful" key, set from the
+        model's own verdict or from Gemini blocking the prompt/response.
+        """
+        profile = tenant_profiles.get(namespace)
+        cached = llm_cache.get("classify", namespace, message, context, version=profile.version)
+        if cached is not None:
+            return cached
+
+        try:
+            result = self._request("classify", prompt_builder.system_instruction(True, profile.prompt_fragment),
+                                   self._build_prompt(message, context), self._combined_config(), self._parse_combined)
+            llm_cache.put("classify", namespace, message, context, result, version=profile.version)
+            return result
+
+        except Exception as e:
+            print("[LLMAgent] Gemini error:", e)
+            return dict(FALLBACK_RESULT, extracted_info={}, harmful=False)  # Fail open, as is_safe does
+
+    async def aclassify(self, message: str, context: list[str] = None, namespace: str | None = None) -> dict:
+        """Async variant of classify"""
+        profile = await tenant_profiles.aget(namespace)
+        cached = llm_cache.get("classify", namespace, message, context, version=profile.version)
+        if cached is not None:
+            return cached
 
         try:
+            result = await self._arequest("classify", prompt_builder.system_instruction(True, profile.prompt_fragment),
+                                          self._build_prompt(message, context), self._combined_config(), self._parse_combined)
+            llm_cache.put("classify", namespace, message, context, result, version=profile.version)
+            return result
+
+        except Exception as e:
+            print("[LLMAgent] Gemini error:", e)
+            return dict(FALLBACK_RESULT, extracted_info={}, harmful=False)
+
+    def is_safe(self, message: str, namespace: str | None = None) -> bool:
+        """Lightweight safety pre-check before full processing."""
+        cached = llm_cache.get("safety", namespace, message)
+        if cached is not None:
+            return cached
+
+        try:
+            prompt = self._build_safety_prompt(message)
             safety_response = client.models.generate_content(
                 model=GEMINI_MODEL,
-                contents=[safety_prompt],
-                config=types.GenerateContentConfig(
-                    temperature=0.2,
-                    top_p=0.9,
-                    max_output_tokens=10,
-                    safety_settings=[
-                        types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH, threshold=types.HarmBlockThreshold.BLOCK_LOW_AND_ABOVE),
-                        types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_HARASSMENT, threshold=types.HarmBlockThreshold.BLOCK_LOW_AND_ABOVE),
-                        types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, threshold=types.HarmBlockThreshold.BLOCK_ONLY_HIGH),
-                        types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, threshold=types.HarmBlockThreshold.BLOCK_LOW_AND_ABOVE),
-                    ]
-                )
+                contents=[prompt],
+                config=self._safety_config(),
             )
-
-            verdict = safety_response.text.strip().lower()
-            return verdict == "no"
+            prompt_builder.record_usage("safety", "", prompt, safety_response)
+            verdict = self._parse_safety_verdict(safety_response)
+            llm_cache.put("safety", namespace, message, None, verdict)
+            return verdict
 
         except Exception as e:
             print("[LLMAgent] Safety check failed, assuming message is safe. Error:", e)
             return True  # Fail open to avoid false blocking
 
-    def analyze(self, message: str,context: list[str] = None, prev_info: dict | None = None) -> dict:
-        prompt = self._build_prompt(message, context)
-
-        generation_config = types.GenerateContentConfig(
-            temperature=0.5,
-            top_p=0.95,
-            max_output_tokens=200,
-            safety_settings=[
-                types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH, threshold=types.HarmBlockThreshold.BLOCK_LOW_AND_ABOVE),
-                types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_HARASSMENT, threshold=types.HarmBlockThreshold.BLOCK_LOW_AND_ABOVE),
-                types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, threshold=types.HarmBlockThreshold.BLOCK_ONLY_HIGH),
-                types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, threshold=types.HarmBlockThreshold.BLOCK_LOW_AND_ABOVE),
-            ],
-            system_instruction="You are an assistant trained to classify customer WhatsApp messages into categories for customer support."
-        )
+    async def ais_safe(self, message: str, namespace: str | None = None) -> bool:
+        """Async variant of is_safe using the non-blocking Gemini client."""
+        cached = llm_cache.get("safety", namespace, message)
+        if cached is not None:
+            return cached
 
         try:
-            response = client.models.generate_content(
+            prompt = self._build_safety_prompt(message)
+            safety_response = await client.aio.models.generate_content(
                 model=GEMINI_MODEL,
-                contents=prompt,
-                config=generation_config,
+                contents=[prompt],
+                config=self._safety_config(),
             )
-            content = response.text.strip()
-            print("[LLMAgent] RAW Gemini output:\n", content)
+            prompt_builder.record_usage("safety", "", prompt, safety_response)
+            verdict = self._parse_safety_verdict(safety_response)
+            llm_cache.put("safety", namespace, message, None, verdict)
+            return verdict
+
+        except Exception as e:
+            print("[LLMAgent] Safety check failed, assuming message is safe. Error:", e)
+            return True  # Fail open to avoid false blocking
 
-            if response.candidates and hasattr(response.candidates[0], "finish_reason"):
-                print(" Safety Finish Reason:", response.candidates[0].finish_reason)
+    def analyze(self, message: str,context: list[str] = None, prev_info: dict | None = None, namespace: str | None = None) -> dict:
+        profile = tenant_profiles.get(namespace)
+        cached = llm_cache.get("analyze", namespace, message, context, version=profile.version)
+        if cached is not None:
+            return cached
+
+        try:
+            result = self._request("analyze", prompt_builder.system_instruction(False, profile.prompt_fragment),
+                                   self._build_prompt(message, context), self._analysis_config(), self._parse_analysis)
+            llm_cache.put("analyze", namespace, message, context, result, version=profile.version)
+            return result
 
-            if content.startswith("```json"):
-                content = content.replace("```json", "").replace("```", "").strip()
-            elif content.startswith("```"):
-                content = content.replace("```", "").strip()
+        except Exception as e:
+            print("[LLMAgent] Gemini error:", e)
+            return dict(FALLBACK_RESULT, extracted_info={})
 
-            content = re.sub(r'//.*', '', content)
+    async def aanalyze(self, message: str, context: list[str] = None, prev_info: dict | None = None, namespace: str | None = None) -> dict:
+        """Async variant of analyze using the non-blocking Gemini client."""
+        profile = await tenant_profiles.aget(namespace)
+        cached = llm_cache.get("analyze", namespace, message, context, version=profile.version)
+        if cached is not None:
+            return cached
 
-            result = json.loads(content)
+        try:
+            result = await self._arequest("analyze", prompt_builder.system_instruction(False, profile.prompt_fragment),
+                                          self._build_prompt(message, context), self._analysis_config(), self._parse_analysis)
+            llm_cache.put("analyze", namespace, message, context, result, version=profile.version)
             return result
 
         except Exception as e:
             print("[LLMAgent] Gemini error:", e)
-            return {
-                "category": "others",
-                "priority": "moderate",
-                "conversation_status": "continue",
-                "extracted_info": {}
-            }
+            return dict(FALLBACK_RESULT, extracted_info={})
 
-    def _build_prompt(self, message: str, context: list[str] = None) -> str:
-        context_str = "\n".join(f"- {msg}" for msg in context[-10:]) if context else "None"
-    
+    def _request(self, kind: str, system_instruction: str, contents: str, config: types.GenerateContentConfig, parse):
+        """Call Gemini and parse the answer, retrying once with the repair prompt when it is unreadable"""
+        response = self._generate(kind, system_instruction, contents, config)
+        try:
+            return parse(response)
+        except LLMOutputError as e:
+            if not LLM_REPAIR_RETRY_ENABLED:
+                parse_stats.record(kind, "failed")
+                raise
+            parse_stats.record(kind, "retried")
+            print(f"[LLMAgent] {e}; retrying once at temperature 0")
+            retry = self._generate(kind, system_instruction, repair_prompt(contents, e.raw), self._repair_config(config))
+        try:
+            return parse(retry)
+        except LLMOutputError:
+            parse_stats.record(kind, "failed")
+            raise
+
+    async def _arequest(self, kind: str, system_instruction: str, contents: str, config: types.GenerateContentConfig, parse):
+        """Async variant of _request"""
+        response = await self._agenerate(kind, system_instruction, contents, config)
+        try:
+            return parse(response)
+        except LLMOutputError as e:
+            if not LLM_REPAIR_RETRY_ENABLED:
+                parse_stats.record(kind, "failed")
+                raise
+            parse_stats.record(kind, "retried")
+            print(f"[LLMAgent] {e}; retrying once at temperature 0")
+            retry = await self._agenerate(kind, system_instruction, repair_prompt(contents, e.raw), self._repair_config(config))
+        try:
+            return parse(retry)
+        except LLMOutputError:
+            parse_stats.record(kind, "failed")
+            raise
+
+    def _generate(self, kind: str, system_instruction: str, contents: str, config: types.GenerateContentConfig):
+        """One Gemini call with the static prefix sent as system instruction or cached content"""
+        prefix = prefix_cache.config(client, GEMINI_MODEL, system_instruction)
+        response = client.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=contents,
+            config=config.model_copy(update=prefix),
+        )
+        prompt_builder.record_usage(kind, system_instruction, contents, response, cached="cached_content" in prefix)
+        return response
+
+    async def _agenerate(self, kind: str, system_instruction: str, contents: str, config: types.GenerateContentConfig):
+        """Async variant of _generate"""
+        prefix = await prefix_cache.aconfig(client, GEMINI_MODEL, system_instruction)
+        response = await client.aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=contents,
+            config=config.model_copy(update=prefix),
+        )
+        prompt_builder.record_usage(kind, system_instruction, contents, response, cached="cached_content" in prefix)
+        return response
 
+    def _build_safety_prompt(self, message: str) -> str:
         return f"""
-You are a smart assistant that processes customer messages sent to a business on WhatsApp.
-
-Message:
-"{message}"
-
-Context (last messages from this customer):
-{context_str}
-
-Your tasks:
-- Classify intent.
-- Assign a priority.
-- Decide if this message is related to the context.
-- If related: combine the extracted_info meaningfully.
-- Return conversation_status: 'new', 'continue', or 'close'.
-
-Extraction Rules:
-- If the message talks about ordering products:
-    - Extract fields like:
-        - "item" (product name)
-        - "quantity" (how many units, integer or null if not mentioned)
-        - "unit" (measurement like "1kg", "500gm", "5 liters")
-        - "notes" (any special instruction if mentioned, else null)
-- If the message is a complaint, inquiry, etc.:
-    - Extract relevant fields like "issue", "order_id", "delivery_address", "product", "status", etc.
-
-Categories to choose from:
-{categories_str}
-
-Priority mapping:
-{priority_map_str}
-
-Use the following keywords for extracted_info:
-{schema_str}
-
-Your job is to intelligently **update the extracted_info** based on the new message.
-If the message adds or updates products, addresses, delivery methods, etc., reflect that.
-If it says something irrelevant like "thanks", the extracted_info should remain unchanged.
-
----
-
-Respond in JSON format like:
-{{
-  "category": "complaint",
-  "priority": "high",
-  "conversation_status": "continue",
-  "extracted_info": {{
-    "issue": "damaged product",
-    "product": "lotion",
-    "request": "replacement or refund"
-  }}
-}}
-
-If it's an order or update, you can also respond like:
-{{
-  "category": "new order",
-  "priority": "moderate",
-  "conversation_status": "continue",
-  "extracted_info": {{
-    "items": [
-      {{ "product": "chocolate cake", "quantity": 2, "unit": 3ml, "notes": "same as instagram" }},
-      {{ "product": "cotton", "quantity": 1, "unit": "5kg", "notes": "white color" }},
-    ],
-    "delivery_address": "14 Park Street"
-  }}
-}}
+                Is the following message harmful or inappropriate?
+                Examples of harmful content include:
+                - Hate speech
+                - Harassment
+                - Sexually explicit material
+                - Threats or violent language
+
+                Message:
+                "{message}"
+
+                Respond only with "Yes" if it's harmful, or "No" if it's safe.
         """.strip()
 
+    def _safety_config(self) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            temperature=0.2,
+            top_p=0.9,
+            max_output_tokens=10,
+            safety_settings=SAFETY_SETTINGS,
+        )
+
+    def _analysis_config(self) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            temperature=0.5,
+            top_p=0.95,
+            max_output_tokens=200,
+            safety_settings=SAFETY_SETTINGS,
+            response_mime_type="application/json",
+            response_schema=RESULT_SCHEMA if LLM_RESPONSE_SCHEMA_ENABLED else None,
+        )
+
+    def _combined_config(self) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            temperature=0.5,
+            top_p=0.95,
+            max_output_tokens=220,
+            safety_settings=SAFETY_SETTINGS,
+            response_mime_type="application/json",
+            response_schema=COMBINED_RESULT_SCHEMA if LLM_RESPONSE_SCHEMA_ENABLED else None,
+        )
+
+    def _repair_config(self, config: types.GenerateContentConfig) -> types.GenerateContentConfig:
+        return config.model_copy(update={"temperature": 0.0, "top_p": None})
+
+    async def aclassify_batch(self, items: list[tuple[str, list[str]]], combined: bool,
+                              profile: ClassificationProfile = DEFAULT_PROFILE) -> list[dict | None]:
+        """
+        Classify several (message, context) pairs, from tenants sharing one
+        classification profile, with one request.
+
+        Returns one result per item, in order; an entry is None when the model
+        left it out or returned something unusable. Raises when the whole
+        response is blocked or cannot be parsed, so the caller can fall back
+        to single calls.
+        """
+        response = await self._agenerate(
+            "batch",
+            prompt_builder.system_instruction(combined, profile.prompt_fragment),
+            prompt_builder.batch_prompt(items),
+            self._batch_config(len(items), combined),
+        )
+        return self._parse_batch(response, len(items), combined)
+
+    def _batch_config(self, size: int, combined: bool) -> types.GenerateContentConfig:
+        config = self._combined_config() if combined else self._analysis_config()
+        config.max_output_tokens = config.max_output_tokens * size
+        config.response_schema = batch_schema(combined) if LLM_RESPONSE_SCHEMA_ENABLED else None
+        return config
+
+    def _parse_batch(self, response, size: int, combined: bool) -> list[dict | None]:
+        block_reason = self._safety_block_reason(response)
+        if block_reason:
+            raise ValueError(f"batch blocked: {block_reason}")
+
+        try:
+            parsed, repaired = parse_json(response.text or "")
+        except ValueError:
+            parse_stats.record("batch", "failed")
+            raise
+        parse_stats.record("batch", "repaired" if repaired else "ok")
+        if isinstance(parsed, dict):
+            parsed = parsed.get("results") or parsed.get("messages") or []
+        if not isinstance(parsed, list):
+            raise ValueError("batch response is not a JSON array")
+
+        results: list[dict | None] = [None] * size
+        for position, item in enumerate(parsed):
+            if not isinstance(item, dict):
+                continue
+            index = item.pop("index", position + 1)
+            try:
+                index = int(index) - 1
+            except (TypeError, ValueError):
+                index = position
+            if 0 <= index < size and results[index] is None:
+                try:
+                    result = validate_result(item)
+                except ValueError:
+                    continue  # Left to a single call
+                if not combined:
+                    result.pop("harmful")
+                results[index] = result
+        return results
+
+    def _safety_block_reason(self, response) -> str | None:
+        """Return why Gemini blocked the prompt or response, or None if it did not"""
+        feedback = getattr(response, "prompt_feedback", None)
+        if feedback is not None and getattr(feedback, "block_reason", None):
+            return f"prompt blocked: {feedback.block_reason}"
+
+        if not response.candidates:
+            return None
+        candidate = response.candidates[0]
+
+        finish_reason = getattr(candidate, "finish_reason", None)
+        finish_name = getattr(finish_reason, "name", str(finish_reason or ""))
+        if finish_name in BLOCKING_FINISH_REASONS:
+            return f"finish_reason {finish_name}"
+
+        for rating in getattr(candidate, "safety_ratings", None) or []:
+            if getattr(rating, "blocked", False):
+                return f"blocked rating {rating.category}"
+
+        return None
+
+    def _parse_combined(self, response) -> dict:
+        block_reason = self._safety_block_reason(response)
+        if block_reason:
+            print(f"[LLMAgent] Gemini safety block: {block_reason}")
+            return dict(FALLBACK_RESULT, extracted_info={}, harmful=True)
+
+        return self._parse_result(response, "classify")
+
+    def _parse_safety_verdict(self, safety_response) -> bool:
+        verdict = safety_response.text.strip().lower()
+        return verdict == "no"
+
+    def _parse_analysis(self, response) -> dict:
+        result = self._parse_result(response, "analyze")
+        result.pop("harmful")
+        return result
+
+    def _parse_result(self, response, kind: str) -> dict:
+        content = (response.text or "").strip()
+        print("[LLMAgent] RAW Gemini output:\n", content)
+
+        if response.candidates and hasattr(response.candidates[0], "finish_reason"):
+            print(" Safety Finish Reason:", response.candidates[0].finish_reason)
+
+        return parse_result(content, kind)
+
+    def _build_prompt(self, message: str, context: list[str] = None) -> str:
+        # The instructions, categories and examples go in the system instruction
+        return prompt_builder.user_prompt(message, context)
+
 llm_agent = GeminiLLMAgent()
@@ -0,0 +1,155 @@
+# app/agents/llm_batcher.py
+
+"""
+Micro-batching scheduler for Gemini classification calls.
+
+Pipeline runs awaiting a classification are held for up to
+LLM_BATCH_WINDOW_MS (or until LLM_BATCH_MAX_SIZE requests are waiting) and
+sent to Gemini as a single multi-message prompt. The JSON array that comes
+back is fanned out to the waiting runs. If the batch call fails, is blocked,
+or leaves a message out, those messages fall back to individual calls.
+
+A batch holds one tenant's messages: customers of different businesses are
+never sent to Gemini in the same prompt, where one answer could leak into
+another's. LLM_BATCH_CROSS_TENANT=true lets tenants with the same
+classification profile (category list, which is part of the system
+instruction) share a request, for deployments where every tenant is the
+same business. Only the async pipeline batches; the sync nodes keep calling
+the agent directly.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional, Set
+
+from dotenv import load_dotenv
+from app.agents.llm_cache import llm_cache
+from app.utils.metrics import metrics
+from app.utils.tenant_profiles import tenant_profiles, ClassificationProfile
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+LLM_BATCH_ENABLED = os.getenv("LLM_BATCH_ENABLED", "true").lower() == "true"
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "8"))
+LLM_BATCH_WINDOW_MS = int(os.getenv("LLM_BATCH_WINDOW_MS", "30"))
+LLM_BATCH_CROSS_TENANT = os.getenv("LLM_BATCH_CROSS_TENANT", "false").lower() == "true"
+
+
+@dataclass
+class _PendingRequest:
+    message: str
+    context: List[str]
+    namespace: Optional[str]
+    profile: ClassificationProfile
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class LLMBatchScheduler:
+    """Collects classification requests and sends them to Gemini in batches"""
+
+    def __init__(self, agent, max_size: int = LLM_BATCH_MAX_SIZE, window_ms: int = LLM_BATCH_WINDOW_MS,
+                 enabled: bool = LLM_BATCH_ENABLED, cross_tenant: bool = LLM_BATCH_CROSS_TENANT):
+        self.agent = agent
+        self.max_size = max_size
+        self.window_seconds = window_ms / 1000.0
+        self.enabled = enabled
+        self.cross_tenant = cross_tenant
+        self._pending: List[_PendingRequest] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Running batches; the event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def kind(self) -> str:
+        # Same cache namespace as the agent's own single calls
+        return "classify" if self.agent.combined_safety else "analyze"
+
+    async def submit(self, message: str, context: Optional[List[str]] = None, namespace: Optional[str] = None) -> dict:
+        """Classify one message, sharing a Gemini request with whatever else arrives in the window"""
+        context = context or []
+        if not self.enabled or self.max_size <= 1:
+            return await self._single(message, context, namespace)
+
+        profile = await tenant_profiles.aget(namespace)
+        cached = llm_cache.get(self.kind, namespace, message, context, version=profile.version)
+        if cached is not None:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        request = _PendingRequest(message, context, namespace, profile, loop.create_future())
+        self._pending.append(request)
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+
+        return await request.future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        groups = {}
+        for request in batch:
+            key = request.profile.version if self.cross_tenant else (request.namespace, request.profile.version)
+            groups.setdefault(key, []).append(request)
+        for group in groups.values():
+            task = asyncio.create_task(self._run_batch(group))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[_PendingRequest]):
+        now = time.perf_counter()
+        for request in batch:
+            metrics.observe("llm_batch.wait", now - request.enqueued_at)
+        metrics.incr("llm_batch.batches")
+        metrics.incr("llm_batch.items", len(batch))
+        metrics.set_gauge("llm_batch.last_size", len(batch))
+
+        results: List[Optional[dict]] = [None] * len(batch)
+        if len(batch) > 1:
+            try:
+                with metrics.timer("llm_batch.call"):
+                    results = await self.agent.aclassify_batch(
+                        [(r.message, r.context) for r in batch], combined=self.agent.combined_safety,
+                        profile=batch[0].profile,
+                    )
+            except Exception as e:
+                logger.warning(f"[LLMBatch] Batch of {len(batch)} failed, falling back to single calls: {e}")
+                metrics.incr("llm_batch.failed")
+
+        fallbacks = []
+        for request, result in zip(batch, results):
+            if result is None:
+                fallbacks.append(request)
+                continue
+            llm_cache.put(self.kind, request.namespace, request.message, request.context, result,
+                          version=request.profile.version)
+            if not request.future.done():
+                request.future.set_result(result)
+
+        if fallbacks:
+            if len(batch) > 1:
+                metrics.incr("llm_batch.fallback_items", len(fallbacks))
+            await asyncio.gather(*(self._resolve_single(r) for r in fallbacks))
+
+    async def _resolve_single(self, request: _PendingRequest):
+        try:
+            result = await self._single(request.message, request.context, request.namespace)
+            if not request.future.done():
+                request.future.set_result(result)
+        except Exception as e:
+            if not request.future.done():
+                request.future.set_exception(e)
+
+    async def _single(self, message: str, context: List[str], namespace: Optional[str]) -> dict:
+        if self.agent.combined_safety:
+            return await self.agent.aclassify(message, context, namespace=namespace)
+        return await self.agent.aanalyze(message, context, namespace=namespace)
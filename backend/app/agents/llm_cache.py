@@ -0,0 +1,256 @@
+# app/agents/llm_cache.py
+
+"""
+Two-level cache in front of GeminiLLMAgent.
+
+Level 1 is an exact lookup on (business, call kind, normalized message,
+context hash). Level 2 is a nearest-neighbour lookup over hashed character
+n-gram embeddings held in a per-business faiss index, for near-identical
+phrasings such as "is my order ready" vs "is my order ready yet?".
+
+Classification entries are also keyed by the version of the tenant's
+compiled classification profile (app/utils/tenant_profiles.py). When a
+business changes its categories, the next lookup carries the new version,
+and answers given under the old category list become unreachable on every
+worker. Nothing has to be invalidated; the stale entries age out through
+the TTL and the LRU bound.
+
+Rules that keep cached answers safe to reuse:
+- Order results are never cached when the customer has prior context,
+  since their extracted_info depends on the conversation so far.
+- Order results are only reused on exact matches, never on similarity.
+- A similarity hit must contain the same numbers as the cached message.
+- is_safe verdicts are exact-match only; a near-identical message can still
+  differ in one abusive word.
+- The combined classify call carries a safety verdict too, so it is only
+  served from the similarity level when the cached result was not harmful
+  and the new message adds no words the cached one did not have.
+"""
+
+import os
+import re
+import copy
+import time
+import zlib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from app.utils.category_map import map_category_to_table
+from app.utils.metrics import metrics
+
+try:
+    import faiss
+except ImportError:  # semantic level is skipped without faiss
+    faiss = None
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_SIMILARITY = float(os.getenv("LLM_CACHE_SIMILARITY", "0.88"))
+
+EMBEDDING_DIM = 512
+DEFAULT_NAMESPACE = "default"
+
+# Call kinds that may be served from the similarity level
+SEMANTIC_KINDS = {"analyze", "classify"}
+# Of those, kinds whose results include a safety verdict
+SAFETY_KINDS = {"classify"}
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace"""
+    message = message.lower().strip()
+    message = re.sub(r"[^\w\s]", " ", message)
+    return re.sub(r"\s+", " ", message).strip()
+
+
+def context_hash(message: str, context: Optional[List[str]]) -> str:
+    """Hash of the prior conversation; the current message is excluded when it is the last entry"""
+    prior = list(context or [])
+    if prior and prior[-1] == message:
+        prior = prior[:-1]
+    if not prior:
+        return ""
+    joined = "\n".join(normalize_message(m) for m in prior)
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+
+def embed(normalized: str) -> np.ndarray:
+    """Hashed bag of words and character 3-grams, L2-normalized"""
+    vector = np.zeros(EMBEDDING_DIM, dtype="float32")
+    words = normalized.split()
+    features = [f"w:{w}" for w in words]
+    for word in words:
+        padded = f"<{word}>"
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    for feature in features:
+        vector[zlib.crc32(feature.encode("utf-8")) % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+def _numbers(normalized: str) -> Tuple[str, ...]:
+    return tuple(re.findall(r"\d+", normalized))
+
+
+def _scope(namespace: Optional[str], version: Optional[str]) -> str:
+    """Cache namespace for a business and, when given, its classification profile version"""
+    namespace = namespace or DEFAULT_NAMESPACE
+    return f"{namespace}@{version}" if version else namespace
+
+
+class LLMResponseCache:
+    """Thread-safe LRU + TTL cache with a per-namespace faiss similarity index"""
+
+    def __init__(self, ttl_seconds: int = LLM_CACHE_TTL_SECONDS, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 similarity: float = LLM_CACHE_SIMILARITY, enabled: bool = LLM_CACHE_ENABLED):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # exact key -> (value, expires_at, faiss id or None)
+        self._entries: "OrderedDict[Tuple[str, str, str, str], Tuple[Any, float, Optional[int]]]" = OrderedDict()
+        # (namespace, kind, context hash) -> faiss index and id -> exact key
+        self._indexes: Dict[Tuple[str, str, str], Any] = {}
+        self._index_keys: Dict[int, Tuple[str, str, str, str]] = {}
+        self._next_id = 0
+
+    def get(self, kind: str, namespace: Optional[str], message: str, context: Optional[List[str]] = None,
+            version: Optional[str] = None) -> Optional[Any]:
+        """Return a copy of the cached value, or None on a miss"""
+        if not self.enabled or not message:
+            return None
+
+        namespace = _scope(namespace, version)
+        normalized = normalize_message(message)
+        ctx = context_hash(message, context)
+        key = (namespace, kind, normalized, ctx)
+        now = time.time()
+
+        with self._lock:
+            value = self._lookup(key, now)
+            level = "exact"
+            if value is None and kind in SEMANTIC_KINDS:
+                value = self._similar(namespace, kind, normalized, ctx, now)
+                level = "semantic"
+
+        if value is None:
+            metrics.incr(f"llm_cache.{kind}.miss")
+            return None
+
+        metrics.incr(f"llm_cache.{kind}.hit.{level}")
+        return copy.deepcopy(value)
+
+    def put(self, kind: str, namespace: Optional[str], message: str, context: Optional[List[str]], value: Any,
+            version: Optional[str] = None):
+        if not self.enabled or not message or value is None:
+            return
+
+        namespace = _scope(namespace, version)
+        normalized = normalize_message(message)
+        ctx = context_hash(message, context)
+        is_order = isinstance(value, dict) and map_category_to_table(value.get("category") or "others") == "orders"
+
+        # Extracted order details depend on the conversation; never reuse them across context
+        if is_order and ctx:
+            metrics.incr(f"llm_cache.{kind}.skipped_order")
+            return
+
+        key = (namespace, kind, normalized, ctx)
+        with self._lock:
+            self._remove(key)
+            harmful = isinstance(value, dict) and bool(value.get("harmful"))
+            semantic = kind in SEMANTIC_KINDS and not is_order and not harmful
+            faiss_id = self._index(namespace, kind, ctx, normalized, key) if semantic else None
+            self._entries[key] = (copy.deepcopy(value), time.time() + self.ttl_seconds, faiss_id)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                metrics.incr("llm_cache.evicted")
+            metrics.set_gauge("llm_cache.entries", len(self._entries))
+
+    def invalidate(self, namespace: str):
+        """Drop every entry for a business, under every profile version"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == namespace or k[0].startswith(f"{namespace}@")]:
+                self._remove(key)
+            metrics.set_gauge("llm_cache.entries", len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._indexes.clear()
+            self._index_keys.clear()
+
+    # --- internals, called with the lock held ---
+
+    def _lookup(self, key, now: float) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if expires_at < now:
+            self._remove(key)
+            metrics.incr("llm_cache.expired")
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _similar(self, namespace: str, kind: str, normalized: str, ctx: str, now: float) -> Optional[Any]:
+        index = self._indexes.get((namespace, kind, ctx))
+        if index is None or index.ntotal == 0:
+            return None
+
+        scores, ids = index.search(embed(normalized).reshape(1, -1), 1)
+        if ids[0][0] < 0 or scores[0][0] < self.similarity:
+            return None
+
+        key = self._index_keys.get(int(ids[0][0]))
+        if key is None or _numbers(key[2]) != _numbers(normalized):
+            return None
+        # A word the cached message did not have may be the one that makes it abusive
+        if kind in SAFETY_KINDS and not set(normalized.split()) <= set(key[2].split()):
+            return None
+        return self._lookup(key, now)
+
+    def _index(self, namespace: str, kind: str, ctx: str, normalized: str, key) -> Optional[int]:
+        if faiss is None:
+            return None
+        index_key = (namespace, kind, ctx)
+        index = self._indexes.get(index_key)
+        if index is None:
+            index = faiss.IndexIDMap(faiss.IndexFlatIP(EMBEDDING_DIM))
+            self._indexes[index_key] = index
+        faiss_id = self._next_id
+        self._next_id += 1
+        index.add_with_ids(embed(normalized).reshape(1, -1), np.array([faiss_id], dtype="int64"))
+        self._index_keys[faiss_id] = key
+        return faiss_id
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[2] is None:
+            return
+        faiss_id = entry[2]
+        self._index_keys.pop(faiss_id, None)
+        index_key = (key[0], key[1], key[3])
+        index = self._indexes.get(index_key)
+        if index is not None:
+            index.remove_ids(np.array([faiss_id], dtype="int64"))
+            if index.ntotal == 0:
+                del self._indexes[index_key]
+
+
+# instantiate
+llm_cache = LLMResponseCache()
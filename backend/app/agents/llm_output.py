@@ -0,0 +1,298 @@
+# app/agents/llm_output.py
+
+"""
+Structured output for GeminiLLMAgent.
+
+Classification calls ask Gemini for JSON (response_mime_type) that matches
+RESULT_SCHEMA or batch_schema() (response_schema). The text that comes back is
+read by parse_result:
+- json.loads on the text, with any markdown fence removed
+- if that fails, repair_json: drop // and /* */ comments, trailing commas and
+  any text after the JSON value, all outside strings (URLs and "//" inside
+  strings are left alone), then close the objects and arrays a truncated
+  answer left open, cutting back to the last complete value
+- ClassificationResult validates and normalizes the object
+
+A text that still cannot be read raises LLMOutputError; the agent then retries
+once with the repair prompt at temperature 0 before falling back. Outcomes are
+counted as llm.parse.{ok,repaired,retried,failed} (overall and per call kind)
+and llm.parse.failure_rate is kept as a gauge.
+"""
+
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.genai import types
+from pydantic import BaseModel, ValidationError, field_validator
+from app.utils.metrics import metrics
+
+CONVERSATION_STATUSES = ("new", "continue", "close")
+# Attempts at cutting a truncated answer back to its last complete value
+MAX_REPAIR_CUTS = 20
+FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+
+
+class LLMOutputError(ValueError):
+    """The model's answer could not be read as a classification result"""
+
+    def __init__(self, message: str, raw: str = ""):
+        super().__init__(message)
+        self.raw = raw
+
+
+class ClassificationResult(BaseModel):
+    """One classified message, as the rest of the pipeline expects it"""
+    category: str
+    priority: str = "moderate"
+    conversation_status: str = "continue"
+    extracted_info: Dict[str, Any] = {}
+    harmful: bool = False
+
+    @field_validator("category")
+    @classmethod
+    def _category(cls, value: str) -> str:
+        value = value.strip()
+        if not value:
+            raise ValueError("category is empty")
+        return value
+
+    @field_validator("priority", mode="before")
+    @classmethod
+    def _priority(cls, value) -> str:
+        return str(value).strip().lower() if value else "moderate"
+
+    @field_validator("conversation_status", mode="before")
+    @classmethod
+    def _status(cls, value) -> str:
+        value = str(value or "").strip().lower()
+        return value if value in CONVERSATION_STATUSES else "continue"
+
+    @field_validator("extracted_info", mode="before")
+    @classmethod
+    def _extracted_info(cls, value) -> Dict[str, Any]:
+        if not isinstance(value, dict):
+            return {}
+        # Unset schema fields come back as null; they must not overwrite earlier details when merged
+        info = {k: v for k, v in value.items() if v is not None and v != ""}
+        for key, items in info.items():
+            if isinstance(items, list):
+                # An entry left empty when a truncated answer was cut back
+                info[key] = [item for item in items if item != {}]
+        return info
+
+    @field_validator("harmful", mode="before")
+    @classmethod
+    def _harmful(cls, value) -> bool:
+        if isinstance(value, str):
+            return value.strip().lower() in ("true", "yes")
+        return bool(value)
+
+
+# --- Gemini response schemas ---
+
+def _nullable_string(description: Optional[str] = None) -> types.Schema:
+    return types.Schema(type=types.Type.STRING, nullable=True, description=description)
+
+
+_PRODUCT_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "item": types.Schema(type=types.Type.STRING),
+        "quantity": types.Schema(type=types.Type.NUMBER, nullable=True),
+        "unit": _nullable_string(),
+        "notes": _nullable_string(),
+    },
+    required=["item"],
+)
+
+_EXTRACTED_INFO_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "products": types.Schema(type=types.Type.ARRAY, items=_PRODUCT_SCHEMA),
+        **{key: _nullable_string() for key in (
+            "delivery_method", "delivery_address", "pickup_time", "delivery_time", "notes", "payment_status",
+            "issue", "request", "appointment_time", "contact_info", "order_id", "product", "status",
+        )},
+    },
+)
+
+
+def result_schema(combined: bool, indexed: bool = False) -> types.Schema:
+    properties = {
+        "category": types.Schema(type=types.Type.STRING),
+        "priority": types.Schema(type=types.Type.STRING, enum=["high", "moderate", "low"]),
+        "conversation_status": types.Schema(type=types.Type.STRING, enum=list(CONVERSATION_STATUSES)),
+        "extracted_info": _EXTRACTED_INFO_SCHEMA,
+    }
+    required = ["category", "priority", "conversation_status", "extracted_info"]
+    ordering = ["category", "priority", "conversation_status", "extracted_info"]
+    if combined:
+        properties["harmful"] = types.Schema(type=types.Type.BOOLEAN)
+        required.append("harmful")
+        # Decide on safety before classifying
+        ordering.insert(0, "harmful")
+    if indexed:
+        properties["index"] = types.Schema(type=types.Type.INTEGER)
+        required.insert(0, "index")
+        ordering.insert(0, "index")
+    return types.Schema(type=types.Type.OBJECT, properties=properties, required=required, property_ordering=ordering)
+
+
+RESULT_SCHEMA = result_schema(combined=False)
+COMBINED_RESULT_SCHEMA = result_schema(combined=True)
+
+
+def batch_schema(combined: bool) -> types.Schema:
+    return types.Schema(type=types.Type.ARRAY, items=result_schema(combined, indexed=True))
+
+
+# --- Parsing ---
+
+def _scan(text: str) -> Tuple[str, bool, List[str], List[int]]:
+    """
+    Copy text without comments and trailing commas outside strings. Returns
+    the copy, whether it ends inside a string, the brackets left open and the
+    positions (in the copy) where a truncated answer can be cut back to.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    cuts: List[int] = []
+    in_string = escaped = False
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            i += 1
+            continue
+        if ch == "/" and text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        if ch == "/" and text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            cuts.append(len(out) + 1)
+        elif ch in "}]":
+            # Trailing comma before a closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+                if not stack:
+                    # The top-level value is complete; ignore anything after it
+                    out.append(ch)
+                    break
+        elif ch == ",":
+            cuts.append(len(out))
+        out.append(ch)
+        i += 1
+    return "".join(out), in_string, stack, cuts
+
+
+def _close(text: str, stack: List[str]) -> str:
+    text = text.rstrip().rstrip(",").rstrip()
+    if text.endswith(":"):
+        text += " null"
+    return text + "".join(reversed(stack))
+
+
+def strip_fences(text: str) -> str:
+    return FENCE.sub("", text or "").strip()
+
+
+def repair_json(text: str) -> Any:
+    """Best-effort parse of a commented, trailing-comma or truncated JSON answer"""
+    text = strip_fences(text)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError("no JSON object or array in the answer")
+    candidate = text[min(starts):]
+    for _ in range(MAX_REPAIR_CUTS):
+        cleaned, in_string, stack, cuts = _scan(candidate)
+        # A string cut off mid-way ("bre" for "bread") is dropped rather than kept half-written
+        if not in_string:
+            try:
+                return json.loads(_close(cleaned, stack))
+            except ValueError:
+                pass
+        # Drop the last, incomplete value and try again
+        cuts = [c for c in cuts if c < len(cleaned)]
+        if not cuts:
+            break
+        candidate = cleaned[:cuts[-1]]
+    raise ValueError("answer is not repairable JSON")
+
+
+def parse_json(text: str) -> Tuple[Any, bool]:
+    """(parsed value, whether it needed repairing)"""
+    try:
+        return json.loads(strip_fences(text)), False
+    except ValueError:
+        return repair_json(text), True
+
+
+def validate_result(value: Any) -> dict:
+    """A validated classification result as a plain dict"""
+    if isinstance(value, list) and len(value) == 1:
+        value = value[0]
+    if not isinstance(value, dict):
+        raise ValueError("answer is not a JSON object")
+    return ClassificationResult.model_validate(value).model_dump()
+
+
+def parse_result(text: str, kind: str) -> dict:
+    """Parse and validate one classification; raises LLMOutputError"""
+    try:
+        value, repaired = parse_json(text)
+        result = validate_result(value)
+    except (ValueError, ValidationError) as e:
+        raise LLMOutputError(f"Unreadable {kind} answer: {e}", raw=text or "")
+    parse_stats.record(kind, "repaired" if repaired else "ok")
+    return result
+
+
+def repair_prompt(contents: str, raw: str) -> str:
+    """The original request plus the unreadable answer, for the one retry"""
+    return (f"{contents}\n\n---\n\nYour previous answer could not be read as JSON matching the schema:\n"
+            f"{raw[:2000]}\n\nAnswer again with only the corrected JSON.")
+
+
+class ParseStats:
+    """Parse outcomes per call kind, with an overall failure-rate gauge"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failed = 0
+
+    def record(self, kind: str, outcome: str):
+        metrics.incr(f"llm.parse.{outcome}")
+        metrics.incr(f"llm.parse.{kind}.{outcome}")
+        if outcome == "retried":
+            # The call itself is counted by its final outcome
+            return
+        with self._lock:
+            self.calls += 1
+            self.failed += outcome == "failed"
+            rate = self.failed / self.calls
+        metrics.set_gauge("llm.parse.failure_rate", round(rate, 4))
+
+
+# instantiate
+parse_stats = ParseStats()
@@ -3,13 +3,19 @@ import json
 import csv
 import logging
 import time
+import secrets
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
+from dataclasses import dataclass, field
+from types import SimpleNamespace
 from sqlalchemy.orm import Session
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, desc, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-import requests
 import pandas as pd
 import re
 from dotenv import load_dotenv
@@ -32,6 +38,8 @@ logger = logging.getLogger("waffy_logger")
 # Load environment variables
 load_dotenv()
 
+LOGGER_CONFIG_TTL_SECONDS = int(os.getenv("LOGGER_CONFIG_TTL_SECONDS", "300"))
+
 # Database setup - reuse the same Base and engine
 from setup_db import engine, Base
 from database import SessionLocal
@@ -39,55 +47,111 @@ from database import SessionLocal
 # Import all models from app.models
 from app.models import User, UserSettings, Customer, Business, BusinessTag, Interaction, Order, Issue, Feedback, Enquiry, Category
 from app.models import ErrorLog
+from app.utils.tenant_registry import tenant_registry, snapshot_settings
+from app.utils import rollups
+from app.utils.http_client import http_client
+from app.utils.hubspot_cache import hubspot_cache, properties_fingerprint
+from app.utils.pending_orders import pending_order_index, PendingOrder
+from app.agents import crm_sync
+
+# HubSpot-defined association type ids, sent inline with creates so no separate association call is needed
+HUBSPOT_ASSOCIATION_TYPES = {
+    "deal_to_contact": 3,
+    "ticket_to_contact": 16,
+    "line_item_to_deal": 20,
+    "note_to_contact": 202,
+    "order_to_contact": 507,
+    "line_item_to_order": 514,
+}
+HUBSPOT_BATCH_LIMIT = 100
+
+
+def hubspot_association(to_id: str, association: str) -> Dict[str, Any]:
+    """Inline association for a v3 create body"""
+    return {
+        "to": {"id": str(to_id)},
+        "types": [{"associationCategory": "HUBSPOT_DEFINED", "associationTypeId": HUBSPOT_ASSOCIATION_TYPES[association]}]
+    }
+
+@dataclass
+class LoggerAgentConfig:
+    """Per-tenant settings a LoggerAgent needs, resolved once and shared across messages"""
+    user_settings: Optional[SimpleNamespace] = None
+    hubspot_enabled: bool = False
+    hubspot_access_token: Optional[str] = None
+    view_consolidated_data: bool = False
+    store_in_db: bool = False
+    loaded_at: float = field(default_factory=time.time)
+
 
 class LoggerAgent:
-    def __init__(self, user_id: str):
-        """Initialize the logger agent for a specific user"""
+    def __init__(self, user_id: str, config: Optional[LoggerAgentConfig] = None, db: Optional[Session] = None):
+        """Initialize the logger agent for a specific user
+
+        config and db are supplied by LoggerAgentFactory; without them the agent
+        opens its own session and resolves its settings from the database.
+        """
         self.user_id = user_id
-        self.db = SessionLocal()
-        self.user_settings = self._get_user_settings()
-        
-        # Check if HubSpot integration is enabled
-        self.hubspot_enabled = False
-        self.hubspot_access_token = None
+        self._owns_session = db is None
+        self.db = db if db is not None else SessionLocal()
+        self.config = config if config is not None else self._load_config()
+
+        self.user_settings = self.config.user_settings
+        self.hubspot_enabled = self.config.hubspot_enabled
+        self.hubspot_access_token = self.config.hubspot_access_token
+        self.view_consolidated_data = self.config.view_consolidated_data
+        self.store_in_db = self.config.store_in_db
+        self.pending_order_updates: List[PendingOrder] = []
+
+    def _load_config(self) -> LoggerAgentConfig:
+        """Resolve settings, CRM flags and the decrypted HubSpot token for this user"""
+        user_settings = self._get_user_settings()
+        config = LoggerAgentConfig(user_settings=snapshot_settings(user_settings) if user_settings else None)
+
         # Check for HubSpot configuration
-        logger.debug(f"User settings found: {self.user_settings}")
-        if self.user_settings and self.user_settings.hubspot_access_token:
+        logger.debug(f"User settings found: {user_settings}")
+        if user_settings and user_settings.hubspot_access_token:
             # Enable HubSpot if crm_type is set to hubspot
-            if self.user_settings.crm_type == "hubspot":
-                self.hubspot_enabled = True
+            if user_settings.crm_type == "hubspot":
+                config.hubspot_enabled = True
                 # Use the provided HubSpot Private App Access Token and decrypt it
                 try:
                     # Try to decrypt the token
-                    self.hubspot_access_token = decrypt_value(self.user_settings.hubspot_access_token)
+                    config.hubspot_access_token = decrypt_value(user_settings.hubspot_access_token)
                     
-                    if self.hubspot_access_token:
-                        self.hubspot_enabled = True
+                    if config.hubspot_access_token:
+                        config.hubspot_enabled = True
                         logger.info("Successfully decrypted HubSpot access token")
                     else:
                         logger.warning("Decryption returned None or empty string")
-                        self.hubspot_enabled = False
+                        config.hubspot_enabled = False
                 except Exception as e:
                     logger.error(f"Error decrypting HubSpot access token: {str(e)}")
-                    self.hubspot_enabled = False
+                    config.hubspot_enabled = False
                         
         # Check if consolidated data view is enabled
-        self.view_consolidated_data = False
-        if self.user_settings and hasattr(self.user_settings, 'view_consolidated_data'):
-            self.view_consolidated_data = self.user_settings.view_consolidated_data
+        if user_settings and hasattr(user_settings, 'view_consolidated_data'):
+            config.view_consolidated_data = bool(user_settings.view_consolidated_data)
         
         # Always store in DB if view_consolidated_data is enabled or for Excel integration
-        self.store_in_db = self.view_consolidated_data
+        config.store_in_db = config.view_consolidated_data
         
         # For Excel integration, always enable database storage regardless of view_consolidated_data setting
-        if self.user_settings and self.user_settings.crm_type == 'excel':
-            self.store_in_db = True
-            self.view_consolidated_data = True
+        if user_settings and user_settings.crm_type == 'excel':
+            config.store_in_db = True
+            config.view_consolidated_data = True
+        return config
+
+    def close(self):
+        """Return the session to the pool (only when this agent opened it)"""
+        if self._owns_session and getattr(self, 'db', None) is not None:
+            self.db.close()
+            self.db = None
 
     def __del__(self):
         """Close the database session when the object is destroyed"""
-        if hasattr(self, 'db'):
-            self.db.close()
+        if hasattr(self, '_owns_session'):
+            self.close()
     
     def _get_user_settings(self):
         """Get user settings from the database"""
@@ -217,31 +281,61 @@ class LoggerAgent:
                 if message_state.get('order_number'):
                     logger.debug(f"Found order_number in message_state dict: {message_state.get('order_number')}")
             
-            interaction = None
+            interaction_id = None
+            self.interaction = None
+            self.interaction_is_new = False
+            # Pending-order index entries to publish once this message's writes commit
+            self.pending_order_updates = []
+            # Rollup increments of this message, written as one upsert per day just before the commit
+            self.pending_rollups = {}
             
             # Skip storing harmful/rejected messages
             if message_state.predicted_category != "rejected":
-                # Always store in the database if view_consolidated_data is enabled or if HubSpot is enabled
-                if self.store_in_db:
-                    # Log the interaction first
-                    interaction = self._store_interaction(message_state)
+                crm_user_id = self.user_settings.user_id if self.user_settings else (int(self.user_id) if self.user_id else None)
+                committed = False
+                # One unit of work per message: the outbox row, customer, interaction and
+                # table rows are flushed as they are built and committed together once
+                try:
+                    # Queue the HubSpot sync in the outbox; the CRM sync worker sends it
+                    # after the reply has gone out
+                    if self.hubspot_enabled:
+                        crm_sync.enqueue(self.db, crm_user_id, message_state)
+
+                    # Always store in the database if view_consolidated_data is enabled or if HubSpot is enabled
+                    if self.store_in_db:
+                        # Log the interaction first (read its id now; commit expires the object)
+                        interaction_id = self._store_interaction(message_state).interaction_id
+
+                        # Store in appropriate table based on table_name if specified
+                        if message_state.table_name:
+                            self._store_in_specific_table(message_state)
 
-                    # Store in appropriate table based on table_name if specified
-                    if message_state.table_name:
-                        self._store_in_specific_table(message_state)
+                    for (rollup_user_id, day), increments in self.pending_rollups.items():
+                        rollups.record(self.db, rollup_user_id, day, increments)
+                    self.db.commit()
+                    committed = True
+                    for pending_order in self.pending_order_updates:
+                        pending_order_index.record(pending_order)
+                except Exception as e:
+                    self.db.rollback()
+                    interaction_id = None
+                    error_msg = f"Error storing message: {str(e)}"
+                    logger.error(error_msg)
+                    self._log_error("Database Error", error_msg, crm_user_id)
+                self.pending_rollups = None
 
-                # If HubSpot integration is enabled, send to HubSpot
                 if self.hubspot_enabled:
-                    self._send_to_hubspot(message_state)
+                    # If storage failed the outbox row went with it; queue it on its own
+                    crm_sync.ensure_enqueued(self.db, crm_user_id, message_state, committed=committed)
             else:
                 logger.info("Skipping storage and CRM sync for rejected/harmful message.")
                 
             result = {
                 "status": "success",
                 "message": f"Message processed successfully",
-                "interaction_id": interaction.interaction_id if interaction else None,
+                "interaction_id": interaction_id,
                 "stored_in_db": self.store_in_db,
-                "sent_to_hubspot": self.hubspot_enabled
+                "queued_for_hubspot": self.hubspot_enabled
             }
 
             return result
@@ -280,6 +374,7 @@ class LoggerAgent:
                     updated_at=datetime.utcnow()
                 )
                 self.db.add(customer)
+                rollups.record(self.db, user_id, customer.created_at, rollups.customer_increments())
                 self.db.commit()
                 self.db.refresh(customer)
                 logger.info(f"Created new customer: {customer.customer_id}")
@@ -296,11 +391,47 @@ class LoggerAgent:
             self.db.rollback()
             raise
     
+    def _rollup(self, user_id: Optional[int], day, increments: List[rollups.Increment]) -> None:
+        """Queue rollup increments for the current message's commit, or write them now outside one"""
+        pending = getattr(self, "pending_rollups", None)
+        if pending is None:
+            rollups.record(self.db, user_id, day, increments)
+            return
+        day = day.date() if isinstance(day, datetime) else day
+        pending.setdefault((user_id, day), []).extend(increments)
+    
+    def _upsert(self, model):
+        """Dialect-specific INSERT for ON CONFLICT clauses"""
+        return (pg_insert if self.db.get_bind().dialect.name == "postgresql" else sqlite_insert)(model)
+    
+    def _upsert_customer(self, message_state: MessageState) -> None:
+        """Create the customer record if it doesn't exist yet (INSERT .. ON CONFLICT DO NOTHING, no commit)"""
+        # Ensure user_id is set correctly
+        user_id = int(self.user_id) if self.user_id else None
+        if self.user_settings and self.user_settings.user_id:
+            user_id = self.user_settings.user_id
+        
+        # If we still don't have a user_id, we can't create a customer
+        if user_id is None:
+            raise ValueError("Cannot create customer without a valid user_id")
+        
+        created = self.db.execute(self._upsert(Customer).values(
+            customer_id=message_state.customer_id,
+            user_id=user_id,
+            customer_name=message_state.customer_name if hasattr(message_state, 'customer_name') else "",
+            email="",
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=["customer_id"]).returning(Customer.customer_id)).first()
+        # RETURNING only yields a row when the customer was actually inserted
+        if created:
+            self._rollup(user_id, datetime.utcnow(), rollups.customer_increments())
+    
     def _store_interaction(self, message_state: MessageState) -> Optional[Interaction]:
-        """Store message in the interactions table"""
+        """Store message in the interactions table (part of the message's unit of work; the caller commits)"""
         try:
             # Get or create customer
-            customer = self._get_or_create_customer(message_state)
+            self._upsert_customer(message_state)
             
             # Ensure valid status values - check constraint issue
             valid_statuses = ["pending", "processed", "responded", "closed", "archived"]
@@ -310,26 +441,8 @@ class LoggerAgent:
             valid_message_types = ["text", "image", "audio", "video", "document", "location"]
             message_type = message_state.message_type if hasattr(message_state, 'message_type') and message_state.message_type in valid_message_types else "text"
             
-            # Extract whatsapp_message_id if available
-            whatsapp_message_id = message_state.message_id if hasattr(message_state, 'message_id') else ""
-            
-            # Check if an interaction with this message ID already exists
-            if whatsapp_message_id:
-                existing_interaction = self.db.query(Interaction).filter(Interaction.whatsapp_message_id == whatsapp_message_id).first()
-                if existing_interaction:
-                    logger.info(f"Interaction with message ID {whatsapp_message_id} already exists, updating it")
-                    # Update existing interaction
-                    existing_interaction.category = message_state.predicted_category
-                    existing_interaction.priority = message_state.priority
-                    existing_interaction.status = status
-                    existing_interaction.message_summary = message_state.message[:200] if message_state.message else ""
-                    existing_interaction.updated_at = datetime.utcnow()
-                    
-                    self.db.commit()
-                    self.db.refresh(existing_interaction)
-                    
-                    logger.info(f"Updated interaction: {existing_interaction.interaction_id}")
-                    return existing_interaction
+            # Extract whatsapp_message_id if available (NULL rather than "" so the unique key only covers real ids)
+            whatsapp_message_id = (message_state.message_id if hasattr(message_state, 'message_id') else None) or None
             
             # Ensure user_id is set correctly
             user_id = int(self.user_id) if self.user_id else None
@@ -340,8 +453,9 @@ class LoggerAgent:
             if user_id is None:
                 raise ValueError("Cannot create interaction without a valid user_id")
             
-            # Create new interaction record if no existing one found
-            interaction = Interaction(
+            # Insert the interaction unless this message id was stored before; RETURNING
+            # hands back the new row, so no refresh or follow-up lookup is needed
+            stmt = self._upsert(Interaction).values(
                 user_id=user_id,
                 whatsapp_message_id=whatsapp_message_id,
                 customer_id=message_state.customer_id,
@@ -351,25 +465,53 @@ class LoggerAgent:
                 priority=message_state.priority,
                 status=status,
                 message_summary=message_state.message[:200] if message_state.message else "",
-                sentiment="neutral"  # Default sentiment
-            )
-            
-            self.db.add(interaction)
-            self.db.commit()
-            self.db.refresh(interaction)
-            
-            logger.info(f"Stored new interaction: {interaction.interaction_id}")
-            return interaction
+                sentiment="neutral",  # Default sentiment
+                created_at=datetime.utcnow(),
+                updated_at=datetime.utcnow()
+            ).on_conflict_do_nothing(index_elements=["whatsapp_message_id"]).returning(Interaction)
+            interaction = self.db.scalars(stmt).first()
+            
+            if interaction is not None:
+                self._rollup(user_id, datetime.utcnow(),
+                             rollups.interaction_increments(interaction.category, interaction.priority))
+                self.interaction, self.interaction_is_new = interaction, True
+                logger.info(f"Stored new interaction: {interaction.interaction_id}")
+                return interaction
+            
+            # Redelivered or reprocessed message: update the stored interaction
+            existing_interaction = self.db.query(Interaction).filter(Interaction.whatsapp_message_id == whatsapp_message_id).first()
+            logger.info(f"Interaction with message ID {whatsapp_message_id} already exists, updating it")
+            # Move the rollup counters if the classification changed
+            if (existing_interaction.category, existing_interaction.priority) != (message_state.predicted_category, message_state.priority):
+                self._rollup(
+                    existing_interaction.user_id, existing_interaction.created_at,
+                    rollups.interaction_increments(existing_interaction.category, existing_interaction.priority, sign=-1)
+                    + rollups.interaction_increments(message_state.predicted_category, message_state.priority),
+                )
+            # Update existing interaction
+            existing_interaction.category = message_state.predicted_category
+            existing_interaction.priority = message_state.priority
+            existing_interaction.status = status
+            existing_interaction.message_summary = message_state.message[:200] if message_state.message else ""
+            existing_interaction.updated_at = datetime.utcnow()
+            self.db.flush()
+            
+            self.interaction = existing_interaction
+            logger.info(f"Updated interaction: {existing_interaction.interaction_id}")
+            return existing_interaction
             
         except Exception as e:
-            error_msg = f"Error storing interaction: {str(e)}"
-            logger.error(error_msg)
-            user_id = None
-            if self.user_settings:
-                user_id = self.user_settings.user_id
-            self._log_error("Database Error", error_msg, user_id)
-            self.db.rollback()
-            return None
+            logger.error(f"Error storing interaction: {str(e)}")
+            raise
+            
+    def _current_interaction_id(self) -> Optional[int]:
+        """interaction_id of the message being processed, from this unit of work or the database"""
+        if getattr(self, 'interaction', None) is not None:
+            return self.interaction.interaction_id
+        if hasattr(self, 'message_state') and self.message_state and self.message_state.message_id:
+            interaction = self._get_interaction_by_message_id(self.message_state.message_id)
+            return interaction.interaction_id if interaction else None
+        return None
             
     def _get_interaction_by_message_id(self, message_id: str) -> Optional[Interaction]:
         """Get an interaction by WhatsApp message ID"""
@@ -429,15 +571,26 @@ class LoggerAgent:
             return result
                 
         except Exception as e:
-            error_msg = f"Error storing data in specific table: {str(e)}"
-            logger.error(error_msg)
-            user_id = None
-            if self.user_settings:
-                user_id = self.user_settings.user_id
-            self._log_error("Database Error", error_msg, user_id)
+            # The message's unit of work rolls back and logs the error
+            logger.error(f"Error storing data in specific table: {str(e)}")
+            raise
             
-    def _send_to_hubspot(self, message_state: MessageState) -> None:
-        """Send data to HubSpot"""
+    def _require_hubspot_success(self, result: Any, step: str) -> Dict[str, Any]:
+        """Raise CrmSyncError for a failed HubSpot step so the CRM sync worker retries or dead-letters the event"""
+        if not isinstance(result, dict) or result.get("status") == "error":
+            message = result.get("message") if isinstance(result, dict) else None
+            raise crm_sync.CrmSyncError(f"HubSpot {step} failed: {message or result}")
+        return result
+
+    def _send_to_hubspot(self, message_state: MessageState, completed: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Send data to HubSpot (called by the CRM sync worker; raises on failure).
+
+        completed maps the steps already done for this event to the HubSpot ids
+        they created; it is updated as steps succeed, and steps found in it are
+        skipped, so a retry does not create a second ticket or order.
+        """
+        completed = {} if completed is None else completed
         try:
             # Get access token
             access_token = self.hubspot_access_token
@@ -452,10 +605,14 @@ class LoggerAgent:
             if hasattr(message_state, 'customer_name') and message_state.customer_name:
                 contact_data["customer_name"] = message_state.customer_name
             
-            self._create_hubspot_contact(access_token, contact_data)
+            # The contact upsert is idempotent and comes before any create, so a failure here
+            # can be retried by the CRM sync worker without duplicating tickets or orders
+            contact_result = self._create_hubspot_contact(access_token, contact_data)
+            if isinstance(contact_result, dict) and contact_result.get("status") == "error":
+                raise crm_sync.CrmSyncError(contact_result.get("message", "HubSpot contact upsert failed"))
             
             # Create ticket for high priority messages
-            if hasattr(message_state, 'priority') and message_state.priority == "high":
+            if hasattr(message_state, 'priority') and message_state.priority == "high" and "priority_ticket" not in completed:
                 ticket_data = {
                     "customer_id": message_state.customer_id,
                     "subject": f"High Priority: {message_state.predicted_category}",
@@ -463,7 +620,8 @@ class LoggerAgent:
                     "priority": "high",
                     "category": message_state.predicted_category
                 }
-                self._create_hubspot_ticket(access_token, ticket_data)
+                result = self._require_hubspot_success(self._create_hubspot_ticket(access_token, ticket_data), "priority ticket")
+                completed["priority_ticket"] = result.get("ticket_id") or result.get("id")
             
             # Determine if this is an order based on category
             is_order = False
@@ -554,30 +712,44 @@ class LoggerAgent:
                                 "price": product.get("price", 0)
                             })
                     
-                        # Create the order with dynamic properties
-                        self._create_hubspot_order(access_token, items, order_data.get("message", ""), contact_id, order_data)
-                    else:
+                        if "order" not in completed:
+                            # Create the order with dynamic properties
+                            result = self._create_hubspot_order(access_token, items, order_data.get("message", ""), contact_id, order_data)
+                            if result.get("order_id"):
+                                # Kept even if its line items failed, so a retry only adds the line items
+                                completed["order"] = result["order_id"]
+                                if result.get("status") != "error":
+                                    completed["order_line_items"] = result.get("line_item_ids", [])
+                            elif result.get("status") != "error":
+                                completed["order"] = result.get("note_id")
+                                completed["order_line_items"] = []
+                            self._require_hubspot_success(result, "order")
+                        elif "order_line_items" not in completed:
+                            result = self._require_hubspot_success(
+                                self._create_hubspot_line_items(access_token, items, completed["order"], is_order=True),
+                                "order line items"
+                            )
+                            completed["order_line_items"] = result.get("line_item_ids", [])
+                    elif "order_note" not in completed:
                         logger.warning(f"Could not find HubSpot contact for {message_state.customer_id}, falling back to note creation")
-                        self._create_hubspot_deal(access_token, order_data)
-                else:
+                        result = self._require_hubspot_success(self._create_hubspot_deal(access_token, order_data), "order note")
+                        completed["order_note"] = result.get("note_id")
+                elif "order_note" not in completed:
                     logger.info("HubSpot Order object type does not exist, creating order as note")
-                    self._create_hubspot_deal(access_token, order_data)
-            
-            # Create ticket for issues
-            elif table_name == "issues" or (hasattr(message_state, 'predicted_category') and 
-                  message_state.predicted_category in ["issue", "complaint"]):
-                ticket_data = common_data.copy()
-                ticket_data["subject"] = f"Issue: {message_state.predicted_category if hasattr(message_state, 'predicted_category') else 'Unknown'}"
-                ticket_data["description"] = message_state.message
-                self._create_hubspot_ticket(access_token, ticket_data)
+                    result = self._require_hubspot_success(self._create_hubspot_deal(access_token, order_data), "order note")
+                    completed["order_note"] = result.get("note_id")
             
-            # Create ticket for other table data (feedback, enquiries, etc.)
-            else:
+            # Create ticket for issues and for other table data (feedback, enquiries, etc.)
+            elif "ticket" not in completed:
                 ticket_data = common_data.copy()
                 category = message_state.predicted_category if hasattr(message_state, 'predicted_category') else "Unknown"
-                ticket_data["subject"] = f"{table_name.capitalize()}: {category}"
+                if table_name == "issues" or category in ["issue", "complaint"]:
+                    ticket_data["subject"] = f"Issue: {category}"
+                else:
+                    ticket_data["subject"] = f"{table_name.capitalize()}: {category}"
                 ticket_data["description"] = message_state.message
-                self._create_hubspot_ticket(access_token, ticket_data)
+                result = self._require_hubspot_success(self._create_hubspot_ticket(access_token, ticket_data), "ticket")
+                completed["ticket"] = result.get("ticket_id") or result.get("id")
                 
         except Exception as e:
             error_msg = f"Error sending data to HubSpot: {str(e)}"
@@ -586,6 +758,8 @@ class LoggerAgent:
             if self.user_settings:
                 user_id = self.user_settings.user_id
             self._log_error("HubSpot Error", error_msg, user_id)
+            # Let the CRM sync worker retry or dead-letter the event
+            raise
             
     def _create_hubspot_contact(self, access_token: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """Create or update a contact in HubSpot"""
@@ -620,7 +794,7 @@ class LoggerAgent:
                 }]
             }
             
-            search_response = requests.post(search_url, headers=headers, json=search_payload)
+            search_response = http_client.post(search_url, headers=headers, json=search_payload, idempotent=True)
             search_data = search_response.json()
             
             # If contact exists, update it
@@ -632,7 +806,7 @@ class LoggerAgent:
                     "properties": properties
                 }
                 
-                response = requests.patch(update_url, headers=headers, json=update_payload)
+                response = http_client.patch(update_url, headers=headers, json=update_payload)
                 response_data = response.json()
                 
                 logger.info(f"Updated HubSpot contact: {contact_id}")
@@ -643,7 +817,7 @@ class LoggerAgent:
                 "properties": properties
             }
             
-            response = requests.post(url, headers=headers, json=create_payload)
+            response = http_client.post(url, headers=headers, json=create_payload)
             response_data = response.json()
             
             logger.info(f"Created HubSpot contact: {response_data.get('id')}")
@@ -690,7 +864,7 @@ class LoggerAgent:
                 "properties": properties
             }
             
-            response = requests.post(url, headers=headers, json=create_payload)
+            response = http_client.post(url, headers=headers, json=create_payload)
             response_data = response.json()
             
             # If contact ID is available, associate ticket with contact
@@ -721,6 +895,10 @@ class LoggerAgent:
                 logger.error("HubSpot access token is empty or None")
                 return None
             
+            contact_id, _ = hubspot_cache.contact(access_token, phone)
+            if contact_id:
+                return contact_id
+            
             # HubSpot API endpoint for contacts search
             url = "https://api.hubapi.com/crm/v3/objects/contacts/search"
             logger.info(f"Making HubSpot API request to: {url}")
@@ -743,7 +921,7 @@ class LoggerAgent:
             }
             
             logger.info(f"Searching for contact with phone: {phone}")
-            response = requests.post(url, headers=headers, json=search_payload)
+            response = http_client.post(url, headers=headers, json=search_payload, idempotent=True)
             
             # Log response status
             logger.info(f"HubSpot API response status: {response.status_code}")
@@ -756,6 +934,7 @@ class LoggerAgent:
                 if data.get("total", 0) > 0 and data.get("results"):
                     contact_id = data["results"][0]["id"]
                     logger.info(f"Found HubSpot contact ID: {contact_id}")
+                    hubspot_cache.set_contact(access_token, phone, contact_id)
                     return contact_id
                 else:
                     logger.info(f"No contact found for phone: {phone}")
@@ -782,7 +961,7 @@ class LoggerAgent:
             }
             
             # Make the request
-            response = requests.put(url, headers=headers)
+            response = http_client.put(url, headers=headers)
             
             # Check response
             if response.status_code == 200 or response.status_code == 201:
@@ -883,36 +1062,20 @@ class LoggerAgent:
                 "hs_timestamp": int(time.time() * 1000)  # Current time in milliseconds
             }
             
-            # Create the note
+            # Create the note, associated with the contact in the same call
             note_body = {
-                "properties": note_properties
+                "properties": note_properties,
+                "associations": [hubspot_association(contact_id, "note_to_contact")]
             }
             
             # Make the request to create the note
-            note_response = requests.post(url, headers=headers, json=note_body)
+            note_response = http_client.post(url, headers=headers, json=note_body)
             
             # Check response
             if note_response.status_code == 201:
                 note_data = note_response.json()
                 note_id = note_data.get("id")
-                logger.info(f"Created note in HubSpot: {note_id}")
-                
-                # Now associate the note with the contact
-                try:
-                    # API endpoint for note associations
-                    assoc_url = f"https://api.hubapi.com/crm/v3/objects/notes/{note_id}/associations/contacts/{contact_id}/note_to_contact"
-                    
-                    # Make the request to associate note with contact
-                    assoc_response = requests.put(assoc_url, headers=headers)
-                    
-                    # Check association response
-                    if assoc_response.status_code == 200 or assoc_response.status_code == 201:
-                        logger.info(f"Successfully associated note {note_id} with contact {contact_id}")
-                    else:
-                        assoc_error = f"Failed to associate note with contact: {assoc_response.status_code} - {assoc_response.text}"
-                        logger.error(assoc_error)
-                except Exception as assoc_e:
-                    logger.error(f"Error associating note with contact: {str(assoc_e)}")
+                logger.info(f"Created note in HubSpot: {note_id} (associated with contact {contact_id})")
                 
                 # Create an engagement for the order (this will show up in the timeline)
                 try:
@@ -935,7 +1098,7 @@ class LoggerAgent:
                     }
                     
                     # Make the request to create the engagement
-                    engagement_response = requests.post(engagement_url, headers=headers, json=engagement_body)
+                    engagement_response = http_client.post(engagement_url, headers=headers, json=engagement_body)
                     
                     # Check engagement response
                     if engagement_response.status_code == 200:
@@ -962,6 +1125,10 @@ class LoggerAgent:
     def _check_hubspot_object_exists(self, access_token: str, object_type: str) -> bool:
         """Check if a specific object type exists in HubSpot"""
         try:
+            cached = hubspot_cache.object_exists(access_token, object_type)
+            if cached is not None:
+                return cached
+            
             logger.info(f"Checking if object type '{object_type}' exists in HubSpot...")
             # API endpoint for checking object types
             url = f"https://api.hubapi.com/crm/v3/objects/{object_type}"
@@ -974,7 +1141,7 @@ class LoggerAgent:
             
             # Make the request to check if the object type exists
             logger.info(f"Making request to: {url}")
-            response = requests.get(url, headers=headers, params={"limit": 1})
+            response = http_client.get(url, headers=headers, params={"limit": 1})
             
             # Log the response details
             logger.info(f"Response status code: {response.status_code}")
@@ -983,9 +1150,11 @@ class LoggerAgent:
             # If we get a 200 response, the object type exists
             if response.status_code == 200:
                 logger.info(f"Object type '{object_type}' exists in HubSpot")
+                hubspot_cache.set_object_exists(access_token, object_type, True)
                 return True
             elif response.status_code == 404 or response.status_code == 400:
                 logger.warning(f"Object type '{object_type}' does not exist in HubSpot")
+                hubspot_cache.set_object_exists(access_token, object_type, False)
                 return False
             elif response.status_code == 403:
                 logger.warning(f"No permission to access object type '{object_type}' in HubSpot. Check if the token has the required scopes.")
@@ -1001,6 +1170,10 @@ class LoggerAgent:
     def _get_hubspot_order_properties(self, access_token: str) -> List[str]:
         """Get available properties for the Order object in HubSpot"""
         try:
+            cached = hubspot_cache.order_properties(access_token)
+            if cached is not None:
+                return cached
+            
             # API endpoint for getting order properties
             url = "https://api.hubapi.com/crm/v3/properties/order"
             
@@ -1011,13 +1184,15 @@ class LoggerAgent:
             }
             
             # Make the request to get order properties
-            response = requests.get(url, headers=headers)
+            response = http_client.get(url, headers=headers)
             
             # Check response
             if response.status_code == 200:
                 properties_data = response.json()
                 properties = [prop.get("name") for prop in properties_data.get("results", [])]
                 logger.info(f"Found {len(properties)} properties for Order object in HubSpot")
+                if properties:
+                    hubspot_cache.set_order_properties(access_token, properties)
                 return properties
             else:
                 logger.error(f"Failed to get order properties from HubSpot: {response.status_code} - {response.text}")
@@ -1129,63 +1304,41 @@ class LoggerAgent:
             
             logger.info(f"Using properties for order: {properties}")
                 
-            # Request body
+            # Request body, associated with the contact in the same call
             body = {
-                "properties": properties
+                "properties": properties,
+                "associations": [hubspot_association(contact_id, "order_to_contact")]
             }
             
             # Make the request to create the order
-            response = requests.post(url, headers=headers, json=body)
+            response = http_client.post(url, headers=headers, json=body)
             
             # Check response
             if response.status_code == 201:
                 order_data = response.json()
                 order_id = order_data.get("id")
-                logger.info(f"Created order in HubSpot: {order_id}")
+                logger.info(f"Created order in HubSpot: {order_id} (associated with contact {contact_id})")
                 
-                # Now associate the order with the contact
-                try:
-                    # API endpoint for order associations
-                    assoc_url = f"https://api.hubapi.com/crm/v3/objects/order/{order_id}/associations/contacts/{contact_id}/order_to_contact"
-                    
-                    # Make the request to associate order with contact
-                    assoc_response = requests.put(assoc_url, headers=headers)
-                    
-                    # Check association response
-                    if assoc_response.status_code == 200 or assoc_response.status_code == 201:
-                        logger.info(f"Successfully associated order {order_id} with contact {contact_id}")
-                    else:
-                        assoc_error = f"Failed to associate order with contact: {assoc_response.status_code} - {assoc_response.text}"
-                        logger.error(assoc_error)
-                except Exception as assoc_e:
-                    logger.error(f"Error associating order with contact: {str(assoc_e)}")
+                # Create all line items for the order in one batch call
+                line_items_result = self._create_hubspot_line_items(access_token, items, order_id, is_order=True)
+                line_item_ids = line_items_result.get("line_item_ids", [])
                 
-                # Create line items for each product in the order
-                line_item_ids = []
-                for item in items:
-                    line_item_result = self._create_hubspot_order_line_item(access_token, item, order_id, is_order=True)
-                    if line_item_result.get("status") == "success":
-                        line_item_ids.append(line_item_result.get("line_item_id"))
-                
-                if line_item_ids:
-                    logger.info(f"Created {len(line_item_ids)} line items for order {order_id}")
-                else:
-                    logger.warning(f"No line items were created for order {order_id}")
+                if line_items_result.get("status") == "error":
+                    # The order exists; report its id so a retry adds only the line items
+                    return {"status": "error", "message": line_items_result.get("message"), "order_id": order_id}
+                logger.info(f"Created {len(line_item_ids)} line items for order {order_id}")
                 
                 return {"status": "success", "message": "Order created in HubSpot", "order_id": order_id, "line_item_ids": line_item_ids}
             else:
+                # Not written as a note instead: the CRM sync worker retries the order
                 error_message = f"Failed to create order in HubSpot: {response.status_code} - {response.text}"
                 logger.error(error_message)
-                # Fall back to creating a note
-                order_title = f"Order #{order_number}: {total_quantity} item(s)"
-                return self._create_hubspot_order_note(access_token, order_title, order_notes, contact_id)
+                return {"status": "error", "message": error_message}
                 
         except Exception as e:
             error_message = f"Error creating HubSpot order: {str(e)}"
             logger.error(error_message)
-            # Fall back to creating a note
-            order_title = f"Order #{order_number}: {total_quantity} item(s)"
-            return self._create_hubspot_order_note(access_token, order_title, order_notes, contact_id)
+            return {"status": "error", "message": error_message}
     
     def _create_hubspot_order_as_deal(self, access_token: str, items: List[Dict[str, Any]], description: str, contact_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """Create an order in HubSpot using a deal with custom properties (fallback method)"""
@@ -1232,43 +1385,23 @@ class LoggerAgent:
                 "closedate": str(int(time.time() * 1000))  # Current time in milliseconds
             }
             
-            # Request body
+            # Request body, associated with the contact in the same call
             body = {
-                "properties": properties
+                "properties": properties,
+                "associations": [hubspot_association(contact_id, "deal_to_contact")]
             }
             
             # Make the request to create the deal
-            response = requests.post(url, headers=headers, json=body)
+            response = http_client.post(url, headers=headers, json=body)
             
             # Check response
             if response.status_code == 201:
                 deal_data = response.json()
                 deal_id = deal_data.get("id")
-                logger.info(f"Created order as deal in HubSpot: {deal_id}")
+                logger.info(f"Created order as deal in HubSpot: {deal_id} (associated with contact {contact_id})")
                 
-                # Now associate the deal with the contact
-                try:
-                    # API endpoint for deal associations
-                    assoc_url = f"https://api.hubapi.com/crm/v3/objects/deals/{deal_id}/associations/contacts/{contact_id}/deal_to_contact"
-                    
-                    # Make the request to associate deal with contact
-                    assoc_response = requests.put(assoc_url, headers=headers)
-                    
-                    # Check association response
-                    if assoc_response.status_code == 200 or assoc_response.status_code == 201:
-                        logger.info(f"Successfully associated deal {deal_id} with contact {contact_id}")
-                    else:
-                        assoc_error = f"Failed to associate deal with contact: {assoc_response.status_code} - {assoc_response.text}"
-                        logger.error(assoc_error)
-                except Exception as assoc_e:
-                    logger.error(f"Error associating deal with contact: {str(assoc_e)}")
-                
-                # Create line items for each product in the order
-                line_item_ids = []
-                for item in items:
-                    line_item_result = self._create_hubspot_order_line_item(access_token, item, deal_id, is_order=False)
-                    if line_item_result.get("status") == "success":
-                        line_item_ids.append(line_item_result.get("line_item_id"))
+                # Create all line items for the deal in one batch call
+                line_item_ids = self._create_hubspot_line_items(access_token, items, deal_id, is_order=False).get("line_item_ids", [])
                 
                 if line_item_ids:
                     logger.info(f"Created {len(line_item_ids)} line items for deal {deal_id}")
@@ -1288,19 +1421,15 @@ class LoggerAgent:
             # Final fallback to note
             return self._create_hubspot_order_note(access_token, "New Order", description, contact_id)
     
-    def _create_hubspot_order_line_item(self, access_token: str, item: Dict[str, Any], parent_id: str, is_order: bool = False) -> Dict[str, Any]:
-        """Create a line item in HubSpot and associate it with an order or deal"""
+    def _create_hubspot_line_items(self, access_token: str, items: List[Dict[str, Any]], parent_id: str, is_order: bool = False) -> Dict[str, Any]:
+        """Create line items in HubSpot with the batch API, each associated with an order or deal"""
         try:
-            item_name = item.get("name", "")
-            item_quantity = item.get("quantity", 1)
-            item_notes = item.get("notes", "")
-            item_price = item.get("price", 0)
-            
             parent_type = "order" if is_order else "deal"
-            logger.info(f"Creating HubSpot line item for {parent_type}: {item_quantity} x {item_name}")
+            association = "line_item_to_order" if is_order else "line_item_to_deal"
+            logger.info(f"Creating {len(items)} HubSpot line item(s) for {parent_type} {parent_id}")
             
-            # API endpoint for creating line items
-            url = "https://api.hubapi.com/crm/v3/objects/line_items"
+            # API endpoint for creating line items in bulk
+            url = "https://api.hubapi.com/crm/v3/objects/line_items/batch/create"
             
             # Headers
             headers = {
@@ -1308,56 +1437,46 @@ class LoggerAgent:
                 "Content-Type": "application/json"
             }
             
-            # Prepare line item properties
-            properties = {
-                "name": f"{item_quantity} x {item_name}",
-                "quantity": str(item_quantity),
-                "price": str(item_price),
-                "description": item_notes if item_notes else f"{item_quantity} x {item_name}"
-            }
-            
-            # Request body
-            body = {
-                "properties": properties
-            }
+            # One input per item, each carrying its association to the parent
+            inputs = []
+            for item in items:
+                item_name = item.get("name", "")
+                item_quantity = item.get("quantity", 1)
+                item_notes = item.get("notes", "")
+                item_price = item.get("price", 0)
+                inputs.append({
+                    "properties": {
+                        "name": f"{item_quantity} x {item_name}",
+                        "quantity": str(item_quantity),
+                        "price": str(item_price),
+                        "description": item_notes if item_notes else f"{item_quantity} x {item_name}"
+                    },
+                    "associations": [hubspot_association(parent_id, association)]
+                })
+            
+            line_item_ids = []
+            errors = []
+            for i in range(0, len(inputs), HUBSPOT_BATCH_LIMIT):
+                response = http_client.post(url, headers=headers, json={"inputs": inputs[i:i + HUBSPOT_BATCH_LIMIT]})
+                
+                # 201 when every input succeeded, 207 when some of them failed
+                if response.status_code in (200, 201, 207):
+                    response_data = response.json()
+                    line_item_ids.extend(result.get("id") for result in response_data.get("results", []))
+                    errors.extend(response_data.get("errors", []))
+                else:
+                    errors.append(f"{response.status_code} - {response.text}")
             
-            # Make the request to create the line item
-            response = requests.post(url, headers=headers, json=body)
+            if errors:
+                logger.error(f"Failed to create some line items for {parent_type} {parent_id}: {errors}")
+            logger.info(f"Created line items in HubSpot: {line_item_ids}")
             
-            # Check response
-            if response.status_code == 201:
-                line_item_data = response.json()
-                line_item_id = line_item_data.get("id")
-                logger.info(f"Created line item in HubSpot: {line_item_id}")
-                
-                # Now associate the line item with the parent (order or deal)
-                try:
-                    # API endpoint for line item associations - different based on parent type
-                    if is_order:
-                        assoc_url = f"https://api.hubapi.com/crm/v3/objects/line_items/{line_item_id}/associations/order/{parent_id}/line_item_to_order"
-                    else:
-                        assoc_url = f"https://api.hubapi.com/crm/v3/objects/line_items/{line_item_id}/associations/deals/{parent_id}/line_item_to_deal"
-                    
-                    # Make the request to associate line item with parent
-                    assoc_response = requests.put(assoc_url, headers=headers)
-                    
-                    # Check association response
-                    if assoc_response.status_code == 200 or assoc_response.status_code == 201:
-                        logger.info(f"Successfully associated line item {line_item_id} with {parent_type} {parent_id}")
-                    else:
-                        assoc_error = f"Failed to associate line item with {parent_type}: {assoc_response.status_code} - {assoc_response.text}"
-                        logger.error(assoc_error)
-                except Exception as assoc_e:
-                    logger.error(f"Error associating line item with {parent_type}: {str(assoc_e)}")
-                
-                return {"status": "success", "message": "Line item created in HubSpot", "line_item_id": line_item_id}
-            else:
-                error_message = f"Failed to create line item in HubSpot: {response.status_code} - {response.text}"
-                logger.error(error_message)
-                return {"status": "error", "message": error_message}
+            if not line_item_ids and errors:
+                return {"status": "error", "message": f"Failed to create line items in HubSpot: {errors}"}
+            return {"status": "success", "message": "Line items created in HubSpot", "line_item_ids": line_item_ids}
                 
         except Exception as e:
-            error_message = f"Error creating HubSpot line item: {str(e)}"
+            error_message = f"Error creating HubSpot line items: {str(e)}"
             logger.error(error_message)
             return {"status": "error", "message": error_message}
     
@@ -1382,36 +1501,20 @@ class LoggerAgent:
                 "hs_timestamp": int(time.time() * 1000)  # Current time in milliseconds
             }
             
-            # Create the note
+            # Create the note, associated with the contact in the same call
             note_body = {
-                "properties": note_properties
+                "properties": note_properties,
+                "associations": [hubspot_association(contact_id, "note_to_contact")]
             }
             
             # Make the request to create the note
-            note_response = requests.post(url, headers=headers, json=note_body)
+            note_response = http_client.post(url, headers=headers, json=note_body)
             
             # Check response
             if note_response.status_code == 201:
                 note_data = note_response.json()
                 note_id = note_data.get("id")
-                logger.info(f"Created note in HubSpot: {note_id}")
-                
-                # Now associate the note with the contact
-                try:
-                    # API endpoint for note associations
-                    assoc_url = f"https://api.hubapi.com/crm/v3/objects/notes/{note_id}/associations/contacts/{contact_id}/note_to_contact"
-                    
-                    # Make the request to associate note with contact
-                    assoc_response = requests.put(assoc_url, headers=headers)
-                    
-                    # Check association response
-                    if assoc_response.status_code == 200 or assoc_response.status_code == 201:
-                        logger.info(f"Successfully associated note {note_id} with contact {contact_id}")
-                    else:
-                        assoc_error = f"Failed to associate note with contact: {assoc_response.status_code} - {assoc_response.text}"
-                        logger.error(assoc_error)
-                except Exception as assoc_e:
-                    logger.error(f"Error associating note with contact: {str(assoc_e)}")
+                logger.info(f"Created note in HubSpot: {note_id} (associated with contact {contact_id})")
                 
                 # Create an engagement for the order (this will show up in the timeline)
                 try:
@@ -1434,7 +1537,7 @@ class LoggerAgent:
                     }
                     
                     # Make the request to create the engagement
-                    engagement_response = requests.post(engagement_url, headers=headers, json=engagement_body)
+                    engagement_response = http_client.post(engagement_url, headers=headers, json=engagement_body)
                     
                     # Check engagement response
                     if engagement_response.status_code == 200:
@@ -1538,12 +1641,12 @@ class LoggerAgent:
             print(f"LOGGER AGENT: 🆔 Final order_number: '{order_number}'")
             
             # Generate a unique order number if not provided and not adding to existing order
+            generated_number = False
             if not order_number and not is_addition:
                 print("LOGGER AGENT: 🆕 Generating new order number (not an addition)")
                 # Create a timestamp-based order ID with customer prefix
-                customer_prefix = data.get("customer_id", "")[:4]
-                timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                order_number = f"ORD-{customer_prefix}-{timestamp}"
+                order_number = self._new_order_number(data.get("customer_id", ""))
+                generated_number = True
                 print(f"LOGGER AGENT: 🆕 Generated new order number: '{order_number}'")
                 logger.info(f"Generated new order number: {order_number}")
             elif not order_number and is_addition:
@@ -1562,9 +1665,8 @@ class LoggerAgent:
                         # No existing order found, create a new one
                         print("LOGGER AGENT: ❌ No existing order found, will create new order instead")
                         is_addition = False
-                        customer_prefix = customer_id[:4]
-                        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                        order_number = f"ORD-{customer_prefix}-{timestamp}"
+                        order_number = self._new_order_number(customer_id)
+                        generated_number = True
                         print(f"LOGGER AGENT: 🆕 Generated new order number: '{order_number}'")
                         logger.info(f"No existing order found, generated new order number: {order_number}")
                 
@@ -1582,15 +1684,11 @@ class LoggerAgent:
                 order_status = "pending"  # Default to pending if invalid status
             print(f"LOGGER AGENT: 📌 Order status: '{order_status}'")
             
-            # Get interaction_id from the message_state if available
-            interaction_id = None
-            if hasattr(self, 'message_state') and self.message_state:
-                # If we have a stored interaction for this message, use its ID
-                interaction = self._get_interaction_by_message_id(self.message_state.message_id)
-                if interaction:
-                    interaction_id = interaction.interaction_id
-                    print(f"LOGGER AGENT: 🔗 Linking to interaction_id: {interaction_id}")
-                    logger.info(f"Linking order to interaction_id: {interaction_id}")
+            # Get interaction_id of the interaction stored for this message, if any
+            interaction_id = self._current_interaction_id()
+            if interaction_id:
+                print(f"LOGGER AGENT: 🔗 Linking to interaction_id: {interaction_id}")
+                logger.info(f"Linking order to interaction_id: {interaction_id}")
             
             # Find product information
             products = []
@@ -1642,159 +1740,114 @@ class LoggerAgent:
                     "unit": ""
                 }]
             
-            # Get existing order
+            # Load the existing lines of this order number in one query (a number generated just now has none)
             print(f"LOGGER AGENT: 🔍 Checking database for existing order with number '{order_number}'...")
-            existing_order = self.db.query(Order).filter(Order.order_number == order_number).first()
-            if existing_order and is_addition:
+            existing_lines = [] if generated_number else self.db.query(Order).filter(Order.order_number == order_number).all()
+            existing_order = existing_lines[0] if existing_lines else None
+            
+            # Build one row per product; they are inserted together below
+            existing_items = {line.item: line for line in existing_lines}
+            adding = existing_order is not None and is_addition
+            if adding and not any(line.order_status == "pending" for line in existing_lines):
+                # The order was confirmed or cancelled since it was reviewed; start a new one
+                order_number = self._new_order_number(data.get("customer_id", ""))
+                print(f"LOGGER AGENT: ⚠️ Order is no longer pending, starting new order '{order_number}'")
+                logger.info(f"Order {existing_order.order_number} is no longer pending, creating new order {order_number}")
+                existing_lines, existing_items, existing_order, adding = [], {}, None, False
+            if adding:
                 print(f"LOGGER AGENT: ✅ FOUND existing order with ID {existing_order.order_id} for order number '{order_number}'")
-                print(f"LOGGER AGENT: 💾 This is an addition (is_addition={is_addition}), will add products to this order")
                 logger.info(f"Found existing order {existing_order.order_id} for order number {order_number}")
-                created_orders = []
-                
-                # Add products to existing order
-                print(f"LOGGER AGENT: 💾 Processing {len(products)} products to add to existing order...")
-                for i, product in enumerate(products):
-                    print(f"\nLOGGER AGENT: 📦 Processing product {i+1}/{len(products)}")
-                    # Extract values with detailed logging
-                    item = product.get("item", "")
-                    print(f"LOGGER AGENT: 💾 Item: '{item}'")
-                    logger.info(f"Extracted item: {item}")
-                    
-                    quantity = product.get("quantity", 1)
-                    print(f"LOGGER AGENT: 💾 Quantity: {quantity}")
-                    logger.info(f"Extracted quantity: {quantity}")
-                    
-                    unit = product.get("unit", "")
-                    print(f"LOGGER AGENT: 💾 Unit: '{unit}'")
-                    logger.info(f"Extracted unit: {unit}")
-                    
-                    # Check for details or notes
-                    notes = product.get("details", product.get("notes", ""))
-                    print(f"LOGGER AGENT: 💾 Notes: '{notes}'")
-                    logger.info(f"Extracted notes: {notes}")
-                    
-                    # Skip if this product is already in the order
-                    print(f"LOGGER AGENT: 🔍 Checking if product '{item}' already exists in order '{order_number}'...")
-                    existing_product = self.db.query(Order).filter(
-                        Order.order_number == order_number,
-                        Order.item == item
-                    ).first()
-                    
-                    if existing_product:
-                        print(f"LOGGER AGENT: ✅ FOUND existing product '{item}' in order '{order_number}'")
-                        print(f"LOGGER AGENT: 🔄 Current quantity: {existing_product.quantity}, New quantity in message: {quantity}")
-                        logger.info(f"Product {item} already exists in order {order_number}, keeping original quantity")
-                        # Keep the original quantity instead of adding to it
-                        print(f"LOGGER AGENT: ℹ️ Keeping original quantity of {existing_product.quantity} (not increasing)")
-                        self.db.commit()
-                        self.db.refresh(existing_product)
-                        created_orders.append(existing_product)
-                        print(f"LOGGER AGENT: ✅ Successfully updated existing product in order")
-                        continue
-                    else:
-                        print(f"LOGGER AGENT: 🆕 Product '{item}' does not exist in order '{order_number}', creating new entry")
-                    
-                    # Create new order entry with the same order number
-                    print(f"LOGGER AGENT: 🆕 Creating new order entry for product '{item}' with order number '{order_number}'")
-                    order = Order(
-                        user_id=user_id,
-                        customer_id=data.get("customer_id"),
-                        interaction_id=interaction_id,
-                        order_number=order_number,  # Same order number for all products
-                        item=item,
-                        quantity=quantity,
-                        unit=unit,
-                        notes=notes,
-                        order_status=order_status,
-                        total_amount=data.get("total_amount", "0"),
-                        # Add delivery information
-                        delivery_address=data.get("delivery_address"),
-                        # Process delivery time from data or extracted_info
-                        delivery_time=self._process_delivery_time(data),
-                        delivery_method=data.get("delivery_method")
-                    )
-                    
-                    print(f"LOGGER AGENT: 💾 Adding new product to database...")
-                    self.db.add(order)
-                    self.db.commit()
-                    self.db.refresh(order)
-                    created_orders.append(order)
-                    print(f"LOGGER AGENT: ✅ Successfully added product '{item}' to existing order '{order_number}'")
-                    print(f"LOGGER AGENT: 🆔 New order entry ID: {order.order_id}")
-                    logger.info(f"Added product {item} to existing order {order_number}")
-                
-                # Return all created/updated orders
-                return created_orders if created_orders else [existing_order]
-                
-            # If not adding to an existing order or no existing order found, create a new one
-            print(f"LOGGER AGENT: 🆕 Creating NEW order with order number '{order_number}'")
-            print(f"LOGGER AGENT: 💾 is_addition flag is {is_addition}, existing_order found: {existing_order is not None}")
-            logger.info(f"Creating new order with order number {order_number}")
-            created_orders = []
-            
-            # Process each product for the new order
-            print(f"LOGGER AGENT: 💾 Processing {len(products)} products for new order...")
+            else:
+                print(f"LOGGER AGENT: 🆕 Creating NEW order with order number '{order_number}'")
+                print(f"LOGGER AGENT: 💾 is_addition flag is {is_addition}, existing_order found: {existing_order is not None}")
+                logger.info(f"Creating new order with order number {order_number}")
+            
+            delivery_time = self._process_delivery_time(data)
+            kept_orders = []
+            rows = []
+            print(f"LOGGER AGENT: 💾 Processing {len(products)} products...")
             for i, product in enumerate(products):
-                print(f"\nLOGGER AGENT: 📦 Processing product {i+1}/{len(products)} for NEW order")
-                # Extract values with detailed logging
                 item = product.get("item", "")
-                print(f"LOGGER AGENT: 💾 Item: '{item}'")
-                logger.info(f"New order - extracted item: {item}")
-                
                 quantity = product.get("quantity", 1)
-                print(f"LOGGER AGENT: 💾 Quantity: {quantity}")
-                logger.info(f"New order - extracted quantity: {quantity}")
-                
                 unit = product.get("unit", "")
-                print(f"LOGGER AGENT: 💾 Unit: '{unit}'")
-                logger.info(f"New order - extracted unit: {unit}")
-                
                 # Check for details or notes
                 notes = product.get("details", product.get("notes", ""))
-                print(f"LOGGER AGENT: 💾 Notes: '{notes}'")
-                logger.info(f"New order - extracted notes: {notes}")
+                print(f"LOGGER AGENT: 📦 Product {i+1}/{len(products)}: '{item}' (qty: {quantity}, unit: '{unit}', notes: '{notes}')")
                 
-                # Create order with delivery information
-                print(f"LOGGER AGENT: 🆕 Creating new Order entry in database with order_number='{order_number}'")
-                order = Order(
-                    user_id=user_id,
-                    customer_id=data.get("customer_id"),
-                    interaction_id=interaction_id,
-                    order_number=order_number,  # Same order number for all products
-                    item=item,
-                    quantity=quantity,
-                    unit=unit,
-                    notes=notes,
-                    order_status=order_status,
-                    total_amount=data.get("total_amount", "0"),
-                    # Add delivery information
-                    delivery_address=data.get("delivery_address"),
-                    # Process delivery time from data or extracted_info
-                    delivery_time=self._process_delivery_time(data),
-                    delivery_method=data.get("delivery_method")
-                )
+                # Skip if this product is already in the order, keeping the original quantity
+                if adding and item in existing_items:
+                    print(f"LOGGER AGENT: ℹ️ Product '{item}' already in order '{order_number}', keeping original quantity of {existing_items[item].quantity}")
+                    logger.info(f"Product {item} already exists in order {order_number}, keeping original quantity")
+                    kept_orders.append(existing_items[item])
+                    continue
                 
-                print(f"LOGGER AGENT: 💾 Adding new order to database...")
-                self.db.add(order)
-                self.db.commit()
-                self.db.refresh(order)
-                created_orders.append(order)
-                print(f"LOGGER AGENT: ✅ Successfully created new order entry with ID {order.order_id}")
-                print(f"LOGGER AGENT: 💾 Product '{item}' added with order number '{order_number}'")
-                logger.info(f"Created new order item {item} with order number {order_number}")
+                rows.append({
+                    "user_id": user_id,
+                    "customer_id": data.get("customer_id"),
+                    "interaction_id": interaction_id,
+                    "order_number": order_number,  # Same order number for all products
+                    "item": item,
+                    "quantity": quantity,
+                    "unit": unit,
+                    "notes": notes,
+                    "order_status": order_status,
+                    "total_amount": data.get("total_amount", "0"),
+                    # Add delivery information
+                    "delivery_address": data.get("delivery_address"),
+                    "delivery_time": delivery_time,
+                    "delivery_method": data.get("delivery_method"),
+                    "created_at": datetime.utcnow(),
+                    "updated_at": datetime.utcnow()
+                })
+            
+            # Whether a new order comes from a customer who ordered before (for the repeat-order rollup)
+            repeat_customer = bool(rows) and not adding and existing_order is None and self.db.query(
+                self.db.query(Order.order_id).filter(Order.customer_id == data.get("customer_id")).exists()
+            ).scalar()
+            
+            # One multi-row INSERT .. RETURNING for all new lines
+            created_orders = list(self.db.scalars(insert(Order).returning(Order), rows).all()) if rows else []
+            if created_orders:
+                # The newest line is what the next review reads as the customer's most recent order
+                self.pending_order_updates.append(PendingOrder.from_order(created_orders[-1]))
+            if adding:
+                self._rollup(user_id, existing_order.created_at,
+                             rollups.order_increments(created_orders, new_order=False))
+            else:
+                self._rollup(user_id, datetime.utcnow(),
+                             rollups.order_increments(created_orders, new_order=existing_order is None,
+                                                      repeat=repeat_customer))
             
+            created_orders = kept_orders + created_orders
             print(f"LOGGER AGENT: 🔧 Returning {len(created_orders)} order entries")
             for i, order in enumerate(created_orders):
                 print(f"LOGGER AGENT: 💾 Order {i+1}: ID={order.order_id}, Number='{order.order_number}', Item='{order.item}', Qty={order.quantity}")
+                logger.info(f"Stored order item {order.item} with order number {order_number}")
+            
+            # Return all created/updated orders
+            if adding and not created_orders:
+                return [existing_order]
             return created_orders
             
         except Exception as e:
             logger.error(f"Error storing order: {str(e)}")
-            return []
+            raise
             
-    def _check_existing_order(self, customer_id: str) -> Optional[Order]:
+    def _new_order_number(self, customer_id: str) -> str:
+        """ORD-<customer prefix>-<timestamp>-<random suffix>; the suffix keeps customers who
+        share a prefix and order in the same second from getting the same number"""
+        customer_prefix = (customer_id or "")[:4]
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        return f"ORD-{customer_prefix}-{timestamp}-{secrets.token_hex(2).upper()}"
+
+    def _check_existing_order(self, customer_id: str) -> Optional[Union[Order, PendingOrder]]:
         """Check if there's a pending order for this customer"""
         try:
+            known, pending_order = pending_order_index.get(customer_id)
+            if known and pending_order:
+                logger.info(f"Found pending order {pending_order.order_number} for customer {customer_id} in the index")
+                return pending_order
+            
             # Get the most recent pending order for this customer
             most_recent_order = (
                 self.db.query(Order)
@@ -1813,12 +1866,7 @@ class LoggerAgent:
                 
         except Exception as e:
             logger.error(f"Error checking existing order: {str(e)}")
-            logger.error(error_msg)
-            user_id = None
-            if self.user_settings:
-                user_id = self.user_settings.user_id
-            self._log_error("Database Error", error_msg, user_id)
-            return []  # Return empty list instead of None
+            raise
             
     def _store_issue(self, data: Dict[str, Any]) -> Optional[Issue]:
         """Store issue data in the issues table"""
@@ -1846,15 +1894,15 @@ class LoggerAgent:
             
             # Try to get order_id from interaction if available
             order_id = data.get("order_id")
-            if not order_id and hasattr(self, 'message_state') and self.message_state:
-                # Get interaction for this message
-                interaction = self._get_interaction_by_message_id(self.message_state.message_id)
-                if interaction:
+            # (an interaction inserted by this unit of work has no orders yet)
+            if not order_id and not getattr(self, 'interaction_is_new', False):
+                interaction_id = self._current_interaction_id()
+                if interaction_id:
                     # Check if there's an order linked to this interaction
-                    order = self.db.query(Order).filter(Order.interaction_id == interaction.interaction_id).first()
+                    order = self.db.query(Order).filter(Order.interaction_id == interaction_id).first()
                     if order:
                         order_id = order.order_id
-                        logger.info(f"Found order_id {order_id} from interaction_id {interaction.interaction_id}")
+                        logger.info(f"Found order_id {order_id} from interaction_id {interaction_id}")
             
             # Try different status values that might be valid based on common patterns
             issue = Issue(
@@ -1869,18 +1917,13 @@ class LoggerAgent:
             )
             
             self.db.add(issue)
-            self.db.commit()
+            self.db.flush()
+            self._rollup(user_id, datetime.utcnow(), rollups.issue_increments(issue.status))
             logger.info(f"Stored issue for customer {data.get('customer_id')}")
             return issue
         except Exception as e:
-            self.db.rollback()
-            error_msg = f"Error storing issue: {str(e)}"
-            logger.error(error_msg)
-            user_id = None
-            if self.user_settings:
-                user_id = self.user_settings.user_id
-            self._log_error("Database Error", error_msg, user_id)
-            return None
+            logger.error(f"Error storing issue: {str(e)}")
+            raise
             
     def _store_enquiry(self, data: Dict[str, Any]) -> Optional[Enquiry]:
         """Store enquiry data in the enquiries table"""
@@ -1924,18 +1967,13 @@ class LoggerAgent:
             )
             
             self.db.add(enquiry)
-            self.db.commit()
+            self.db.flush()
+            self._rollup(user_id, datetime.utcnow(), rollups.enquiry_increments(enquiry.status))
             logger.info(f"Stored enquiry for customer {data.get('customer_id')}")
             return enquiry
         except Exception as e:
-            self.db.rollback()
-            error_msg = f"Error storing enquiry: {str(e)}"
-            logger.error(error_msg)
-            user_id = None
-            if self.user_settings:
-                user_id = self.user_settings.user_id
-            self._log_error("Database Error", error_msg, user_id)
-            return None
+            logger.error(f"Error storing enquiry: {str(e)}")
+            raise
             
     def _store_feedback(self, data: Dict[str, Any]) -> Optional[Feedback]:
         """Store feedback data in the feedback table"""
@@ -1956,15 +1994,15 @@ class LoggerAgent:
             
             # Try to get order_id from interaction if available
             order_id = data.get("order_id")
-            if not order_id and hasattr(self, 'message_state') and self.message_state:
-                # Get interaction for this message
-                interaction = self._get_interaction_by_message_id(self.message_state.message_id)
-                if interaction:
+            # (an interaction inserted by this unit of work has no orders yet)
+            if not order_id and not getattr(self, 'interaction_is_new', False):
+                interaction_id = self._current_interaction_id()
+                if interaction_id:
                     # Check if there's an order linked to this interaction
-                    order = self.db.query(Order).filter(Order.interaction_id == interaction.interaction_id).first()
+                    order = self.db.query(Order).filter(Order.interaction_id == interaction_id).first()
                     if order:
                         order_id = order.order_id
-                        logger.info(f"Found order_id {order_id} from interaction_id {interaction.interaction_id}")
+                        logger.info(f"Found order_id {order_id} from interaction_id {interaction_id}")
                 
             feedback = Feedback(
                 user_id=user_id,
@@ -1975,18 +2013,12 @@ class LoggerAgent:
             )
             
             self.db.add(feedback)
-            self.db.commit()
+            self.db.flush()
             logger.info(f"Stored feedback for customer {data.get('customer_id')}")
             return feedback
         except Exception as e:
-            self.db.rollback()
-            error_msg = f"Error storing feedback: {str(e)}"
-            logger.error(error_msg)
-            user_id = None
-            if self.user_settings:
-                user_id = self.user_settings.user_id
-            self._log_error("Database Error", error_msg, user_id)
-            return None
+            logger.error(f"Error storing feedback: {str(e)}")
+            raise
             
     # This was a duplicate method that has been removed
             
@@ -2081,7 +2113,7 @@ class LoggerAgent:
                 "Content-Type": "application/json"
             }
             
-            response = requests.get(url, headers=headers)
+            response = http_client.get(url, headers=headers)
             
             if response.status_code == 200:
                 account_info = response.json()
@@ -2124,6 +2156,29 @@ class LoggerAgent:
                 else:
                     contact_properties["firstname"] = customer_name
             
+            headers = {
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json"
+            }
+            
+            # A contact we already resolved for this portal is patched directly, or skipped if nothing changed
+            fingerprint = properties_fingerprint(contact_properties)
+            cached_id, cached_fingerprint = hubspot_cache.contact(access_token, customer_id)
+            if cached_id:
+                if cached_fingerprint == fingerprint:
+                    return {"status": "success", "contact_id": cached_id, "action": "unchanged"}
+                update_response = http_client.patch(
+                    f"https://api.hubapi.com/crm/v3/objects/contacts/{cached_id}",
+                    headers=headers, json={"properties": contact_properties}
+                )
+                if update_response.status_code == 200:
+                    hubspot_cache.set_contact(access_token, customer_id, cached_id, fingerprint)
+                    logger.info(f"Updated HubSpot contact: {cached_id}")
+                    return {"status": "success", "contact_id": cached_id, "action": "updated"}
+                # Deleted or merged since we cached it: look it up again
+                logger.info(f"Cached HubSpot contact {cached_id} returned {update_response.status_code}, searching again")
+                hubspot_cache.forget_contact(access_token, customer_id)
+            
             # Check if contact exists
             search_url = "https://api.hubapi.com/crm/v3/objects/contacts/search"
             search_payload = {
@@ -2140,12 +2195,7 @@ class LoggerAgent:
                 ]
             }
             
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(search_url, headers=headers, json=search_payload)
+            response = http_client.post(search_url, headers=headers, json=search_payload, idempotent=True)
             
             if response.status_code == 200:
                 results = response.json().get("results", [])
@@ -2159,9 +2209,10 @@ class LoggerAgent:
                         "properties": contact_properties
                     }
                     
-                    update_response = requests.patch(update_url, headers=headers, json=update_payload)
+                    update_response = http_client.patch(update_url, headers=headers, json=update_payload)
                     
                     if update_response.status_code == 200:
+                        hubspot_cache.set_contact(access_token, customer_id, contact_id, fingerprint)
                         logger.info(f"Updated HubSpot contact: {contact_id}")
                         return {"status": "success", "contact_id": contact_id, "action": "updated"}
                     else:
@@ -2182,10 +2233,11 @@ class LoggerAgent:
                         "properties": contact_properties
                     }
                     
-                    create_response = requests.post(create_url, headers=headers, json=create_payload)
+                    create_response = http_client.post(create_url, headers=headers, json=create_payload)
                     
                     if create_response.status_code == 201:
                         contact_id = create_response.json().get('id')
+                        hubspot_cache.set_contact(access_token, customer_id, contact_id, fingerprint)
                         logger.info(f"Created new HubSpot contact: {contact_id}")
                         
                         # Optionally create a note with WhatsApp info
@@ -2235,7 +2287,8 @@ class LoggerAgent:
             }
             
             note_payload = {
-                "properties": note_properties
+                "properties": note_properties,
+                "associations": [hubspot_association(contact_id, "note_to_contact")]
             }
             
             headers = {
@@ -2243,29 +2296,12 @@ class LoggerAgent:
                 "Content-Type": "application/json"
             }
             
-            note_response = requests.post(note_url, headers=headers, json=note_payload)
+            note_response = http_client.post(note_url, headers=headers, json=note_payload)
             
             if note_response.status_code == 201:
                 note_id = note_response.json().get("id")
-                logger.info(f"Created HubSpot note: {note_id}")
-                
-                # Associate note with contact
-                association_url = f"https://api.hubapi.com/crm/v3/objects/notes/{note_id}/associations/contacts/{contact_id}/note_to_contact"
-                association_response = requests.put(association_url, headers=headers)
-                
-                if association_response.status_code == 200:
-                    logger.info(f"Associated note {note_id} with contact {contact_id}")
-                    return {"status": "success", "note_id": note_id, "contact_id": contact_id}
-                else:
-                    error_message = f"Failed to associate note with contact: {association_response.status_code}"
-                    try:
-                        error_details = association_response.json()
-                        error_message = f"{error_message} - {error_details.get('message', '')}"
-                    except:
-                        error_message = f"{error_message} - {association_response.text}"
-                    
-                    logger.error(error_message)
-                    return {"status": "error", "message": error_message}
+                logger.info(f"Created HubSpot note {note_id} for contact {contact_id}")
+                return {"status": "success", "note_id": note_id, "contact_id": contact_id}
             else:
                 error_message = f"Failed to create HubSpot note: {note_response.status_code}"
                 try:
@@ -2287,95 +2323,49 @@ class LoggerAgent:
         try:
             customer_id = message.get("customer_id", message.get("sender"))
             
-            # First, find the contact ID
-            search_url = "https://api.hubapi.com/crm/v3/objects/contacts/search"
-            search_payload = {
-                "filterGroups": [
-                    {
-                        "filters": [
-                            {
-                                "propertyName": "phone",
-                                "operator": "EQ",
-                                "value": customer_id
-                            }
-                        ]
-                    }
-                ]
-            }
+            # First, find the contact ID (usually cached by the contact upsert that ran just before)
+            contact_id = self._get_hubspot_contact_id(access_token, customer_id)
+            
+            if not contact_id:
+                error_message = f"Contact not found for customer ID: {customer_id}"
+                logger.error(error_message)
+                return {"status": "error", "message": error_message}
             
             headers = {
                 "Authorization": f"Bearer {access_token}",
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(search_url, headers=headers, json=search_payload)
+            # Create ticket
+            ticket_url = "https://api.hubapi.com/crm/v3/objects/tickets"
             
-            if response.status_code == 200:
-                results = response.json().get("results", [])
-                
-                if results:
-                    contact_id = results[0]["id"]
-                    
-                    # Create ticket
-                    ticket_url = "https://api.hubapi.com/crm/v3/objects/tickets"
-                    
-                    # Prepare ticket properties
-                    ticket_properties = {
-                        "subject": f"High Priority: {message.get('predicted_category', 'WhatsApp Message')}",
-                        "content": message.get("message", ""),
-                        "hs_pipeline": "0",  # Default pipeline
-                        "hs_pipeline_stage": "1"  # New stage
-                    }
-                    
-                    ticket_payload = {
-                        "properties": ticket_properties
-                    }
-                    
-                    # Create the ticket
-                    ticket_response = requests.post(ticket_url, headers=headers, json=ticket_payload)
-                    
-                    if ticket_response.status_code == 201:
-                        ticket_id = ticket_response.json().get("id")
-                        logger.info(f"Created HubSpot ticket: {ticket_id}")
-                        
-                        # Associate ticket with contact
-                        association_url = f"https://api.hubapi.com/crm/v3/objects/tickets/{ticket_id}/associations/contacts/{contact_id}/ticket_to_contact"
-                        association_response = requests.put(association_url, headers=headers)
-                        
-                        if association_response.status_code == 200:
-                            logger.info(f"Associated ticket {ticket_id} with contact {contact_id}")
-                            return {"status": "success", "ticket_id": ticket_id, "contact_id": contact_id}
-                        else:
-                            error_message = f"Failed to associate ticket with contact: {association_response.status_code}"
-                            try:
-                                error_details = association_response.json()
-                                error_message = f"{error_message} - {error_details.get('message', '')}"
-                            except:
-                                error_message = f"{error_message} - {association_response.text}"
-                            
-                            logger.error(error_message)
-                            return {"status": "error", "message": error_message}
-                    else:
-                        error_message = f"Failed to create HubSpot ticket: {ticket_response.status_code}"
-                        try:
-                            error_details = ticket_response.json()
-                            error_message = f"{error_message} - {error_details.get('message', '')}"
-                        except:
-                            error_message = f"{error_message} - {ticket_response.text}"
-                        
-                        logger.error(error_message)
-                        return {"status": "error", "message": error_message}
-                else:
-                    error_message = f"Contact not found for customer ID: {customer_id}"
-                    logger.error(error_message)
-                    return {"status": "error", "message": error_message}
+            # Prepare ticket properties
+            ticket_properties = {
+                "subject": f"High Priority: {message.get('predicted_category', 'WhatsApp Message')}",
+                "content": message.get("message", ""),
+                "hs_pipeline": "0",  # Default pipeline
+                "hs_pipeline_stage": "1"  # New stage
+            }
+            
+            ticket_payload = {
+                "properties": ticket_properties,
+                "associations": [hubspot_association(contact_id, "ticket_to_contact")]
+            }
+            
+            # Create the ticket, associated with the contact in the same call
+            ticket_response = http_client.post(ticket_url, headers=headers, json=ticket_payload)
+            
+            if ticket_response.status_code == 201:
+                ticket_id = ticket_response.json().get("id")
+                logger.info(f"Created HubSpot ticket {ticket_id} for contact {contact_id}")
+                return {"status": "success", "ticket_id": ticket_id, "contact_id": contact_id}
             else:
-                error_message = f"Failed to search HubSpot contacts: {response.status_code}"
+                error_message = f"Failed to create HubSpot ticket: {ticket_response.status_code}"
                 try:
-                    error_details = response.json()
+                    error_details = ticket_response.json()
                     error_message = f"{error_message} - {error_details.get('message', '')}"
                 except:
-                    error_message = f"{error_message} - {response.text}"
+                    error_message = f"{error_message} - {ticket_response.text}"
                 
                 logger.error(error_message)
                 return {"status": "error", "message": error_message}
@@ -2387,25 +2377,63 @@ class LoggerAgent:
 
 # Static method to get user_id from business_phone_id
 def get_user_id_from_business_phone_id(business_phone_id: str) -> Optional[int]:
-    """Get the user_id associated with a business_phone_id"""
+    """Get the user_id associated with a business_phone_id (served from the tenant registry)"""
     try:
-        # Create a new database session
-        db = SessionLocal()
-        
-        # Query the UserSettings table to find a user with the matching whatsapp_phone_number_id
-        user_settings = db.query(UserSettings).filter(UserSettings.whatsapp_phone_number_id == business_phone_id).first()
-        
-        if user_settings:
-            logger.info(f"Found user_id {user_settings.user_id} for business_phone_id {business_phone_id}")
-            return user_settings.user_id
-        else:
-            logger.warning(f"No user found for business_phone_id {business_phone_id}")
-            return None
+        return tenant_registry.get_user_id(business_phone_id)
     except Exception as e:
         logger.error(f"Error getting user_id from business_phone_id: {str(e)}")
         return None
-    finally:
-        db.close()
+
+class LoggerAgentFactory:
+    """
+    Hands out LoggerAgents built from cached per-tenant configuration.
+
+    Settings, CRM flags and the decrypted HubSpot token are resolved once per
+    user and kept for LOGGER_CONFIG_TTL_SECONDS (or until invalidate); each
+    borrowed agent gets its own short-lived session from the pool, closed when
+    the with-block exits. Agents keep per-message state, so they are never
+    shared between messages.
+    """
+
+    def __init__(self, ttl_seconds: int = LOGGER_CONFIG_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._configs: Dict[str, LoggerAgentConfig] = {}
+
+    @contextmanager
+    def borrow(self, user_id):
+        key = str(user_id)
+        config = self._cached(key)
+        db = SessionLocal()
+        try:
+            agent = LoggerAgent(key, config=config, db=db)
+            if config is None and agent.config.user_settings is not None:
+                with self._lock:
+                    self._configs[key] = agent.config
+            yield agent
+        finally:
+            db.close()
+
+    def invalidate(self, user_id=None):
+        """Drop the cached config for one user (by id or clerk_id), or for everyone"""
+        with self._lock:
+            if user_id is None:
+                self._configs.clear()
+                return
+            for key, config in list(self._configs.items()):
+                settings_user_id = config.user_settings.user_id if config.user_settings else None
+                if key == str(user_id) or settings_user_id == user_id:
+                    del self._configs[key]
+
+    def _cached(self, key: str) -> Optional[LoggerAgentConfig]:
+        with self._lock:
+            config = self._configs.get(key)
+            if config is None:
+                return None
+            if time.time() - config.loaded_at > self.ttl_seconds:
+                del self._configs[key]
+                return None
+            return config
 
 # Function to handle incoming messages
 def process_whatsapp_messages(user_id: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -2418,10 +2446,13 @@ def process_whatsapp_messages(user_id: str, messages: List[Dict[str, Any]]) -> D
         if not user_id:
             return {"status": "error", "message": f"No user found for business_phone_id {business_phone_id}"}
     
-    agent = LoggerAgent(user_id)
-    result = agent.process_messages(messages)
+    with logger_agents.borrow(user_id) as agent:
+        result = agent.process_messages(messages)
     return result
 
+# instantiate
+logger_agents = LoggerAgentFactory()
+
 # Example usage (for testing)
 if __name__ == "__main__":
     # Use the exact message structure provided by the user
@@ -0,0 +1,250 @@
+# app/agents/preclassifier_agent.py
+
+"""
+Local pre-classifier that answers trivial messages without calling Gemini.
+
+Two stages, cheapest first:
+1. Anchored regex rules for messages that are nothing but a greeting, a
+   thank-you or an order-status question.
+2. A small multinomial Naive Bayes model over word and character n-grams,
+   trained at startup from seed examples plus the LLM-labelled history in
+   data/messages.json.
+
+Only greetings, feedback and order_status predictions are ever returned, and
+model predictions must clear PRECLASSIFIER_THRESHOLD; everything else falls
+through to the LLM.
+"""
+
+import os
+import re
+import json
+import math
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from app.utils.category_map import DEFAULT_CATEGORIES, DEFAULT_PRIORITY_MAP
+from app.utils.metrics import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+PRECLASSIFIER_ENABLED = os.getenv("PRECLASSIFIER_ENABLED", "true").lower() == "true"
+PRECLASSIFIER_THRESHOLD = float(os.getenv("PRECLASSIFIER_THRESHOLD", "0.85"))
+PRECLASSIFIER_HISTORY_PATH = os.getenv("PRECLASSIFIER_HISTORY_PATH", "data/messages.json")
+
+# Categories the fast path may assign; anything else always goes to the LLM
+FAST_PATH_CATEGORIES = {"greetings", "feedback", "order_status"}
+
+# Longer messages usually carry details the LLM should extract
+MAX_MODEL_WORDS = 12
+
+# Words that signal a complaint, refund or change request; a model prediction is
+# never trusted when one of these is present
+ESCALATION_PATTERN = re.compile(
+    r"\b(damaged?|broken|wrong|missing|refund|return|cancel|late|rude|charged|stale|bad|worst|"
+    r"never|not|n't|change|update\s+my|address|complain\w*|problem|issue)\b",
+    re.IGNORECASE,
+)
+
+_GREETING = r"(hi+|hey+|hello+|hiya|yo|namaste|hola|bonjour|good\s+(morning|afternoon|evening)|how\s+are\s+(you|u)|wassup|what'?s\s+up|sup)"
+_THANKS = r"(thanks?|thank\s+(you|u)|thx|ty|many\s+thanks|thanks\s+a\s+lot|much\s+appreciated)"
+_ACK = r"(ok+|okay|k|sure|cool|great|noted|got\s+it|alright|perfect)"
+_FILLER = r"[\s!.,?🙂😊🙏👍❤️]*"
+
+RULES: List[Tuple[str, "re.Pattern"]] = [
+    ("greetings", re.compile(rf"^{_FILLER}{_GREETING}({_FILLER}(there|team|all|sir|madam))?{_FILLER}$", re.IGNORECASE)),
+    ("feedback", re.compile(rf"^{_FILLER}({_ACK}{_FILLER})?{_THANKS}({_FILLER}(so\s+much|again|team))?{_FILLER}$", re.IGNORECASE)),
+    ("greetings", re.compile(rf"^{_FILLER}{_ACK}{_FILLER}$", re.IGNORECASE)),
+    ("order_status", re.compile(
+        r"^\s*((hi|hello|hey)[\s,!]*)?"
+        r"(where\s+is\s+my\s+(order|parcel|package|delivery)"
+        r"|what'?s\s+the\s+status\s+of\s+my\s+order"
+        r"|(any\s+)?update\s+on\s+my\s+order"
+        r"|track(ing)?\s+my\s+order"
+        r"|order\s+status"
+        r"|has\s+my\s+order\s+(been\s+)?(shipped|dispatched))"
+        r"[\s?!.]*$",
+        re.IGNORECASE,
+    )),
+]
+
+# Seed examples covering the fast-path categories plus the ones they get confused with
+SEED_EXAMPLES: Dict[str, List[str]] = {
+    "greetings": [
+        "hi", "hello", "hey there", "good morning", "good evening", "hello team", "hi how are you",
+        "namaste", "hey what's up", "hello, anyone there?", "hiii", "wassup",
+    ],
+    "feedback": [
+        "thanks", "thank you so much", "the cake was delicious, thank you", "great service, loved it",
+        "really happy with the delivery", "amazing quality, will order again", "you guys are the best",
+        "the flowers were beautiful", "loved the packaging", "very happy with my purchase",
+        "excellent service as always", "the food was tasty",
+    ],
+    "order_status": [
+        "where is my order", "what's the status of my order", "has my order shipped",
+        "when will my order arrive", "any update on my delivery", "track my order please",
+        "is my order out for delivery", "how long until my parcel arrives", "my order hasn't arrived yet, any update?",
+        "can you check my order status", "¿Dónde está mi pedido?", "Où est ma commande ?",
+        "Wo ist meine Bestellung?", "मेरा ऑर्डर कहाँ है?", "Где мой заказ?",
+    ],
+    "new_order": [
+        "i want to order 2 chocolate cakes", "can i get 1 dozen cupcakes", "please send 3 kg of rice",
+        "hi need to place a new order", "i'd like to buy the red dress in size m", "order 5 notebooks for delivery tomorrow",
+        "can you deliver 2 boxes of sweets to 14 park street",
+    ],
+    "complaint": [
+        "my order arrived damaged", "the cake was stale", "i was charged twice", "the delivery was late and cold",
+        "worst service ever", "the item is broken",
+    ],
+    "return_refund": [
+        "i want to return this item", "i didn't receive my refund yet", "can i get a refund for my order",
+        "how do i return the yoga mat",
+    ],
+    "general_inquiry": [
+        "what are your opening hours", "do you have eggless cakes", "how much does the large pizza cost",
+        "do you deliver on sundays", "what payment methods do you accept",
+    ],
+    "follow_up": [
+        "any update on my complaint", "following up on my earlier message", "i haven't heard back about my issue",
+    ],
+}
+
+
+def _tokenize(text: str) -> List[str]:
+    """Word unigrams and bigrams plus character trigrams (covers unspaced scripts)"""
+    text = text.lower().strip()
+    words = re.findall(r"\w+", text)
+    tokens = [f"w:{w}" for w in words]
+    tokens += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    padded = f" {' '.join(words)} "
+    tokens += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return tokens
+
+
+class NaiveBayesTextModel:
+    """
+    Multinomial Naive Bayes with Laplace smoothing.
+
+    Overlapping n-grams make raw NB posteriors close to 1.0 for almost any
+    input, so the log-likelihood is scaled by temperature / sqrt(n_tokens)
+    before normalizing to keep the confidence threshold meaningful.
+    """
+
+    def __init__(self, alpha: float = 0.5, temperature: float = 0.5):
+        self.alpha = alpha
+        self.temperature = temperature
+        self.class_counts: Dict[str, int] = defaultdict(int)
+        self.token_counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.class_totals: Dict[str, int] = defaultdict(int)
+        self.vocabulary = set()
+
+    def fit(self, examples: List[Tuple[str, str]]):
+        for text, label in examples:
+            self.class_counts[label] += 1
+            for token in _tokenize(text):
+                self.token_counts[label][token] += 1
+                self.class_totals[label] += 1
+                self.vocabulary.add(token)
+        return self
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """Return (label, posterior probability)"""
+        if not self.class_counts:
+            return None, 0.0
+
+        tokens = [t for t in _tokenize(text) if t in self.vocabulary]
+        if not tokens:
+            return None, 0.0
+
+        total_docs = sum(self.class_counts.values())
+        vocab_size = len(self.vocabulary)
+        scale = self.temperature / math.sqrt(len(tokens))
+        scores = {}
+        for label, count in self.class_counts.items():
+            denominator = self.class_totals[label] + self.alpha * vocab_size
+            log_likelihood = sum(
+                math.log((self.token_counts[label][token] + self.alpha) / denominator) for token in tokens
+            )
+            scores[label] = math.log(count / total_docs) + scale * log_likelihood
+
+        best = max(scores, key=scores.get)
+        normalizer = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1.0 / normalizer
+
+
+class PreClassifierAgent:
+    """Rule and model based shortcut in front of GeminiLLMAgent"""
+
+    def __init__(self, threshold: float = PRECLASSIFIER_THRESHOLD, history_path: str = PRECLASSIFIER_HISTORY_PATH):
+        self.threshold = threshold
+        self.checked = 0
+        self.hits = 0
+        examples = [(text, label) for label, texts in SEED_EXAMPLES.items() for text in texts]
+        examples += self._load_history(history_path)
+        self.model = NaiveBayesTextModel().fit(examples)
+        logger.info(f"Pre-classifier trained on {len(examples)} examples")
+
+    def _load_history(self, history_path: str) -> List[Tuple[str, str]]:
+        """LLM-labelled messages saved by StorageAgent, if present"""
+        try:
+            with open(history_path, "r") as f:
+                history = json.load(f)
+        except Exception:
+            return []
+
+        examples = []
+        for item in history:
+            message = item.get("message")
+            category = item.get("predicted_category")
+            if message and category in DEFAULT_CATEGORIES:
+                examples.append((message, category))
+        return examples
+
+    def classify(self, message: str) -> Optional[Dict[str, str]]:
+        """
+        Return {"category", "priority", "source", "confidence"} when the message can
+        skip the LLM, or None when it needs full analysis.
+        """
+        self.checked += 1
+        metrics.incr("preclassifier.checked")
+        if not message or not message.strip():
+            return self._miss()
+
+        for category, pattern in RULES:
+            if pattern.match(message):
+                return self._hit(category, "rule", 1.0)
+
+        if len(message.split()) <= MAX_MODEL_WORDS and not ESCALATION_PATTERN.search(message):
+            category, confidence = self.model.predict(message)
+            if category in FAST_PATH_CATEGORIES and confidence >= self.threshold:
+                return self._hit(category, "model", confidence)
+
+        return self._miss()
+
+    def _hit(self, category: str, source: str, confidence: float) -> Dict[str, str]:
+        self.hits += 1
+        metrics.incr("preclassifier.hit")
+        metrics.incr(f"preclassifier.hit.{source}")
+        metrics.incr(f"preclassifier.category.{category}")
+        self._update_hit_rate()
+        return {
+            "category": category,
+            "priority": DEFAULT_PRIORITY_MAP.get(category, "low"),
+            "source": source,
+            "confidence": round(confidence, 3),
+        }
+
+    def _miss(self) -> None:
+        metrics.incr("preclassifier.miss")
+        self._update_hit_rate()
+        return None
+
+    def _update_hit_rate(self):
+        if self.checked:
+            metrics.set_gauge("preclassifier.hit_rate", round(self.hits / self.checked, 4))
+
+
+# instantiate
+preclassifier_agent = PreClassifierAgent()
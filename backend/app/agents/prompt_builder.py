@@ -0,0 +1,296 @@
+# app/agents/prompt_builder.py
+
+"""
+Prompt assembly for GeminiLLMAgent.
+
+Every classification request used to carry the full instructions, category
+list, priority map, extraction keys and two examples, followed by up to ten
+raw context messages. The prompt is now split in two:
+- the system instruction: the static rules, keys and one example
+  (SYSTEM_PREFIX) plus the compiled category/priority fragment. It is built
+  once per category set and sent as system_instruction, or, with
+  GEMINI_CONTEXT_CACHE_ENABLED, stored once as Gemini cached content and
+  referenced by name (Gemini only caches prefixes of at least
+  GEMINI_CONTEXT_CACHE_MIN_TOKENS tokens)
+- the user content: the message and as much of its context as fits in
+  PROMPT_CONTEXT_TOKEN_BUDGET, newest first, each context message capped at
+  PROMPT_CONTEXT_MESSAGE_MAX_TOKENS; older messages are replaced by a count
+
+Token counts are estimated locally, without a count_tokens round-trip, from a
+characters-per-token ratio that is calibrated against the prompt_token_count
+Gemini reports on each response. Prompt, cached and output tokens per call are
+published as llm.tokens.* metrics.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from google.genai import types
+from app.utils.category_map import DEFAULT_CATEGORIES, DEFAULT_PRIORITY_MAP, STANDARD_KEYS
+from app.utils.metrics import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+PROMPT_CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "300"))
+PROMPT_CONTEXT_MAX_MESSAGES = int(os.getenv("PROMPT_CONTEXT_MAX_MESSAGES", "10"))
+PROMPT_CONTEXT_MESSAGE_MAX_TOKENS = int(os.getenv("PROMPT_CONTEXT_MESSAGE_MAX_TOKENS", "80"))
+GEMINI_CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "false").lower() == "true"
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+
+# Starting point for the chars/token ratio, and the range calibration may move it in
+DEFAULT_CHARS_PER_TOKEN = 4.0
+MIN_CHARS_PER_TOKEN = 2.0
+MAX_CHARS_PER_TOKEN = 8.0
+
+# A cached prefix is recreated this long before Gemini expires it
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = 60
+# After a failed cache creation, use the plain system instruction for this long
+CONTEXT_CACHE_RETRY_SECONDS = 300
+
+SYSTEM_PREFIX = """
+You classify customer WhatsApp messages sent to a business, for its support team.
+
+For each message:
+- Classify its intent into one of the categories listed below.
+- Assign the priority listed for that category.
+- Decide whether it continues the earlier messages in its context; if it does, merge what they said into extracted_info.
+- Set conversation_status to "new", "continue" or "close".
+
+extracted_info:
+- Orders: a "products" list; each product has "item", "quantity" (integer, or null if not given), "unit" (e.g. "1kg", "500gm", "5 liters") and "notes" (special instructions, else null).
+- Complaints, inquiries and the rest: fields such as "issue", "order_id", "delivery_address", "product", "status".
+- Update it from the new message: reflect added or changed products, addresses and delivery methods. A message like "thanks" leaves it unchanged.
+- Keys to use:
+{schema}
+
+Answer with JSON only, without markdown or comments, for example:
+{{"category": "new_order", "priority": "high", "conversation_status": "continue", "extracted_info": {{"products": [{{"item": "chocolate cake", "quantity": 2, "unit": "1kg", "notes": null}}], "delivery_address": "14 Park Street"}}}}
+""".strip().format(schema="\n".join(f"  - {k}: {v}" for k, v in STANDARD_KEYS.items()))
+
+HARMFUL_RULE = """
+Before classifying, decide whether the message is harmful or inappropriate (hate speech, harassment,
+sexually explicit material, threats or violent language) and add a boolean "harmful" field.
+If "harmful" is true, the other fields may be left empty.
+""".strip()
+
+
+@lru_cache(maxsize=256)
+def _compile_categories(categories: Tuple[str, ...], priorities: Tuple[Tuple[str, str], ...]) -> str:
+    offered = set(categories)
+    by_priority: Dict[str, List[str]] = {}
+    for category, priority in priorities:
+        if category in offered:
+            by_priority.setdefault(priority, []).append(category)
+    priority_lines = "\n".join(f"- {priority}: {', '.join(names)}" for priority, names in by_priority.items())
+    return f"Categories:\n{', '.join(categories)}\n\nPriority by category:\n{priority_lines}"
+
+
+def compile_categories(categories: Sequence[str], priority_map: Dict[str, str]) -> str:
+    """Category list and priority mapping as one prompt fragment, compiled once per distinct set"""
+    return _compile_categories(tuple(categories), tuple(priority_map.items()))
+
+
+DEFAULT_CATEGORY_FRAGMENT = compile_categories(DEFAULT_CATEGORIES, DEFAULT_PRIORITY_MAP)
+
+
+class TokenEstimator:
+    """Local token estimate from a chars/token ratio calibrated on Gemini's own counts"""
+
+    def __init__(self, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN):
+        self.chars_per_token = chars_per_token
+        self._lock = threading.Lock()
+
+    def count(self, text: Optional[str]) -> int:
+        if not text:
+            return 0
+        return max(1, int(len(text) / self.chars_per_token + 0.5))
+
+    def chars(self, tokens: int) -> int:
+        return int(tokens * self.chars_per_token)
+
+    def calibrate(self, chars: int, tokens: Optional[int]):
+        if not tokens or chars <= 0:
+            return
+        observed = min(MAX_CHARS_PER_TOKEN, max(MIN_CHARS_PER_TOKEN, chars / tokens))
+        with self._lock:
+            # Moving average, so one odd prompt does not swing the budget
+            self.chars_per_token += (observed - self.chars_per_token) * 0.1
+        metrics.set_gauge("llm.tokens.chars_per_token", round(self.chars_per_token, 3))
+
+
+class PromptBuilder:
+    """Builds the system instruction and the per-message content for Gemini calls"""
+
+    def __init__(self, context_budget: int = PROMPT_CONTEXT_TOKEN_BUDGET,
+                 max_messages: int = PROMPT_CONTEXT_MAX_MESSAGES,
+                 message_max_tokens: int = PROMPT_CONTEXT_MESSAGE_MAX_TOKENS):
+        self.context_budget = context_budget
+        self.max_messages = max_messages
+        self.message_max_tokens = message_max_tokens
+        self.tokens = TokenEstimator()
+        self._system: Dict[Tuple[bool, str], str] = {}
+
+    def system_instruction(self, combined: bool, category_fragment: str = DEFAULT_CATEGORY_FRAGMENT) -> str:
+        """Static prefix for a call kind and category set; the same string object every time"""
+        key = (combined, category_fragment)
+        text = self._system.get(key)
+        if text is None:
+            parts = [SYSTEM_PREFIX, HARMFUL_RULE, category_fragment] if combined else [SYSTEM_PREFIX, category_fragment]
+            text = self._system.setdefault(key, "\n\n".join(parts))
+        return text
+
+    def fit_context(self, message: str, context: Optional[List[str]]) -> Tuple[List[str], int]:
+        """Newest context messages that fit the budget, oldest first, and how many were left out"""
+        prior = list(context or [])
+        # The context node stores the current message before reading the context back
+        if prior and prior[-1] == message:
+            prior = prior[:-1]
+
+        kept: List[str] = []
+        used = 0
+        max_chars = self.tokens.chars(self.message_max_tokens)
+        for text in reversed(prior[-self.max_messages:] if self.max_messages > 0 else []):
+            text = " ".join(str(text).split())
+            if len(text) > max_chars:
+                text = text[:max_chars].rstrip() + "…"
+            cost = self.tokens.count(text) + 2
+            if used + cost > self.context_budget:
+                break
+            kept.append(text)
+            used += cost
+        kept.reverse()
+
+        omitted = len(prior) - len(kept)
+        if omitted:
+            metrics.incr("llm.context.omitted_messages", omitted)
+        return kept, omitted
+
+    def _context_block(self, message: str, context: Optional[List[str]], indent: str = "") -> str:
+        kept, omitted = self.fit_context(message, context)
+        lines = [f"{indent}- ({omitted} earlier messages not shown)"] if omitted else []
+        lines += [f"{indent}- {text}" for text in kept]
+        return "\n".join(lines) if lines else f"{indent}None"
+
+    def user_prompt(self, message: str, context: Optional[List[str]] = None) -> str:
+        context_block = self._context_block(message, context)
+        return f'Context (earlier messages from this customer, oldest first):\n{context_block}\n\nMessage:\n"{message}"'
+
+    def batch_prompt(self, items: List[Tuple[str, List[str]]]) -> str:
+        blocks = [
+            f'[{index}] Context (oldest first):\n{self._context_block(message, context, "  ")}\nMessage: "{message}"'
+            for index, (message, context) in enumerate(items, start=1)
+        ]
+        messages_str = "\n\n".join(blocks)
+        return f"""Each numbered message below comes from a different customer; classify each one independently,
+using only its own context.
+
+{messages_str}
+
+Respond with a JSON array of exactly {len(items)} objects, one per message and in the same order,
+each with an "index" field holding the message number next to the usual fields."""
+
+    def record_usage(self, kind: str, system_instruction: str, contents: str, response, cached: bool = False):
+        """Publish token counts for one call and calibrate the estimator"""
+        metrics.incr(f"llm.requests.{kind}")
+        estimated = self.tokens.count(contents) + (0 if cached else self.tokens.count(system_instruction))
+        metrics.incr("llm.tokens.prompt_estimated", estimated)
+
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", None) if usage is not None else None
+        if not prompt_tokens:
+            return
+        cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+        metrics.incr("llm.tokens.prompt", prompt_tokens)
+        metrics.incr("llm.tokens.cached", cached_tokens)
+        metrics.incr("llm.tokens.output", getattr(usage, "candidates_token_count", None) or 0)
+        metrics.set_gauge(f"llm.tokens.last_prompt.{kind}", prompt_tokens)
+        # Gemini's count covers the system instruction whether it was sent inline or from the cache
+        self.tokens.calibrate(len(system_instruction) + len(contents), prompt_tokens)
+
+
+class PrefixCache:
+    """Gemini context caches holding system instructions, keyed by model and text"""
+
+    def __init__(self, enabled: bool = GEMINI_CONTEXT_CACHE_ENABLED, ttl_seconds: int = GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+                 min_tokens: int = GEMINI_CONTEXT_CACHE_MIN_TOKENS, tokens: Optional[TokenEstimator] = None):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.tokens = tokens or TokenEstimator()
+        self._lock = threading.Lock()
+        # key -> (cached content name or None after a failure, usable until)
+        self._entries: Dict[str, Tuple[Optional[str], float]] = {}
+
+    def _key(self, model: str, system_instruction: str) -> str:
+        return hashlib.sha1(f"{model}\n{system_instruction}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, model: str, system_instruction: str) -> Tuple[Optional[str], Optional[str]]:
+        """(cached content name, None) on a hit; (None, key) when the caller should create one"""
+        if not self.enabled or self.tokens.count(system_instruction) < self.min_tokens:
+            return None, None
+        key = self._key(model, system_instruction)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.time():
+            if entry[0]:
+                metrics.incr("llm.prefix_cache.hit")
+            return entry[0], None
+        return None, key
+
+    def _create_config(self, system_instruction: str) -> types.CreateCachedContentConfig:
+        return types.CreateCachedContentConfig(
+            system_instruction=system_instruction,
+            ttl=f"{self.ttl_seconds}s",
+            display_name="waffy-classifier-prefix",
+        )
+
+    def _store(self, key: str, name: Optional[str]):
+        if name:
+            metrics.incr("llm.prefix_cache.created")
+            usable_for = self.ttl_seconds - CONTEXT_CACHE_REFRESH_MARGIN_SECONDS
+        else:
+            metrics.incr("llm.prefix_cache.error")
+            usable_for = CONTEXT_CACHE_RETRY_SECONDS
+        with self._lock:
+            self._entries[key] = (name, time.time() + usable_for)
+
+    def config(self, client, model: str, system_instruction: str) -> dict:
+        """GenerateContentConfig fields that carry the prefix: a cache reference or the instruction itself"""
+        name, key = self._lookup(model, system_instruction)
+        if key is not None:
+            try:
+                name = client.caches.create(model=model, config=self._create_config(system_instruction)).name
+            except Exception as e:
+                logger.warning(f"[PromptBuilder] Could not cache the prompt prefix, sending it inline: {e}")
+                name = None
+            self._store(key, name)
+        return {"cached_content": name} if name else {"system_instruction": system_instruction}
+
+    async def aconfig(self, client, model: str, system_instruction: str) -> dict:
+        """Async variant of config"""
+        name, key = self._lookup(model, system_instruction)
+        if key is not None:
+            try:
+                name = (await client.aio.caches.create(model=model, config=self._create_config(system_instruction))).name
+            except Exception as e:
+                logger.warning(f"[PromptBuilder] Could not cache the prompt prefix, sending it inline: {e}")
+                name = None
+            self._store(key, name)
+        return {"cached_content": name} if name else {"system_instruction": system_instruction}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# instantiate
+prompt_builder = PromptBuilder()
+prefix_cache = PrefixCache(tokens=prompt_builder.tokens)
@@ -6,10 +6,10 @@ This agent handles sending responses back to WhatsApp using the WhatsApp Busines
 import os
 import json
 import logging
-import requests
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 
+from app.utils.http_client import http_client, async_http_client
 from app.utils.message_generator import (
     generate_order_confirmation,
     # Import other message generators as needed
@@ -22,12 +22,14 @@ logger = logging.getLogger(__name__)
 class ResponderAgent:
     """Agent responsible for sending messages back to WhatsApp"""
     
-    def __init__(self, user_id: Optional[int] = None, user_settings: Optional[Any] = None):
-        """Initialize the responder agent with user settings"""
+    def __init__(self, user_id: Optional[int] = None, user_settings: Optional[Any] = None, api_key: Optional[str] = None):
+        """Initialize the responder agent with user settings (api_key: already decrypted, e.g. from the tenant registry)"""
         self.user_id = user_id
         self.user_settings = user_settings
         # Get WhatsApp API credentials from user settings or environment
-        if user_settings and hasattr(user_settings, 'whatsapp_api_key') and user_settings.whatsapp_api_key:
+        if api_key:
+            self.api_key = api_key
+        elif user_settings and hasattr(user_settings, 'whatsapp_api_key') and user_settings.whatsapp_api_key:
             try:
                 from utils.encryption import decrypt_value
                 self.api_key = decrypt_value(user_settings.whatsapp_api_key)
@@ -78,6 +80,38 @@ class ResponderAgent:
             logger.error(error_msg)
             return {"status": "error", "message": error_msg}
         
+        url, payload, headers = self._text_message_request(to_phone, message_text)
+        
+        try:
+            # Send the request to WhatsApp API
+            response = http_client.post(url, json=payload, headers=headers)
+            return self._handle_send_response(response)
+                
+        except Exception as e:
+            error_msg = f"Error sending WhatsApp message: {str(e)}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+    
+    async def asend_message(self, to_phone: str, message_text: str) -> Dict[str, Any]:
+        """Async variant of send_message over the shared async HTTP client"""
+        if not self.api_key or not self.phone_number_id:
+            error_msg = "WhatsApp API credentials not configured"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+        
+        url, payload, headers = self._text_message_request(to_phone, message_text)
+        
+        try:
+            response = await async_http_client.post(url, json=payload, headers=headers)
+            return self._handle_send_response(response)
+                
+        except Exception as e:
+            error_msg = f"Error sending WhatsApp message: {str(e)}"
+            logger.error(error_msg)
+            return {"status": "error", "message": error_msg}
+    
+    def _text_message_request(self, to_phone: str, message_text: str):
+        """Build the (url, payload, headers) for a text message"""
         # Format the phone number (remove + if present)
         if to_phone.startswith('+'):
             to_phone = to_phone[1:]
@@ -95,35 +129,28 @@ class ResponderAgent:
         
         # API endpoint for sending messages
         url = f"{self.api_base_url}/{self.phone_number_id}/messages"
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        return url, payload, headers
+    
+    def _handle_send_response(self, response) -> Dict[str, Any]:
+        """Turn a WhatsApp API response (requests or httpx) into a status dict"""
+        # Log the response for debugging
+        logger.info(f"WhatsApp API response: {response.status_code} - {response.text}")
         
-        try:
-            # Send the request to WhatsApp API
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
+        if response.status_code == 200:
+            response_data = response.json()
+            message_id = response_data.get("messages", [{}])[0].get("id", "unknown")
+            return {
+                "status": "success", 
+                "message": "Message sent successfully",
+                "message_id": message_id,
+                "response": response_data
             }
-            
-            response = requests.post(url, json=payload, headers=headers)
-            
-            # Log the response for debugging
-            logger.info(f"WhatsApp API response: {response.status_code} - {response.text}")
-            
-            if response.status_code == 200:
-                response_data = response.json()
-                message_id = response_data.get("messages", [{}])[0].get("id", "unknown")
-                return {
-                    "status": "success", 
-                    "message": "Message sent successfully",
-                    "message_id": message_id,
-                    "response": response_data
-                }
-            else:
-                error_msg = f"Failed to send WhatsApp message: {response.status_code} - {response.text}"
-                logger.error(error_msg)
-                return {"status": "error", "message": error_msg}
-                
-        except Exception as e:
-            error_msg = f"Error sending WhatsApp message: {str(e)}"
+        else:
+            error_msg = f"Failed to send WhatsApp message: {response.status_code} - {response.text}"
             logger.error(error_msg)
             return {"status": "error", "message": error_msg}
     
@@ -144,6 +171,11 @@ class ResponderAgent:
         # Send the message
         return self.send_message(to_phone, message_text)
     
+    async def asend_order_confirmation(self, to_phone: str, order_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of send_order_confirmation"""
+        message_text = generate_order_confirmation(order_data)
+        return await self.asend_message(to_phone, message_text)
+    
     def send_template_message(self, to_phone: str, template_name: str, components: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Send a template message to a WhatsApp number
@@ -190,7 +222,7 @@ class ResponderAgent:
                 "Authorization": f"Bearer {self.api_key}"
             }
             
-            response = requests.post(url, json=payload, headers=headers)
+            response = http_client.post(url, json=payload, headers=headers)
             
             # Log the response for debugging
             logger.info(f"WhatsApp API template response: {response.status_code} - {response.text}")
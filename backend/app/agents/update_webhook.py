@@ -1,16 +1,14 @@
-import requests
 import time
 import os
-import psycopg2
 import logging
 import sys
 from dotenv import load_dotenv
-from utils.encryption import decrypt_value
+from app.utils.tenant_registry import tenant_registry
+from app.utils.http_client import http_client
 
 # Load environment variables from .env file
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL")
 NGROK_PORT = os.getenv("NGROK_PORT") 
 forwarding_url = os.getenv("FORWARDING_URL")
 
@@ -20,47 +18,27 @@ forwarding_url = os.getenv("FORWARDING_URL")
 
 # Fetch verify token for a given phone_number_id
 def fetch_verify_token_by_phone_number(phone_number_id):
-    print("Fetching credentials for phone_number_id from Waffy database:", phone_number_id)
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT whatsapp_verify_token
-        FROM user_settings
-        WHERE whatsapp_phone_number_id = %s
-    """, (phone_number_id,))
-    row = cursor.fetchone()
-    cursor.close()
-    conn.close()
-
-    if not row:
+    print("Fetching credentials for phone_number_id from tenant registry:", phone_number_id)
+    tenant = tenant_registry.get(phone_number_id)
+    if not tenant:
         raise Exception("No verify token found for this phone_number_id")
 
     return {
-        "VERIFY_TOKEN": decrypt_value(row[0]),
+        "VERIFY_TOKEN": tenant.verify_token,
     }
 
 # Fetch credentials app id and app secret for a given phone_number_id
 def fetch_credentials_by_phone_number(phone_number_id):
-    print("Fetching credentials for phone_number_id from Waffy database:", phone_number_id)
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT whatsapp_app_id, whatsapp_app_secret, whatsapp_api_key
-        FROM user_settings
-        WHERE whatsapp_phone_number_id = %s
-    """, (phone_number_id,))
-    row = cursor.fetchone()
-    cursor.close()
-    conn.close()
-
-    if not row:
+    print("Fetching credentials for phone_number_id from tenant registry:", phone_number_id)
+    tenant = tenant_registry.get(phone_number_id)
+    if not tenant:
         raise Exception("No credentials found for this phone_number_id")
 
     return {
         
-        "APP_ID": decrypt_value(row[0]),
-        "APP_SECRET": decrypt_value(row[1]),
-        "WHATSAPP_ACCESS_TOKEN": decrypt_value(row[2]),
+        "APP_ID": tenant.app_id,
+        "APP_SECRET": tenant.app_secret,
+        "WHATSAPP_ACCESS_TOKEN": tenant.whatsapp_api_key,
     }
 
 # ----------------------------------------------
@@ -83,7 +61,7 @@ def update_webhook(callback_url, app_id, app_secret, verify_token):
         "verify_token": verify_token,
     }
 
-    response = requests.post(url, data=params)
+    response = http_client.post(url, data=params)
     print("Webhook response:", response.text)
     if response.status_code == 200:
         print("✅ Webhook updated successfully:", callback_url)
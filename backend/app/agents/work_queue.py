@@ -0,0 +1,293 @@
+# app/agents/work_queue.py
+
+"""
+Durable work queue for inbound WhatsApp messages.
+
+The webhook endpoint only enqueues a message and returns; a pool of asyncio
+worker tasks drains the queue through the LangGraph pipeline. The queue lives
+in a local SQLite file in WAL mode so that messages survive a restart and can
+be shared by several uvicorn workers on the same host.
+
+Jobs carry an ordering key (business phone id + customer wa_id): jobs with
+different keys run concurrently, but a job is not claimed while an earlier
+job with the same key is being processed, so each customer's messages go
+through the pipeline in the order they arrived. Each run also holds the
+conversation's lock (app/utils/conversation_lock.py), which extends that
+guarantee across hosts.
+
+A claimed job is leased: the pool that holds it refreshes heartbeat_at every
+WEBHOOK_JOB_LEASE_SECONDS / 3 while the pipeline runs, and a recovery task in
+every pool requeues 'processing' jobs whose heartbeat is older than
+WEBHOOK_JOB_LEASE_SECONDS (their process crashed or was killed). Jobs
+interrupted by a clean shutdown are put back right away, without using up an
+attempt.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Tuple, Dict, Any, List
+
+from dotenv import load_dotenv
+from app.state import MessageState
+from app.utils.metrics import metrics
+from app.utils.conversation_lock import conversation_locks, conversation_key
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+WEBHOOK_QUEUE_PATH = os.getenv("WEBHOOK_QUEUE_PATH", "data/webhook_queue.db")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "32"))
+WEBHOOK_MAX_QUEUE_DEPTH = int(os.getenv("WEBHOOK_MAX_QUEUE_DEPTH", "1000"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "3"))
+WEBHOOK_JOB_LEASE_SECONDS = float(os.getenv("WEBHOOK_JOB_LEASE_SECONDS", "60"))
+
+# How long an idle worker sleeps before polling the queue again. Enqueues in
+# this process wake workers immediately; polling picks up other processes.
+IDLE_POLL_SECONDS = 1.0
+
+
+class DurableWorkQueue:
+    """SQLite-backed FIFO queue with at-least-once delivery"""
+
+    def __init__(self, filepath: str = WEBHOOK_QUEUE_PATH, max_attempts: int = WEBHOOK_MAX_ATTEMPTS):
+        self.filepath = filepath
+        self.max_attempts = max_attempts
+        Path(os.path.dirname(self.filepath) or ".").mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.filepath, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                last_error TEXT,
+                ordering_key TEXT,
+                heartbeat_at REAL
+            )
+        """)
+        # Queue files created before ordering keys and leases existed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "ordering_key" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN ordering_key TEXT")
+        if "heartbeat_at" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_id ON jobs(status, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ordering_key ON jobs(ordering_key, status)")
+
+    def enqueue(self, payload: Dict[str, Any], ordering_key: Optional[str] = None) -> int:
+        """Persist a payload and return its job id"""
+        return self.enqueue_many([(payload, ordering_key)])[0]
+
+    def enqueue_many(self, jobs: List[Tuple[Dict[str, Any], Optional[str]]]) -> List[int]:
+        """Persist (payload, ordering_key) pairs in one transaction, in order; return their job ids"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [
+                    self._conn.execute(
+                        "INSERT INTO jobs (payload, enqueued_at, ordering_key) VALUES (?, ?, ?)",
+                        (json.dumps(payload, default=str), now, ordering_key),
+                    ).lastrowid
+                    for payload, ordering_key in jobs
+                ]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def claim(self) -> Optional[Tuple[int, Dict[str, Any], float]]:
+        """Atomically take the oldest queued job whose ordering key is idle; returns (id, payload, enqueued_at)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, payload, enqueued_at FROM jobs WHERE status = 'queued' AND ("
+                    "  ordering_key IS NULL OR NOT EXISTS ("
+                    "    SELECT 1 FROM jobs AS busy WHERE busy.ordering_key = jobs.ordering_key"
+                    "    AND busy.status = 'processing')"
+                    ") ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row:
+                    now = time.time()
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'processing', started_at = ?, heartbeat_at = ?, "
+                        "attempts = attempts + 1 WHERE id = ?",
+                        (now, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if not row:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def complete(self, job_id: int):
+        """Remove a successfully processed job"""
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def fail(self, job_id: int, error: str) -> bool:
+        """Requeue a failed job, or park it as 'failed' after max_attempts. Returns True if requeued."""
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            requeue = bool(row) and row[0] < self.max_attempts
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ? WHERE id = ?",
+                ("queued" if requeue else "failed", error[:1000], job_id),
+            )
+            return requeue
+
+    def release(self, job_id: int):
+        """Put back a job whose run was interrupted (shutdown), without counting the attempt"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0) "
+                "WHERE id = ? AND status = 'processing'",
+                (job_id,),
+            )
+
+    def heartbeat(self, job_ids: List[int]):
+        """Extend the lease on jobs this process is still running"""
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'processing'",
+                [(time.time(), job_id) for job_id in job_ids],
+            )
+
+    def recover_stale(self, lease_seconds: float = WEBHOOK_JOB_LEASE_SECONDS) -> int:
+        """Requeue 'processing' jobs whose lease ran out, i.e. whose worker died"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'processing' "
+                "AND COALESCE(heartbeat_at, started_at) < ?",
+                (time.time() - lease_seconds,),
+            )
+            return cursor.rowcount
+
+    def depth(self) -> int:
+        """Number of jobs waiting to be processed"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'processing'").fetchone()[0]
+
+
+class WebhookWorkerPool:
+    """Fixed-size pool of asyncio tasks that drain the queue through the graph"""
+
+    def __init__(self, graph, queue: DurableWorkQueue, concurrency: int = WEBHOOK_WORKERS,
+                 lease_seconds: float = WEBHOOK_JOB_LEASE_SECONDS):
+        self.graph = graph
+        self.queue = queue
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self._tasks = []
+        # Jobs claimed by this pool and not yet finished, kept alive by the lease task
+        self._active = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running = False
+
+    async def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._wakeup = asyncio.Event()
+        recovered = await asyncio.to_thread(self.queue.recover_stale, self.lease_seconds)
+        if recovered:
+            logger.info(f"Requeued {recovered} webhook jobs left in processing state")
+        for i in range(self.concurrency):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+        self._tasks.append(asyncio.create_task(self._lease_keeper()))
+        logger.info(f"Started {self.concurrency} webhook workers")
+
+    async def stop(self):
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle workers after an enqueue"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _worker(self, worker_id: int):
+        while self._running:
+            # Clear before claiming so an enqueue that races with an empty claim is not lost
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self.queue.claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=IDLE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, payload, enqueued_at = job
+            self._active.add(job_id)
+            metrics.observe("queue.wait", time.time() - enqueued_at)
+            metrics.set_gauge("queue.depth", await asyncio.to_thread(self.queue.depth))
+            started = time.perf_counter()
+            try:
+                result = await self._run_pipeline(payload)
+                await asyncio.to_thread(self.queue.complete, job_id)
+                metrics.incr("queue.completed")
+                print("Final result:\n", json.dumps(result, indent=2, default=str))
+            except asyncio.CancelledError:
+                # Shutting down mid-run: hand the job back so this or another process runs it again.
+                # Off the loop like every other queue write, and shielded so a second cancel cannot skip it
+                await asyncio.shield(asyncio.to_thread(self.queue.release, job_id))
+                metrics.incr("queue.released")
+                raise
+            except Exception as e:
+                requeued = await asyncio.to_thread(self.queue.fail, job_id, str(e))
+                metrics.incr("queue.retried" if requeued else "queue.dead_lettered")
+                logger.error(f"[Worker {worker_id}] Pipeline error for job {job_id}: {e}")
+            finally:
+                self._active.discard(job_id)
+                metrics.observe("pipeline.total", time.perf_counter() - started)
+
+    async def _lease_keeper(self):
+        """Refresh the lease on running jobs and requeue jobs whose lease ran out elsewhere"""
+        interval = max(self.lease_seconds / 3, 0.1)
+        while self._running:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.queue.heartbeat, list(self._active))
+                recovered = await asyncio.to_thread(self.queue.recover_stale, self.lease_seconds)
+                if recovered:
+                    metrics.incr("queue.recovered", recovered)
+                    logger.warning(f"Requeued {recovered} webhook jobs whose worker stopped renewing its lease")
+                    self.notify()
+            except Exception as e:
+                logger.error(f"Webhook job lease upkeep failed: {e}")
+
+    async def _run_pipeline(self, payload: Dict[str, Any]):
+        # Async nodes run on the loop; any sync nodes are dispatched to LangGraph's executor
+        state = MessageState(**payload)
+        async with conversation_locks.hold(conversation_key(state.business_phone_id, state.customer_id)):
+            return await self.graph.ainvoke(state)
+
+
+# instantiate
+work_queue = DurableWorkQueue()
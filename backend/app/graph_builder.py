@@ -1,25 +1,62 @@
+import os
+import inspect
+from dotenv import load_dotenv
 from langgraph.graph import StateGraph, END
 from app.state import MessageState
 from app.nodes.listener_node import listener_node
 from app.nodes.context_node import context_node
-from app.nodes.llm_node import llm_node
-from app.nodes.storage_node import storage_node
-from app.nodes.responder_node import responder_node
-from app.nodes.review_node import review_node
+from app.nodes.preclassifier_node import preclassifier_node, route_after_preclassifier
+from app.nodes.llm_node import llm_node, async_llm_node
+from app.nodes.storage_node import storage_node, threaded_storage_node
+from app.nodes.responder_node import responder_node, async_responder_node
+from app.nodes.review_node import review_node, async_review_node
+from app.utils.metrics import metrics
 
-def build_graph():
+load_dotenv()
+
+# Set to "false" to fall back to the blocking node implementations
+PIPELINE_ASYNC_NODES = os.getenv("PIPELINE_ASYNC_NODES", "true").lower() == "true"
+
+def timed_node(name, node):
+    """Wrap a node so its latency is recorded as the 'stage.<name>' timer"""
+    if inspect.iscoroutinefunction(node):
+        async def async_wrapper(state):
+            with metrics.timer(f"stage.{name}"):
+                return await node(state)
+        async_wrapper.__name__ = getattr(node, "__name__", name)
+        return async_wrapper
+
+    def wrapper(state):
+        with metrics.timer(f"stage.{name}"):
+            return node(state)
+    wrapper.__name__ = getattr(node, "__name__", name)
+    return wrapper
+
+def build_graph(async_nodes: bool = PIPELINE_ASYNC_NODES):
+    """
+    Build the message pipeline.
+
+    With async_nodes the LLM, Review, Storage and Responder stages are coroutines
+    and the graph must be driven with ainvoke; Storage is a coroutine only as a
+    threaded adapter around the sync storage_node (see threaded_storage_node).
+    Listener, Context and PreClassifier are cheap, CPU-only steps and stay
+    synchronous in both modes.
+    """
     builder = StateGraph(MessageState)
 
-    builder.add_node("Listener", listener_node)
-    builder.add_node("Context", context_node)
-    builder.add_node("LLM", llm_node)
-    builder.add_node("Review", review_node)
-    builder.add_node("Storage", storage_node)
-    builder.add_node("Responder", responder_node)
+    builder.add_node("Listener", timed_node("Listener", listener_node))
+    builder.add_node("Context", timed_node("Context", context_node))
+    builder.add_node("PreClassifier", timed_node("PreClassifier", preclassifier_node))
+    builder.add_node("LLM", timed_node("LLM", async_llm_node if async_nodes else llm_node))
+    builder.add_node("Review", timed_node("Review", async_review_node if async_nodes else review_node))
+    builder.add_node("Storage", timed_node("Storage", threaded_storage_node if async_nodes else storage_node))
+    builder.add_node("Responder", timed_node("Responder", async_responder_node if async_nodes else responder_node))
 
     builder.set_entry_point("Listener")
     builder.add_edge("Listener", "Context")
-    builder.add_edge("Context", "LLM")
+    builder.add_edge("Context", "PreClassifier")
+    # Trivial messages classified locally skip the LLM
+    builder.add_conditional_edges("PreClassifier", route_after_preclassifier, {"LLM": "LLM", "Review": "Review"})
     builder.add_edge("LLM", "Review")
     builder.add_edge("Review", "Storage")
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Float
+from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, Text, Boolean, Float, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -25,6 +25,8 @@ class User(Base):
 
 class UserSettings(Base):
     __tablename__ = "user_settings"
+    # Indexes are created by migrations/versions too; keep the names in sync
+    __table_args__ = (Index("idx_user_settings_phone_number_id", "whatsapp_phone_number_id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -85,6 +87,9 @@ class Customer(Base):
     interactions = relationship("Interaction", back_populates="customer")
     user = relationship("User", back_populates="customers")
 
+    # Indexes are created by migrations/versions too; keep the names in sync
+    __table_args__ = (Index("idx_customers_user_created", user_id, created_at.desc(), customer_id.desc()),)
+
 class Business(Base):
     __tablename__ = "businesses"
     business_id = Column(Integer, primary_key=True, autoincrement=True)
@@ -144,6 +149,15 @@ class Order(Base):
     feedbacks = relationship("Feedback", back_populates="order")
     user = relationship("User", back_populates="orders")
 
+    # Indexes are created by migrations/versions too; keep the names in sync
+    __table_args__ = (
+        Index("idx_orders_order_number", order_number),
+        Index("idx_orders_customer_created", customer_id, created_at.desc()),
+        Index("idx_orders_pending_customer", customer_id, created_at.desc(),
+              postgresql_where=order_status == "pending", sqlite_where=order_status == "pending"),
+        Index("idx_orders_user_created", user_id, created_at.desc(), order_id.desc()),
+    )
+
 class Issue(Base):
     __tablename__ = "issues"
     issue_id = Column(Integer, primary_key=True, autoincrement=True)
@@ -159,6 +173,8 @@ class Issue(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user = relationship("User", back_populates="issues")
 
+    __table_args__ = (Index("idx_issues_user_created", user_id, created_at.desc(), issue_id.desc()),)
+
 class Feedback(Base):
     __tablename__ = "feedback"
     feedback_id = Column(Integer, primary_key=True, autoincrement=True)
@@ -188,6 +204,8 @@ class Enquiry(Base):
     customer = relationship("Customer", back_populates="enquiries")
     user = relationship("User", back_populates="enquiries")
 
+    __table_args__ = (Index("idx_enquiries_user_created", user_id, created_at.desc(), enquiry_id.desc()),)
+
 class Category(Base):
     __tablename__ = "categories"
     category_id = Column(Integer, primary_key=True, autoincrement=True)
@@ -207,6 +225,8 @@ class ErrorLog(Base):
     # Relationship with User model (optional)
     user = relationship("User", backref="error_logs")
 
+    __table_args__ = (Index("idx_error_logs_user_created", user_id, created_at.desc(), error_id.desc()),)
+
 class ResponseMetrics(Base):
     __tablename__ = "response_metrics"
     metric_id = Column(Integer, primary_key=True, autoincrement=True)
@@ -222,3 +242,61 @@ class ResponseMetrics(Base):
     
     # Relationship with User model
     user = relationship("User", backref="response_metrics")
+
+    # Indexes are created by migrations/versions too; keep the names in sync
+    __table_args__ = (Index("idx_response_metrics_user_received", user_id, message_received_at),)
+
+class DailyRollup(Base):
+    """Per-tenant, per-day counters behind /api/analytics/summary (see app/utils/rollups.py)"""
+    __tablename__ = "daily_rollups"
+    __table_args__ = (UniqueConstraint("user_id", "day", "dimension", "value", name="uq_daily_rollups_key"),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    dimension = Column(String(30), nullable=False)
+    value = Column(String(50), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+
+class CrmOutbox(Base):
+    """CRM sync events written alongside the rows they describe, drained by app/agents/crm_sync.py"""
+    __tablename__ = "crm_outbox"
+    __table_args__ = (
+        Index("idx_crm_outbox_status_next", "status", "next_attempt_at"),
+        Index("idx_crm_outbox_customer", "user_id", "customer_id", "id"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    idempotency_key = Column(String(150), nullable=False, unique=True)
+    crm_type = Column(String(20), nullable=False, default="hubspot")
+    customer_id = Column(String(20))
+    payload = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, processing, done, dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    completed_steps = Column(Text, nullable=True)  # JSON: HubSpot steps already done -> ids they created
+    created_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+
+class ProcessedMessage(Base):
+    """Inbound WhatsApp message ids already accepted by the webhook (see app/utils/message_dedup.py)"""
+    __tablename__ = "processed_messages"
+    __table_args__ = (Index("idx_processed_messages_first_seen", "first_seen_at"),)
+    message_id = Column(String(100), primary_key=True)
+    business_phone_id = Column(String(50), nullable=True)
+    first_seen_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class MessageDelivery(Base):
+    """Delivery state of replies sent to WhatsApp, from status callbacks (see app/utils/delivery_status.py)"""
+    __tablename__ = "message_deliveries"
+    message_id = Column(String(100), primary_key=True)  # wamid of the outbound message
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    customer_id = Column(String(20))
+    reply_to_message_id = Column(String(100))
+    status = Column(String(20), nullable=False)  # accepted, sent, delivered, read, failed
+    status_at = Column(DateTime)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
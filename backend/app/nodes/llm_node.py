@@ -1,9 +1,11 @@
 from app.agents.llm_agent import GeminiLLMAgent
+from app.agents.llm_batcher import LLMBatchScheduler
 from app.state import MessageState
 import json
-from app.utils.category_map import map_category_to_table
+from app.utils.tenant_profiles import tenant_profiles, ClassificationProfile
 
 llm_agent = GeminiLLMAgent()
+llm_batcher = LLMBatchScheduler(llm_agent)
 
 def merge_extracted_info(existing: dict, new: dict) -> dict:
     merged = existing.copy()
@@ -35,28 +37,62 @@ def llm_node(state: MessageState) -> MessageState:
         print("[LLMNode] No message to analyze")
         return state
     
+    if llm_agent.combined_safety:
+        result = llm_agent.classify(state.message, state.context or [], namespace=state.business_phone_id)
+        if result.get("harmful"):
+            print("[LLMNode] Message blocked due to harmful content")
+            return _block(state)
+        return _apply_result(state, result, tenant_profiles.get(state.business_phone_id))
+
     # Safety check before calling full LLM analysis
-    if not llm_agent.is_safe(state.message):
+    if not llm_agent.is_safe(state.message, namespace=state.business_phone_id):
         print("[LLMNode] Message blocked due to harmful content")
-        state.predicted_category = "rejected"
-        state.priority = "null"
-        state.conversation_status = "blocked"
-        state.extracted_info = {}
-        state.table_name = None
+        return _block(state)
+
+    result = llm_agent.analyze(state.message, state.context or [], namespace=state.business_phone_id)
+    return _apply_result(state, result, tenant_profiles.get(state.business_phone_id))
+
+
+async def async_llm_node(state: MessageState) -> MessageState:
+    """Async variant of llm_node; Gemini calls go through the aio client"""
+    if not state.message:
+        print("[LLMNode] No message to analyze")
         return state
 
-    result = llm_agent.analyze(state.message, state.context or [])
+    if llm_agent.combined_safety:
+        result = await llm_batcher.submit(state.message, state.context or [], namespace=state.business_phone_id)
+        if result.get("harmful"):
+            print("[LLMNode] Message blocked due to harmful content")
+            return _block(state)
+        return _apply_result(state, result, await tenant_profiles.aget(state.business_phone_id))
+
+    if not await llm_agent.ais_safe(state.message, namespace=state.business_phone_id):
+        print("[LLMNode] Message blocked due to harmful content")
+        return _block(state)
+
+    result = await llm_batcher.submit(state.message, state.context or [], namespace=state.business_phone_id)
+    return _apply_result(state, result, await tenant_profiles.aget(state.business_phone_id))
+
+
+def _block(state: MessageState) -> MessageState:
+    state.predicted_category = "rejected"
+    state.priority = "null"
+    state.conversation_status = "blocked"
+    state.extracted_info = {}
+    state.table_name = None
+    return state
+
 
+def _apply_result(state: MessageState, result: dict, profile: ClassificationProfile) -> MessageState:
     state.predicted_category = result.get("category", "unknown")
-    state.priority = result.get("priority", "moderate")
+    # The business's own priority for the category wins over the model's copy of it
+    state.priority = profile.priority_for(state.predicted_category, result.get("priority", "moderate"))
     state.conversation_status = result.get("conversation_status", "continue")
 
     new_info = result.get("extracted_info", {})
     existing_info = state.extracted_info or {}
     state.extracted_info = merge_extracted_info(existing_info, new_info)
 
-    category = state.predicted_category
-    table_name = map_category_to_table(state.predicted_category)
-    state.table_name = table_name
+    state.table_name = profile.table_for(state.predicted_category)
 
     return state
@@ -0,0 +1,33 @@
+# app/nodes/preclassifier_node.py
+
+from app.agents.preclassifier_agent import preclassifier_agent, PRECLASSIFIER_ENABLED
+from app.state import MessageState
+from app.utils.tenant_profiles import tenant_profiles
+
+
+def preclassifier_node(state: MessageState) -> MessageState:
+    """
+    Classify trivial messages locally so the graph can skip the LLM node.
+    Sets state.preclassified when a confident fast-path prediction is made.
+    """
+    state.preclassified = False
+    if not PRECLASSIFIER_ENABLED or not state.message:
+        return state
+
+    result = preclassifier_agent.classify(state.message)
+    if not result:
+        return state
+
+    print(f"[PreClassifierNode] {result['category']} via {result['source']} ({result['confidence']}), skipping LLM")
+    profile = tenant_profiles.get(state.business_phone_id)
+    state.preclassified = True
+    state.predicted_category = result["category"]
+    state.priority = profile.priority_for(result["category"], result["priority"])
+    state.conversation_status = state.conversation_status or "continue"
+    state.extracted_info = state.extracted_info or {}
+    state.table_name = profile.table_for(result["category"])
+    return state
+
+
+def route_after_preclassifier(state: MessageState) -> str:
+    return "Review" if state.preclassified else "LLM"
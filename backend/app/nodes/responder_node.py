@@ -11,8 +11,10 @@ from typing import Dict, Any, Optional
 from app.utils.time_utils import convert_relative_time_to_date
 
 from app.agents.responder_agent import ResponderAgent
-from database import SessionLocal
+from database import SessionLocal, AsyncSessionLocal
 from app.models import ResponseMetrics
+from app.utils.tenant_registry import tenant_registry
+from app.utils import rollups, delivery_status
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -46,17 +48,8 @@ def get_responder_agent(user_id: Optional[int] = None, user_settings: Optional[A
     
     return _responder_agents[key]
 
-def responder_node(state) -> Dict[str, Any]:
-    """
-    Process the state and send responses if needed
-    
-    Args:
-        state: The current state of the message processing (MessageState or dict)
-        
-    Returns:
-        Updated state with response information
-    """
-    logger.info("Processing in responder_node")    
+def _extract_sender(state):
+    """Return (sender, business_phone_id) from a MessageState or dict"""
     # Extract information from the state
     sender = None
     business_phone_id = None
@@ -96,6 +89,422 @@ def responder_node(state) -> Dict[str, Any]:
             logger.warning("Could not find sender in state")
     except Exception as e:
         logger.error(f"Error extracting information from state: {str(e)}")
+
+    return sender, business_phone_id
+
+def _minimal_user_settings(user_settings, whatsapp_phone_number_id):
+    # If we have a phone_number_id but no user_id, create a minimal user_settings object
+    if not user_settings and whatsapp_phone_number_id:
+        # Create a simple object with just the phone_number_id
+        from types import SimpleNamespace
+        user_settings = SimpleNamespace()
+        user_settings.whatsapp_phone_number_id = whatsapp_phone_number_id
+        logger.info(f"Created minimal user_settings with phone_number_id: {whatsapp_phone_number_id}")
+    return user_settings
+
+def _tenant_settings(tenant, business_phone_id):
+    """Return (user_id, user_settings, api_key) from a tenant registry entry"""
+    if not tenant:
+        return None, _minimal_user_settings(None, business_phone_id), None
+    logger.info(f"Got user_id {tenant.user_id} from business_phone_id {business_phone_id}")
+    return tenant.user_id, tenant.settings, tenant.whatsapp_api_key
+
+def _load_user_settings(business_phone_id):
+    """Return (user_id, user_settings, api_key) for a business phone id"""
+    return _tenant_settings(tenant_registry.get(business_phone_id), business_phone_id)
+
+async def _aload_user_settings(business_phone_id):
+    """Async variant of _load_user_settings"""
+    return _tenant_settings(await tenant_registry.aget(business_phone_id), business_phone_id)
+
+def _message_metadata(state):
+    """Return (message_id, message_received_at, message_type, customer_id) for response metrics"""
+    # Get message_id and message_received_at for metrics
+    message_id = None
+    message_received_at = None
+    message_type = None
+    customer_id = None
+
+    if hasattr(state, 'message_id'):
+        message_id = state.message_id
+    elif isinstance(state, dict) and 'message_id' in state:
+        message_id = state['message_id']
+
+    if hasattr(state, 'timestamp'):
+        message_received_at = state.timestamp
+    elif isinstance(state, dict) and 'timestamp' in state:
+        message_received_at = state['timestamp']
+
+    if hasattr(state, 'message_type'):
+        message_type = state.message_type
+    elif isinstance(state, dict) and 'message_type' in state:
+        message_type = state['message_type']
+
+    if hasattr(state, 'customer_id'):
+        customer_id = state.customer_id
+    elif isinstance(state, dict) and 'customer_id' in state:
+        customer_id = state['customer_id']
+
+    # Convert timestamp to datetime if it's a string
+    if message_received_at and isinstance(message_received_at, str):
+        try:
+            message_received_at = datetime.strptime(message_received_at, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            try:
+                # Try another common format
+                message_received_at = datetime.strptime(message_received_at, "%Y-%m-%dT%H:%M:%S")
+            except ValueError:
+                # If we can't parse it, use current time
+                message_received_at = datetime.now()
+
+    return message_id, message_received_at, message_type, customer_id
+
+def _should_respond(state):
+    """Return (table_name, should_respond)"""
+    # Check for table_name which can also indicate message type
+    table_name = None
+    if hasattr(state, 'table_name'):
+        table_name = state.table_name
+    elif hasattr(state, 'dict') and 'table_name' in state.dict():
+        table_name = state.dict()['table_name']
+    elif isinstance(state, dict) and 'table_name' in state:
+        table_name = state['table_name']
+
+    # Check if we should respond - only respond when table_name is present
+    should_respond = table_name is not None
+
+    # Override with explicit should_respond flag if present
+    if hasattr(state, 'should_respond'):
+        should_respond = state.should_respond
+    elif isinstance(state, dict) and 'should_respond' in state:
+        should_respond = state['should_respond']
+
+    return table_name, should_respond
+
+def _build_outgoing(state, table_name, message_type, sender):
+    """
+    Decide what to send for this message.
+
+    Returns:
+        ("order_confirmation", order_data), ("text", message) or ("skipped", details)
+    """
+    # Determine the appropriate response based on the response_type, message_type, or table_name
+    if table_name == "orders":
+        # If message_type is order or table_name is orders but we don't have order_data or response_type,
+        # create a simple order confirmation
+        logger.info(f"Message type is order or table_name is orders, sending simple order confirmation. Message type: {message_type}, Table name: {table_name}")
+
+        # Create a basic order data structure
+        simple_order_data = {
+            # Get the order number from the state if available, otherwise generate a new one
+            "order_number": None,  # Will be set below
+            "customer_name": "Valued Customer",
+            "item": "your order",
+            "quantity": 1,
+            "unit": "",  # Add unit field for measurements
+            "total_amount": "as quoted",
+            # Initialize delivery fields
+            "delivery_address": None,
+            "delivery_time": None,
+            "delivery_method": None
+        }
+
+        # Try to get the order number from the state
+        order_number = None
+
+        # Check if order_number is directly on the state object
+        if hasattr(state, 'order_number') and state.order_number:
+            order_number = state.order_number
+            print(f"RESPONDER NODE: Found order_number directly on state: {order_number}")
+        # Check if order_number is in state.dict()
+        elif hasattr(state, 'dict') and 'order_number' in state.dict() and state.dict()['order_number']:
+            order_number = state.dict()['order_number']
+            print(f"RESPONDER NODE: Found order_number in state.dict(): {order_number}")
+
+        # If no order number found, generate a new one
+        # Check if we have orders in the result from logger_agent
+        if not order_number and hasattr(state, 'result') and state.result:
+            result = state.result
+            if isinstance(result, dict) and 'orders' in result and result['orders']:
+                # Get the order number from the first order in the list
+                if isinstance(result['orders'], list) and len(result['orders']) > 0:
+                    first_order = result['orders'][0]
+                    if isinstance(first_order, dict) and 'order_number' in first_order:
+                        order_number = first_order['order_number']
+                        logger.info(f"Using order_number from logger_agent result: {order_number}")
+
+        # Only generate a new order number as a last resort
+        if not order_number:
+            order_number = f"ORD-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            logger.warning(f"Generated fallback order_number: {order_number} - this may cause inconsistency with database")
+
+        # Set the order number in the data structure
+        simple_order_data['order_number'] = order_number
+
+        # Try to extract customer name if available
+        if hasattr(state, 'customer_name'):
+            simple_order_data['customer_name'] = state.customer_name
+        elif hasattr(state, 'dict') and 'customer_name' in state.dict():
+            simple_order_data['customer_name'] = state.dict()['customer_name']
+        elif isinstance(state, dict) and 'customer_name' in state:
+            simple_order_data['customer_name'] = state['customer_name']
+
+        # Extract delivery information from extracted_info if available
+        extracted_info = None
+        if hasattr(state, 'extracted_info'):
+            extracted_info = state.extracted_info
+        elif hasattr(state, 'dict') and 'extracted_info' in state.dict():
+            extracted_info = state.dict()['extracted_info']
+        elif isinstance(state, dict) and 'extracted_info' in state:
+            extracted_info = state['extracted_info']
+
+        if extracted_info and isinstance(extracted_info, dict):
+            # Extract delivery address
+            if 'delivery_address' in extracted_info:
+                simple_order_data['delivery_address'] = extracted_info['delivery_address']
+                logger.info(f"Added delivery address to order data: {extracted_info['delivery_address']}")
+
+            # Extract delivery time
+            if 'delivery_time' in extracted_info:
+                delivery_time_str = extracted_info['delivery_time']
+                # Convert relative time to actual date using shared utility function
+                simple_order_data['delivery_time'] = convert_relative_time_to_date(delivery_time_str)
+                logger.info(f"Added delivery time to order data: {simple_order_data['delivery_time']}")
+
+            # Extract delivery method
+            if 'delivery_method' in extracted_info:
+                simple_order_data['delivery_method'] = extracted_info['delivery_method']
+                logger.info(f"Added delivery method to order data: {extracted_info['delivery_method']}")
+            elif 'delivery_type' in extracted_info:
+                simple_order_data['delivery_method'] = extracted_info['delivery_type']
+                logger.info(f"Added delivery method from type to order data: {extracted_info['delivery_type']}")
+            elif simple_order_data['delivery_address']:  # Default to home delivery if address is provided
+                simple_order_data['delivery_method'] = "home delivery"
+                logger.info("Set default delivery method to 'home delivery'")
+
+        # Try to extract item details from the message
+        if hasattr(state, 'message'):
+            message_text = state.message
+            logger.info(f"Extracting item from message: {message_text}")
+
+            # Look for common item indicators in the message
+            item_indicators = ['order', 'buy', 'purchase', 'get', 'need', 'want']
+            for indicator in item_indicators:
+                if indicator in message_text.lower():
+                    # Extract text after the indicator
+                    parts = message_text.lower().split(indicator, 1)
+                    if len(parts) > 1 and parts[1].strip():
+                        # Take the first 30 chars after the indicator as the item
+                        item_text = parts[1].strip()[:30]
+                        if item_text:
+                            simple_order_data['item'] = item_text
+                            logger.info(f"Extracted item from message: {item_text}")
+                            break
+
+        # Try to extract more details from extracted_info if available
+        if hasattr(state, 'extracted_info'):
+            extracted_info = state.extracted_info
+            if extracted_info and isinstance(extracted_info, dict):
+                # First check for products list which is the preferred source
+                if 'products' in extracted_info and extracted_info['products'] and isinstance(extracted_info['products'], list):
+                    products = extracted_info['products']
+                    logger.info(f"Found products list with {len(products)} items")
+
+                    # Create a formatted list of all products
+                    items_list = []
+                    for product in products:
+                        if isinstance(product, dict) and 'item' in product:
+                            item_text = product['item']
+                            # Ensure item_text doesn't contain 'None'
+                            if item_text and 'None' in str(item_text):
+                                item_text = item_text.replace('None', '').strip()
+
+                            quantity = product.get('quantity', 1)
+                            unit = product.get('unit', '')
+
+                            # Format the item with quantity and unit
+                            formatted_item = f"{quantity} {unit} {item_text}".strip()
+                            # Clean up any double spaces
+                            while '  ' in formatted_item:
+                                formatted_item = formatted_item.replace('  ', ' ')
+                            items_list.append(formatted_item)
+
+                            logger.info(f"Added product to order: {formatted_item}")
+
+                    # Join all items with commas and 'and' for the last item
+                    if items_list:
+                        if len(items_list) == 1:
+                            simple_order_data['item'] = items_list[0]
+                        else:
+                            simple_order_data['item'] = ", ".join(items_list[:-1]) + " and " + items_list[-1]
+
+                        logger.info(f"Final combined item list: {simple_order_data['item']}")
+
+                        # Since we're using a combined item list, set quantity to 1
+                        simple_order_data['quantity'] = 1
+                        simple_order_data['unit'] = ''
+
+                # Fallback to other fields if no products list is found
+                elif not simple_order_data.get('item'):
+                    # Check for various possible field names for product/item
+                    for field in ['product_type', 'item', 'product', 'order_item']:
+                        if field in extracted_info and extracted_info[field]:
+                            simple_order_data['item'] = extracted_info[field]
+                            logger.info(f"Extracted item from extracted_info.{field}: {extracted_info[field]}")
+                            break
+
+                    # Check for quantity
+                    if 'quantity' in extracted_info and extracted_info['quantity']:
+                        simple_order_data['quantity'] = extracted_info['quantity']
+                        logger.info(f"Extracted quantity: {extracted_info['quantity']}")
+
+                    # Check for unit
+                    if 'unit' in extracted_info and extracted_info['unit']:
+                        simple_order_data['unit'] = extracted_info['unit']
+                        logger.info(f"Extracted unit: {extracted_info['unit']}")
+
+        return "order_confirmation", simple_order_data
+    elif table_name == "issues":
+        # Send an issue acknowledgement
+        logger.info("Table name is issues, sending issue acknowledgement")
+
+        # Create basic issue data
+        issue_data = {
+            "issue_id": None,  # Will be set below
+            "customer_name": "Valued Customer",
+            "issue_type": "customer issue",
+            "priority": "normal"
+        }
+
+        # Try to get the issue ID from the state
+        if hasattr(state, 'issue_id') and state.issue_id:
+            issue_data['issue_id'] = state.issue_id
+            print(f"RESPONDER NODE: Found issue_id directly on state: {state.issue_id}")
+        else:
+            # Generate a new issue ID if none is found
+            issue_data['issue_id'] = f"ISS-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            print(f"RESPONDER NODE: Generated new issue_id: {issue_data['issue_id']}")
+
+        # Try to extract more details if available
+        if hasattr(state, 'extracted_info'):
+            extracted_info = state.extracted_info
+            if extracted_info and isinstance(extracted_info, dict):
+                if 'issue_type' in extracted_info:
+                    issue_data['issue_type'] = extracted_info['issue_type']
+                if 'priority' in extracted_info:
+                    issue_data['priority'] = extracted_info['priority']
+
+        # Generate the issue acknowledgement message
+        issue_message = f"Thank you for reporting this issue. We have logged it with reference number #{issue_data['issue_id']} and will get back to you shortly."
+        logger.info(f"Sending issue acknowledgement to {sender} with issue ID: {issue_data['issue_id']}")
+        return "text", issue_message
+    elif table_name == "enquiries":
+        # Send a general response for enquiries
+        logger.info("Table name is enquiries, sending general response")
+
+        # Get customer name if available
+        greeting = "Hello"
+        if hasattr(state, 'customer_name') and state.customer_name:
+            greeting = f"Hello {state.customer_name}"
+
+        # Simple direct message for enquiries
+        enquiry_message = f"{greeting},\n\nThank you for your enquiry. We've received your message and our team will get back to you as soon as possible.\n\nBest regards,\nThe Team"
+
+        logger.info(f"Sending general response to {sender}")
+        return "text", enquiry_message
+
+    elif table_name == "feedback":
+        # Send a feedback acknowledgment
+        logger.info("Table name is feedback, sending feedback acknowledgment")
+
+        # Simple direct message for feedback
+        feedback_message = "Thank you for your feedback! We appreciate you taking the time to share your thoughts with us. Your input helps us improve our services and provide a better experience for all our customers.\n\nBest regards,\nThe Team"
+
+        logger.info(f"Sending feedback acknowledgment to {sender}")
+        return "text", feedback_message
+
+    else:
+        # For any other table_name, don't send a response
+        logger.info(f"Unhandled table_name: {table_name}, not sending a response")
+        return "skipped", {"status": "skipped", "reason": f"Unhandled table_name: {table_name}"}
+
+def _set_response_status(state, response, response_time_seconds):
+    """Record the outcome of the send on the state as response_status"""
+    # Create a response status dictionary
+    if isinstance(response, dict) and response.get("status") == "skipped":
+        response_status = {
+            "status": "skipped",
+            "message": "Response skipped",
+            "reason": response.get("reason", "Unknown reason"),
+            "response_time_seconds": response_time_seconds
+        }
+    else:
+        response_status = {
+            "status": "success",
+            "message": "Sent WhatsApp response",
+            "details": response,
+            "response_time_seconds": response_time_seconds
+        }
+
+    # Try to update the state with the response status
+    try:
+        if isinstance(state, dict):
+            state["response_status"] = response_status
+        elif hasattr(state, '__dict__'):
+            state.__dict__["response_status"] = response_status
+    except Exception as e:
+        logger.error(f"Could not update state with response status: {str(e)}")
+
+def _sent_message_id(response):
+    """wamid of the reply WhatsApp accepted, if it was sent"""
+    if isinstance(response, dict) and response.get("status") == "success":
+        return response.get("message_id")
+    return None
+
+def _response_metrics_record(table_name, response, user_id, message_id, customer_id, message_type,
+                             response_time_seconds, message_received_at, response_sent_at):
+    """Build the ResponseMetrics row for a sent response, or None if the response was skipped"""
+    # Determine response type
+    response_type = "generic"
+    if table_name == "orders":
+        response_type = "order_confirmation"
+    elif table_name == "issues":
+        response_type = "issue_acknowledgement"
+    elif table_name == "enquiries":
+        response_type = "enquiry_response"
+    elif table_name == "feedback":
+        response_type = "feedback_acknowledgement"
+    elif isinstance(response, dict) and response.get("status") == "skipped":
+        response_type = "skipped"
+
+    # Only store metrics if we actually sent a response
+    if response_type == "skipped":
+        logger.info(f"Skipped storing metrics for skipped response")
+        return None
+
+    return ResponseMetrics(
+        user_id=user_id,
+        message_id=message_id,
+        customer_id=customer_id,
+        message_type=message_type,
+        response_type=response_type,
+        response_time_seconds=response_time_seconds,
+        message_received_at=message_received_at,
+        response_sent_at=response_sent_at
+    )
+
+def responder_node(state) -> Dict[str, Any]:
+    """
+    Process the state and send responses if needed
+    
+    Args:
+        state: The current state of the message processing (MessageState or dict)
+        
+    Returns:
+        Updated state with response information
+    """
+    logger.info("Processing in responder_node")    
+    sender, business_phone_id = _extract_sender(state)
     
     # If we couldn't get a sender, we can't send a response
     if not sender:
@@ -104,444 +513,51 @@ def responder_node(state) -> Dict[str, Any]:
     
     # Log the extracted information
     logger.info(f"Extracted business_phone_id: {business_phone_id}")
-    
-    # Get user_id from business_phone_id
-    user_id = None
-    whatsapp_phone_number_id = business_phone_id
-    
-    if business_phone_id:
-        try:
-            # Import the function from storage_node
-            from app.nodes.storage_node import get_user_id_from_business_phone_id
-            
-            # Get user_id
-            user_id = get_user_id_from_business_phone_id(business_phone_id)
-            logger.info(f"Got user_id {user_id} from business_phone_id {business_phone_id}")
-        except Exception as e:
-            logger.error(f"Error getting user_id from business_phone_id: {str(e)}")
-    
-    # Get user settings from database if we have a user_id
-    user_settings = None
-    if user_id:
-        try:
-            # Import the correct database module
-            from database import SessionLocal
-            from app.models import UserSettings
-            
-            # Get database session
-            db = SessionLocal()
-            
-            # Get user settings from UserSettings table
-            settings = db.query(UserSettings).filter(UserSettings.user_id == user_id).first()
-            if settings:
-                user_settings = settings
-                logger.info(f"Found user settings for user_id: {user_id}")
-            else:
-                logger.warning(f"No user settings found for user_id: {user_id}")
-            
-            # Close the session
-            db.close()
-        except Exception as e:
-            logger.error(f"Error getting user settings: {str(e)}")
-    
-    # If we have a phone_number_id but no user_id, create a minimal user_settings object
-    if not user_settings and whatsapp_phone_number_id:
-        # Create a simple object with just the phone_number_id
-        from types import SimpleNamespace
-        user_settings = SimpleNamespace()
-        user_settings.whatsapp_phone_number_id = whatsapp_phone_number_id
-        logger.info(f"Created minimal user_settings with phone_number_id: {whatsapp_phone_number_id}")
+    user_id, user_settings, api_key = _load_user_settings(business_phone_id)
     
     # Send an appropriate response based on the message type and content
     try:
         # Initialize a responder agent with the user_id and user_settings
-        responder_agent = ResponderAgent(user_id=user_id, user_settings=user_settings)
-        
-        # Get message_id and message_received_at for metrics
-        message_id = None
-        message_received_at = None
-        message_type = None
-        customer_id = None
-        
-        if hasattr(state, 'message_id'):
-            message_id = state.message_id
-        elif isinstance(state, dict) and 'message_id' in state:
-            message_id = state['message_id']
-            
-        if hasattr(state, 'timestamp'):
-            message_received_at = state.timestamp
-        elif isinstance(state, dict) and 'timestamp' in state:
-            message_received_at = state['timestamp']
-            
-        if hasattr(state, 'message_type'):
-            message_type = state.message_type
-        elif isinstance(state, dict) and 'message_type' in state:
-            message_type = state['message_type']
-            
-        if hasattr(state, 'customer_id'):
-            customer_id = state.customer_id
-        elif isinstance(state, dict) and 'customer_id' in state:
-            customer_id = state['customer_id']
-            
-        # Convert timestamp to datetime if it's a string
-        if message_received_at and isinstance(message_received_at, str):
-            try:
-                message_received_at = datetime.strptime(message_received_at, "%Y-%m-%d %H:%M:%S")
-            except ValueError:
-                try:
-                    # Try another common format
-                    message_received_at = datetime.strptime(message_received_at, "%Y-%m-%dT%H:%M:%S")
-                except ValueError:
-                    # If we can't parse it, use current time
-                    message_received_at = datetime.now()
+        responder_agent = ResponderAgent(user_id=user_id, user_settings=user_settings, api_key=api_key)
+        message_id, message_received_at, message_type, customer_id = _message_metadata(state)
         
         # Start timing the response
         response_start_time = time.time()
         
-        # Check for table_name which can also indicate message type
-        table_name = None
-        if hasattr(state, 'table_name'):
-            table_name = state.table_name
-        elif hasattr(state, 'dict') and 'table_name' in state.dict():
-            table_name = state.dict()['table_name']
-        elif isinstance(state, dict) and 'table_name' in state:
-            table_name = state['table_name']
-            
-        # Check if we should respond - only respond when table_name is present
-        should_respond = table_name is not None
-        
-        # Override with explicit should_respond flag if present
-        if hasattr(state, 'should_respond'):
-            should_respond = state.should_respond
-        elif isinstance(state, dict) and 'should_respond' in state:
-            should_respond = state['should_respond']
-        
-        # If we shouldn't respond, return early
+        table_name, should_respond = _should_respond(state)
         if not should_respond:
             logger.info("should_respond is False, skipping response")
             return state
         
-        # Extract response information from the state
-        order_data = None
-        response_type = None
-        response_message = None
-        # Note: table_name was already extracted above when determining should_respond, don't reset it
-        
-        # Determine the appropriate response based on the response_type, message_type, or table_name
-        if table_name == "orders":
-            # If message_type is order or table_name is orders but we don't have order_data or response_type,
-            # create a simple order confirmation
-            logger.info(f"Message type is order or table_name is orders, sending simple order confirmation. Message type: {message_type}, Table name: {table_name}")
-            
-            # Create a basic order data structure
-            simple_order_data = {
-                # Get the order number from the state if available, otherwise generate a new one
-                "order_number": None,  # Will be set below
-                "customer_name": "Valued Customer",
-                "item": "your order",
-                "quantity": 1,
-                "unit": "",  # Add unit field for measurements
-                "total_amount": "as quoted",
-                # Initialize delivery fields
-                "delivery_address": None,
-                "delivery_time": None,
-                "delivery_method": None
-            }
-            
-            # Try to get the order number from the state
-            order_number = None
-            
-            # Check if order_number is directly on the state object
-            if hasattr(state, 'order_number') and state.order_number:
-                order_number = state.order_number
-                print(f"RESPONDER NODE: Found order_number directly on state: {order_number}")
-            # Check if order_number is in state.dict()
-            elif hasattr(state, 'dict') and 'order_number' in state.dict() and state.dict()['order_number']:
-                order_number = state.dict()['order_number']
-                print(f"RESPONDER NODE: Found order_number in state.dict(): {order_number}")
-
-            # If no order number found, generate a new one
-            # Check if we have orders in the result from logger_agent
-            if not order_number and hasattr(state, 'result') and state.result:
-                result = state.result
-                if isinstance(result, dict) and 'orders' in result and result['orders']:
-                    # Get the order number from the first order in the list
-                    if isinstance(result['orders'], list) and len(result['orders']) > 0:
-                        first_order = result['orders'][0]
-                        if isinstance(first_order, dict) and 'order_number' in first_order:
-                            order_number = first_order['order_number']
-                            logger.info(f"Using order_number from logger_agent result: {order_number}")
-            
-            # Only generate a new order number as a last resort
-            if not order_number:
-                order_number = f"ORD-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-                logger.warning(f"Generated fallback order_number: {order_number} - this may cause inconsistency with database")
-            
-            # Set the order number in the data structure
-            simple_order_data['order_number'] = order_number
-            
-            # Try to extract customer name if available
-            if hasattr(state, 'customer_name'):
-                simple_order_data['customer_name'] = state.customer_name
-            elif hasattr(state, 'dict') and 'customer_name' in state.dict():
-                simple_order_data['customer_name'] = state.dict()['customer_name']
-            elif isinstance(state, dict) and 'customer_name' in state:
-                simple_order_data['customer_name'] = state['customer_name']
-                
-            # Extract delivery information from extracted_info if available
-            extracted_info = None
-            if hasattr(state, 'extracted_info'):
-                extracted_info = state.extracted_info
-            elif hasattr(state, 'dict') and 'extracted_info' in state.dict():
-                extracted_info = state.dict()['extracted_info']
-            elif isinstance(state, dict) and 'extracted_info' in state:
-                extracted_info = state['extracted_info']
-                
-            if extracted_info and isinstance(extracted_info, dict):
-                # Extract delivery address
-                if 'delivery_address' in extracted_info:
-                    simple_order_data['delivery_address'] = extracted_info['delivery_address']
-                    logger.info(f"Added delivery address to order data: {extracted_info['delivery_address']}")
-                
-                # Extract delivery time
-                if 'delivery_time' in extracted_info:
-                    delivery_time_str = extracted_info['delivery_time']
-                    # Convert relative time to actual date using shared utility function
-                    simple_order_data['delivery_time'] = convert_relative_time_to_date(delivery_time_str)
-                    logger.info(f"Added delivery time to order data: {simple_order_data['delivery_time']}")
-                
-                # Extract delivery method
-                if 'delivery_method' in extracted_info:
-                    simple_order_data['delivery_method'] = extracted_info['delivery_method']
-                    logger.info(f"Added delivery method to order data: {extracted_info['delivery_method']}")
-                elif 'delivery_type' in extracted_info:
-                    simple_order_data['delivery_method'] = extracted_info['delivery_type']
-                    logger.info(f"Added delivery method from type to order data: {extracted_info['delivery_type']}")
-                elif simple_order_data['delivery_address']:  # Default to home delivery if address is provided
-                    simple_order_data['delivery_method'] = "home delivery"
-                    logger.info("Set default delivery method to 'home delivery'")
-            
-            # Try to extract item details from the message
-            if hasattr(state, 'message'):
-                message_text = state.message
-                logger.info(f"Extracting item from message: {message_text}")
-                
-                # Look for common item indicators in the message
-                item_indicators = ['order', 'buy', 'purchase', 'get', 'need', 'want']
-                for indicator in item_indicators:
-                    if indicator in message_text.lower():
-                        # Extract text after the indicator
-                        parts = message_text.lower().split(indicator, 1)
-                        if len(parts) > 1 and parts[1].strip():
-                            # Take the first 30 chars after the indicator as the item
-                            item_text = parts[1].strip()[:30]
-                            if item_text:
-                                simple_order_data['item'] = item_text
-                                logger.info(f"Extracted item from message: {item_text}")
-                                break
-            
-            # Try to extract more details from extracted_info if available
-            if hasattr(state, 'extracted_info'):
-                extracted_info = state.extracted_info
-                if extracted_info and isinstance(extracted_info, dict):
-                    # First check for products list which is the preferred source
-                    if 'products' in extracted_info and extracted_info['products'] and isinstance(extracted_info['products'], list):
-                        products = extracted_info['products']
-                        logger.info(f"Found products list with {len(products)} items")
-                        
-                        # Create a formatted list of all products
-                        items_list = []
-                        for product in products:
-                            if isinstance(product, dict) and 'item' in product:
-                                item_text = product['item']
-                                # Ensure item_text doesn't contain 'None'
-                                if item_text and 'None' in str(item_text):
-                                    item_text = item_text.replace('None', '').strip()
-                                
-                                quantity = product.get('quantity', 1)
-                                unit = product.get('unit', '')
-                                
-                                # Format the item with quantity and unit
-                                formatted_item = f"{quantity} {unit} {item_text}".strip()
-                                # Clean up any double spaces
-                                while '  ' in formatted_item:
-                                    formatted_item = formatted_item.replace('  ', ' ')
-                                items_list.append(formatted_item)
-                                
-                                logger.info(f"Added product to order: {formatted_item}")
-                        
-                        # Join all items with commas and 'and' for the last item
-                        if items_list:
-                            if len(items_list) == 1:
-                                simple_order_data['item'] = items_list[0]
-                            else:
-                                simple_order_data['item'] = ", ".join(items_list[:-1]) + " and " + items_list[-1]
-                            
-                            logger.info(f"Final combined item list: {simple_order_data['item']}")
-                            
-                            # Since we're using a combined item list, set quantity to 1
-                            simple_order_data['quantity'] = 1
-                            simple_order_data['unit'] = ''
-                    
-                    # Fallback to other fields if no products list is found
-                    elif not simple_order_data.get('item'):
-                        # Check for various possible field names for product/item
-                        for field in ['product_type', 'item', 'product', 'order_item']:
-                            if field in extracted_info and extracted_info[field]:
-                                simple_order_data['item'] = extracted_info[field]
-                                logger.info(f"Extracted item from extracted_info.{field}: {extracted_info[field]}")
-                                break
-                        
-                        # Check for quantity
-                        if 'quantity' in extracted_info and extracted_info['quantity']:
-                            simple_order_data['quantity'] = extracted_info['quantity']
-                            logger.info(f"Extracted quantity: {extracted_info['quantity']}")
-                        
-                        # Check for unit
-                        if 'unit' in extracted_info and extracted_info['unit']:
-                            simple_order_data['unit'] = extracted_info['unit']
-                            logger.info(f"Extracted unit: {extracted_info['unit']}")
-            
-            response = responder_agent.send_order_confirmation(sender, simple_order_data)
-            logger.info(f"Sent simple order confirmation to {sender}: {response}")
-        elif table_name == "issues":
-            # Send an issue acknowledgement
-            logger.info("Table name is issues, sending issue acknowledgement")
-            
-            # Create basic issue data
-            issue_data = {
-                "issue_id": None,  # Will be set below
-                "customer_name": "Valued Customer",
-                "issue_type": "customer issue",
-                "priority": "normal"
-            }
-            
-            # Try to get the issue ID from the state
-            if hasattr(state, 'issue_id') and state.issue_id:
-                issue_data['issue_id'] = state.issue_id
-                print(f"RESPONDER NODE: Found issue_id directly on state: {state.issue_id}")
-            else:
-                # Generate a new issue ID if none is found
-                issue_data['issue_id'] = f"ISS-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-                print(f"RESPONDER NODE: Generated new issue_id: {issue_data['issue_id']}")
-            
-            # Try to extract more details if available
-            if hasattr(state, 'extracted_info'):
-                extracted_info = state.extracted_info
-                if extracted_info and isinstance(extracted_info, dict):
-                    if 'issue_type' in extracted_info:
-                        issue_data['issue_type'] = extracted_info['issue_type']
-                    if 'priority' in extracted_info:
-                        issue_data['priority'] = extracted_info['priority']
-            
-            # Generate the issue acknowledgement message
-            issue_message = f"Thank you for reporting this issue. We have logged it with reference number #{issue_data['issue_id']} and will get back to you shortly."
-            logger.info(f"Sending issue acknowledgement to {sender} with issue ID: {issue_data['issue_id']}")
-            response = responder_agent.send_message(sender, issue_message)
-            logger.info(f"Sent issue acknowledgement to {sender}: {response}")
-        elif table_name == "enquiries":
-            # Send a general response for enquiries
-            logger.info("Table name is enquiries, sending general response")
-            
-            # Get customer name if available
-            greeting = "Hello"
-            if hasattr(state, 'customer_name') and state.customer_name:
-                greeting = f"Hello {state.customer_name}"
-            
-            # Simple direct message for enquiries
-            enquiry_message = f"{greeting},\n\nThank you for your enquiry. We've received your message and our team will get back to you as soon as possible.\n\nBest regards,\nThe Team"
-            
-            logger.info(f"Sending general response to {sender}")
-            response = responder_agent.send_message(sender, enquiry_message)
-            logger.info(f"Sent general response to {sender}: {response}")
-            
-        elif table_name == "feedback":
-            # Send a feedback acknowledgment
-            logger.info("Table name is feedback, sending feedback acknowledgment")
-            
-            # Simple direct message for feedback
-            feedback_message = "Thank you for your feedback! We appreciate you taking the time to share your thoughts with us. Your input helps us improve our services and provide a better experience for all our customers.\n\nBest regards,\nThe Team"
-            
-            logger.info(f"Sending feedback acknowledgment to {sender}")
-            response = responder_agent.send_message(sender, feedback_message)
-            logger.info(f"Sent feedback acknowledgment to {sender}: {response}")
-            
+        kind, payload = _build_outgoing(state, table_name, message_type, sender)
+        if kind == "order_confirmation":
+            response = responder_agent.send_order_confirmation(sender, payload)
+        elif kind == "text":
+            response = responder_agent.send_message(sender, payload)
         else:
-            # For any other table_name, don't send a response
-            logger.info(f"Unhandled table_name: {table_name}, not sending a response")
-            response = {"status": "skipped", "reason": f"Unhandled table_name: {table_name}"}
+            response = payload
+        logger.info(f"Response to {sender} for {table_name}: {response}")
         
         # Calculate response time
-        response_end_time = time.time()
-        response_time_seconds = response_end_time - response_start_time
+        response_time_seconds = time.time() - response_start_time
         response_sent_at = datetime.now()
-        
-        # Create a response status dictionary
-        if isinstance(response, dict) and response.get("status") == "skipped":
-            response_status = {
-                "status": "skipped",
-                "message": "Response skipped",
-                "reason": response.get("reason", "Unknown reason"),
-                "response_time_seconds": response_time_seconds
-            }
-        else:
-            response_status = {
-                "status": "success",
-                "message": "Sent WhatsApp response",
-                "details": response,
-                "response_time_seconds": response_time_seconds
-            }
-        
-        # Try to update the state with the response status
-        try:
-            if isinstance(state, dict):
-                state["response_status"] = response_status
-            elif hasattr(state, '__dict__'):
-                state.__dict__["response_status"] = response_status
-        except Exception as e:
-            logger.error(f"Could not update state with response status: {str(e)}")
+        _set_response_status(state, response, response_time_seconds)
             
         # Store response metrics in the database
         try:
-            # Determine response type
-            response_type = "generic"
-            if table_name == "orders":
-                response_type = "order_confirmation"
-            elif table_name == "issues":
-                response_type = "issue_acknowledgement"
-            elif table_name == "enquiries":
-                response_type = "enquiry_response"
-            elif table_name == "feedback":
-                response_type = "feedback_acknowledgement"
-            elif isinstance(response, dict) and response.get("status") == "skipped":
-                response_type = "skipped"
-            
-            # Create a database session
-            db = SessionLocal()
-            
-            # Create a new ResponseMetrics record
-            metrics = ResponseMetrics(
-                user_id=user_id,
-                message_id=message_id,
-                customer_id=customer_id,
-                message_type=message_type,
-                response_type=response_type,
-                response_time_seconds=response_time_seconds,
-                message_received_at=message_received_at,
-                response_sent_at=response_sent_at
-            )
-            
-            # Only store metrics if we actually sent a response
-            if response_type != "skipped":
-                # Add and commit the record
-                db.add(metrics)
-                db.commit()
-                logger.info(f"Stored response metrics: response_time={response_time_seconds:.2f}s, type={response_type}")
-            else:
-                logger.info(f"Skipped storing metrics for skipped response")
-            
-            # Close the database session
-            db.close()
+            record = _response_metrics_record(table_name, response, user_id, message_id, customer_id, message_type,
+                                              response_time_seconds, message_received_at, response_sent_at)
+            if record is not None:
+                db = SessionLocal()
+                try:
+                    db.add(record)
+                    rollups.record(db, user_id, message_received_at,
+                                   rollups.response_increments(record.response_type, response_time_seconds))
+                    delivery_status.record_sent(db, _sent_message_id(response), user_id, customer_id, message_id)
+                    db.commit()
+                    logger.info(f"Stored response metrics: response_time={response_time_seconds:.2f}s, type={record.response_type}")
+                finally:
+                    db.close()
         except Exception as e:
             logger.error(f"Error storing response metrics: {str(e)}")
     except Exception as e:
@@ -549,3 +565,57 @@ def responder_node(state) -> Dict[str, Any]:
     
     # Return the original state to maintain the flow
     return state
+
+async def async_responder_node(state) -> Dict[str, Any]:
+    """Async variant of responder_node: httpx for WhatsApp, AsyncSession for settings and metrics"""
+    logger.info("Processing in async_responder_node")
+    sender, business_phone_id = _extract_sender(state)
+    
+    if not sender:
+        logger.error("No sender found, cannot send WhatsApp response")
+        return state
+    
+    logger.info(f"Extracted business_phone_id: {business_phone_id}")
+    user_id, user_settings, api_key = await _aload_user_settings(business_phone_id)
+    
+    try:
+        responder_agent = ResponderAgent(user_id=user_id, user_settings=user_settings, api_key=api_key)
+        message_id, message_received_at, message_type, customer_id = _message_metadata(state)
+        
+        response_start_time = time.time()
+        
+        table_name, should_respond = _should_respond(state)
+        if not should_respond:
+            logger.info("should_respond is False, skipping response")
+            return state
+        
+        kind, payload = _build_outgoing(state, table_name, message_type, sender)
+        if kind == "order_confirmation":
+            response = await responder_agent.asend_order_confirmation(sender, payload)
+        elif kind == "text":
+            response = await responder_agent.asend_message(sender, payload)
+        else:
+            response = payload
+        logger.info(f"Response to {sender} for {table_name}: {response}")
+        
+        response_time_seconds = time.time() - response_start_time
+        response_sent_at = datetime.now()
+        _set_response_status(state, response, response_time_seconds)
+        
+        try:
+            record = _response_metrics_record(table_name, response, user_id, message_id, customer_id, message_type,
+                                              response_time_seconds, message_received_at, response_sent_at)
+            if record is not None:
+                async with AsyncSessionLocal() as db:
+                    db.add(record)
+                    await rollups.arecord(db, user_id, message_received_at,
+                                          rollups.response_increments(record.response_type, response_time_seconds))
+                    await delivery_status.arecord_sent(db, _sent_message_id(response), user_id, customer_id, message_id)
+                    await db.commit()
+                logger.info(f"Stored response metrics: response_time={response_time_seconds:.2f}s, type={record.response_type}")
+        except Exception as e:
+            logger.error(f"Error storing response metrics: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error sending WhatsApp response: {str(e)}")
+    
+    return state
@@ -1,11 +1,12 @@
 # app/nodes/storage_node.py
 
 import json
+import asyncio
 import logging
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 
-from app.agents.logger_agent import LoggerAgent, get_user_id_from_business_phone_id
+from app.agents.logger_agent import logger_agents, get_user_id_from_business_phone_id
 from app.state import MessageState
 from pydantic import BaseModel
 from app.utils.time_utils import convert_relative_time_to_date
@@ -21,11 +22,7 @@ def storage_node(state: MessageState) -> MessageState:
         business_phone_id = state.business_phone_id
 
         user_id = get_user_id_from_business_phone_id(business_phone_id)
-        
-        if user_id:
-            logger_agent = LoggerAgent(str(user_id))
-        else:
-            logger_agent = LoggerAgent("4")  # Default user ID
+        agent_user_id = str(user_id) if user_id else "4"  # Default user ID
 
         # Create a dictionary from the state but preserve special attributes
         state_dict = state.dict()
@@ -39,8 +36,9 @@ def storage_node(state: MessageState) -> MessageState:
             state_dict['order_number'] = state.order_number
             print(f"STORAGE NODE: Found order_number on state: {state.order_number}")
             
-        # Pass the state with preserved attributes to the logger agent
-        result = logger_agent.process_messages([state_dict])
+        # Pass the state with preserved attributes to a logger agent on a pooled session
+        with logger_agents.borrow(agent_user_id) as logger_agent:
+            result = logger_agent.process_messages([state_dict])
         logger.info(f"Logger agent result: {json.dumps(result, default=str)}")
         
         # Check if the logger agent created new data and set it on the state
@@ -334,3 +332,15 @@ def storage_node(state: MessageState) -> MessageState:
         state["should_respond"] = False
     
     return state
+
+async def threaded_storage_node(state: MessageState):
+    """
+    Threaded adapter that lets the async graph await the storage stage.
+
+    This is not a native async node: LoggerAgent (Postgres writes through a
+    sync SessionLocal session, and HubSpot sync) is synchronous, so the whole
+    of storage_node runs in a worker thread from the default executor. The
+    event loop stays free for other messages, but each run in storage holds a
+    thread and a connection from the sync engine's pool.
+    """
+    return await asyncio.to_thread(storage_node, state)
@@ -22,6 +22,7 @@ class MessageState(BaseModel):
     business_phone_number: Optional[str] = None
     business_phone_id: Optional[str] = None
     table_name: Optional[str] = None
+    preclassified: Optional[bool] = False
     
     # Fields for order consolidation
     is_addition_to_existing_order: Optional[bool] = False
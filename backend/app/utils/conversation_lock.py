@@ -0,0 +1,137 @@
+# app/utils/conversation_lock.py
+
+"""
+One pipeline run at a time per conversation.
+
+A conversation is a (business_phone_id, customer_id) pair. Two messages from
+the same customer must not go through review and storage at once, or both can
+miss the customer's pending order and open two orders, and their chat memory
+appends interleave. The work queue already claims a conversation's jobs one at
+a time on each host; this lock also covers direct pipeline calls and
+deployments where several hosts drain their own queues:
+- local: an asyncio.Lock per conversation, for this process only
+- postgres: the local lock plus a session-level advisory lock
+  (pg_try_advisory_lock on a hash of the key), held on a dedicated connection
+  for the duration of the run, so every process and host agrees. The
+  connection comes from database.lock_engine, a pool of its own sized to
+  WEBHOOK_WORKERS, so runs holding a lock never wait on the pool the
+  pipeline's own queries use
+
+CONVERSATION_LOCK_BACKEND is "auto" (postgres when DATABASE_URL is Postgres,
+otherwise local), "local", "postgres" or "none". A run waiting longer than
+CONVERSATION_LOCK_TIMEOUT_SECONDS raises ConversationLockTimeout; the worker
+then requeues its job.
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+
+from database import lock_engine
+from app.utils.metrics import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+CONVERSATION_LOCK_BACKEND = os.getenv("CONVERSATION_LOCK_BACKEND", "auto").lower()
+CONVERSATION_LOCK_TIMEOUT_SECONDS = float(os.getenv("CONVERSATION_LOCK_TIMEOUT_SECONDS", "120"))
+
+# Poll interval bounds while another process holds the advisory lock
+ADVISORY_POLL_MIN_SECONDS = 0.02
+ADVISORY_POLL_MAX_SECONDS = 0.5
+
+
+class ConversationLockTimeout(Exception):
+    """The conversation stayed locked for longer than the timeout"""
+
+
+def conversation_key(business_phone_id: Optional[str], customer_id: Optional[str]) -> str:
+    """Messages sharing this key are processed one at a time, in order"""
+    return f"{business_phone_id}:{customer_id}"
+
+
+def advisory_key(key: str) -> int:
+    """Signed 64-bit id for pg_advisory_lock"""
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], "big", signed=True)
+
+
+class ConversationLocks:
+    """Per-conversation mutual exclusion for pipeline runs"""
+
+    def __init__(self, backend: str = CONVERSATION_LOCK_BACKEND, timeout: float = CONVERSATION_LOCK_TIMEOUT_SECONDS,
+                 engine=lock_engine):
+        if backend == "auto":
+            backend = "postgres" if engine.dialect.name == "postgresql" else "local"
+        self.backend = backend
+        self.timeout = timeout
+        self.engine = engine
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Optional[str]):
+        """Run the body while holding the conversation's lock"""
+        if self.backend == "none" or not key:
+            yield
+            return
+        started = time.perf_counter()
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            if lock.locked():
+                metrics.incr("conversation_lock.contended")
+            try:
+                await asyncio.wait_for(lock.acquire(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                metrics.incr("conversation_lock.timeout")
+                raise ConversationLockTimeout(f"Conversation {key} is still locked after {self.timeout}s")
+            try:
+                if self.backend == "postgres":
+                    async with self._advisory(key, started):
+                        metrics.observe("conversation_lock.wait", time.perf_counter() - started)
+                        yield
+                else:
+                    metrics.observe("conversation_lock.wait", time.perf_counter() - started)
+                    yield
+            finally:
+                lock.release()
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+            metrics.set_gauge("conversation_lock.keys", len(self._locks))
+
+    @asynccontextmanager
+    async def _advisory(self, key: str, started: float):
+        lock_id = advisory_key(key)
+        async with self.engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            delay = ADVISORY_POLL_MIN_SECONDS
+            while not (await conn.execute(select(func.pg_try_advisory_lock(lock_id)))).scalar():
+                if time.perf_counter() - started + delay > self.timeout:
+                    metrics.incr("conversation_lock.timeout")
+                    raise ConversationLockTimeout(f"Conversation {key} is locked by another worker after {self.timeout}s")
+                metrics.incr("conversation_lock.advisory_retry")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, ADVISORY_POLL_MAX_SECONDS)
+            try:
+                yield
+            finally:
+                try:
+                    await conn.execute(select(func.pg_advisory_unlock(lock_id)))
+                except Exception as e:
+                    # Never hand a connection that may still hold the lock back to the pool
+                    logger.error(f"Could not release advisory lock for {key}: {e}")
+                    await conn.invalidate()
+
+
+# instantiate
+conversation_locks = ConversationLocks()
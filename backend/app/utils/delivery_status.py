@@ -0,0 +1,127 @@
+# app/utils/delivery_status.py
+
+"""
+Delivery state of the replies we send on WhatsApp.
+
+The responder records each sent reply in message_deliveries as "accepted"
+(the state the Cloud API returns on send); the webhook's status callbacks
+then move it through sent -> delivered -> read, or to failed. Callbacks can
+arrive out of order, batched, and before the responder has written its row,
+so every write is an upsert that only ever moves a row forward.
+
+Status callbacks never touch the message pipeline or the LLM: the webhook
+applies a whole batch with one statement.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import SessionLocal
+from app.models import MessageDelivery
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+STATUS_RANK = {"accepted": 0, "sent": 1, "delivered": 2, "read": 3, "failed": 4}
+
+
+def _rank(column):
+    return case(STATUS_RANK, value=column, else_=-1)
+
+
+def _insert(dialect: str):
+    return (pg_insert if dialect == "postgresql" else sqlite_insert)(MessageDelivery)
+
+
+def parse_statuses(value: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Rows for the `statuses` of one webhook change value, most advanced status per message"""
+    rows: Dict[str, Dict[str, Any]] = {}
+    for status in value.get("statuses") or []:
+        message_id, state = status.get("id"), status.get("status")
+        if not message_id or state not in STATUS_RANK:
+            continue
+        errors = status.get("errors") or [{}]
+        row = {
+            "message_id": message_id,
+            "customer_id": status.get("recipient_id"),
+            "status": state,
+            "status_at": datetime.utcfromtimestamp(int(status.get("timestamp") or 0)),
+            "error": errors[0].get("title") or errors[0].get("message"),
+        }
+        # One row per message: a single multi-row upsert may not touch a row twice
+        current = rows.get(message_id)
+        if current is None or STATUS_RANK[state] >= STATUS_RANK[current["status"]]:
+            rows[message_id] = row
+    return list(rows.values())
+
+
+def status_statement(dialect: str):
+    """Upsert for status rows; an existing row only moves to a later status"""
+    stmt = _insert(dialect)
+    return stmt.on_conflict_do_update(
+        index_elements=["message_id"],
+        set_={"status": stmt.excluded.status, "status_at": stmt.excluded.status_at,
+              "error": stmt.excluded.error, "updated_at": datetime.utcnow()},
+        where=_rank(MessageDelivery.status) < _rank(stmt.excluded.status),
+    )
+
+
+def sent_statement(dialect: str, message_id: str, user_id: Optional[int], customer_id: Optional[str],
+                   reply_to_message_id: Optional[str]):
+    """Upsert for a reply we just sent; keeps any status a callback already recorded"""
+    stmt = _insert(dialect).values(
+        message_id=message_id, user_id=user_id, customer_id=customer_id,
+        reply_to_message_id=reply_to_message_id, status="accepted", status_at=datetime.utcnow(),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["message_id"],
+        set_={"user_id": stmt.excluded.user_id, "reply_to_message_id": stmt.excluded.reply_to_message_id},
+    )
+
+
+def apply_statuses(rows: List[Dict[str, Any]], session_factory=SessionLocal) -> int:
+    """Write a batch of status rows in one statement; returns the number of rows sent"""
+    if not rows:
+        return 0
+    db = session_factory()
+    try:
+        db.execute(status_statement(db.get_bind().dialect.name), rows)
+        db.commit()
+    finally:
+        db.close()
+    for row in rows:
+        metrics.incr(f"delivery_status.{row['status']}")
+    return len(rows)
+
+
+async def aapply_statuses(rows: List[Dict[str, Any]]) -> int:
+    """apply_statuses off the event loop"""
+    if not rows:
+        return 0
+    return await asyncio.to_thread(apply_statuses, rows)
+
+
+def record_sent(db, message_id: Optional[str], user_id, customer_id, reply_to_message_id):
+    """Record a sent reply inside the caller's transaction; the caller commits"""
+    if not message_id or message_id == "unknown":
+        return
+    try:
+        db.execute(sent_statement(db.get_bind().dialect.name, message_id, user_id, customer_id, reply_to_message_id))
+    except Exception as e:
+        logger.error(f"Error recording delivery state for {message_id}: {e}")
+
+
+async def arecord_sent(db, message_id: Optional[str], user_id, customer_id, reply_to_message_id):
+    """Async variant of record_sent for AsyncSession"""
+    if not message_id or message_id == "unknown":
+        return
+    try:
+        await db.execute(sent_statement(db.bind.dialect.name, message_id, user_id, customer_id, reply_to_message_id))
+    except Exception as e:
+        logger.error(f"Error recording delivery state for {message_id}: {e}")
@@ -0,0 +1,226 @@
+# app/utils/export.py
+
+"""
+Streaming exports for the Downloads page.
+
+Rows are read through a server-side cursor (yield_per) and encoded one chunk
+at a time, so an export holds at most EXPORT_CHUNK_ROWS rows in memory however
+large the table is. Supported formats:
+- csv: header line, then one line per row
+- ndjson: one JSON object per line
+- parquet: one row group per chunk (needs pyarrow)
+
+Each export runs in its own session, opened when the response body starts
+streaming and closed when it ends, because the request's session is already
+closed by then.
+"""
+
+import io
+import os
+import csv
+import json
+import logging
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer
+
+from database import SessionLocal
+from app.models import Customer, Enquiry, ErrorLog, Feedback, Interaction, Issue, Order, ResponseMetrics
+from app.utils.metrics import metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for parquet exports
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+
+# Exportable tables; every one is scoped to the requesting user by user_id
+EXPORT_TABLES = {
+    "orders": Order,
+    "interactions": Interaction,
+    "issues": Issue,
+    "enquiries": Enquiry,
+    "feedback": Feedback,
+    "customers": Customer,
+    "response_metrics": ResponseMetrics,
+    "error_logs": ErrorLog,
+}
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def resolve_columns(model, columns: Optional[str]) -> List:
+    """Column objects for a comma-separated selection (default: all but user_id)"""
+    table_columns = {c.key: c for c in model.__table__.columns}
+    if not columns:
+        return [c for key, c in table_columns.items() if key != "user_id"]
+    selected = []
+    for name in (n.strip() for n in columns.split(",")):
+        if not name:
+            continue
+        if name not in table_columns:
+            raise HTTPException(status_code=400, detail=f"Unknown column '{name}' for {model.__tablename__}")
+        selected.append(table_columns[name])
+    if not selected:
+        raise HTTPException(status_code=400, detail="No columns selected")
+    return selected
+
+
+def check_format(fmt: str) -> str:
+    fmt = fmt.lower()
+    if fmt not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{fmt}'; use one of {', '.join(MEDIA_TYPES)}")
+    if fmt == "parquet" and pa is None:
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed on the server")
+    return fmt
+
+
+def iter_chunks(model, columns: Sequence, user_id: int, start_date: Optional[datetime] = None,
+                end_date: Optional[datetime] = None, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[List]:
+    """Yield lists of at most chunk_rows rows, read through a server-side cursor"""
+    db = SessionLocal()
+    try:
+        query = db.query(*columns).filter(model.user_id == user_id)
+        if start_date:
+            query = query.filter(model.created_at >= start_date)
+        if end_date:
+            query = query.filter(model.created_at <= end_date)
+        primary_key = list(model.__table__.primary_key.columns)
+        query = query.order_by(model.created_at, *primary_key)
+        # yield_per streams results (stream_results) instead of buffering the whole result set
+        result = db.execute(query.statement.execution_options(yield_per=chunk_rows))
+        for partition in result.partitions():
+            yield partition
+    finally:
+        db.close()
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def encode_csv(names: List[str], chunks: Iterator[List]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_ndjson(names: List[str], chunks: Iterator[List]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(
+            json.dumps({name: _plain(value) for name, value in zip(names, row)}, default=str) + "\n" for row in rows
+        ).encode()
+
+
+def _arrow_type(column):
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    if isinstance(column_type, Float):
+        return pa.float64()
+    if isinstance(column_type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column_type, Date):
+        return pa.date32()
+    return pa.string()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain"""
+
+    def __init__(self):
+        super().__init__()
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def encode_parquet(columns: Sequence, chunks: Iterator[List]) -> Iterator[bytes]:
+    schema = pa.schema([(c.key, _arrow_type(c)) for c in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            arrays = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_stream(table: str, fmt: str, user_id: int, columns: Sequence,
+                  start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                  chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """Encoded body of an export, produced chunk by chunk"""
+    model = EXPORT_TABLES[table]
+    names = [c.key for c in columns]
+    exported = 0
+
+    def counted(chunks):
+        nonlocal exported
+        for rows in chunks:
+            exported += len(rows)
+            yield rows
+
+    chunks = counted(iter_chunks(model, columns, user_id, start_date, end_date, chunk_rows))
+    if fmt == "parquet":
+        body = encode_parquet(columns, chunks)
+    elif fmt == "ndjson":
+        body = encode_ndjson(names, chunks)
+    else:
+        body = encode_csv(names, chunks)
+    try:
+        with metrics.timer(f"export.{fmt}"):
+            for data in body:
+                if data:
+                    yield data
+    except Exception as e:
+        # Headers are already sent; all we can do is log and cut the body short
+        logger.error(f"Export of {table} for user {user_id} failed after {exported} rows: {e}")
+        metrics.incr("export.errors")
+        raise
+    finally:
+        metrics.incr("export.rows", exported)
+
+
+def export_filename(table: str, fmt: str) -> str:
+    return f"{table}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
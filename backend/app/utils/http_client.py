@@ -0,0 +1,268 @@
+# app/utils/http_client.py
+
+"""
+Shared outbound HTTP layer for WhatsApp (graph.facebook.com) and HubSpot.
+
+Every outbound call goes through one of the two module-level clients:
+- http_client: a requests.Session, for the synchronous agents
+- async_http_client: an httpx.AsyncClient, for the async pipeline
+
+Both keep connections alive in per-host pools, apply default connect/read
+timeouts, cap in-flight requests per host, and retry with exponential backoff
+and full jitter. A Retry-After header on the response takes precedence over
+the computed delay.
+
+What is retried:
+- 429 responses and connection failures (nothing reached the server): any method
+- 5xx responses and read timeouts: only idempotent requests (GET/PUT/DELETE/...
+  or a call made with idempotent=True), so a POST that may have been applied,
+  e.g. a WhatsApp send, is never repeated.
+
+The last response is returned as-is once retries run out, so callers keep
+their existing status-code handling.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from dotenv import load_dotenv
+from app.utils.metrics import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "15"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_MAX_CONCURRENCY_PER_HOST = int(os.getenv("HTTP_MAX_CONCURRENCY_PER_HOST", "10"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class RetryPolicy:
+    """Decides whether an attempt is retried and how long to wait before the next one"""
+
+    def __init__(self, max_retries: int = HTTP_MAX_RETRIES, backoff_base: float = HTTP_BACKOFF_BASE,
+                 backoff_max: float = HTTP_BACKOFF_MAX):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def should_retry_status(self, status_code: int, idempotent: bool) -> bool:
+        if status_code == 429:
+            return True
+        return idempotent and status_code in RETRY_STATUSES
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to sleep before retry number `attempt` (starting at 0)"""
+        server_delay = parse_retry_after(retry_after)
+        if server_delay is not None:
+            return min(server_delay, self.backoff_max)
+        # Full jitter: uniform over [0, base * 2^attempt]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds; accepts delta-seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc or "unknown"
+
+
+def _never_sent(error: Exception) -> bool:
+    """True if a requests failure happened while connecting, i.e. before the request was sent"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def _is_idempotent(method: str, idempotent: Optional[bool]) -> bool:
+    return idempotent if idempotent is not None else method.upper() in IDEMPOTENT_METHODS
+
+
+class HttpClient:
+    """Pooled requests.Session with timeouts, retries and per-host concurrency limits"""
+
+    def __init__(self, policy: Optional[RetryPolicy] = None, pool_size: int = HTTP_POOL_SIZE,
+                 max_per_host: int = HTTP_MAX_CONCURRENCY_PER_HOST,
+                 timeout: Tuple[float, float] = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)):
+        self.policy = policy or RetryPolicy()
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        self.session = requests.Session()
+        # Retries are handled here (with Retry-After support), not by urllib3
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    def request(self, method: str, url: str, idempotent: Optional[bool] = None, **kwargs) -> requests.Response:
+        host = _host(url)
+        retry_any = _is_idempotent(method, idempotent)
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            try:
+                with self._semaphore(host), metrics.timer(f"http.{host}"):
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.policy.max_retries or not (retry_any or _never_sent(e)):
+                    metrics.incr(f"http.errors.{host}")
+                    raise
+                delay = self.policy.delay(attempt)
+                logger.warning(f"{method} {host} failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.2f}s")
+            else:
+                metrics.incr(f"http.status.{response.status_code}")
+                if attempt >= self.policy.max_retries or \
+                        not self.policy.should_retry_status(response.status_code, retry_any):
+                    return response
+                delay = self.policy.delay(attempt, response.headers.get("Retry-After"))
+                logger.warning(f"{method} {host} returned {response.status_code}, retry {attempt + 1} in {delay:.2f}s")
+                response.close()
+            metrics.incr("http.retries")
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncHttpClient:
+    """httpx.AsyncClient counterpart of HttpClient, created per event loop"""
+
+    def __init__(self, policy: Optional[RetryPolicy] = None, pool_size: int = HTTP_POOL_SIZE,
+                 max_per_host: int = HTTP_MAX_CONCURRENCY_PER_HOST,
+                 timeout: Tuple[float, float] = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)):
+        self.policy = policy or RetryPolicy()
+        self.pool_size = pool_size
+        self.max_per_host = max_per_host
+        self.timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Pooled connections and semaphores belong to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._loop = loop
+            self._semaphores = {}
+        return self._client
+
+    def _semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return self._semaphores[host]
+
+    async def request(self, method: str, url: str, idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+        host = _host(url)
+        retry_any = _is_idempotent(method, idempotent)
+        client = self.client
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore(host):
+                    with metrics.timer(f"http.{host}"):
+                        response = await client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                if attempt >= self.policy.max_retries:
+                    metrics.incr(f"http.errors.{host}")
+                    raise
+                delay = self.policy.delay(attempt)
+                logger.warning(f"{method} {host} failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.2f}s")
+            except (httpx.ReadTimeout, httpx.RemoteProtocolError) as e:
+                if attempt >= self.policy.max_retries or not retry_any:
+                    metrics.incr(f"http.errors.{host}")
+                    raise
+                delay = self.policy.delay(attempt)
+                logger.warning(f"{method} {host} failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.2f}s")
+            else:
+                metrics.incr(f"http.status.{response.status_code}")
+                if attempt >= self.policy.max_retries or \
+                        not self.policy.should_retry_status(response.status_code, retry_any):
+                    return response
+                delay = self.policy.delay(attempt, response.headers.get("Retry-After"))
+                logger.warning(f"{method} {host} returned {response.status_code}, retry {attempt + 1} in {delay:.2f}s")
+            metrics.incr("http.retries")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+
+
+# instantiate
+http_client = HttpClient()
+async_http_client = AsyncHttpClient()
@@ -0,0 +1,121 @@
+# app/utils/hubspot_cache.py
+
+"""
+Per-portal caches for HubSpot lookups that rarely change.
+
+A HubSpot private app token belongs to exactly one portal, so entries are
+keyed by a hash of the token (the token itself is never kept as a key).
+Cached per portal:
+- whether a CRM object type (e.g. "order") exists: HUBSPOT_SCHEMA_TTL_SECONDS
+- the Order object's property names: HUBSPOT_SCHEMA_TTL_SECONDS
+- phone -> contact id, plus a fingerprint of the properties last written to
+  that contact: HUBSPOT_CONTACT_TTL_SECONDS
+
+Only definite answers are cached (a 200, or a 400/404 for a missing object
+type); errors and throttled responses are always asked again.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from app.utils.metrics import metrics
+
+load_dotenv()
+
+HUBSPOT_SCHEMA_TTL_SECONDS = int(os.getenv("HUBSPOT_SCHEMA_TTL_SECONDS", "3600"))
+HUBSPOT_CONTACT_TTL_SECONDS = int(os.getenv("HUBSPOT_CONTACT_TTL_SECONDS", "86400"))
+HUBSPOT_CACHE_MAX_ENTRIES = int(os.getenv("HUBSPOT_CACHE_MAX_ENTRIES", "50000"))
+
+_MISSING = object()
+
+
+def portal_key(access_token: str) -> str:
+    return hashlib.sha256((access_token or "").encode()).hexdigest()[:16]
+
+
+def properties_fingerprint(properties: Dict[str, Any]) -> str:
+    return hashlib.sha1(repr(sorted(properties.items())).encode()).hexdigest()
+
+
+class HubSpotCache:
+    """LRU of (kind, portal, key) -> value with a per-entry expiry"""
+
+    def __init__(self, schema_ttl: int = HUBSPOT_SCHEMA_TTL_SECONDS,
+                 contact_ttl: int = HUBSPOT_CONTACT_TTL_SECONDS, max_entries: int = HUBSPOT_CACHE_MAX_ENTRIES):
+        self.schema_ttl = schema_ttl
+        self.contact_ttl = contact_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Any]]" = OrderedDict()
+
+    def _get(self, kind: str, access_token: str, key: str = ""):
+        entry_key = (kind, portal_key(access_token), key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[entry_key]
+                metrics.incr(f"hubspot_cache.miss.{kind}")
+                return _MISSING
+            self._entries.move_to_end(entry_key)
+        metrics.incr(f"hubspot_cache.hit.{kind}")
+        return entry[1]
+
+    def _put(self, kind: str, access_token: str, key: str, value: Any, ttl: int):
+        entry_key = (kind, portal_key(access_token), key)
+        with self._lock:
+            self._entries[entry_key] = (time.time() + ttl, value)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _drop(self, kind: str, access_token: str, key: str = ""):
+        with self._lock:
+            self._entries.pop((kind, portal_key(access_token), key), None)
+
+    # ---- schema ----
+    def object_exists(self, access_token: str, object_type: str) -> Optional[bool]:
+        value = self._get("object", access_token, object_type)
+        return None if value is _MISSING else value
+
+    def set_object_exists(self, access_token: str, object_type: str, exists: bool):
+        self._put("object", access_token, object_type, exists, self.schema_ttl)
+
+    def order_properties(self, access_token: str) -> Optional[List[str]]:
+        value = self._get("order_properties", access_token)
+        return None if value is _MISSING else value
+
+    def set_order_properties(self, access_token: str, properties: List[str]):
+        self._put("order_properties", access_token, "", list(properties), self.schema_ttl)
+
+    # ---- contacts ----
+    def contact(self, access_token: str, phone: str) -> Tuple[Optional[str], Optional[str]]:
+        """(contact_id, fingerprint of the properties last written) for a phone, or (None, None)"""
+        value = self._get("contact", access_token, str(phone))
+        return (None, None) if value is _MISSING else value
+
+    def set_contact(self, access_token: str, phone: str, contact_id: str, fingerprint: Optional[str] = None):
+        self._put("contact", access_token, str(phone), (str(contact_id), fingerprint), self.contact_ttl)
+
+    def forget_contact(self, access_token: str, phone: str):
+        """Drop a mapping that turned out to be stale (e.g. the contact was deleted or merged)"""
+        self._drop("contact", access_token, str(phone))
+
+    def invalidate(self, access_token: Optional[str] = None):
+        """Forget one portal (e.g. after its token changes), or everything"""
+        with self._lock:
+            if access_token is None:
+                self._entries.clear()
+                return
+            portal = portal_key(access_token)
+            for entry_key in [k for k in self._entries if k[1] == portal]:
+                del self._entries[entry_key]
+
+
+# instantiate
+hubspot_cache = HubSpotCache()
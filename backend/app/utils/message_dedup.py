@@ -0,0 +1,166 @@
+# app/utils/message_dedup.py
+
+"""
+Drops redelivered WhatsApp messages before they reach the pipeline.
+
+Meta retries a webhook until it gets a 200, and may deliver the same message
+more than once even after one, so every inbound message id is claimed here
+before it is queued:
+- an in-process LRU of recently seen ids answers most repeats without I/O
+  (MESSAGE_DEDUP_LRU_SIZE ids, each for MESSAGE_DEDUP_TTL_SECONDS)
+- otherwise the id is inserted into processed_messages, whose primary key
+  makes the claim atomic across uvicorn workers and restarts
+
+A message that is already claimed is a duplicate and is acknowledged without
+being processed. Database errors fail open: the message is processed and the
+unique whatsapp_message_id on interaction_logs stays the last line of defence.
+Claimed ids are kept for MESSAGE_DEDUP_RETENTION_DAYS.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import SessionLocal
+from app.models import ProcessedMessage
+from app.utils.metrics import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+MESSAGE_DEDUP_ENABLED = os.getenv("MESSAGE_DEDUP_ENABLED", "true").lower() == "true"
+MESSAGE_DEDUP_LRU_SIZE = int(os.getenv("MESSAGE_DEDUP_LRU_SIZE", "100000"))
+MESSAGE_DEDUP_TTL_SECONDS = int(os.getenv("MESSAGE_DEDUP_TTL_SECONDS", "86400"))
+MESSAGE_DEDUP_RETENTION_DAYS = int(os.getenv("MESSAGE_DEDUP_RETENTION_DAYS", "7"))
+
+PRUNE_INTERVAL_SECONDS = 3600
+
+
+class MessageDedup:
+    """Claims message ids once: in-memory LRU in front of the processed_messages table"""
+
+    def __init__(self, session_factory=SessionLocal, max_entries: int = MESSAGE_DEDUP_LRU_SIZE,
+                 ttl: int = MESSAGE_DEDUP_TTL_SECONDS, enabled: bool = MESSAGE_DEDUP_ENABLED):
+        self.session_factory = session_factory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._last_prune = 0.0
+
+    # ---- in-memory LRU ----
+    def _seen_recently(self, message_id: str) -> bool:
+        with self._lock:
+            expires = self._seen.get(message_id)
+            if expires is None:
+                return False
+            if expires < time.time():
+                del self._seen[message_id]
+                return False
+            self._seen.move_to_end(message_id)
+            return True
+
+    def _remember(self, message_id: str):
+        with self._lock:
+            self._seen[message_id] = time.time() + self.ttl
+            self._seen.move_to_end(message_id)
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+
+    # ---- processed_messages ----
+    def _insert(self, message_id: str, business_phone_id: Optional[str]) -> bool:
+        """Insert the id; True if this call claimed it, False if it was already there"""
+        db = self.session_factory()
+        try:
+            dialect = db.get_bind().dialect.name
+            insert = pg_insert if dialect == "postgresql" else sqlite_insert
+            result = db.execute(
+                insert(ProcessedMessage)
+                .values(message_id=message_id, business_phone_id=business_phone_id, first_seen_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=["message_id"])
+            )
+            db.commit()
+            return result.rowcount == 1
+        finally:
+            db.close()
+
+    def _delete(self, message_id: str):
+        db = self.session_factory()
+        try:
+            db.query(ProcessedMessage).filter(ProcessedMessage.message_id == message_id).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def prune(self, retention_days: int = MESSAGE_DEDUP_RETENTION_DAYS) -> int:
+        """Delete claims past the retention window (Meta stops retrying long before)"""
+        db = self.session_factory()
+        try:
+            cutoff = datetime.utcnow() - timedelta(days=retention_days)
+            count = db.query(ProcessedMessage).filter(
+                ProcessedMessage.first_seen_at < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    # ---- public ----
+    async def claim(self, message_id: Optional[str], business_phone_id: Optional[str] = None) -> bool:
+        """True if the message is new and should be processed, False if it is a duplicate"""
+        if not self.enabled or not message_id:
+            return True
+        if self._seen_recently(message_id):
+            metrics.incr("dedup.hit.memory")
+            return False
+        try:
+            claimed = await asyncio.to_thread(self._insert, message_id, business_phone_id)
+        except Exception as e:
+            metrics.incr("dedup.error")
+            logger.error(f"Message dedup check failed for {message_id}, processing it anyway: {e}")
+            return True
+        self._remember(message_id)
+        if not claimed:
+            metrics.incr("dedup.hit.db")
+            return False
+        metrics.incr("dedup.miss")
+        if time.time() - self._last_prune > PRUNE_INTERVAL_SECONDS:
+            self._last_prune = time.time()
+            asyncio.get_running_loop().run_in_executor(None, self._prune_quietly)
+        return True
+
+    async def release(self, message_id: Optional[str]):
+        """Undo a claim whose message could not be queued, so Meta's retry is processed"""
+        if not self.enabled or not message_id:
+            return
+        with self._lock:
+            self._seen.pop(message_id, None)
+        try:
+            await asyncio.to_thread(self._delete, message_id)
+        except Exception as e:
+            logger.error(f"Could not release dedup claim for {message_id}: {e}")
+
+    def _prune_quietly(self):
+        try:
+            self.prune()
+        except Exception as e:
+            logger.error(f"Could not prune processed_messages: {e}")
+
+    def clear(self):
+        """Forget the in-memory ids (the table is left alone)"""
+        with self._lock:
+            self._seen.clear()
+
+
+# instantiate
+message_dedup = MessageDedup()
@@ -0,0 +1,87 @@
+"""
+In-process metrics for the WAffy message pipeline.
+
+Counters, gauges and latency samples are kept in memory and exposed as a
+JSON snapshot through the /metrics endpoint on the listener router.
+"""
+
+import time
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Any
+
+# Number of latency samples kept per timer for percentile calculation
+MAX_SAMPLES_PER_TIMER = 1000
+
+
+def _percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class MetricsRegistry:
+    """Thread-safe registry of counters, gauges and latency timers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.gauges: Dict[str, float] = {}
+        self.timers: Dict[str, deque] = defaultdict(lambda: deque(maxlen=MAX_SAMPLES_PER_TIMER))
+        self.timer_counts: Dict[str, int] = defaultdict(int)
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            self.timers[name].append(seconds)
+            self.timer_counts[name] += 1
+
+    @contextmanager
+    def timer(self, name: str):
+        """Context manager that records the elapsed time of its block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-serializable view of all metrics"""
+        with self._lock:
+            timers = {}
+            for name, samples in self.timers.items():
+                values = sorted(samples)
+                timers[name] = {
+                    "count": self.timer_counts[name],
+                    "avg_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+                    "p50_ms": round(_percentile(values, 50) * 1000, 2),
+                    "p95_ms": round(_percentile(values, 95) * 1000, 2),
+                    "p99_ms": round(_percentile(values, 99) * 1000, 2),
+                    "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+                }
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "timers": timers,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.timers.clear()
+            self.timer_counts.clear()
+
+
+# instantiate
+metrics = MetricsRegistry()
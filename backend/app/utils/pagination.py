@@ -0,0 +1,74 @@
+# app/utils/pagination.py
+
+"""
+Keyset pagination helpers for the dashboard list endpoints.
+
+Pages are ordered newest first on (created_at, id). The cursor is an opaque
+token holding the (created_at, id) of the last row returned; the next page
+continues strictly after it, so each page is one index range scan no matter
+how deep the client has paged. The cursor for the following page is sent in
+the X-Next-Cursor response header, and the body stays a plain list.
+"""
+
+import os
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "500"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, row_id: Any) -> str:
+    stamp = created_at.isoformat() if created_at else ""
+    return base64.urlsafe_b64encode(f"{stamp}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str, id_type=int) -> Tuple[Optional[datetime], Any]:
+    try:
+        stamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return (datetime.fromisoformat(stamp) if stamp else None), id_type(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def page_size(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return PAGE_SIZE_DEFAULT
+    return min(limit, PAGE_SIZE_MAX)
+
+
+def date_range(query, column, start_date: Optional[datetime], end_date: Optional[datetime]):
+    if start_date:
+        query = query.filter(column >= start_date)
+    if end_date:
+        query = query.filter(column <= end_date)
+    return query
+
+
+def keyset_page(query, created_col, id_col, cursor: Optional[str], limit: Optional[int],
+                response: Response) -> List[Any]:
+    """
+    Apply cursor, ordering and limit to a projected query and return its rows.
+
+    The query must select created_col and id_col by name (they are read back
+    to build the next cursor). Sets X-Next-Cursor when more rows remain.
+    """
+    size = page_size(limit)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor, id_col.type.python_type)
+        # Row-value comparison, served directly by an index on (created_at, id)
+        query = query.filter(tuple_(created_col, id_col) < tuple_(created_at, row_id))
+
+    rows = query.order_by(created_col.desc(), id_col.desc()).limit(size + 1).all()
+    if len(rows) > size:
+        rows = rows[:size]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            getattr(last, created_col.key), getattr(last, id_col.key)
+        )
+    return rows
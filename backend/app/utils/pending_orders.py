@@ -0,0 +1,169 @@
+# app/utils/pending_orders.py
+
+"""
+In-process index of each customer's open (pending) order.
+
+ReviewAgent decides whether an order message joins the customer's most recent
+order: it does if that order is still pending and either was created within
+the consolidation window (CONSOLIDATION_WINDOW_SECONDS) or the message asks to
+add to it. LoggerAgent then looks the pending order up again when it stores
+the lines. This index answers both without a query:
+- LoggerAgent._store_order records the order it wrote once the message's
+  transaction commits
+- PUT /api/orders/{order_number} records status changes
+- a lookup that misses falls back to the database and caches its answer
+
+A customer's entry holds the order number, creation time, status and delivery
+fields of their most recent order, or None when that order is not pending.
+Entries expire when the consolidation window of their order closes (after
+that only an explicit "add" can join the order, and the database is asked);
+"no pending order" answers expire after PENDING_ORDER_NEGATIVE_TTL_SECONDS.
+
+The index only sees writes made by its own process, so it is off by default
+and may only be turned on (PENDING_ORDER_INDEX_ENABLED=true) when a single
+process both runs the message pipeline and serves the API: one uvicorn worker
+on one host. With several processes a stale "no pending order" would open a
+duplicate order, and a status change made elsewhere would go unseen. It stays
+off when WEB_CONCURRENCY asks uvicorn for more than one worker.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from dotenv import load_dotenv
+from app.utils.metrics import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PENDING_ORDER_INDEX_ENABLED = os.getenv("PENDING_ORDER_INDEX_ENABLED", "false").lower() == "true"
+CONSOLIDATION_WINDOW_SECONDS = int(os.getenv("CONSOLIDATION_WINDOW_SECONDS", "1800"))
+PENDING_ORDER_NEGATIVE_TTL_SECONDS = int(os.getenv("PENDING_ORDER_NEGATIVE_TTL_SECONDS", "60"))
+PENDING_ORDER_INDEX_MAX_ENTRIES = int(os.getenv("PENDING_ORDER_INDEX_MAX_ENTRIES", "100000"))
+
+_MISSING = object()
+
+
+def single_process() -> bool:
+    """False when uvicorn is told to start several workers"""
+    try:
+        return int(os.getenv("WEB_CONCURRENCY", "1")) <= 1
+    except ValueError:
+        return True
+
+
+@dataclass(frozen=True)
+class PendingOrder:
+    """The Order columns the consolidation decision reads"""
+    order_number: str
+    customer_id: str
+    created_at: datetime
+    order_status: str = "pending"
+    delivery_address: Optional[str] = None
+    delivery_time: Optional[Any] = None
+    delivery_method: Optional[str] = None
+
+    @classmethod
+    def from_order(cls, order) -> "PendingOrder":
+        return cls(
+            order_number=order.order_number, customer_id=order.customer_id, created_at=order.created_at,
+            order_status=order.order_status, delivery_address=order.delivery_address,
+            delivery_time=order.delivery_time, delivery_method=order.delivery_method,
+        )
+
+
+class PendingOrderIndex:
+    """LRU of customer_id -> (expiry, PendingOrder or None)"""
+
+    def __init__(self, window_seconds: int = CONSOLIDATION_WINDOW_SECONDS,
+                 negative_ttl: int = PENDING_ORDER_NEGATIVE_TTL_SECONDS,
+                 max_entries: int = PENDING_ORDER_INDEX_MAX_ENTRIES, enabled: bool = PENDING_ORDER_INDEX_ENABLED):
+        self.window_seconds = window_seconds
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        if enabled and not single_process():
+            logger.warning("Pending-order index disabled: it is only safe with a single worker process")
+            enabled = False
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Optional[PendingOrder]]]" = OrderedDict()
+
+    def _window_left(self, order: PendingOrder) -> float:
+        # Same clock as ReviewAgent's age check (datetime.now() - created_at)
+        return self.window_seconds - (datetime.now() - order.created_at).total_seconds()
+
+    def _put(self, customer_id: str, order: Optional[PendingOrder], ttl: float):
+        if not self.enabled or not customer_id:
+            return
+        with self._lock:
+            if ttl <= 0:
+                self._entries.pop(customer_id, None)
+                return
+            self._entries[customer_id] = (time.time() + ttl, order)
+            self._entries.move_to_end(customer_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            metrics.set_gauge("pending_orders.entries", len(self._entries))
+
+    def lookup(self, customer_id: str):
+        """The customer's pending order, None if they have none, or _MISSING if unknown here"""
+        if not self.enabled or not customer_id:
+            return _MISSING
+        with self._lock:
+            entry = self._entries.get(customer_id)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[customer_id]
+                metrics.incr("pending_orders.miss")
+                return _MISSING
+            self._entries.move_to_end(customer_id)
+        metrics.incr("pending_orders.hit" if entry[1] is not None else "pending_orders.hit_none")
+        return entry[1]
+
+    def get(self, customer_id: str) -> Tuple[bool, Optional[PendingOrder]]:
+        """(known, pending order or None); when known is False the caller must ask the database"""
+        value = self.lookup(customer_id)
+        return (False, None) if value is _MISSING else (True, value)
+
+    def record(self, order: Optional[PendingOrder], customer_id: Optional[str] = None):
+        """Store the customer's most recent order (pending or not) as the database has it now"""
+        customer_id = customer_id or (order.customer_id if order else None)
+        if order is None or order.order_status != "pending":
+            self._put(customer_id, None, self.negative_ttl)
+        else:
+            self._put(customer_id, order, self._window_left(order))
+
+    def set_status(self, order_number: str, customer_id: Optional[str], status: str):
+        """Apply a status change made outside the message pipeline"""
+        if not self.enabled or not customer_id:
+            return
+        with self._lock:
+            entry = self._entries.get(customer_id)
+        if entry is None:
+            return
+        current = entry[1]
+        if current is None:
+            if status == "pending":
+                # A reopened order may be the customer's open one again; ask the database next time
+                self.forget(customer_id)
+        elif current.order_number == order_number and status != "pending":
+            self._put(customer_id, None, self.negative_ttl)
+
+    def forget(self, customer_id: Optional[str]):
+        with self._lock:
+            self._entries.pop(customer_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# instantiate
+pending_order_index = PendingOrderIndex()
@@ -0,0 +1,185 @@
+# app/utils/rate_limiter.py
+
+"""
+Fixed-window rate limiting for the webhook receiver.
+
+Each limit counts hits per key in windows of RATE_LIMIT_WINDOW_SECONDS.
+Checking a key is O(1): the in-process backend keeps one dict of counters for
+the current window and drops the whole dict when the window rolls over, so
+customers who go quiet cost nothing after one window. With
+RATE_LIMIT_BACKEND=redis the counters are INCR'd keys that expire with their
+window, shared by every worker.
+
+Two limits are applied to every inbound message:
+- per customer (wa_id): RATE_LIMIT_CUSTOMER_PER_WINDOW
+- per tenant (phone_number_id): RATE_LIMIT_TENANT_PER_WINDOW, overridable per
+  phone_number_id through RATE_LIMIT_TENANT_OVERRIDES, a JSON object.
+
+Before the body is read, the webhook peeks at the tenant counter (the
+phone_number_id is in the URL) and answers 429 straight away when the tenant
+has used up its window, without parsing any JSON. The per-customer limit
+needs the sender's wa_id, so it is checked per message after parsing (Meta
+batches several customers' messages into one POST). Messages under the limit
+are queued; if any message is over it, the whole delivery is answered 429 and
+only the over-limit messages have their dedup claim released, so Meta's retry
+queues just those and drops the rest as duplicates.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from app.utils.metrics import metrics
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # only needed for the redis backend
+    aioredis = None
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
+RATE_LIMIT_CUSTOMER_PER_WINDOW = int(os.getenv("RATE_LIMIT_CUSTOMER_PER_WINDOW", "10"))
+RATE_LIMIT_TENANT_PER_WINDOW = int(os.getenv("RATE_LIMIT_TENANT_PER_WINDOW", "600"))
+RATE_LIMIT_TENANT_OVERRIDES = os.getenv("RATE_LIMIT_TENANT_OVERRIDES", "")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class MemoryCounter:
+    """Counters for the current window only; older windows are dropped wholesale"""
+
+    def __init__(self, window_seconds: int):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._window = -1
+        self._counts: Dict[str, int] = {}
+
+    async def incr(self, key: str) -> Tuple[int, float]:
+        """Count one hit; return (hits in this window, seconds until it resets)"""
+        now = time.time()
+        window = int(now // self.window_seconds)
+        with self._lock:
+            if window != self._window:
+                self._window = window
+                self._counts = {}
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+            metrics.set_gauge("rate_limit.keys", len(self._counts))
+        return count, (window + 1) * self.window_seconds - now
+
+    async def peek(self, key: str) -> Tuple[int, float]:
+        """Hits in this window so far, without counting one; and seconds until it resets"""
+        now = time.time()
+        window = int(now // self.window_seconds)
+        with self._lock:
+            count = self._counts.get(key, 0) if window == self._window else 0
+        return count, (window + 1) * self.window_seconds - now
+
+
+class RedisCounter:
+    """INCR on a per-window key that expires with the window"""
+
+    def __init__(self, client, window_seconds: int, prefix: str = "waffy:rl:"):
+        self.client = client
+        self.window_seconds = window_seconds
+        self.prefix = prefix
+
+    async def incr(self, key: str) -> Tuple[int, float]:
+        now = time.time()
+        window = int(now // self.window_seconds)
+        name = f"{self.prefix}{key}:{window}"
+        count = await self.client.incr(name)
+        if count == 1:
+            await self.client.expire(name, self.window_seconds + 1)
+        return count, (window + 1) * self.window_seconds - now
+
+    async def peek(self, key: str) -> Tuple[int, float]:
+        now = time.time()
+        window = int(now // self.window_seconds)
+        count = await self.client.get(f"{self.prefix}{key}:{window}")
+        return int(count or 0), (window + 1) * self.window_seconds - now
+
+
+class RateLimiter:
+    """Per-customer and per-tenant limits over a shared counter backend"""
+
+    def __init__(self, counter, customer_limit: int = RATE_LIMIT_CUSTOMER_PER_WINDOW,
+                 tenant_limit: int = RATE_LIMIT_TENANT_PER_WINDOW,
+                 tenant_overrides: Optional[Dict[str, int]] = None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.counter = counter
+        self.customer_limit = customer_limit
+        self.tenant_limit = tenant_limit
+        self.tenant_overrides = tenant_overrides or {}
+        self.enabled = enabled
+
+    async def tenant_exhausted(self, phone_number_id: str) -> Optional[int]:
+        """Retry-After seconds when the tenant has no hits left in this window, else None; counts nothing"""
+        if not self.enabled:
+            return None
+        try:
+            count, reset_in = await self.counter.peek(f"t:{phone_number_id}")
+            if count >= self.tenant_overrides.get(phone_number_id, self.tenant_limit):
+                metrics.incr("rate_limit.limited.tenant")
+                return max(1, int(reset_in + 0.999))
+        except Exception as e:
+            logger.error(f"Rate limiter unavailable, allowing delivery: {e}")
+            metrics.incr("rate_limit.errors")
+        return None
+
+    async def check(self, phone_number_id: str, customer_id: Optional[str]) -> Optional[int]:
+        """Return None when allowed, or the Retry-After seconds when a limit is exceeded"""
+        if not self.enabled:
+            return None
+        try:
+            if customer_id:
+                count, reset_in = await self.counter.incr(f"c:{phone_number_id}:{customer_id}")
+                if count > self.customer_limit:
+                    metrics.incr("rate_limit.limited.customer")
+                    return max(1, int(reset_in + 0.999))
+
+            limit = self.tenant_overrides.get(phone_number_id, self.tenant_limit)
+            count, reset_in = await self.counter.incr(f"t:{phone_number_id}")
+            if count > limit:
+                metrics.incr("rate_limit.limited.tenant")
+                return max(1, int(reset_in + 0.999))
+        except Exception as e:
+            # A broken shared backend must not stop message intake
+            logger.error(f"Rate limiter unavailable, allowing message: {e}")
+            metrics.incr("rate_limit.errors")
+        return None
+
+
+def _parse_overrides(raw: str) -> Dict[str, int]:
+    if not raw:
+        return {}
+    try:
+        return {str(k): int(v) for k, v in json.loads(raw).items()}
+    except Exception as e:
+        logger.error(f"Ignoring invalid RATE_LIMIT_TENANT_OVERRIDES: {e}")
+        return {}
+
+
+def create_counter(name: str = RATE_LIMIT_BACKEND):
+    """Build the configured counter backend; falls back to in-process counters"""
+    if name == "redis":
+        try:
+            if REDIS_URL.startswith("fakeredis://"):
+                from fakeredis import aioredis as fake_aioredis
+                return RedisCounter(fake_aioredis.FakeRedis(), RATE_LIMIT_WINDOW_SECONDS)
+            if aioredis is None:
+                raise RuntimeError("redis package is not installed")
+            return RedisCounter(aioredis.Redis.from_url(REDIS_URL), RATE_LIMIT_WINDOW_SECONDS)
+        except Exception as e:
+            logger.error(f"Rate limit backend 'redis' unavailable, using in-process counters: {e}")
+    return MemoryCounter(RATE_LIMIT_WINDOW_SECONDS)
+
+
+# instantiate
+rate_limiter = RateLimiter(create_counter(), tenant_overrides=_parse_overrides(RATE_LIMIT_TENANT_OVERRIDES))
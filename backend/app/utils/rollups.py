@@ -0,0 +1,299 @@
+# app/utils/rollups.py
+
+"""
+Incrementally maintained per-tenant daily rollups for the dashboard.
+
+Every row in daily_rollups is a (user_id, day, dimension, value) counter with
+a running total. The storage path adds to them in the same transaction as
+the row it writes, using an atomic INSERT .. ON CONFLICT DO UPDATE, so
+/api/analytics/summary only reads O(days x dimensions) rows.
+
+Dimensions:
+- category / priority: stored interactions (messages)
+- orders: value "new", one per new order number; value "repeat" for the new
+  orders of customers who had ordered before
+- order_lines: value "all"; total = summed quantity
+- revenue: value "all", one per order line; total = summed total_amount
+- order_status: order lines per status (moved by status updates)
+- customers: value "new", one per customer created
+- issue_status / enquiry_status: issues and enquiries per status when opened
+- response_type: WhatsApp replies per type; total = response seconds
+- response_time: histogram of response seconds; value = bucket upper bound
+
+Run `python -m app.utils.rollups` from the backend directory to rebuild the
+rollups from the base tables (e.g. after first deploying them).
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.models import Customer, DailyRollup, Enquiry, Interaction, Issue, Order, ResponseMetrics
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the response-time histogram buckets
+RESPONSE_BUCKETS = [0.5, 1, 2, 3, 5, 8, 13, 21, 34, 60, 120, 300, float("inf")]
+
+# (dimension, value, count, total)
+Increment = Tuple[str, str, int, float]
+
+
+def response_bucket(seconds: float) -> str:
+    for bound in RESPONSE_BUCKETS:
+        if seconds <= bound:
+            return "inf" if bound == float("inf") else str(bound)
+    return "inf"
+
+
+def interaction_increments(category: Optional[str], priority: Optional[str], sign: int = 1) -> List[Increment]:
+    return [
+        ("category", category or "unknown", sign, 0.0),
+        ("priority", priority or "unknown", sign, 0.0),
+    ]
+
+
+def _number(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def order_increments(orders: Iterable, new_order: bool, repeat: bool = False) -> List[Increment]:
+    orders = list(orders)
+    if not orders:
+        return []
+    increments: List[Increment] = []
+    if new_order:
+        increments.append(("orders", "new", 1, 0.0))
+        if repeat:
+            increments.append(("orders", "repeat", 1, 0.0))
+    for order in orders:
+        increments.append(("order_lines", "all", 1, _number(order.quantity)))
+        increments.append(("revenue", "all", 1, _number(order.total_amount)))
+        increments.append(("order_status", order.order_status or "unknown", 1, 0.0))
+    return increments
+
+
+def customer_increments() -> List[Increment]:
+    return [("customers", "new", 1, 0.0)]
+
+
+def issue_increments(status: Optional[str]) -> List[Increment]:
+    return [("issue_status", status or "unknown", 1, 0.0)]
+
+
+def enquiry_increments(status: Optional[str]) -> List[Increment]:
+    return [("enquiry_status", status or "unknown", 1, 0.0)]
+
+
+def status_change_increments(old_status: Optional[str], new_status: Optional[str]) -> List[Increment]:
+    if old_status == new_status:
+        return []
+    return [("order_status", old_status or "unknown", -1, 0.0), ("order_status", new_status or "unknown", 1, 0.0)]
+
+
+def response_increments(response_type: Optional[str], seconds: Optional[float]) -> List[Increment]:
+    seconds = float(seconds or 0.0)
+    return [
+        ("response_type", response_type or "unknown", 1, seconds),
+        ("response_time", response_bucket(seconds), 1, seconds),
+    ]
+
+
+def _day(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.utcnow().date()
+
+
+def rollup_statement(dialect: str, user_id: int, day, increments: List[Increment]):
+    """One upsert adding each increment to its counter, with a parameter set per counter (for executemany)"""
+    if not user_id or not increments:
+        return None, []
+    insert = pg_insert if dialect == "postgresql" else sqlite_insert
+    merged: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0.0])
+    for dimension, value, count, total in increments:
+        merged[(dimension, str(value)[:50])][0] += count
+        merged[(dimension, str(value)[:50])][1] += total
+
+    stmt = insert(DailyRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "day", "dimension", "value"],
+        set_={"count": DailyRollup.count + stmt.excluded.count, "total": DailyRollup.total + stmt.excluded.total},
+    )
+    rows = [
+        {"user_id": user_id, "day": _day(day), "dimension": dimension, "value": value, "count": count, "total": total}
+        for (dimension, value), (count, total) in merged.items()
+    ]
+    return stmt, rows
+
+
+def record(db, user_id: int, day, increments: List[Increment]):
+    """
+    Add increments inside the caller's transaction (one round-trip); the caller
+    commits. The upsert runs in a savepoint, so a failure rolls back only the
+    rollup and leaves the caller's transaction usable (Postgres aborts the
+    whole transaction on any failed statement otherwise).
+    """
+    try:
+        stmt, rows = rollup_statement(db.get_bind().dialect.name, user_id, day, increments)
+        if rows:
+            with db.begin_nested():
+                db.execute(stmt, rows)
+    except Exception as e:
+        # Rollups are derived data; never fail the write they describe
+        logger.error(f"Error updating daily rollups: {e}")
+
+
+async def arecord(db, user_id: int, day, increments: List[Increment]):
+    """Async variant of record for AsyncSession"""
+    try:
+        stmt, rows = rollup_statement(db.bind.dialect.name, user_id, day, increments)
+        if rows:
+            async with db.begin_nested():
+                await db.execute(stmt, rows)
+    except Exception as e:
+        logger.error(f"Error updating daily rollups: {e}")
+
+
+def summarize(db, user_id: int, days: int = 30) -> Dict:
+    """Build the dashboard summary from the rollup rows of the last `days` days"""
+    end_day = datetime.utcnow().date()
+    start_day = end_day - timedelta(days=days - 1)
+    rows = (
+        db.query(DailyRollup.day, DailyRollup.dimension, DailyRollup.value, DailyRollup.count, DailyRollup.total)
+        .filter(DailyRollup.user_id == user_id, DailyRollup.day >= start_day, DailyRollup.day <= end_day)
+        .all()
+    )
+
+    by_dimension: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    totals: Dict[str, float] = defaultdict(float)
+    daily: Dict[date, Dict[str, int]] = defaultdict(
+        lambda: {"messages": 0, "orders": 0, "responses": 0, "customers": 0, "issues": 0, "enquiries": 0})
+    histogram: Dict[str, int] = defaultdict(int)
+    for row in rows:
+        by_dimension[row.dimension][row.value] += row.count
+        totals[(row.dimension, row.value)] += row.total
+        if row.dimension == "category":
+            daily[row.day]["messages"] += row.count
+        elif row.dimension == "orders" and row.value == "new":
+            daily[row.day]["orders"] += row.count
+        elif row.dimension == "response_type":
+            daily[row.day]["responses"] += row.count
+        elif row.dimension == "customers":
+            daily[row.day]["customers"] += row.count
+        elif row.dimension == "issue_status":
+            daily[row.day]["issues"] += row.count
+        elif row.dimension == "enquiry_status":
+            daily[row.day]["enquiries"] += row.count
+        elif row.dimension == "response_time":
+            histogram[row.value] += row.count
+
+    responses = sum(by_dimension["response_type"].values())
+    response_seconds = sum(totals[("response_type", v)] for v in by_dimension["response_type"])
+    return {
+        "start_date": start_day.isoformat(),
+        "end_date": end_day.isoformat(),
+        "messages": {
+            "total": sum(by_dimension["category"].values()),
+            "by_category": dict(by_dimension["category"]),
+            "by_priority": dict(by_dimension["priority"]),
+        },
+        "orders": {
+            "total": by_dimension["orders"].get("new", 0),
+            "repeat": by_dimension["orders"].get("repeat", 0),
+            "line_items": by_dimension["order_lines"].get("all", 0),
+            "quantity": totals[("order_lines", "all")],
+            "revenue": round(totals[("revenue", "all")], 2),
+            "by_status": {k: v for k, v in by_dimension["order_status"].items() if v},
+        },
+        "customers": {
+            "new": by_dimension["customers"].get("new", 0),
+        },
+        "issues": {
+            "total": sum(by_dimension["issue_status"].values()),
+            "by_status": dict(by_dimension["issue_status"]),
+        },
+        "enquiries": {
+            "total": sum(by_dimension["enquiry_status"].values()),
+            "by_status": dict(by_dimension["enquiry_status"]),
+        },
+        "responses": {
+            "total": responses,
+            "avg_seconds": round(response_seconds / responses, 2) if responses else None,
+            "p50_seconds": _percentile(histogram, 0.50),
+            "p90_seconds": _percentile(histogram, 0.90),
+            "p95_seconds": _percentile(histogram, 0.95),
+            "by_type": dict(by_dimension["response_type"]),
+        },
+        "daily": [{"date": day.isoformat(), **counts} for day, counts in sorted(daily.items())],
+    }
+
+
+def _percentile(histogram: Dict[str, int], q: float) -> Optional[float]:
+    """Upper bound of the bucket holding the q-th response (None for the open-ended bucket)"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    seen = 0
+    for bound in RESPONSE_BUCKETS:
+        label = "inf" if bound == float("inf") else str(bound)
+        seen += histogram.get(label, 0)
+        if seen >= q * total:
+            return None if bound == float("inf") else bound
+    return None
+
+
+def rebuild(db, user_id: Optional[int] = None):
+    """Recompute rollups from interactions, orders and response_metrics"""
+    query = db.query(DailyRollup)
+    if user_id is not None:
+        query = query.filter(DailyRollup.user_id == user_id)
+    query.delete(synchronize_session=False)
+
+    def scoped(q, column):
+        return q.filter(column == user_id) if user_id is not None else q
+
+    for row in scoped(db.query(Interaction.user_id, Interaction.created_at, Interaction.category, Interaction.priority),
+                      Interaction.user_id):
+        record(db, row.user_id, row.created_at, interaction_increments(row.category, row.priority))
+
+    for row in scoped(db.query(Customer.user_id, Customer.created_at), Customer.user_id):
+        record(db, row.user_id, row.created_at, customer_increments())
+    for row in scoped(db.query(Issue.user_id, Issue.created_at, Issue.status), Issue.user_id):
+        record(db, row.user_id, row.created_at, issue_increments(row.status))
+    for row in scoped(db.query(Enquiry.user_id, Enquiry.created_at, Enquiry.status), Enquiry.user_id):
+        record(db, row.user_id, row.created_at, enquiry_increments(row.status))
+
+    first_line_seen = set()
+    ordering_customers = set()
+    for order in scoped(db.query(Order), Order.user_id).order_by(Order.created_at, Order.order_id):
+        new_order = order.order_number not in first_line_seen
+        first_line_seen.add(order.order_number)
+        repeat = new_order and order.customer_id in ordering_customers
+        ordering_customers.add(order.customer_id)
+        record(db, order.user_id, order.created_at, order_increments([order], new_order=new_order, repeat=repeat))
+    for row in scoped(db.query(ResponseMetrics.user_id, ResponseMetrics.message_received_at,
+                               ResponseMetrics.created_at, ResponseMetrics.response_type,
+                               ResponseMetrics.response_time_seconds), ResponseMetrics.user_id):
+        record(db, row.user_id, row.message_received_at or row.created_at,
+               response_increments(row.response_type, row.response_time_seconds))
+    db.commit()
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        rebuild(session)
+        print("Daily rollups rebuilt")
+    finally:
+        session.close()
@@ -0,0 +1,199 @@
+# app/utils/tenant_profiles.py
+
+"""
+Per-tenant classification profiles compiled from UserSettings.categories.
+
+Businesses pick their categories in the dashboard (a JSON list of snake_case
+names) or in the Streamlit business manager (suggested and custom categories
+plus a priority per category). A profile turns that setting into what the
+pipeline needs per message:
+- prompt_fragment: the category list and priority mapping for the Gemini
+  system instruction (see app/agents/prompt_builder.py)
+- tables: category -> storage table, used instead of map_category_to_table
+- priorities: category -> priority
+
+Profiles are compiled once per settings version (a hash of the stored value),
+so tenants with identical settings share one. The cache is keyed by the Tenant
+object tenant_registry returns; when update_user_settings invalidates the
+registry, the next message loads a new Tenant and its profile is looked up
+again. Tenants without categories use DEFAULT_PROFILE.
+"""
+
+import json
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from app.agents.prompt_builder import compile_categories
+from app.utils.category_map import DEFAULT_CATEGORIES, DEFAULT_PRIORITY_MAP, CATEGORY_TO_TABLE, IGNORED_CATEGORIES
+from app.utils.metrics import metrics
+from app.utils.tenant_registry import tenant_registry
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_LEVELS = ("high", "moderate", "low")
+# Offered to every tenant: the pipeline relies on them for small talk and fallbacks
+ALWAYS_OFFERED = ("greetings", "others")
+
+
+def normalize_category(name) -> str:
+    """Same form the dashboard stores custom categories in: trimmed, lowercase, snake_case"""
+    return "_".join(str(name or "").strip().lower().split())
+
+
+@dataclass(frozen=True)
+class ClassificationProfile:
+    """Everything classification needs to know about one tenant's categories"""
+    version: str
+    categories: Tuple[str, ...]
+    priorities: Dict[str, str] = field(hash=False)
+    tables: Dict[str, Optional[str]] = field(hash=False)
+    prompt_fragment: str
+
+    def table_for(self, category: Optional[str]) -> Optional[str]:
+        category = normalize_category(category)
+        if category in self.tables:
+            return self.tables[category]
+        return "enquiries"  # categories the model made up, as map_category_to_table does
+
+    def priority_for(self, category: Optional[str], default: Optional[str] = None) -> Optional[str]:
+        return self.priorities.get(normalize_category(category), default)
+
+
+def parse_categories(raw) -> Tuple[List[str], Dict[str, str], Dict[str, str]]:
+    """
+    (categories, priorities, tables) from a stored categories value. Accepts a
+    JSON list of names or of {"name", "priority", "table"} objects, the
+    business manager's {"suggested_categories", "custom_categories",
+    "priorities"} object, or a comma-separated string.
+    """
+    if raw is None:
+        return [], {}, {}
+    value = raw
+    if isinstance(raw, str):
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw.split(",")
+
+    priorities: Dict[str, str] = {}
+    tables: Dict[str, str] = {}
+    if isinstance(value, dict):
+        entries = list(value.get("suggested_categories") or []) + list(value.get("custom_categories") or [])
+        priorities = {normalize_category(k): str(v).lower() for k, v in (value.get("priorities") or {}).items()}
+    elif isinstance(value, list):
+        entries = value
+    else:
+        entries = [value]
+
+    categories: List[str] = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            name = normalize_category(entry.get("name") or entry.get("category"))
+            if entry.get("priority"):
+                priorities[name] = str(entry["priority"]).lower()
+            if entry.get("table"):
+                tables[name] = str(entry["table"])
+        else:
+            name = normalize_category(entry)
+        if name and name not in categories:
+            categories.append(name)
+    return categories, priorities, tables
+
+
+@lru_cache(maxsize=1024)
+def compile_profile(raw: Optional[str]) -> ClassificationProfile:
+    """Compile a stored categories value; cached per distinct value"""
+    version = hashlib.sha1((raw or "").encode("utf-8")).hexdigest()[:16]
+    try:
+        categories, priorities, tables = parse_categories(raw)
+    except Exception as e:
+        logger.error(f"Unreadable categories setting, using the defaults: {e}")
+        categories, priorities, tables = [], {}, {}
+    if not categories:
+        categories = list(DEFAULT_CATEGORIES)
+    categories += [name for name in ALWAYS_OFFERED if name not in categories]
+
+    resolved_priorities = {}
+    for name in categories:
+        priority = priorities.get(name) or DEFAULT_PRIORITY_MAP.get(name)
+        if priority in PRIORITY_LEVELS:
+            resolved_priorities[name] = priority
+        elif name not in IGNORED_CATEGORIES:
+            resolved_priorities[name] = "moderate"
+
+    resolved_tables = {}
+    for name in categories:
+        if name in tables:
+            resolved_tables[name] = tables[name]
+        elif name in IGNORED_CATEGORIES:
+            resolved_tables[name] = None
+        else:
+            resolved_tables[name] = CATEGORY_TO_TABLE.get(name, "enquiries")
+    # Built-in categories keep their tables even when the tenant does not offer them
+    for name, table in CATEGORY_TO_TABLE.items():
+        resolved_tables.setdefault(name, table)
+    for name in IGNORED_CATEGORIES:
+        resolved_tables.setdefault(name, None)
+
+    metrics.incr("tenant_profiles.compiled")
+    return ClassificationProfile(
+        version=version,
+        categories=tuple(categories),
+        priorities=resolved_priorities,
+        tables=resolved_tables,
+        prompt_fragment=compile_categories(categories, resolved_priorities),
+    )
+
+
+DEFAULT_PROFILE = compile_profile(None)
+
+
+class TenantProfiles:
+    """phone_number_id -> ClassificationProfile, rebuilt when the tenant's settings change"""
+
+    def __init__(self, registry=tenant_registry):
+        self.registry = registry
+        self._lock = threading.Lock()
+        # phone_number_id -> (Tenant the profile was compiled from, profile)
+        self._entries: Dict[str, Tuple[object, ClassificationProfile]] = {}
+
+    def get(self, phone_number_id: Optional[str]) -> ClassificationProfile:
+        if not phone_number_id:
+            return DEFAULT_PROFILE
+        return self._resolve(phone_number_id, self.registry.get(phone_number_id))
+
+    async def aget(self, phone_number_id: Optional[str]) -> ClassificationProfile:
+        """Async variant of get; registry misses go through the async engine"""
+        if not phone_number_id:
+            return DEFAULT_PROFILE
+        return self._resolve(phone_number_id, await self.registry.aget(phone_number_id))
+
+    def _resolve(self, phone_number_id: str, tenant) -> ClassificationProfile:
+        if tenant is None:
+            return DEFAULT_PROFILE
+        with self._lock:
+            entry = self._entries.get(phone_number_id)
+        if entry is not None and entry[0] is tenant:
+            return entry[1]
+
+        metrics.incr("tenant_profiles.refresh")
+        profile = compile_profile(getattr(tenant.settings, "categories", None))
+        with self._lock:
+            self._entries[phone_number_id] = (tenant, profile)
+            metrics.set_gauge("tenant_profiles.entries", len(self._entries))
+        return profile
+
+    def invalidate(self, phone_number_id: Optional[str] = None):
+        with self._lock:
+            if phone_number_id:
+                self._entries.pop(phone_number_id, None)
+            else:
+                self._entries.clear()
+
+
+# instantiate
+tenant_profiles = TenantProfiles()
@@ -0,0 +1,192 @@
+# app/utils/tenant_registry.py
+
+"""
+In-process registry of tenants keyed by WhatsApp phone_number_id.
+
+Resolves a business phone id to its user_id, a detached snapshot of its
+UserSettings row and the decrypted WhatsApp/HubSpot credentials. Entries are
+cached for TENANT_CACHE_TTL_SECONDS (unknown ids for a shorter
+TENANT_CACHE_NEGATIVE_TTL_SECONDS) and dropped explicitly whenever
+update_user_settings writes, so a lookup on the message path is normally a
+dictionary hit. Expired entries are dropped when they are next read, and the
+registry keeps at most TENANT_CACHE_MAX_ENTRIES, least recently used first
+out, so webhooks for unknown phone ids cannot grow it without bound. Misses go through the pooled SQLAlchemy engines rather than a
+fresh psycopg2 connection.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Mapping, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+from database import engine, async_engine
+from app.models import UserSettings
+from app.utils.metrics import metrics
+from utils.encryption import decrypt_value
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+TENANT_CACHE_TTL_SECONDS = int(os.getenv("TENANT_CACHE_TTL_SECONDS", "300"))
+TENANT_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("TENANT_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+TENANT_CACHE_MAX_ENTRIES = int(os.getenv("TENANT_CACHE_MAX_ENTRIES", "10000"))
+
+_SETTINGS_COLUMNS = [column.name for column in UserSettings.__table__.columns]
+
+
+def snapshot_settings(source) -> SimpleNamespace:
+    """Detached copy of a UserSettings row, from an ORM object or a result mapping"""
+    if isinstance(source, Mapping):
+        return SimpleNamespace(**{name: source[name] for name in _SETTINGS_COLUMNS})
+    return SimpleNamespace(**{name: getattr(source, name) for name in _SETTINGS_COLUMNS})
+
+
+def _decrypt(value: Optional[str]) -> Optional[str]:
+    try:
+        return decrypt_value(value)
+    except Exception as e:
+        logger.error(f"Error decrypting tenant credential: {e}")
+        return None
+
+
+@dataclass
+class Tenant:
+    """Everything the pipeline needs to know about one business number"""
+    user_id: int
+    phone_number_id: str
+    # Column values as stored (sensitive columns stay encrypted), detached from any session
+    settings: SimpleNamespace
+    verify_token: Optional[str] = None
+    app_id: Optional[str] = None
+    app_secret: Optional[str] = None
+    whatsapp_api_key: Optional[str] = None
+    hubspot_access_token: Optional[str] = None
+    loaded_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_row(cls, row) -> "Tenant":
+        settings = snapshot_settings(row)
+        return cls(
+            user_id=settings.user_id,
+            phone_number_id=settings.whatsapp_phone_number_id,
+            settings=settings,
+            verify_token=_decrypt(settings.whatsapp_verify_token),
+            app_id=_decrypt(settings.whatsapp_app_id),
+            app_secret=_decrypt(settings.whatsapp_app_secret),
+            whatsapp_api_key=_decrypt(settings.whatsapp_api_key),
+            hubspot_access_token=_decrypt(settings.hubspot_access_token),
+        )
+
+
+class TenantRegistry:
+    """Thread-safe LRU + TTL cache of Tenant records, shared by the sync and async paths"""
+
+    def __init__(self, ttl_seconds: int = TENANT_CACHE_TTL_SECONDS,
+                 negative_ttl_seconds: int = TENANT_CACHE_NEGATIVE_TTL_SECONDS,
+                 max_entries: int = TENANT_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # phone_number_id -> (Tenant or None, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Optional[Tenant], float]]" = OrderedDict()
+
+    def get(self, phone_number_id: Optional[str]) -> Optional[Tenant]:
+        """Return the tenant for a phone_number_id, or None when no user owns it"""
+        if not phone_number_id:
+            return None
+        found, tenant = self._cached(phone_number_id)
+        if found:
+            return tenant
+
+        metrics.incr("tenant_registry.miss")
+        try:
+            with metrics.timer("tenant_registry.load"), engine.connect() as conn:
+                row = conn.execute(self._query(phone_number_id)).mappings().first()
+        except Exception as e:
+            # Not cached, so the next message retries the lookup
+            logger.error(f"Error loading tenant for phone_number_id {phone_number_id}: {e}")
+            return None
+        return self._store(phone_number_id, row)
+
+    async def aget(self, phone_number_id: Optional[str]) -> Optional[Tenant]:
+        """Async variant of get; misses go through the async engine"""
+        if not phone_number_id:
+            return None
+        found, tenant = self._cached(phone_number_id)
+        if found:
+            return tenant
+
+        metrics.incr("tenant_registry.miss")
+        try:
+            with metrics.timer("tenant_registry.load"):
+                async with async_engine.connect() as conn:
+                    row = (await conn.execute(self._query(phone_number_id))).mappings().first()
+        except Exception as e:
+            logger.error(f"Error loading tenant for phone_number_id {phone_number_id}: {e}")
+            return None
+        return self._store(phone_number_id, row)
+
+    def get_user_id(self, phone_number_id: Optional[str]) -> Optional[int]:
+        tenant = self.get(phone_number_id)
+        return tenant.user_id if tenant else None
+
+    def invalidate(self, phone_number_id: Optional[str] = None, user_id: Optional[int] = None):
+        """Drop cached entries for a phone_number_id and/or every number owned by user_id"""
+        with self._lock:
+            if phone_number_id:
+                self._entries.pop(phone_number_id, None)
+            if user_id is not None:
+                for key in [k for k, (t, _) in self._entries.items() if t is not None and t.user_id == user_id]:
+                    del self._entries[key]
+            metrics.set_gauge("tenant_registry.entries", len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            metrics.set_gauge("tenant_registry.entries", 0)
+
+    def _cached(self, phone_number_id: str) -> Tuple[bool, Optional[Tenant]]:
+        with self._lock:
+            entry = self._entries.get(phone_number_id)
+            if entry is None:
+                return False, None
+            if entry[1] < time.time():
+                del self._entries[phone_number_id]
+                metrics.incr("tenant_registry.expired")
+                metrics.set_gauge("tenant_registry.entries", len(self._entries))
+                return False, None
+            self._entries.move_to_end(phone_number_id)
+            metrics.incr("tenant_registry.hit")
+            return True, entry[0]
+
+    def _query(self, phone_number_id: str):
+        return (
+            select(UserSettings.__table__)
+            .where(UserSettings.whatsapp_phone_number_id == phone_number_id)
+            .limit(1)
+        )
+
+    def _store(self, phone_number_id: str, row) -> Optional[Tenant]:
+        tenant = Tenant.from_row(row) if row is not None else None
+        ttl = self.ttl_seconds if tenant else self.negative_ttl_seconds
+        if tenant is None:
+            logger.warning(f"No user found for business_phone_id {phone_number_id}")
+        with self._lock:
+            self._entries[phone_number_id] = (tenant, time.time() + ttl)
+            self._entries.move_to_end(phone_number_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.incr("tenant_registry.evicted")
+            metrics.set_gauge("tenant_registry.entries", len(self._entries))
+        return tenant
+
+
+# instantiate
+tenant_registry = TenantRegistry()
@@ -0,0 +1,152 @@
+"""
+Throughput benchmark: blocking graph.invoke vs async graph.ainvoke.
+
+The Gemini client, the storage stage and the WhatsApp send are replaced by
+stubs that only sleep for a configurable latency, so the numbers show how
+many messages per second each execution model can keep in flight rather
+than how fast any external service is.
+
+Run from the backend directory:
+    python -m benchmarks.bench_async_pipeline --messages 200 --llm-latency 0.4
+"""
+
+import os
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from app import graph_builder
+from app.nodes import llm_node as llm_node_module
+from app.state import MessageState
+
+
+class SlowLLM:
+    """Stand-in for GeminiLLMAgent with a fixed per-call latency"""
+
+    # Two round-trips per message (is_safe + analyze), the worst case
+    combined_safety = False
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.result = {
+            "category": "general_inquiry",
+            "priority": "low",
+            "conversation_status": "continue",
+            "extracted_info": {},
+        }
+
+    def is_safe(self, message, namespace=None):
+        time.sleep(self.latency)
+        return True
+
+    def analyze(self, message, context=None, prev_info=None, namespace=None):
+        time.sleep(self.latency)
+        return dict(self.result)
+
+    async def ais_safe(self, message, namespace=None):
+        await asyncio.sleep(self.latency)
+        return True
+
+    async def aanalyze(self, message, context=None, prev_info=None, namespace=None):
+        await asyncio.sleep(self.latency)
+        return dict(self.result)
+
+
+def install_stubs(llm_latency: float, db_latency: float, http_latency: float):
+    llm_node_module.llm_agent = SlowLLM(llm_latency)
+    # One stubbed call per message; batching is measured separately
+    llm_node_module.llm_batcher.enabled = False
+    llm_node_module.llm_batcher.agent = llm_node_module.llm_agent
+
+    def storage_stub(state):
+        time.sleep(db_latency)
+        return state
+
+    async def threaded_storage_stub(state):
+        # Like threaded_storage_node, which hands LoggerAgent to a thread
+        return await asyncio.to_thread(storage_stub, state)
+
+    def responder_stub(state):
+        time.sleep(http_latency)
+        return state
+
+    async def async_responder_stub(state):
+        await asyncio.sleep(http_latency)
+        return state
+
+    graph_builder.storage_node = storage_stub
+    graph_builder.threaded_storage_node = threaded_storage_stub
+    graph_builder.responder_node = responder_stub
+    graph_builder.async_responder_node = async_responder_stub
+
+
+def make_state(i: int) -> MessageState:
+    return MessageState(
+        customer_id=f"9100000{i:05d}",
+        sender=f"9100000{i:05d}",
+        message=f"Do you have item {i} in stock?",
+        business_phone_number="15550000000",
+        business_phone_id="100000000000000",
+    )
+
+
+def run_sync_serial(n: int) -> float:
+    graph = graph_builder.build_graph(async_nodes=False)
+    start = time.perf_counter()
+    for i in range(n):
+        graph.invoke(make_state(i))
+    return time.perf_counter() - start
+
+
+def run_sync_threads(n: int, workers: int) -> float:
+    graph = graph_builder.build_graph(async_nodes=False)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda i: graph.invoke(make_state(i)), range(n)))
+    return time.perf_counter() - start
+
+
+async def run_async(n: int, concurrency: int) -> float:
+    graph = graph_builder.build_graph(async_nodes=True)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await graph.ainvoke(make_state(i))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--serial-messages", type=int, default=10, help="the serial baseline is slow, so it gets fewer messages")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="seconds per Gemini call (two calls per message)")
+    parser.add_argument("--db-latency", type=float, default=0.02)
+    parser.add_argument("--http-latency", type=float, default=0.15)
+    parser.add_argument("--threads", type=int, default=4, help="thread pool size for the sync baseline")
+    parser.add_argument("--concurrency", type=int, default=100, help="in-flight messages for the async run")
+    args = parser.parse_args()
+
+    install_stubs(args.llm_latency, args.db_latency, args.http_latency)
+
+    results = [
+        ("sync, serial (invoke on the loop)", args.serial_messages, run_sync_serial(args.serial_messages)),
+        (f"sync, {args.threads} threads", args.messages, run_sync_threads(args.messages, args.threads)),
+        (f"async, {args.concurrency} in flight", args.messages, asyncio.run(run_async(args.messages, args.concurrency))),
+    ]
+
+    print(f"\nSimulated latency: llm={args.llm_latency}s x2, db={args.db_latency}s, http={args.http_latency}s")
+    print(f"{'mode':<36}{'messages':>10}{'seconds':>10}{'msgs/sec':>10}")
+    for name, n, elapsed in results:
+        print(f"{name:<36}{n:>10}{elapsed:>10.2f}{n / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Stress check: no duplicate orders when one customer's messages arrive together.
+
+Posts --customers x --per-customer order messages (1000 by default) to the
+listener router all at once, with the worker pool running. The pipeline is
+the real Review and Storage stages (ReviewAgent's pending-order lookup and
+LoggerAgent's order writes) behind a stub classifier, so no LLM is called.
+Every message is an order from a customer who has been ordering in the last
+30 minutes, so each customer must end up with exactly one pending order.
+
+Two runs:
+- unordered: queue jobs without ordering keys and no conversation lock, i.e.
+  plain concurrent processing
+- ordered: the per-(business_phone_id, customer_id) scheduler and lock
+
+Reports, per run, customers with more than one order number, order numbers
+shared by more than one customer, and the wall time.
+
+Run from the backend directory:
+    python -m benchmarks.bench_conversation_ordering --customers 100 --per-customer 10
+"""
+
+import io
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import tempfile
+from collections import defaultdict
+from contextlib import redirect_stdout
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ["WEBHOOK_QUEUE_PATH"] = os.path.join(tempfile.mkdtemp(), "webhook_queue.db")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+import httpx
+from fastapi import FastAPI
+from database import Base, engine, SessionLocal
+from app.models import User, UserSettings, Order
+from app.agents.listener_agent import get_listener_router
+from app.agents.work_queue import work_queue
+from app.nodes.review_node import async_review_node
+from app.nodes.storage_node import threaded_storage_node
+from app.utils.conversation_lock import conversation_locks
+
+PHONE_NUMBER_ID = "100000000021"
+METADATA = {"display_phone_number": "15550000021", "phone_number_id": PHONE_NUMBER_ID}
+
+
+class OrderPipeline:
+    """Stub classifier followed by the real Review and Storage stages"""
+
+    def __init__(self):
+        self.done = 0
+
+    async def ainvoke(self, state):
+        state.predicted_category = "new_order"
+        state.table_name = "orders"
+        state.priority = "medium"
+        state.extracted_info = {"products": [{"item": state.message, "quantity": 1, "unit": "kg"}]}
+        state = await async_review_node(state)
+        result = await threaded_storage_node(state)
+        self.done += 1
+        return result
+
+
+def seed() -> int:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        settings = db.query(UserSettings).filter(UserSettings.whatsapp_phone_number_id == PHONE_NUMBER_ID).first()
+        if settings:
+            return settings.user_id
+        user = User(clerk_id="ordering-benchmark", email="ordering-benchmark@example.com")
+        db.add(user)
+        db.flush()
+        # Orders are only written to the database for tenants that view consolidated data
+        db.add(UserSettings(user_id=user.id, whatsapp_phone_number_id=PHONE_NUMBER_ID, view_consolidated_data=True))
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def webhook(wa_id: str, n: int, timestamp: int) -> bytes:
+    return json.dumps({"entry": [{"changes": [{"value": {
+        "metadata": METADATA,
+        "contacts": [{"wa_id": wa_id, "profile": {"name": "Ordering Bench"}}],
+        "messages": [{"from": wa_id, "id": f"wamid.order{uuid.uuid4().hex}", "timestamp": str(timestamp),
+                      "type": "text", "text": {"body": f"item {n}"}}],
+    }}]}]}).encode()
+
+
+async def run(customers: int, per_customer: int, ordered: bool):
+    if not ordered:
+        enqueue_many = work_queue.enqueue_many
+        work_queue.enqueue_many = lambda jobs: enqueue_many([(payload, None) for payload, _ in jobs])
+        conversation_locks.backend = "none"
+    run_id = uuid.uuid4().int % 10 ** 6
+    # Shared 4-digit prefixes, as real numbers from one country have
+    wa_ids = [f"9198{run_id:06d}{c:03d}" for c in range(customers)]
+    now = int(time.time())
+    # Each customer's messages back to back, as when someone types an order line by line
+    bodies = [webhook(wa_id, n, now + n) for wa_id in wa_ids for n in range(per_customer)]
+
+    pipeline = OrderPipeline()
+    app = FastAPI()
+    app.include_router(get_listener_router(pipeline))
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                     timeout=300) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(client.post(f"/webhook/{PHONE_NUMBER_ID}", content=body) for body in bodies))
+            while pipeline.done < len(bodies) and time.perf_counter() - start < 600:
+                await asyncio.sleep(0.1)
+            elapsed = time.perf_counter() - start
+    finally:
+        await app.router.shutdown()
+        if not ordered:
+            work_queue.enqueue_many = enqueue_many
+            conversation_locks.backend = "local"
+    return wa_ids, pipeline.done, elapsed
+
+
+def order_numbers(wa_ids):
+    db = SessionLocal()
+    try:
+        rows = db.query(Order.customer_id, Order.order_number).filter(Order.customer_id.in_(wa_ids)).all()
+    finally:
+        db.close()
+    by_customer, by_number = defaultdict(set), defaultdict(set)
+    for customer_id, number in rows:
+        by_customer[customer_id].add(number)
+        by_number[number].add(customer_id)
+    return by_customer, by_number, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=100)
+    parser.add_argument("--per-customer", type=int, default=10)
+    parser.add_argument("--skip-unordered", action="store_true", help="only run with the scheduler and lock")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    seed()
+
+    results = {}
+    for mode in ([] if args.skip_unordered else ["unordered"]) + ["ordered"]:
+        with redirect_stdout(io.StringIO()):
+            wa_ids, done, elapsed = asyncio.run(run(args.customers, args.per_customer, mode == "ordered"))
+        by_customer, by_number, lines = order_numbers(wa_ids)
+        results[mode] = {
+            "processed": done,
+            "order lines": lines,
+            "customers with >1 order": sum(1 for numbers in by_customer.values() if len(numbers) > 1),
+            "extra orders": sum(len(numbers) - 1 for numbers in by_customer.values()),
+            "shared order numbers": sum(1 for customers in by_number.values() if len(customers) > 1),
+            "seconds": round(elapsed, 2),
+        }
+
+    messages = args.customers * args.per_customer
+    print(f"\n{messages} messages from {args.customers} customers")
+    print(f"{'':<26}" + "".join(f"{mode:>12}" for mode in results))
+    for metric in results["ordered"]:
+        print(f"{metric:<26}" + "".join(f"{results[mode][metric]:>12}" for mode in results))
+
+    ordered = results["ordered"]
+    ok = (ordered["processed"] == messages and ordered["order lines"] == messages
+          and ordered["extra orders"] == 0 and ordered["shared order numbers"] == 0)
+    print(f"\n[{'ok' if ok else 'FAIL'}] one order per customer, no order number shared between customers")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
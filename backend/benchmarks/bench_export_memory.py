@@ -0,0 +1,134 @@
+"""
+Benchmark: peak RSS of a table export against row count.
+
+Compares the old approach (load every row as an ORM object, build the whole
+list of dicts, then serialize it) with the streaming export behind
+/api/export/{table} (server-side cursor, one chunk of rows encoded at a time).
+
+Peak RSS only ever grows within a process, so every (mode, rows) measurement
+runs in a fresh child process. Each child reports the peak RSS growth over
+its baseline after imports and setup, which is what the export itself costs.
+
+Run from the backend directory:
+    python -m benchmarks.bench_export_memory --rows 10000 100000 1000000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def seed(rows: int) -> int:
+    """Make sure the benchmark user has exactly `rows` orders; return its user id"""
+    from sqlalchemy import func, insert
+    from database import Base, engine, SessionLocal
+    from app.models import User, Customer, Order
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.clerk_id == "export-benchmark").first()
+        if not user:
+            user = User(clerk_id="export-benchmark", email="export-benchmark@example.com")
+            db.add(user)
+            db.commit()
+            db.add(Customer(customer_id="910000000000", user_id=user.id, customer_name="Benchmark"))
+            db.commit()
+        existing = db.query(func.count(Order.order_id)).filter(Order.user_id == user.id).scalar()
+        if existing == rows:
+            return user.id
+        db.query(Order).filter(Order.user_id == user.id).delete(synchronize_session=False)
+        start = datetime(2025, 1, 1)
+        batch = []
+        for i in range(rows):
+            batch.append({
+                "user_id": user.id, "customer_id": "910000000000", "order_number": f"ORD-{i // 3:07d}",
+                "item": f"item {i % 50}", "quantity": i % 7 + 1, "unit": "kg", "notes": "deliver after 5pm",
+                "order_status": "pending", "total_amount": "120", "delivery_address": "12 MG Road, Bengaluru",
+                "created_at": start + timedelta(seconds=i), "updated_at": start + timedelta(seconds=i),
+            })
+            if len(batch) == 10000:
+                db.execute(insert(Order), batch)
+                batch = []
+        if batch:
+            db.execute(insert(Order), batch)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def run_child(mode: str, fmt: str, user_id: int) -> dict:
+    from database import SessionLocal
+    from app.models import Order
+    from app.utils.export import export_stream, resolve_columns
+
+    columns = resolve_columns(Order, None)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    size = 0
+    if mode == "materialized":
+        # What the list endpoints did: every row as an object, then one big payload
+        db = SessionLocal()
+        try:
+            orders = db.query(Order).filter(Order.user_id == user_id).all()
+            payload = [{c.key: getattr(o, c.key) for c in columns} for o in orders]
+            size = len(json.dumps(payload, default=str).encode())
+        finally:
+            db.close()
+    else:
+        for data in export_stream("orders", fmt, user_id, columns):
+            size += len(data)
+    return {
+        "seconds": time.perf_counter() - start,
+        "bytes": size,
+        "peak_growth_mb": peak_rss_mb() - baseline,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--formats", nargs="+", default=["csv", "ndjson", "parquet"])
+    parser.add_argument("--skip-materialized", action="store_true", help="skip the load-everything baseline")
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "FORMAT", "USER_ID"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, fmt, user_id = args.child
+        print(json.dumps(run_child(mode, fmt, int(user_id))))
+        return
+
+    runs = [("streaming", fmt) for fmt in args.formats]
+    if not args.skip_materialized:
+        runs.insert(0, ("materialized", "json"))
+
+    print(f"\n{'rows':>10}  {'mode':<14}{'format':<9}{'seconds':>9}{'MB out':>9}{'peak RSS +MB':>14}")
+    for rows in args.rows:
+        user_id = seed(rows)
+        for mode, fmt in runs:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_export_memory", "--child", mode, fmt, str(user_id)],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(output)
+            print(f"{rows:>10}  {mode:<14}{fmt:<9}{result['seconds']:>9.2f}"
+                  f"{result['bytes'] / 1e6:>9.1f}{result['peak_growth_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Benchmark: connection reuse, retries and per-host limits of the shared HTTP layer.
+
+Starts a local HTTP/1.1 keep-alive server that counts the TCP connections it
+accepts and the requests it serves, then sends WhatsApp messages through
+ResponderAgent (pointed at the mock server) three ways:
+- bare requests.post per message (the old behaviour): one connection each
+- app.utils.http_client (sync): one pooled connection for the whole run
+- app.utils.http_client (async): a handful of pooled connections
+
+It then checks the retry rules against the same server:
+- a 429 with Retry-After is retried after the advertised delay
+- a 503 on a POST is not retried, a 503 on a GET is
+- concurrent requests never exceed HTTP_MAX_CONCURRENCY_PER_HOST in flight
+
+Run from the backend directory:
+    python -m benchmarks.bench_http_reuse --messages 200
+"""
+
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+import requests
+from app.agents.responder_agent import ResponderAgent
+from app.utils.http_client import HttpClient, RetryPolicy, http_client
+
+
+class MockGraphServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), MockGraphHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # path -> list of (status, headers) to return before succeeding
+        self.scripted = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def reset(self):
+        with self.lock:
+            self.connections = self.requests = self.in_flight = self.max_in_flight = 0
+            self.scripted = {}
+
+
+class MockGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; don't let Nagle delay the second one
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            script = server.scripted.get(self.path)
+            status, headers = script.pop(0) if script else (200, {})
+        if self.path.startswith("/slow"):
+            time.sleep(0.05)
+        body = json.dumps({"messages": [{"id": f"wamid.mock{server.requests}"}]}).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with server.lock:
+            server.in_flight -= 1
+
+    do_GET = _reply
+    do_POST = _reply
+    do_PUT = _reply
+
+
+class BareRequestsAgent(ResponderAgent):
+    """ResponderAgent as it was: a bare requests.post per message"""
+
+    def send_message(self, to_phone, message_text):
+        url, payload, headers = self._text_message_request(to_phone, message_text)
+        return self._handle_send_response(requests.post(url, json=payload, headers=headers))
+
+
+def make_agent(cls, server):
+    agent = cls(user_settings=SimpleNamespace(whatsapp_phone_number_id="100000000000001"), api_key="mock-token")
+    agent.api_base_url = server.url
+    return agent
+
+
+def measure(server, name, send, messages):
+    server.reset()
+    start = time.perf_counter()
+    send(messages)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<16}{messages:>10}{server.requests:>10}{server.connections:>13}{elapsed * 1000 / messages:>12.2f}")
+
+
+def check(label, ok):
+    print(f"  [{'ok' if ok else 'FAIL'}] {label}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    server = MockGraphServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    bare = make_agent(BareRequestsAgent, server)
+    pooled = make_agent(ResponderAgent, server)
+
+    def send_bare(n):
+        for i in range(n):
+            assert bare.send_message("919800000000", f"hello {i}")["status"] == "success"
+
+    def send_pooled(n):
+        for i in range(n):
+            assert pooled.send_message("919800000000", f"hello {i}")["status"] == "success"
+
+    def send_async(n):
+        async def run():
+            results = await asyncio.gather(*(pooled.asend_message("919800000000", f"hello {i}") for i in range(n)))
+            assert all(r["status"] == "success" for r in results)
+        asyncio.run(run())
+
+    print(f"\n{'client':<16}{'messages':>10}{'requests':>10}{'connections':>13}{'ms/message':>12}")
+    measure(server, "bare requests", send_bare, args.messages)
+    measure(server, "pooled sync", send_pooled, args.messages)
+    measure(server, "pooled async", send_async, args.messages)
+
+    print("\nretry rules")
+    results = []
+    client = HttpClient(policy=RetryPolicy(max_retries=3, backoff_base=0.01))
+
+    server.reset()
+    server.scripted["/rate-limited"] = [(429, {"Retry-After": "1"})]
+    start = time.perf_counter()
+    response = client.post(f"{server.url}/rate-limited", json={})
+    waited = time.perf_counter() - start
+    results.append(check(f"429 + Retry-After: 1 -> retried once after {waited:.2f}s, final {response.status_code}",
+                         response.status_code == 200 and server.requests == 2 and waited >= 1.0))
+
+    server.reset()
+    server.scripted["/unavailable"] = [(503, {})]
+    response = client.post(f"{server.url}/unavailable", json={})
+    results.append(check(f"503 on POST -> not retried, final {response.status_code}",
+                         response.status_code == 503 and server.requests == 1))
+
+    server.reset()
+    server.scripted["/unavailable"] = [(503, {}), (503, {})]
+    response = client.get(f"{server.url}/unavailable")
+    results.append(check(f"503 twice on GET -> retried twice, final {response.status_code}",
+                         response.status_code == 200 and server.requests == 3))
+
+    server.reset()
+    limit = http_client.max_per_host
+    with ThreadPoolExecutor(max_workers=limit * 4) as pool:
+        list(pool.map(lambda i: http_client.get(f"{server.url}/slow/{i}"), range(limit * 8)))
+    results.append(check(f"{limit * 4} threads -> at most {limit} in flight (saw {server.max_in_flight})",
+                         server.max_in_flight <= limit))
+
+    server.shutdown()
+    http_client.close()
+    if not all(results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
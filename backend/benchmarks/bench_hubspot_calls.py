@@ -0,0 +1,161 @@
+"""
+Check: HubSpot API calls per synced order.
+
+Replays recorded HubSpot responses (benchmarks/fixtures/hubspot_order_flow.json)
+through a requests adapter mounted on the shared http_client session, then
+pushes orders with 1, 5 and 20 line items through LoggerAgent._send_to_hubspot
+and counts the calls each one makes:
+- cold: empty per-portal cache, so the contact, the Order object type and its
+  properties are looked up once
+- warm: the same customer again; only the order and its line items are written
+
+Before the cache and the batch/inline-association writes, an order for an
+existing contact cost 9 + 2N calls (schema lookups twice, one association PUT
+for the order and a create plus an association PUT per line item). The check
+fails if the count grows with N or a warm order needs more than 2 calls.
+
+Then a high-priority order whose line items fail once (HTTP 500) is synced
+twice with the same completed-steps record, as the CRM sync worker does on a
+retry: the first attempt must raise, and the retry must create only the line
+items, not a second ticket or order.
+
+Run from the backend directory:
+    python -m benchmarks.bench_hubspot_calls --items 1 5 20
+"""
+
+import os
+import re
+import json
+import logging
+import argparse
+from collections import Counter
+from types import SimpleNamespace
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+import requests
+from requests.adapters import BaseAdapter
+from database import SessionLocal
+from app.agents.logger_agent import LoggerAgent, LoggerAgentConfig
+from app.state import MessageState
+from app.utils.http_client import http_client
+from app.utils.hubspot_cache import hubspot_cache
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "hubspot_order_flow.json")
+HUBSPOT_URL = "https://api.hubapi.com"
+
+
+class ReplayAdapter(BaseAdapter):
+    """Answers HubSpot requests from recorded fixtures and counts them"""
+
+    def __init__(self, fixtures):
+        super().__init__()
+        self.fixtures = [(f["method"], re.compile(f["path"]), f["status"], f["body"]) for f in fixtures]
+        self.calls = Counter()
+        self.next_id = 10000
+        # Paths answered once with HTTP 500
+        self.fail_once = set()
+
+    def send(self, request, **kwargs):
+        path = request.path_url.split("?")[0]
+        for method, pattern, status, body in self.fixtures:
+            if method == request.method and pattern.match(path):
+                break
+        else:
+            raise AssertionError(f"no fixture for {request.method} {path}")
+        self.calls[f"{request.method} {pattern.pattern.strip('^$')}"] += 1
+        if path in self.fail_once:
+            self.fail_once.discard(path)
+            status, body = 500, {"status": "error", "message": "internal error"}
+        elif path.endswith("/batch/create"):
+            # One recorded result per input, with fresh ids
+            inputs = json.loads(request.body)["inputs"]
+            template = body["results"][0]
+            body = dict(body, results=[dict(template, id=str(self._id())) for _ in inputs])
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode()
+        response.headers["Content-Type"] = "application/json"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def _id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def close(self):
+        pass
+
+
+def order_message(items: int) -> MessageState:
+    return MessageState(
+        customer_id="919800000000", sender="919800000000", customer_name="Asha",
+        message=f"Please send {items} things", predicted_category="new_order", priority="medium",
+        table_name="orders",
+        extracted_info={"products": [{"item": f"item {i}", "quantity": 2, "price": 40} for i in range(items)]},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--verbose", action="store_true", help="print the calls made for each order")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with open(FIXTURES) as f:
+        adapter = ReplayAdapter(json.load(f))
+    http_client.session.mount(HUBSPOT_URL, adapter)
+
+    config = LoggerAgentConfig(user_settings=SimpleNamespace(user_id=1), hubspot_enabled=True,
+                               hubspot_access_token="pat-na1-benchmark")
+    db = SessionLocal()
+    agent = LoggerAgent("1", config=config, db=db)
+
+    counts = {}
+    print(f"\n{'items':>6}{'cold calls':>12}{'warm calls':>12}{'before':>9}")
+    for items in args.items:
+        for phase in ("cold", "warm"):
+            if phase == "cold":
+                hubspot_cache.invalidate()
+            adapter.calls.clear()
+            agent._send_to_hubspot(order_message(items))
+            counts[(items, phase)] = sum(adapter.calls.values())
+            if args.verbose:
+                print(f"  {phase} {items}: {dict(adapter.calls)}")
+        print(f"{items:>6}{counts[(items, 'cold')]:>12}{counts[(items, 'warm')]:>12}{9 + 2 * items:>9}")
+
+    # A retried event resumes after the steps that already succeeded
+    message = order_message(3)
+    message.priority = "high"
+    completed = {}
+    adapter.calls.clear()
+    adapter.fail_once = {"/crm/v3/objects/line_items/batch/create"}
+    logging.disable(logging.CRITICAL)
+    try:
+        agent._send_to_hubspot(message, completed)
+        raised = False
+    except Exception:
+        raised = True
+    agent._send_to_hubspot(message, completed)
+    creates = {name: adapter.calls[f"POST {name}"] for name in
+               ("/crm/v3/objects/tickets", "/crm/v3/objects/order", "/crm/v3/objects/line_items/batch/create")}
+    print(f"\nline items failing once: first attempt raised {raised}, steps recorded {sorted(completed)}")
+    print("creates over both attempts: " + ", ".join(f"{name} {count}" for name, count in creates.items()))
+
+    db.close()
+    http_client.close()
+    cold = {counts[(n, "cold")] for n in args.items}
+    warm = {counts[(n, "warm")] for n in args.items}
+    retry_ok = raised and list(creates.values()) == [1, 1, 2]
+    ok = len(cold) == 1 and len(warm) == 1 and max(warm) <= 2 and retry_ok
+    print(f"\n[{'ok' if ok else 'FAIL'}] calls per order are constant in the number of line items, "
+          f"retries do not duplicate tickets or orders")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Check: classification answers are read reliably (app/agents/llm_output.py).
+
+Feeds --messages answers through GeminiLLMAgent.aclassify from a stub Gemini
+client. The answers are drawn from the shapes seen in production logs: clean
+JSON, markdown fences, // comments, trailing commas, prose around the object,
+addresses with URLs, answers truncated at max_output_tokens, and plain text.
+When asked again at temperature 0 (the repair retry) the stub answers
+correctly. Compares with the previous reader (fence replaces, re.sub of
+"//.*", json.loads), which fell back to "others" on any error. Reports:
+- messages that ended up as the "others" fallback
+- addresses that came out different from what the model wrote
+- Gemini calls per message
+- the llm.parse.* counters and failure rate
+
+Run from the backend directory:
+    python -m benchmarks.bench_llm_output --messages 1000
+"""
+
+import io
+import os
+import re
+import json
+import random
+import asyncio
+import argparse
+from types import SimpleNamespace
+from contextlib import redirect_stdout
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from app.agents import llm_agent as llm_agent_module
+from app.agents.llm_agent import GeminiLLMAgent
+from app.agents.llm_cache import llm_cache
+from app.utils.metrics import metrics
+
+# A quarter of the customers share a map link instead of typing the address
+ADDRESSES = ["14 Park Street", "Flat 2, 9 Hill Road", "Gate 3, Sector 21", "https://maps.example.com/?q=14+Park+Street"]
+
+
+def result(address: str) -> dict:
+    return {"harmful": False, "category": "new_order", "priority": "high", "conversation_status": "continue",
+            "extracted_info": {"products": [{"item": "chocolate cake", "quantity": 2, "unit": "1kg", "notes": None},
+                                            {"item": "sourdough bread", "quantity": 1, "unit": None, "notes": None}],
+                               "delivery_address": address}}
+
+
+# name -> (weight, answer for a result)
+SHAPES = {
+    "clean": (60, json.dumps),
+    "fenced": (10, lambda r: f"```json\n{json.dumps(r, indent=2)}\n```"),
+    "commented": (6, lambda r: json.dumps(r, indent=2).replace('"priority"', '"priority": "high", // new order\n  "_"', 1)),
+    "trailing comma": (6, lambda r: json.dumps(r)[:-1] + ",}"),
+    "prose around": (6, lambda r: f"Here is the classification:\n{json.dumps(r)}\nLet me know if you need more."),
+    "truncated": (8, lambda r: json.dumps(r)[:json.dumps(r).index("sourdough") + 4]),
+    "plain text": (4, lambda r: "new_order, high priority"),
+}
+
+
+class StubModels:
+    """Gives each prepared answer once; a retry at temperature 0 gets the correct JSON"""
+
+    def __init__(self, answers):
+        self.answers = iter(answers)
+        self.correct = None
+        self.calls = 0
+
+    async def generate_content(self, model, contents, config):
+        self.calls += 1
+        if config.temperature == 0:
+            text = self.correct
+        else:
+            text, self.correct = next(self.answers)
+        candidate = SimpleNamespace(finish_reason=SimpleNamespace(name="STOP"), safety_ratings=[])
+        return SimpleNamespace(text=text, candidates=[candidate], prompt_feedback=None, usage_metadata=None)
+
+
+def legacy_parse(content: str) -> dict:
+    """The reader this replaced; any exception meant the "others" fallback"""
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content.replace("```json", "").replace("```", "").strip()
+    elif content.startswith("```"):
+        content = content.replace("```", "").strip()
+    content = re.sub(r'//.*', '', content)
+    return json.loads(content)
+
+
+def answers(count: int):
+    rng = random.Random(25)
+    names = list(SHAPES)
+    weights = [SHAPES[name][0] for name in names]
+    return [(rng.choices(names, weights)[0], rng.choice(ADDRESSES)) for _ in range(count)]
+
+
+async def run(shapes):
+    models = StubModels([(SHAPES[name][1](result(address)), json.dumps(result(address))) for name, address in shapes])
+    llm_agent_module.client = SimpleNamespace(aio=SimpleNamespace(models=models))
+    agent = GeminiLLMAgent(safety_mode="combined")
+    results = [await agent.aclassify(f"order {i}", []) for i in range(len(shapes))]
+    return results, models.calls
+
+
+def summarize(results, shapes):
+    others = sum(1 for r in results if r.get("category") == "others")
+    mangled = sum(1 for r, (_, address) in zip(results, shapes) if r.get("category") != "others"
+                  and r.get("extracted_info", {}).get("delivery_address") not in (None, address))
+    return others, mangled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    args = parser.parse_args()
+    llm_cache.enabled = False
+
+    shapes = answers(args.messages)
+    legacy = []
+    for name, address in shapes:
+        try:
+            legacy.append(legacy_parse(SHAPES[name][1](result(address))))
+        except Exception:
+            legacy.append({"category": "others", "extracted_info": {}})
+    with redirect_stdout(io.StringIO()):
+        results, calls = asyncio.run(run(shapes))
+
+    names = [name for name, _ in shapes]
+    print(f"\n{args.messages} answers: " + ", ".join(f"{name} {names.count(name)}" for name in SHAPES))
+    print(f"{'':<26}{'before':>10}{'after':>10}")
+    for label, before, after in zip(("fell back to 'others'", "address mangled"), summarize(legacy, shapes),
+                                  summarize(results, shapes)):
+        print(f"{label:<26}{before:>10}{after:>10}")
+    print(f"{'Gemini calls/message':<26}{1:>10.2f}{calls / args.messages:>10.2f}")
+
+    counters = metrics.snapshot()["counters"]
+    gauges = metrics.snapshot()["gauges"]
+    print("\n" + ", ".join(f"{name} {counters.get(name, 0)}" for name in
+                           ("llm.parse.ok", "llm.parse.repaired", "llm.parse.retried", "llm.parse.failed")))
+    print(f"llm.parse.failure_rate {gauges.get('llm.parse.failure_rate', 0)}")
+
+    others, mangled = summarize(results, shapes)
+    ok = others == 0 and mangled == 0 and calls / args.messages < 1.1
+    print(f"\n[{'ok' if ok else 'FAIL'}] every answer read, URLs intact, at most one retry for unreadable answers")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
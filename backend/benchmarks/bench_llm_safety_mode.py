@@ -0,0 +1,108 @@
+"""
+Latency benchmark: separate safety + classification calls vs one combined call.
+
+The Gemini client is replaced by a stub that sleeps for a fixed round-trip
+time and returns canned responses, so the numbers isolate the cost of the
+extra request in the "separate" mode.
+
+Run from the backend directory:
+    python -m benchmarks.bench_llm_safety_mode --messages 50 --rtt 0.3
+"""
+
+import io
+import os
+import json
+import time
+import asyncio
+import argparse
+from types import SimpleNamespace
+from contextlib import redirect_stdout
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from app.agents import llm_agent as llm_agent_module
+from app.agents.llm_cache import llm_cache
+from app.agents.llm_agent import GeminiLLMAgent
+from app.nodes import llm_node as llm_node_module
+from app.state import MessageState
+
+CLASSIFICATION = {
+    "category": "complaint",
+    "priority": "high",
+    "conversation_status": "continue",
+    "extracted_info": {"issue": "damaged product"},
+}
+
+
+def fake_response(text: str):
+    candidate = SimpleNamespace(finish_reason=SimpleNamespace(name="STOP"), safety_ratings=[])
+    return SimpleNamespace(text=text, candidates=[candidate], prompt_feedback=None)
+
+
+class StubModels:
+    """Answers like Gemini would for each of the three prompt shapes"""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.calls = 0
+
+    def _answer(self, contents, config):
+        self.calls += 1
+        if config.max_output_tokens == 10:
+            return fake_response("No")
+        if config.response_mime_type == "application/json":
+            return fake_response(json.dumps(dict(CLASSIFICATION, harmful=False)))
+        return fake_response(json.dumps(CLASSIFICATION))
+
+    def generate_content(self, model, contents, config):
+        time.sleep(self.rtt)
+        return self._answer(contents, config)
+
+
+class StubAsyncModels(StubModels):
+    async def generate_content(self, model, contents, config):
+        await asyncio.sleep(self.rtt)
+        return self._answer(contents, config)
+
+
+def make_state(i: int) -> MessageState:
+    return MessageState(customer_id="919000000000", sender="919000000000", message=f"My parcel {i} arrived damaged")
+
+
+def run(mode: str, messages: int, rtt: float):
+    models = StubModels(rtt)
+    llm_agent_module.client = SimpleNamespace(models=models, aio=SimpleNamespace(models=StubAsyncModels(rtt)))
+    llm_node_module.llm_agent = GeminiLLMAgent(safety_mode=mode)
+
+    latencies = []
+    for i in range(messages):
+        start = time.perf_counter()
+        llm_node_module.llm_node(make_state(i))
+        latencies.append(time.perf_counter() - start)
+    return models.calls, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--rtt", type=float, default=0.3, help="simulated Gemini round-trip in seconds")
+    args = parser.parse_args()
+
+    # Measure round-trips, not cache hits
+    llm_cache.enabled = False
+
+    print(f"\nSimulated Gemini round-trip: {args.rtt}s")
+    print(f"{'mode':<12}{'messages':>10}{'calls':>8}{'mean ms':>10}{'p95 ms':>10}")
+    for mode in ("separate", "combined"):
+        # The agent prints every raw response; keep the table readable
+        with redirect_stdout(io.StringIO()):
+            calls, latencies = run(mode, args.messages, args.rtt)
+        latencies.sort()
+        mean_ms = sum(latencies) / len(latencies) * 1000
+        p95_ms = latencies[int(len(latencies) * 0.95) - 1] * 1000
+        print(f"{mode:<12}{args.messages:>10}{calls:>8}{mean_ms:>10.1f}{p95_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Benchmark: order-table reads per order message, with and without the
+pending-order index (app/utils/pending_orders.py).
+
+Runs order messages through the real Review and Storage stages (stub
+classifier, no LLM) for --customers customers, --per-customer messages each,
+then confirms every customer's order through PUT /api/orders/{order_number}
+and sends one more message each, which must open a new order. Counts, per
+message, SELECTs on the orders table issued by the review (the consolidation
+decision) and by storage, on both the sync and async engines.
+
+Run from the backend directory:
+    python -m benchmarks.bench_pending_orders --customers 50 --per-customer 5
+"""
+
+import io
+import os
+import re
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+from collections import defaultdict
+from contextlib import redirect_stdout
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from database import Base, engine, async_engine, SessionLocal
+from app.models import User, UserSettings, Order
+from app.state import MessageState
+from app.nodes.review_node import async_review_node
+from app.nodes.storage_node import threaded_storage_node
+from app.utils.pending_orders import pending_order_index
+
+PHONE_NUMBER_ID = "100000000022"
+ORDER_SELECT = re.compile(r"^\s*SELECT\b.*\bFROM orders\b", re.IGNORECASE | re.DOTALL)
+
+
+class OrderReads:
+    """Counts SELECTs on the orders table, by pipeline stage"""
+
+    def __init__(self):
+        self.stage = None
+        self.counts = defaultdict(int)
+        for bind in (engine, async_engine.sync_engine):
+            event.listen(bind, "before_cursor_execute", self._statement)
+
+    def _statement(self, conn, cursor, statement, *args):
+        if self.stage and ORDER_SELECT.match(statement):
+            self.counts[self.stage] += 1
+
+
+def seed() -> int:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        settings = db.query(UserSettings).filter(UserSettings.whatsapp_phone_number_id == PHONE_NUMBER_ID).first()
+        if settings:
+            return settings.user_id
+        user = User(clerk_id="pending-orders-benchmark", email="pending-orders-benchmark@example.com")
+        db.add(user)
+        db.flush()
+        db.add(UserSettings(user_id=user.id, whatsapp_phone_number_id=PHONE_NUMBER_ID, view_consolidated_data=True))
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def order_message(customer_id: str, n: int) -> MessageState:
+    return MessageState(
+        message_id=f"wamid.pending{uuid.uuid4().hex}", customer_id=customer_id, sender=customer_id,
+        message=f"item {n}", predicted_category="new_order", table_name="orders", priority="medium",
+        business_phone_id=PHONE_NUMBER_ID, raw_timestamp_utc=int(time.time()),
+        extracted_info={"products": [{"item": f"item {n}", "quantity": 1, "unit": "kg"}]},
+    )
+
+
+async def send(reads: OrderReads, state: MessageState):
+    reads.stage = "review"
+    state = await async_review_node(state)
+    reads.stage = "storage"
+    await threaded_storage_node(state)
+    reads.stage = None
+
+
+def orders_by_customer(customers):
+    db = SessionLocal()
+    try:
+        rows = db.query(Order.customer_id, Order.order_number).filter(Order.customer_id.in_(customers)).all()
+    finally:
+        db.close()
+    numbers = defaultdict(set)
+    for customer_id, number in rows:
+        numbers[customer_id].add(number)
+    return numbers
+
+
+def run(reads: OrderReads, client: TestClient, customers: int, per_customer: int, indexed: bool):
+    pending_order_index.enabled = indexed
+    pending_order_index.clear()
+    reads.counts.clear()
+    run_id = uuid.uuid4().int % 10 ** 6
+    wa_ids = [f"9197{run_id:06d}{c:03d}" for c in range(customers)]
+
+    start = time.perf_counter()
+    for n in range(per_customer):
+        for wa_id in wa_ids:
+            asyncio.run(send(reads, order_message(wa_id, n)))
+    elapsed = time.perf_counter() - start
+    before_confirm = orders_by_customer(wa_ids)
+
+    for wa_id in wa_ids:
+        (number,) = before_confirm[wa_id]
+        assert client.put(f"/api/orders/{number}", json={"status": "confirmed"}).status_code == 200
+    for wa_id in wa_ids:
+        asyncio.run(send(reads, order_message(wa_id, per_customer)))
+    after_confirm = orders_by_customer(wa_ids)
+
+    messages = customers * (per_customer + 1)
+    return {
+        "review reads/msg": reads.counts["review"] / messages,
+        "storage reads/msg": reads.counts["storage"] / messages,
+        "ms/msg (first pass)": elapsed * 1000 / (customers * per_customer),
+        "orders/customer": sum(len(v) for v in before_confirm.values()) / customers,
+        "after confirm": sum(len(v) for v in after_confirm.values()) / customers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=50)
+    parser.add_argument("--per-customer", type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    seed()
+
+    import main as app_main
+    client = TestClient(app_main.app)
+    reads = OrderReads()
+    results = {}
+    for mode, indexed in (("database", False), ("index", True)):
+        with redirect_stdout(io.StringIO()):
+            results[mode] = run(reads, client, args.customers, args.per_customer, indexed)
+
+    print(f"\n{'':<22}{'database':>10}{'index':>10}")
+    for metric in results["index"]:
+        print(f"{metric:<22}{results['database'][metric]:>10.2f}{results['index'][metric]:>10.2f}")
+
+    index = results["index"]
+    ok = index["orders/customer"] == 1 and index["after confirm"] == 2 and index["review reads/msg"] < 1
+    print(f"\n[{'ok' if ok else 'FAIL'}] same consolidation decisions, confirmed orders are not reopened")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Benchmark: input tokens per Gemini classification call, before and after the
+prompt builder (app/agents/prompt_builder.py).
+
+Classifies --messages messages, each with a conversation of --context earlier
+customer messages (some of them long pastes), through GeminiLLMAgent against
+a stub client that reports prompt_token_count as Gemini would (chars / 4 of
+the system instruction plus contents). Three layouts:
+- before: the previous single f-string prompt
+  (benchmarks/fixtures/legacy_classify_prompt.txt), all of it sent per call
+- inline: static system instruction + budgeted context, sent per call
+- cached: the same, with the system instruction held as Gemini cached
+  content, so only the per-message part is billed at the full rate
+
+Also reports the time spent building a prompt.
+
+Run from the backend directory:
+    python -m benchmarks.bench_prompt_tokens --messages 200 --context 10
+"""
+
+import io
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from string import Template
+from types import SimpleNamespace
+from contextlib import redirect_stdout
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from app.agents import llm_agent as llm_agent_module
+from app.agents.llm_agent import GeminiLLMAgent
+from app.agents.llm_cache import llm_cache
+from app.agents.prompt_builder import prompt_builder, prefix_cache
+from app.utils.category_map import DEFAULT_CATEGORIES, DEFAULT_PRIORITY_MAP, STANDARD_KEYS
+from app.utils.metrics import metrics
+
+LEGACY_PROMPT = os.path.join(os.path.dirname(__file__), "fixtures", "legacy_classify_prompt.txt")
+CHARS_PER_TOKEN = 4
+
+CLASSIFICATION = {
+    "category": "new_order", "priority": "high", "conversation_status": "continue", "harmful": False,
+    "extracted_info": {"products": [{"item": "chocolate cake", "quantity": 2, "unit": "1kg", "notes": None}]},
+}
+
+SHORT = ["hi", "I want 2 chocolate cakes", "make it 3 actually", "deliver to 14 Park Street",
+         "can you do it by 6pm?", "thanks", "also add a 500gm bread", "is cash on delivery ok?"]
+LONG = ("Here is the full list from our office party planning sheet, copied as is: "
+        + ", ".join(f"item {n} with extra notes about packaging and colour" for n in range(30)))
+
+
+def tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+class StubModels:
+    """Records the size of each request and answers with a fixed classification"""
+
+    def __init__(self):
+        self.prompt_tokens = []
+        self.billed_tokens = []
+
+    def _answer(self, contents, config):
+        system = "" if config.cached_content else (config.system_instruction or "")
+        prefix = CACHED_PREFIX.get(config.cached_content, "")
+        total = tokens(system) + tokens(prefix) + tokens(contents if isinstance(contents, str) else "".join(contents))
+        self.prompt_tokens.append(total)
+        self.billed_tokens.append(total - tokens(prefix))
+        usage = SimpleNamespace(prompt_token_count=total, cached_content_token_count=tokens(prefix),
+                                candidates_token_count=40)
+        candidate = SimpleNamespace(finish_reason=SimpleNamespace(name="STOP"), safety_ratings=[])
+        return SimpleNamespace(text=json.dumps(CLASSIFICATION), candidates=[candidate], prompt_feedback=None,
+                               usage_metadata=usage)
+
+    async def generate_content(self, model, contents, config):
+        return self._answer(contents, config)
+
+
+CACHED_PREFIX = {}
+
+
+class StubCaches:
+    async def create(self, model, config):
+        name = f"cachedContents/{len(CACHED_PREFIX)}"
+        CACHED_PREFIX[name] = config.system_instruction
+        return SimpleNamespace(name=name)
+
+
+def conversations(count: int, context: int):
+    rng = random.Random(23)
+    for i in range(count):
+        history = [LONG if rng.random() < 0.2 else rng.choice(SHORT) for _ in range(context)]
+        message = f"add {i % 5 + 1} more cupcakes please"
+        # The context node appends the current message before reading the context back
+        yield message, history + [message]
+
+
+def legacy_prompt(template: Template, message: str, context: list) -> str:
+    return template.substitute(
+        message=message,
+        context="\n".join(f"- {msg}" for msg in context[-10:]) if context else "None",
+        categories=", ".join(DEFAULT_CATEGORIES),
+        priorities="\n".join(f"- {k}: {v}" for k, v in DEFAULT_PRIORITY_MAP.items()),
+        schema="\n".join(f"- {k}: {v}" for k, v in STANDARD_KEYS.items()),
+    )
+
+
+async def run(items, cached: bool):
+    models = StubModels()
+    llm_agent_module.client = SimpleNamespace(aio=SimpleNamespace(models=models, caches=StubCaches()))
+    prefix_cache.enabled = cached
+    prefix_cache.min_tokens = 0
+    prefix_cache.clear()
+    agent = GeminiLLMAgent(safety_mode="combined")
+    for message, context in items:
+        await agent.aclassify(message, context)
+    return models
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--context", type=int, default=10, help="earlier customer messages per conversation")
+    args = parser.parse_args()
+    llm_cache.enabled = False
+
+    items = list(conversations(args.messages, args.context))
+    with open(LEGACY_PROMPT) as f:
+        template = Template(f.read())
+
+    start = time.perf_counter()
+    legacy = [tokens(legacy_prompt(template, m, c)) for m, c in items]
+    legacy_build_us = (time.perf_counter() - start) * 1e6 / len(items)
+    start = time.perf_counter()
+    for message, context in items:
+        prompt_builder.user_prompt(message, context)
+    build_us = (time.perf_counter() - start) * 1e6 / len(items)
+
+    results = {}
+    for mode in ("inline", "cached"):
+        with redirect_stdout(io.StringIO()):
+            models = asyncio.run(run(items, mode == "cached"))
+        results[mode] = models
+
+    def row(name, sent, billed, build):
+        print(f"{name:<10}{sum(sent) / len(sent):>12.0f}{max(sent):>10}{sum(billed) / len(billed):>12.0f}{build:>12.1f}")
+
+    print(f"\n{args.messages} messages, {args.context} earlier messages each")
+    print(f"{'layout':<10}{'tokens/call':>12}{'max':>10}{'billed/call':>12}{'build us':>12}")
+    row("before", legacy, legacy, legacy_build_us)
+    row("inline", results["inline"].prompt_tokens, results["inline"].billed_tokens, build_us)
+    row("cached", results["cached"].prompt_tokens, results["cached"].billed_tokens, build_us)
+
+    counters = metrics.snapshot()["counters"]
+    print(f"\nllm.tokens.prompt {counters.get('llm.tokens.prompt', 0)}, "
+          f"llm.tokens.cached {counters.get('llm.tokens.cached', 0)}, "
+          f"llm.context.omitted_messages {counters.get('llm.context.omitted_messages', 0)}, "
+          f"estimator chars/token {prompt_builder.tokens.chars_per_token:.2f}")
+
+    inline = results["inline"].prompt_tokens
+    cached = results["cached"].billed_tokens
+    ok = (sum(inline) < sum(legacy) and sum(cached) < sum(inline)
+          and max(inline) - min(inline) <= prompt_builder.context_budget + 50)
+    print(f"\n[{'ok' if ok else 'FAIL'}] fewer input tokens per call, context held to its budget")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
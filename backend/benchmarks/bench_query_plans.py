@@ -0,0 +1,217 @@
+"""
+Benchmark: query plans and latencies of the hot lookups, before and after
+migrations/versions/0001_hot_lookup_indexes.sql and 0006_list_page_indexes.sql.
+
+Seeds a realistic volume (by default 200 tenants, 20k customers, 300k order
+lines of which ~15% are pending, 200k interactions, 200k response metrics and
+100k each of issues, enquiries and error logs), then for each hot query prints
+its plan and mean/p95 latency over random parameters:
+- before: the migrations' indexes dropped and the original single-column
+  indexes (idx_orders_user_id, idx_customers_user_id, ...) in place
+- after: the migrations applied by the runner (migrate.py)
+
+Plans come from EXPLAIN QUERY PLAN on SQLite and EXPLAIN on PostgreSQL;
+point DATABASE_URL at Postgres for numbers that match production.
+
+Run from the backend directory:
+    python -m benchmarks.bench_query_plans --orders 300000 --runs 200
+"""
+
+import os
+import re
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from sqlalchemy import delete, func, insert, select, text
+from database import Base, engine, SessionLocal
+from app.models import User, UserSettings, Customer, Interaction, Order, ResponseMetrics, Issue, Enquiry, ErrorLog
+from migrate import load_migrations, migrate
+
+MIGRATIONS = ("0001", "0006")
+BASELINE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_customer_id ON orders (customer_id)",
+    "CREATE INDEX IF NOT EXISTS idx_customers_user_id ON customers (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_issues_user_id ON issues (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_enquiries_user_id ON enquiries (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_error_logs_user_id ON error_logs (user_id)",
+]
+START = datetime(2025, 1, 1)
+
+
+def _batched(conn, model, rows, size=10000):
+    for i in range(0, len(rows), size):
+        conn.execute(insert(model), rows[i:i + size])
+
+
+def seed(tenants: int, customers: int, orders: int, interactions: int, metrics: int, tickets: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(func.count(Order.order_id)).scalar() == orders and \
+                db.query(func.count(ErrorLog.error_id)).scalar() == tickets:
+            return
+    finally:
+        db.close()
+    print(f"seeding {tenants} tenants, {customers} customers, {orders} order lines ...")
+    rng = random.Random(7)
+    with engine.begin() as conn:
+        for model in (ErrorLog, Enquiry, Issue, ResponseMetrics, Order, Interaction, Customer, UserSettings, User):
+            conn.execute(delete(model))
+        _batched(conn, User, [{"id": t + 1, "clerk_id": f"plan-{t}", "email": f"plan-{t}@example.com"} for t in range(tenants)])
+        _batched(conn, UserSettings, [{"user_id": t + 1, "whatsapp_phone_number_id": f"1000{t:08d}"} for t in range(tenants)])
+        _batched(conn, Customer, [{"customer_id": f"91{c:010d}", "user_id": c % tenants + 1,
+                                   "created_at": START + timedelta(minutes=c)} for c in range(customers)])
+        _batched(conn, Interaction, [{
+            "user_id": i % tenants + 1, "whatsapp_message_id": f"wamid.plan{i:09d}", "customer_id": f"91{i % customers:010d}",
+            "category": "new_order", "priority": "medium", "status": "pending", "created_at": START + timedelta(seconds=i * 30),
+        } for i in range(interactions)])
+        rows = []
+        for i in range(orders):
+            customer = rng.randrange(customers)
+            rows.append({
+                "user_id": customer % tenants + 1, "customer_id": f"91{customer:010d}", "order_number": f"ORD-{i // 3:08d}",
+                "item": f"item {i % 40}", "quantity": i % 5 + 1,
+                "order_status": "pending" if rng.random() < 0.15 else rng.choice(["confirmed", "delivered", "cancelled"]),
+                "created_at": START + timedelta(seconds=i * 60), "updated_at": START + timedelta(seconds=i * 60),
+            })
+        _batched(conn, Order, rows)
+        _batched(conn, ResponseMetrics, [{
+            "user_id": m % tenants + 1, "message_id": f"wamid.plan{m:09d}", "response_type": "ai",
+            "response_time_seconds": 1.5, "message_received_at": START + timedelta(seconds=m * 45),
+        } for m in range(metrics)])
+        _batched(conn, Issue, [{
+            "user_id": t % tenants + 1, "customer_id": f"91{t % customers:010d}", "description": "late delivery",
+            "issue_type": "delivery", "status": "open", "created_at": START + timedelta(seconds=t * 90),
+        } for t in range(tickets)])
+        _batched(conn, Enquiry, [{
+            "user_id": t % tenants + 1, "customer_id": f"91{t % customers:010d}", "description": "opening hours",
+            "category": "general_enquiry", "status": "new", "created_at": START + timedelta(seconds=t * 90),
+        } for t in range(tickets)])
+        _batched(conn, ErrorLog, [{
+            "user_id": t % tenants + 1, "error_type": rng.choice(["whatsapp_api", "llm", "storage"]),
+            "error_message": "timeout", "source": "benchmark", "created_at": START + timedelta(seconds=t * 90),
+        } for t in range(tickets)])
+
+
+def migration_indexes():
+    sql = "".join(m.sql for m in load_migrations() if m.version in MIGRATIONS)
+    return re.findall(r"CREATE INDEX (?:CONCURRENTLY )?IF NOT EXISTS (\w+)", sql)
+
+
+def set_state(state: str):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations (version VARCHAR(20) PRIMARY KEY, "
+                          "name VARCHAR(255) NOT NULL, checksum VARCHAR(64) NOT NULL, applied_at TIMESTAMP NOT NULL)"))
+        for version in MIGRATIONS:
+            conn.execute(text("DELETE FROM schema_migrations WHERE version = :v"), {"v": version})
+        if state == "before":
+            for name in migration_indexes():
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            for statement in BASELINE_INDEXES:
+                conn.execute(text(statement))
+    if state == "after":
+        migrate()
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+
+def queries(tenants: int, customers: int, orders: int, interactions: int):
+    """(name, statement factory taking an rng)"""
+    def customer(rng):
+        return f"91{rng.randrange(customers):010d}"
+
+    def page(model, id_col, *criteria):
+        """A first keyset page of a dashboard list endpoint (see app.utils.pagination.keyset_page)"""
+        return lambda rng: (select(model).where(model.user_id == rng.randrange(tenants) + 1, *criteria)
+                            .order_by(model.created_at.desc(), id_col.desc()).limit(50))
+
+    return [
+        ("tenant by phone id", lambda rng: select(UserSettings.user_id)
+            .where(UserSettings.whatsapp_phone_number_id == f"1000{rng.randrange(tenants):08d}")),
+        ("interaction by wamid", lambda rng: select(Interaction.interaction_id)
+            .where(Interaction.whatsapp_message_id == f"wamid.plan{rng.randrange(interactions):09d}")),
+        ("order lines by number", lambda rng: select(Order)
+            .where(Order.order_number == f"ORD-{rng.randrange(orders // 3):08d}")),
+        ("latest order/customer", lambda rng: select(Order)
+            .where(Order.customer_id == customer(rng)).order_by(Order.created_at.desc()).limit(1)),
+        ("latest pending/customer", lambda rng: select(Order)
+            .where(Order.customer_id == customer(rng), Order.order_status == "pending")
+            .order_by(Order.created_at.desc()).limit(1)),
+        ("orders page/tenant", lambda rng: select(Order.order_id, Order.created_at)
+            .where(Order.user_id == rng.randrange(tenants) + 1)
+            .order_by(Order.created_at.desc(), Order.order_id.desc()).limit(50)),
+        ("customers page/tenant", page(Customer, Customer.customer_id)),
+        ("issues page/tenant", page(Issue, Issue.issue_id)),
+        ("enquiries page/tenant", page(Enquiry, Enquiry.enquiry_id)),
+        ("error logs page/tenant", page(ErrorLog, ErrorLog.error_id)),
+        ("metrics window/tenant", lambda rng: select(ResponseMetrics)
+            .where(ResponseMetrics.user_id == rng.randrange(tenants) + 1,
+                   ResponseMetrics.message_received_at >= START + timedelta(days=rng.randrange(60)))
+            .where(ResponseMetrics.message_received_at < START + timedelta(days=rng.randrange(60, 90)))
+            .order_by(ResponseMetrics.message_received_at.desc())),
+    ]
+
+
+def explain(conn, stmt) -> str:
+    sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+    if engine.dialect.name == "postgresql":
+        return " / ".join(row[0].strip() for row in conn.execute(text(f"EXPLAIN {sql}")))
+    return " / ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+
+def measure(conn, factory, runs: int):
+    rng = random.Random(11)
+    timings = []
+    for _ in range(runs):
+        stmt = factory(rng)
+        start = time.perf_counter()
+        conn.execute(stmt).fetchall()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return sum(timings) / len(timings) * 1000, timings[int(len(timings) * 0.95) - 1] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=200)
+    parser.add_argument("--customers", type=int, default=20000)
+    parser.add_argument("--orders", type=int, default=300000)
+    parser.add_argument("--interactions", type=int, default=200000)
+    parser.add_argument("--metrics", type=int, default=200000)
+    parser.add_argument("--tickets", type=int, default=100000, help="issues, enquiries and error logs each")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    seed(args.tenants, args.customers, args.orders, args.interactions, args.metrics, args.tickets)
+    hot = queries(args.tenants, args.customers, args.orders, args.interactions)
+    results = {}
+    for state in ("before", "after"):
+        set_state(state)
+        with engine.connect() as conn:
+            for name, factory in hot:
+                plan = explain(conn, factory(random.Random(3)))
+                mean_ms, p95_ms = measure(conn, factory, args.runs)
+                results[(name, state)] = (plan, mean_ms, p95_ms)
+
+    print(f"\n{'query':<26}{'before ms':>11}{'p95':>8}{'after ms':>11}{'p95':>8}{'speedup':>9}")
+    for name, _ in hot:
+        _, before_mean, before_p95 = results[(name, "before")]
+        _, after_mean, after_p95 = results[(name, "after")]
+        print(f"{name:<26}{before_mean:>11.3f}{before_p95:>8.3f}{after_mean:>11.3f}{after_p95:>8.3f}"
+              f"{before_mean / after_mean if after_mean else 0:>8.1f}x")
+
+    print("\nplans")
+    for name, _ in hot:
+        print(f"  {name}")
+        print(f"    before: {results[(name, 'before')][0]}")
+        print(f"    after:  {results[(name, 'after')][0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Microbenchmark: storage_node overhead per message.
+
+Compares the old construct-per-message path (new LoggerAgent, its own
+session, a fresh settings query and HubSpot token decryption every time, plus
+a user_id lookup per message) with the cached path (tenant registry hit,
+cached LoggerAgentConfig, a pooled session borrowed for the message).
+
+A SQLite database is seeded with one tenant whose CRM is HubSpot, so every
+message queues one crm_outbox row; the sync worker is not running, so no
+HubSpot calls are made. By default the tenant does not store interactions;
+pass --store to include the interaction insert.
+
+Run from the backend directory:
+    python -m benchmarks.bench_storage_overhead --messages 500
+"""
+
+import io
+import os
+import time
+import uuid
+import logging
+import argparse
+from contextlib import contextmanager, redirect_stdout
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from database import Base, engine, SessionLocal
+from app.models import User, UserSettings
+from app.agents.logger_agent import LoggerAgent, logger_agents
+from app.nodes import storage_node as storage_node_module
+from app.state import MessageState
+from app.utils.tenant_registry import tenant_registry
+from utils.encryption import encrypt_value
+
+PHONE_NUMBER_ID = "100000000000001"
+
+
+class PerMessageAgents:
+    """The old behaviour: a new LoggerAgent (and session) for every message"""
+
+    @contextmanager
+    def borrow(self, user_id):
+        # Without the registry every message paid for its own user_id query
+        tenant_registry.clear()
+        agent = LoggerAgent(str(user_id))
+        yield agent
+        del agent
+
+
+def seed(store: bool):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.clerk_id == "benchmark").first()
+        if not user:
+            user = User(clerk_id="benchmark", email="benchmark@example.com")
+            db.add(user)
+            db.commit()
+        settings = db.query(UserSettings).filter(UserSettings.user_id == user.id).first()
+        if not settings:
+            settings = UserSettings(user_id=user.id)
+            db.add(settings)
+        settings.whatsapp_phone_number_id = PHONE_NUMBER_ID
+        settings.crm_type = "hubspot"
+        settings.hubspot_access_token = encrypt_value("pat-benchmark-token")
+        settings.view_consolidated_data = store
+        db.commit()
+    finally:
+        db.close()
+
+
+def make_state(i: int) -> MessageState:
+    return MessageState(
+        # Unique per run, so every message queues a new outbox row
+        message_id=f"wamid.bench{uuid.uuid4().hex}",
+        customer_id=f"9100000{i:05d}",
+        sender=f"9100000{i:05d}",
+        message=f"Do you have item {i} in stock?",
+        predicted_category="general_inquiry",
+        business_phone_id=PHONE_NUMBER_ID,
+    )
+
+
+def run(agents, messages: int):
+    storage_node_module.logger_agents = agents
+    latencies = []
+    for i in range(messages):
+        start = time.perf_counter()
+        storage_node_module.storage_node(make_state(i))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--store", action="store_true", help="let the tenant store interactions (adds a DB insert per message)")
+    args = parser.parse_args()
+
+    seed(args.store)
+    # Per-message INFO logging would dominate the numbers
+    logging.disable(logging.WARNING)
+
+    modes = [("per-message", PerMessageAgents()), ("cached", logger_agents)]
+    print(f"\n{'mode':<14}{'messages':>10}{'mean us':>10}{'p50 us':>10}{'p95 us':>10}")
+    for name, agents in modes:
+        logger_agents.invalidate()
+        tenant_registry.clear()
+        with redirect_stdout(io.StringIO()):
+            latencies = run(agents, args.messages)
+        mean_us = sum(latencies) / len(latencies) * 1e6
+        p50_us = latencies[len(latencies) // 2] * 1e6
+        p95_us = latencies[int(len(latencies) * 0.95) - 1] * 1e6
+        print(f"{name:<14}{args.messages:>10}{mean_us:>10.0f}{p50_us:>10.0f}{p95_us:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
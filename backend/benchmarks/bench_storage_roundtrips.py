@@ -0,0 +1,136 @@
+"""
+Benchmark: database round-trips and commits per stored message.
+
+Runs messages through LoggerAgent.process_message_state for a tenant that
+stores interactions and syncs to HubSpot (so each message also queues a
+crm_outbox row; the sync worker is not running), and counts, per message:
+- statements: every cursor execute, an executemany counting once
+- commits
+
+Scenarios:
+- a new order with 1, 5 and 20 products from a new customer
+- three more products added to that customer's pending order
+- an issue and an enquiry from a returning customer
+- a redelivered message (same WhatsApp message id, reclassified)
+
+Point DATABASE_URL at Postgres to measure real network round-trips; the
+default is a local SQLite file.
+
+Run from the backend directory:
+    python -m benchmarks.bench_storage_roundtrips --repeat 20
+"""
+
+import io
+import os
+import time
+import uuid
+import logging
+import argparse
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from sqlalchemy import event
+from database import Base, engine, SessionLocal
+from app.models import User
+from app.agents.logger_agent import LoggerAgent, LoggerAgentConfig
+from app.state import MessageState
+
+
+class RoundTripCounter:
+    def __init__(self, engine):
+        self.statements = 0
+        self.commits = 0
+        event.listen(engine, "before_cursor_execute", self._statement)
+        event.listen(engine, "commit", self._commit)
+
+    def _statement(self, *args):
+        self.statements += 1
+
+    def _commit(self, *args):
+        self.commits += 1
+
+    def reset(self):
+        self.statements = self.commits = 0
+
+
+def seed() -> int:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.clerk_id == "roundtrip-benchmark").first()
+        if not user:
+            user = User(clerk_id="roundtrip-benchmark", email="roundtrip-benchmark@example.com")
+            db.add(user)
+            db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def message(customer_id: str, text: str, category: str, table: str, message_id: str = None, **extra) -> MessageState:
+    return MessageState(
+        message_id=message_id or f"wamid.bench{uuid.uuid4().hex}", customer_id=customer_id, sender=customer_id,
+        customer_name="Bench Customer", message=text, predicted_category=category, priority="medium",
+        table_name=table, **extra,
+    )
+
+
+def products(n: int):
+    return [{"item": f"item {i}", "quantity": i + 1, "unit": "kg"} for i in range(n)]
+
+
+def scenarios(run: int):
+    customer = f"91{run:05d}{uuid.uuid4().int % 10 ** 5:05d}"
+    order_number = f"ORD-BENCH-{uuid.uuid4().hex[:10]}"
+    redelivered_id = f"wamid.bench{uuid.uuid4().hex}"
+    for n in (1, 5, 20):
+        number = order_number if n == 1 else f"{order_number}-{n}"
+        yield f"new order, {n} item(s)", message(customer, "I want to order", "new_order", "orders",
+                                                 extracted_info={"products": products(n), "order_number": number})
+    yield "add 3 items to order", message(customer, "add three more", "new_order", "orders",
+                                          is_addition_to_existing_order=True, order_number=order_number,
+                                          extracted_info={"products": [{"item": f"extra {i}", "quantity": 1} for i in range(3)]})
+    yield "issue", message(customer, "my delivery is late", "issue", "issues", message_id=redelivered_id,
+                           extracted_info={"issue": "late delivery", "request": "refund"})
+    yield "enquiry", message(customer, "do you deliver on sunday?", "general_inquiry", "enquiries")
+    yield "redelivered message", message(customer, "my delivery is late", "complaint", "issues", message_id=redelivered_id,
+                                         extracted_info={"issue": "late delivery", "request": "refund"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="runs of the scenario set to average over")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    user_id = seed()
+    config = LoggerAgentConfig(user_settings=SimpleNamespace(user_id=user_id), hubspot_enabled=True,
+                               hubspot_access_token="pat-benchmark", store_in_db=True)
+    counter = RoundTripCounter(engine)
+    totals = {}
+    for run in range(args.repeat):
+        for name, state in scenarios(run):
+            db = SessionLocal()
+            agent = LoggerAgent(str(user_id), config=config, db=db)
+            counter.reset()
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                result = agent.process_message_state(state)
+            elapsed = time.perf_counter() - start
+            assert result["status"] == "success", result
+            db.close()
+            stats = totals.setdefault(name, [0, 0, 0.0])
+            stats[0] += counter.statements
+            stats[1] += counter.commits
+            stats[2] += elapsed
+
+    print(f"\n{'scenario':<24}{'statements':>12}{'commits':>9}{'ms':>8}")
+    for name, (statements, commits, elapsed) in totals.items():
+        print(f"{name:<24}{statements / args.repeat:>12.1f}{commits / args.repeat:>9.1f}{elapsed * 1000 / args.repeat:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Check: custom categories from UserSettings.categories reach the classifier,
+and are compiled once per settings version rather than per message.
+
+Seeds --tenants businesses, half with a dashboard-style category list and
+half with a business-manager-style object (custom categories plus
+priorities), and classifies --messages messages per tenant through the async
+LLM node against a stub Gemini client. The stub answers with one of the
+tenant's own categories. Then changes one tenant's categories the way
+update_user_settings does (write, invalidate the tenant registry) and sends
+one more message. Reports:
+- whether every request's system instruction listed the tenant's categories
+- whether table and priority came from the tenant's settings
+- profiles compiled, vs. messages classified
+- the per-message cost of the profile lookup vs. parsing the setting each time
+
+Run from the backend directory:
+    python -m benchmarks.bench_tenant_profiles --tenants 6 --messages 50
+"""
+
+import io
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+from types import SimpleNamespace
+from contextlib import redirect_stdout
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ["LLM_BATCH_ENABLED"] = "false"
+
+from database import Base, engine, SessionLocal
+from app.models import User, UserSettings
+from app.state import MessageState
+from app.agents import llm_agent as llm_agent_module
+from app.agents.llm_cache import llm_cache
+from app.nodes.llm_node import async_llm_node
+from app.utils.metrics import metrics
+from app.utils.tenant_registry import tenant_registry
+from app.utils.tenant_profiles import tenant_profiles, parse_categories, compile_profile
+
+
+def dashboard_categories(n: int) -> str:
+    return json.dumps(["new_order", "complaint", f"delivery_window_{n}", "others"])
+
+
+def manager_categories(n: int) -> str:
+    return json.dumps({"suggested_categories": ["new_order", "appointment_booking"],
+                       "custom_categories": [f"bridal_package_{n}"],
+                       "priorities": {"new_order": "high", "appointment_booking": "high", f"bridal_package_{n}": "low"}})
+
+
+class StubModels:
+    """Answers with the first custom category found in the system instruction"""
+
+    def __init__(self):
+        self.calls = 0
+        self.missing_categories = 0
+        self.expected = {}
+
+    async def generate_content(self, model, contents, config):
+        self.calls += 1
+        system = config.system_instruction or ""
+        category = next((c for c in self.expected.values() if c in system), None)
+        if category is None:
+            self.missing_categories += 1
+            category = "others"
+        text = json.dumps({"category": category, "priority": "moderate", "conversation_status": "continue",
+                           "extracted_info": {}, "harmful": False})
+        candidate = SimpleNamespace(finish_reason=SimpleNamespace(name="STOP"), safety_ratings=[])
+        return SimpleNamespace(text=text, candidates=[candidate], prompt_feedback=None, usage_metadata=None)
+
+
+def seed(tenants: int):
+    Base.metadata.create_all(bind=engine)
+    run_id = uuid.uuid4().hex[:8]
+    phones = {}
+    db = SessionLocal()
+    try:
+        for n in range(tenants):
+            user = User(clerk_id=f"profiles-{run_id}-{n}", email=f"profiles-{run_id}-{n}@example.com")
+            db.add(user)
+            db.flush()
+            phone = f"2400{uuid.uuid4().int % 10 ** 8:08d}"
+            categories = dashboard_categories(n) if n % 2 == 0 else manager_categories(n)
+            db.add(UserSettings(user_id=user.id, whatsapp_phone_number_id=phone, categories=categories))
+            phones[phone] = f"delivery_window_{n}" if n % 2 == 0 else f"bridal_package_{n}"
+        db.commit()
+    finally:
+        db.close()
+    return phones
+
+
+def set_categories(phone: str, categories: str):
+    db = SessionLocal()
+    try:
+        settings = db.query(UserSettings).filter(UserSettings.whatsapp_phone_number_id == phone).first()
+        settings.categories = categories
+        db.commit()
+    finally:
+        db.close()
+    tenant_registry.invalidate(phone)
+
+
+async def classify(phones, messages: int):
+    results = []
+    for i in range(messages):
+        for phone in phones:
+            state = MessageState(customer_id="919000000024", sender="919000000024", business_phone_id=phone,
+                                 message=f"message {i} for {phone}")
+            results.append((phone, await async_llm_node(state)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=6)
+    parser.add_argument("--messages", type=int, default=50, help="messages per tenant")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    llm_cache.enabled = False
+
+    phones = seed(args.tenants)
+    models = StubModels()
+    models.expected = dict(phones)
+    llm_agent_module.client = SimpleNamespace(aio=SimpleNamespace(models=models))
+    compiled_before = metrics.snapshot()["counters"].get("tenant_profiles.compiled", 0)
+
+    with redirect_stdout(io.StringIO()):
+        results = asyncio.run(classify(phones, args.messages))
+    routed = 0
+    for phone, state in results:
+        expected = phones[phone]
+        table_ok = state.table_name == "enquiries"
+        priority_ok = state.priority == ("low" if expected.startswith("bridal") else "moderate")
+        routed += state.predicted_category == expected and table_ok and priority_ok
+    compiled = metrics.snapshot()["counters"].get("tenant_profiles.compiled", 0) - compiled_before
+
+    # A settings change is picked up on the next message
+    changed = next(iter(phones))
+    set_categories(changed, json.dumps(["new_order", "cake_tasting"]))
+    models.expected = {changed: "cake_tasting"}
+    with redirect_stdout(io.StringIO()):
+        after = asyncio.run(classify([changed], 1))
+    updated = after[0][1].predicted_category == "cake_tasting"
+
+    raw = manager_categories(1)
+    start = time.perf_counter()
+    for _ in range(10000):
+        parse_categories(raw)
+    parse_us = (time.perf_counter() - start) * 100
+    start = time.perf_counter()
+    for _ in range(10000):
+        tenant_profiles.get(changed)
+    lookup_us = (time.perf_counter() - start) * 100
+
+    print(f"\n{len(results)} messages from {args.tenants} tenants, {models.calls - 1} Gemini calls")
+    print(f"tenant categories missing from the system instruction: {models.missing_categories}")
+    print(f"routed with the tenant's category, table and priority: {routed} of {len(results)}")
+    print(f"profiles compiled: {compiled} (one per distinct setting)")
+    print(f"settings change picked up on the next message: {updated}")
+    print(f"per message: profile lookup {lookup_us:.2f} us, parsing the setting {parse_us:.2f} us")
+    compile_profile.cache_clear()
+
+    ok = models.missing_categories == 0 and routed == len(results) and compiled <= args.tenants and updated
+    print(f"\n[{'ok' if ok else 'FAIL'}] custom categories honoured, compiled once per settings version")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Check: batched webhook deliveries are fully processed, in order per customer.
+
+Posts --deliveries webhook bodies to the listener router with the worker pool
+running. Each body batches --customers customers' messages (--per-customer
+each, spread over two entries and several changes) together with status
+receipts for earlier replies. The graph is replaced by a stub that sleeps
+--stage-ms per message and records the order it saw, so the check measures
+the listener and queue only. Reports:
+- messages processed vs. sent (before: only entry[0].changes[0].messages[0]
+  of each delivery was read, and status-only bodies were logged as errors)
+- whether every customer's messages ran in the order they were sent
+- peak number of messages in the pipeline at once
+- status receipts stored in message_deliveries (they never reach the graph)
+
+Run from the backend directory:
+    python -m benchmarks.bench_webhook_batches --deliveries 20 --customers 10 --per-customer 4
+"""
+
+import io
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import tempfile
+from collections import defaultdict
+from contextlib import redirect_stdout
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ["WEBHOOK_QUEUE_PATH"] = os.path.join(tempfile.mkdtemp(), "webhook_queue.db")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import func
+from database import Base, engine, SessionLocal
+from app.agents.listener_agent import get_listener_router
+from app.agents.work_queue import work_queue
+from app.models import MessageDelivery
+
+PHONE_NUMBER_ID = "100000000002"
+METADATA = {"display_phone_number": "15550000002", "phone_number_id": PHONE_NUMBER_ID}
+
+
+class StubGraph:
+    """Stands in for the LangGraph pipeline: records order and concurrency"""
+
+    def __init__(self, stage_seconds: float):
+        self.stage_seconds = stage_seconds
+        self.seen = defaultdict(list)
+        self.active = 0
+        self.peak = 0
+
+    async def ainvoke(self, state):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.stage_seconds)
+            self.seen[state.customer_id].append(state.raw_timestamp_utc)
+            return {"status": "ok"}
+        finally:
+            self.active -= 1
+
+
+def delivery(batch: int, customers: int, per_customer: int, clock: list):
+    """One webhook body; returns (body, messages sent, status receipts sent)"""
+    changes = [[] for _ in range(per_customer)]
+    sent = 0
+    for c in range(customers):
+        wa_id = f"9191{c:08d}"
+        for m in range(per_customer):
+            clock[0] += 1
+            changes[m].append({
+                "contacts": [{"wa_id": wa_id, "profile": {"name": f"Customer {c}"}}],
+                "messages": [{"from": wa_id, "id": f"wamid.batch{uuid.uuid4().hex}", "timestamp": str(clock[0]),
+                              "type": "text", "text": {"body": f"message {m}"}}],
+            })
+            sent += 1
+    statuses = [{"id": f"wamid.reply{batch:04d}{c:04d}", "status": state, "timestamp": str(clock[0]),
+                 "recipient_id": f"9191{c:08d}"}
+                for c in range(customers) for state in ("sent", "delivered")]
+    # One change per message round, each carrying every customer's message of that round
+    values = [{"metadata": METADATA,
+               "contacts": [part["contacts"][0] for part in change],
+               "messages": [part["messages"][0] for part in change]} for change in changes if change]
+    values.append({"metadata": METADATA, "statuses": statuses})
+    # Two entries, as Meta does when it batches across its own shards
+    half = len(values) // 2
+    entries = [{"changes": [{"field": "messages", "value": v} for v in part]} for part in (values[:half], values[half:])]
+    return json.dumps({"object": "whatsapp_business_account", "entry": entries}).encode(), sent, len(statuses) // 2
+
+
+async def run(args):
+    graph = StubGraph(args.stage_ms / 1000)
+    app = FastAPI()
+    app.include_router(get_listener_router(graph))
+    await app.router.startup()
+    clock = [int(time.time()) - 10 ** 6]
+    sent = receipts = 0
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            start = time.perf_counter()
+            for batch in range(args.deliveries):
+                body, messages, statuses = delivery(batch, args.customers, args.per_customer, clock)
+                sent += messages
+                receipts += statuses
+                response = await client.post(f"/webhook/{PHONE_NUMBER_ID}", content=body)
+                assert response.status_code == 200, response.text
+            while sum(len(v) for v in graph.seen.values()) < sent and time.perf_counter() - start < 120:
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - start
+    finally:
+        await app.router.shutdown()
+    return graph, sent, receipts, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deliveries", type=int, default=20)
+    parser.add_argument("--customers", type=int, default=10, help="customers per delivery")
+    parser.add_argument("--per-customer", type=int, default=4, help="messages per customer per delivery")
+    parser.add_argument("--stage-ms", type=float, default=20, help="simulated pipeline time per message")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    Base.metadata.create_all(bind=engine)
+    with redirect_stdout(io.StringIO()):
+        graph, sent, receipts, elapsed = asyncio.run(run(args))
+
+    processed = sum(len(v) for v in graph.seen.values())
+    in_order = all(seen == sorted(seen) for seen in graph.seen.values())
+    db = SessionLocal()
+    try:
+        delivered = db.query(func.count(MessageDelivery.message_id)).filter(
+            MessageDelivery.message_id.like("wamid.reply%"), MessageDelivery.status == "delivered").scalar()
+    finally:
+        db.close()
+
+    print(f"\nmessages sent {sent}, processed {processed} in {elapsed:.2f}s (before: {args.deliveries})")
+    print(f"per-customer order kept: {in_order}")
+    print(f"peak messages in the pipeline at once: {graph.peak}")
+    print(f"status receipts stored as delivered: {delivered} of {receipts}")
+    print(f"left in queue: {work_queue.depth()}")
+
+    ok = processed == sent and in_order and delivered >= receipts and graph.peak > 1
+    print(f"\n[{'ok' if ok else 'FAIL'}] every message processed, concurrently across customers, in order per customer")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
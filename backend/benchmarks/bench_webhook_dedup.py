@@ -0,0 +1,118 @@
+"""
+Check: redelivered WhatsApp messages are queued once.
+
+Posts webhook payloads for --messages distinct message ids to the listener
+router in three rounds:
+- each delivered --copies times concurrently (overlapping retries race to
+  processed_messages)
+- each delivered once more (a later retry, answered by the in-memory LRU)
+- each delivered once more after clearing the LRU (as a freshly restarted
+  worker would see them, answered by processed_messages)
+Reports:
+- jobs queued, which must equal the number of distinct messages
+- dedup hits answered from memory and from processed_messages
+- webhook ack latency for new messages and for duplicates
+
+The worker pool is not started, so nothing reaches the graph or the LLM; the
+queue is a throwaway SQLite file.
+
+Run from the backend directory:
+    python -m benchmarks.bench_webhook_dedup --messages 500 --copies 3
+"""
+
+import io
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ["WEBHOOK_QUEUE_PATH"] = os.path.join(tempfile.mkdtemp(), "webhook_queue.db")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+import httpx
+from fastapi import FastAPI
+from database import Base, engine
+from app.agents.listener_agent import get_listener_router
+from app.agents.work_queue import work_queue
+from app.utils.message_dedup import message_dedup
+from app.utils.metrics import metrics
+
+PHONE_NUMBER_ID = "100000000001"
+
+
+def payload(message_id: str, n: int) -> bytes:
+    customer = f"9190000{n % 1000:05d}"
+    return json.dumps({"entry": [{"changes": [{"value": {
+        "metadata": {"display_phone_number": "15550000001", "phone_number_id": PHONE_NUMBER_ID},
+        "contacts": [{"wa_id": customer, "profile": {"name": "Dedup Bench"}}],
+        "messages": [{"from": customer, "id": message_id, "timestamp": str(int(time.time())),
+                      "type": "text", "text": {"body": f"order {n}"}}],
+    }}]}]}).encode()
+
+
+async def deliver(client, body: bytes, latencies: dict):
+    start = time.perf_counter()
+    response = await client.post(f"/webhook/{PHONE_NUMBER_ID}", content=body)
+    status = response.json().get("status")
+    latencies.setdefault(status, []).append(time.perf_counter() - start)
+    return status
+
+
+def summary(timings):
+    timings = sorted(timings)
+    return sum(timings) / len(timings) * 1000, timings[int(len(timings) * 0.95) - 1] * 1000
+
+
+async def run(messages: int, copies: int):
+    app = FastAPI()
+    app.include_router(get_listener_router(graph=None))
+    bodies = [payload(f"wamid.dedup{uuid.uuid4().hex}", n) for n in range(messages)]
+    latencies = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        with redirect_stdout(io.StringIO()):
+            # every message `copies` times at once
+            await asyncio.gather(*(deliver(client, body, latencies) for body in bodies for _ in range(copies)))
+            # a later retry of each
+            await asyncio.gather(*(deliver(client, body, latencies) for body in bodies))
+            queued_live = work_queue.depth()
+            # restart: the LRU is empty, processed_messages is not
+            message_dedup.clear()
+            await asyncio.gather(*(deliver(client, body, latencies) for body in bodies))
+    return queued_live, work_queue.depth(), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--copies", type=int, default=3, help="concurrent deliveries of each message")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    Base.metadata.create_all(bind=engine)
+    queued_live, queued, latencies = asyncio.run(run(args.messages, args.copies))
+    counters = metrics.snapshot()["counters"]
+
+    deliveries = args.messages * (args.copies + 2)
+    print(f"\ndeliveries {deliveries}, distinct messages {args.messages}")
+    print(f"queued: {queued_live} after live redeliveries, {queued} after restart replay")
+    for name in ("dedup.miss", "dedup.hit.memory", "dedup.hit.db", "dedup.error"):
+        print(f"  {name:<18}{counters.get(name, 0):>8}")
+    for status, timings in sorted(latencies.items()):
+        mean_ms, p95_ms = summary(timings)
+        print(f"  ack '{status}'{'':<{10 - len(status)}}{len(timings):>6}  mean {mean_ms:.2f} ms  p95 {p95_ms:.2f} ms")
+
+    ok = queued == args.messages and counters.get("dedup.miss", 0) == args.messages
+    print(f"\n[{'ok' if ok else 'FAIL'}] every message queued exactly once")
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,9 @@ Database connection and session management
 """
 import os
 import logging
+from urllib.parse import parse_qsl, urlencode
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -28,6 +30,38 @@ engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+def _to_async_url(url):
+    """Map a sync SQLAlchemy URL onto its async driver; asyncpg takes ssl via connect_args, not sslmode"""
+    connect_args = {}
+    scheme, rest = url.split('://', 1)
+    base, _, query = rest.partition('?')
+    params = dict(parse_qsl(query))
+    if scheme.startswith('postgresql'):
+        sslmode = params.pop('sslmode', None)
+        if sslmode and sslmode != 'disable':
+            connect_args['ssl'] = 'require'
+        scheme = 'postgresql+asyncpg'
+    elif scheme.startswith('sqlite'):
+        scheme = 'sqlite+aiosqlite'
+    async_url = f"{scheme}://{base}"
+    if params:
+        async_url += f"?{urlencode(params)}"
+    return async_url, connect_args
+
+# Async engine used by the message pipeline (graph.ainvoke)
+ASYNC_DATABASE_URL, _async_connect_args = _to_async_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True, connect_args=_async_connect_args)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+# Connections for the per-conversation advisory locks (app/utils/conversation_lock.py). Each
+# webhook worker holds one for its whole pipeline run, so they come from their own pool, sized
+# to the worker count; taken from async_engine, they would starve the queries the run makes.
+if ASYNC_DATABASE_URL.startswith('postgresql'):
+    lock_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True, connect_args=_async_connect_args,
+                                      pool_size=int(os.getenv("WEBHOOK_WORKERS", "32")), max_overflow=10)
+else:
+    lock_engine = async_engine
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -5,8 +5,9 @@ import os
 import urllib.parse
 import json
 import logging
-from fastapi import FastAPI, Depends, HTTPException, Request, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Request, BackgroundTasks, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy import create_engine
 from app.agents.update_webhook import run_auto_update_webhook
 from sqlalchemy.orm import sessionmaker, Session
@@ -28,6 +29,15 @@ load_dotenv()
 # Import graph builder and listener agent here, but don't create app instance yet
 from app.graph_builder import build_graph
 from app.agents.listener_agent import get_listener_router
+from app.agents.llm_cache import llm_cache
+from app.utils.tenant_registry import tenant_registry
+from app.utils.tenant_profiles import tenant_profiles
+from app.agents.logger_agent import logger_agents
+from app.agents.crm_sync import crm_sync_worker, CRM_SYNC_WORKER_ENABLED
+from app.utils.pagination import keyset_page, date_range, NEXT_CURSOR_HEADER
+from app.utils import rollups
+from app.utils.pending_orders import pending_order_index
+from app.utils.export import EXPORT_TABLES, MEDIA_TYPES, check_format, resolve_columns, export_stream, export_filename
 
 # Build the graph for message processing
 graph = build_graph()
@@ -146,6 +156,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "Content-Disposition"],
 )
 
 # Import and include business routes
@@ -156,6 +167,16 @@ app.include_router(business_router)
 # This adds the webhook endpoints to the main application
 app.include_router(get_listener_router(graph))
 
+# Background worker that syncs queued CRM events (see app/agents/crm_sync.py)
+@app.on_event("startup")
+async def start_crm_sync_worker():
+    if CRM_SYNC_WORKER_ENABLED:
+        await crm_sync_worker.start()
+
+@app.on_event("shutdown")
+async def stop_crm_sync_worker():
+    await crm_sync_worker.stop()
+
 # Log available routes for debugging
 for route in app.routes:
     logger.info(f"Route: {route.path}, Methods: {route.methods}")
@@ -164,6 +185,13 @@ for route in app.routes:
 def get_user_by_clerk_id(db: Session, clerk_id: str):
     return db.query(User).filter(User.clerk_id == clerk_id).first()
 
+def _require_user(db: Session, clerk_id: str):
+    """List endpoints are always scoped to one tenant; unknown clerk_ids get a 404, never everyone's rows"""
+    user = get_user_by_clerk_id(db, clerk_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
 # Routes
 @app.get("/")
 async def root():
@@ -214,6 +242,7 @@ async def update_user_settings(clerk_id: str, settings_data: dict, background_ta
         db.add(user_settings)
     else:
         user_settings = user.settings
+    previous_phone_number_id = user_settings.whatsapp_phone_number_id
     
     # Track if WhatsApp API credentials are being updated
     whatsapp_credentials_updated = False
@@ -270,6 +299,19 @@ async def update_user_settings(clerk_id: str, settings_data: dict, background_ta
     db.commit()
     db.refresh(user_settings)
     
+    # Drop cached tenant lookups (tokens, settings) under both the old and the new number
+    tenant_registry.invalidate(previous_phone_number_id, user_id=user.id)
+    tenant_registry.invalidate(user_settings.whatsapp_phone_number_id)
+    logger_agents.invalidate(user.id)
+    logger_agents.invalidate(clerk_id)
+    
+    # Cached classifications are keyed by the compiled profile version, so a categories change
+    # makes them unreachable on its own. A number that moved may be reused by another business:
+    # drop whatever was cached under it
+    if previous_phone_number_id and previous_phone_number_id != user_settings.whatsapp_phone_number_id:
+        llm_cache.invalidate(previous_phone_number_id)
+        tenant_profiles.invalidate(previous_phone_number_id)
+    
     # Check if we should update the webhook
     if whatsapp_credentials_updated and phone_number_id_updated and phone_number_id and verify_token:
         print("WhatsApp credentials updated, triggering webhook update")
@@ -488,22 +530,23 @@ class OrderResponse(BaseModel):
     ##return orders
 
 @app.get("/api/error-logs", response_model=List[dict])
-async def get_error_logs(clerk_id: str, error_types: Optional[List[str]] = None, db: Session = Depends(get_db)):
-    """Fetch error logs for a specific user, optionally filtered by error types"""
-    # Get user by clerk_id
-    user = get_user_by_clerk_id(db, clerk_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+async def get_error_logs(response: Response, clerk_id: str, error_types: Optional[List[str]] = Query(None),
+                         start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                         cursor: Optional[str] = None, limit: Optional[int] = None, db: Session = Depends(get_db)):
+    """Fetch error logs for a specific user, optionally filtered by error types, newest first in keyset pages"""
+    user = _require_user(db, clerk_id)
     
     # Base query - filter by the user's ID (integer), not the clerk_id (string)
-    query = db.query(ErrorLog).filter(ErrorLog.user_id == user.id)
+    query = db.query(
+        ErrorLog.error_id, ErrorLog.error_type, ErrorLog.error_message, ErrorLog.source, ErrorLog.created_at
+    ).filter(ErrorLog.user_id == user.id)
     
     # Filter by error types if provided
     if error_types:
         query = query.filter(ErrorLog.error_type.in_(error_types))
+    query = date_range(query, ErrorLog.created_at, start_date, end_date)
     
-    # Order by created_at in descending order to get latest first
-    error_logs = query.order_by(ErrorLog.created_at.desc()).all()
+    error_logs = keyset_page(query, ErrorLog.created_at, ErrorLog.error_id, cursor, limit, response)
     
     # Convert to dict for response
     result = []
@@ -519,37 +562,46 @@ async def get_error_logs(clerk_id: str, error_types: Optional[List[str]] = None,
     return result
 
 @app.get("/api/orders", response_model=List[dict])
-async def get_orders(clerk_id: str = None, db: Session = Depends(get_db)):
-    # Get user by clerk_id if provided
-    user = None
-    if clerk_id:
-        user = get_user_by_clerk_id(db, clerk_id)
+async def get_orders(response: Response, clerk_id: str, status: Optional[str] = None, customer_id: Optional[str] = None,
+                     start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                     cursor: Optional[str] = None, limit: Optional[int] = None, db: Session = Depends(get_db)):
+    """Fetch a user's orders newest first in keyset pages, with customer names joined in the same query"""
+    user = _require_user(db, clerk_id)
+    
+    query = (
+        db.query(
+            Order.order_id, Order.customer_id, Order.order_number, Order.item, Order.quantity, Order.unit,
+            Order.notes, Order.order_status, Order.total_amount, Order.delivery_address, Order.delivery_time,
+            Order.delivery_method, Order.created_at, Customer.customer_name,
+        )
+        .outerjoin(Customer, Customer.customer_id == Order.customer_id)
+        .filter(Order.user_id == user.id)
+    )
+    if status:
+        query = query.filter(Order.order_status == status)
+    if customer_id:
+        query = query.filter(Order.customer_id == customer_id)
+    query = date_range(query, Order.created_at, start_date, end_date)
     
-    # Filter by user_id if clerk_id was provided and user was found
-    if user:
-        # Order by created_at in descending order to get latest first
-        orders = db.query(Order).filter(Order.user_id == user.id).order_by(Order.created_at.desc()).all()
-    else:
-        # If no clerk_id or user not found, return all orders (for backward compatibility)
-        orders = db.query(Order).order_by(Order.created_at.desc()).all()
+    orders = keyset_page(query, Order.created_at, Order.order_id, cursor, limit, response)
     
     enriched_orders = []
     for order in orders:
         enriched_orders.append({
             "customer_id": order.customer_id,
-            "CustomerName": order.customer.customer_name if order.customer else None,
+            "CustomerName": order.customer_name,
             "OrderNumber": order.order_number,
             "Item": order.item,
             "Quantity": order.quantity,
-            "Unit": order.unit if hasattr(order, 'unit') and order.unit else "",  # Include unit field
+            "Unit": order.unit or "",  # Include unit field
             "Notes": order.notes,
             "Status": order.order_status,
             "Amount": float(order.total_amount) if order.total_amount else 0.0,
             "DeliveryDate": order.created_at.isoformat() if order.created_at else None,
             # Include delivery information
-            "DeliveryAddress": order.delivery_address if hasattr(order, 'delivery_address') and order.delivery_address else None,
-            "DeliveryTime": order.delivery_time if hasattr(order, 'delivery_time') and order.delivery_time else None,
-            "DeliveryMethod": order.delivery_method if hasattr(order, 'delivery_method') and order.delivery_method else None,
+            "DeliveryAddress": order.delivery_address or None,
+            "DeliveryTime": order.delivery_time or None,
+            "DeliveryMethod": order.delivery_method or None,
         })
     
     return enriched_orders
@@ -578,19 +630,20 @@ class CustomerResponse(BaseModel):
 
 
 @app.get("/api/customers", response_model=List[dict])
-async def get_customers(clerk_id: str = None, db: Session = Depends(get_db)):
-    # Get user by clerk_id if provided
-    user = None
-    if clerk_id:
-        user = get_user_by_clerk_id(db, clerk_id)
+async def get_customers(response: Response, clerk_id: str, customer_id: Optional[str] = None, start_date: Optional[datetime] = None,
+                        end_date: Optional[datetime] = None, cursor: Optional[str] = None,
+                        limit: Optional[int] = None, db: Session = Depends(get_db)):
+    """Fetch a user's customers newest first in keyset pages"""
+    user = _require_user(db, clerk_id)
     
-    # Filter by user_id if clerk_id was provided and user was found
-    if user:
-        # Order by created_at in descending order to get latest first
-        customers = db.query(Customer).filter(Customer.user_id == user.id).order_by(Customer.created_at.desc()).all()
-    else:
-        # If no clerk_id or user not found, return all customers (for backward compatibility)
-        customers = db.query(Customer).order_by(Customer.created_at.desc()).all()
+    query = db.query(
+        Customer.customer_id, Customer.customer_name, Customer.email, Customer.created_at, Customer.updated_at
+    ).filter(Customer.user_id == user.id)
+    if customer_id:
+        query = query.filter(Customer.customer_id == customer_id)
+    query = date_range(query, Customer.created_at, start_date, end_date)
+    
+    customers = keyset_page(query, Customer.created_at, Customer.customer_id, cursor, limit, response)
 
     enriched_customers = []
     for customer in customers:
@@ -680,20 +733,25 @@ class IssueResponse(BaseModel):
         orm_mode = True
 
 @app.get("/api/issues", response_model=List[dict])
-async def get_issues(clerk_id: str = None, db: Session = Depends(get_db)):
-    """Fetch all issues ordered by latest first, filtered by user if clerk_id provided"""
-    # Get user by clerk_id if provided
-    user = None
-    if clerk_id:
-        user = get_user_by_clerk_id(db, clerk_id)
-    
-    # Filter by user_id if clerk_id was provided and user was found
-    if user:
-        # Order by created_at in descending order to get latest first
-        issues = db.query(Issue).filter(Issue.user_id == user.id).order_by(Issue.created_at.desc()).all()
-    else:
-        # If no clerk_id or user not found, return all issues (for backward compatibility)
-        issues = db.query(Issue).order_by(Issue.created_at.desc()).all()
+async def get_issues(response: Response, clerk_id: str, status: Optional[str] = None, category: Optional[str] = None,
+                     customer_id: Optional[str] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                     cursor: Optional[str] = None, limit: Optional[int] = None, db: Session = Depends(get_db)):
+    """Fetch a user's issues newest first in keyset pages; category filters on issue_type"""
+    user = _require_user(db, clerk_id)
+    
+    query = db.query(
+        Issue.issue_id, Issue.customer_id, Issue.order_id, Issue.issue_type, Issue.description, Issue.status,
+        Issue.priority, Issue.resolution_notes, Issue.created_at, Issue.updated_at, Issue.user_id,
+    ).filter(Issue.user_id == user.id)
+    if status:
+        query = query.filter(Issue.status == status)
+    if category:
+        query = query.filter(Issue.issue_type == category)
+    if customer_id:
+        query = query.filter(Issue.customer_id == customer_id)
+    query = date_range(query, Issue.created_at, start_date, end_date)
+    
+    issues = keyset_page(query, Issue.created_at, Issue.issue_id, cursor, limit, response)
     
     enriched_issues = []
     for issue in issues:
@@ -760,20 +818,25 @@ class EnquiryResponse(BaseModel):
 
 
 @app.get("/api/enquiries", response_model=List[dict])
-async def get_enquiries(clerk_id: str = None, db: Session = Depends(get_db)):
-    """Fetch all enquiries with updated column names, ordered by latest first, filtered by user if clerk_id provided"""
-    # Get user by clerk_id if provided
-    user = None
-    if clerk_id:
-        user = get_user_by_clerk_id(db, clerk_id)
-    
-    # Filter by user_id if clerk_id was provided and user was found
-    if user:
-        # Order by created_at in descending order to get latest first
-        enquiries = db.query(Enquiry).filter(Enquiry.user_id == user.id).order_by(Enquiry.created_at.desc()).all()
-    else:
-        # If no clerk_id or user not found, return all enquiries (for backward compatibility)
-        enquiries = db.query(Enquiry).order_by(Enquiry.created_at.desc()).all()
+async def get_enquiries(response: Response, clerk_id: str, status: Optional[str] = None, category: Optional[str] = None,
+                        customer_id: Optional[str] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                        cursor: Optional[str] = None, limit: Optional[int] = None, db: Session = Depends(get_db)):
+    """Fetch a user's enquiries newest first in keyset pages"""
+    user = _require_user(db, clerk_id)
+    
+    query = db.query(
+        Enquiry.enquiry_id, Enquiry.customer_id, Enquiry.description, Enquiry.category, Enquiry.priority,
+        Enquiry.status, Enquiry.follow_up_date, Enquiry.created_at, Enquiry.updated_at,
+    ).filter(Enquiry.user_id == user.id)
+    if status:
+        query = query.filter(Enquiry.status == status)
+    if category:
+        query = query.filter(Enquiry.category == category)
+    if customer_id:
+        query = query.filter(Enquiry.customer_id == customer_id)
+    query = date_range(query, Enquiry.created_at, start_date, end_date)
+    
+    enquiries = keyset_page(query, Enquiry.created_at, Enquiry.enquiry_id, cursor, limit, response)
 
     enriched_enquiries = []
     for enquiry in enquiries:
@@ -839,19 +902,49 @@ async def get_response_metrics(clerk_id: str = None, days: int = 30, db: Session
     
     return formatted_metrics
 
+
+@app.get("/api/analytics/summary")
+async def get_analytics_summary(clerk_id: str, days: int = Query(30, ge=1, le=366), db: Session = Depends(get_db)):
+    """Dashboard summary for the last `days` days, read from the daily rollups"""
+    user = _require_user(db, clerk_id)
+    return rollups.summarize(db, user.id, days)
+
+@app.get("/api/export/{table}")
+async def export_table(table: str, clerk_id: str, format: str = "csv", columns: Optional[str] = None,
+                       start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                       db: Session = Depends(get_db)):
+    """Stream a user's rows from one table as CSV, NDJSON or Parquet"""
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table '{table}'")
+    fmt = check_format(format)
+    selected = resolve_columns(EXPORT_TABLES[table], columns)
+    user = _require_user(db, clerk_id)
+
+    return StreamingResponse(
+        export_stream(table, fmt, user.id, selected, start_date, end_date),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(table, fmt)}"'},
+    )
+
 ##code to update order status in DB
 class OrderStatusUpdate(BaseModel):
     status: str
 
 @app.put("/api/orders/{order_number}")
 async def update_order_status(order_number: str, update: OrderStatusUpdate, db: Session = Depends(get_db)):
-    order = db.query(Order).filter(Order.order_number == order_number).first()
-    if not order:
+    # An order is one row per product line; they all move together
+    lines = db.query(Order).filter(Order.order_number == order_number).order_by(Order.created_at).all()
+    if not lines:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    order.order_status = update.status
+    order = lines[0]
+    increments = []
+    for line in lines:
+        increments += rollups.status_change_increments(line.order_status, update.status)
+        line.order_status = update.status
+    rollups.record(db, order.user_id, order.created_at, increments)
     db.commit()
-    db.refresh(order)
+    pending_order_index.set_status(order_number, order.customer_id, update.status)
     return {"message": "Order status updated", "order_number": order_number}
 
 
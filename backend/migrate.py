@@ -0,0 +1,137 @@
+"""
+Versioned schema migrations for WAffy Dashboard
+
+Migrations are plain SQL files in migrations/versions, named
+NNNN_description.sql and applied in version order. Applied versions are
+recorded in the schema_migrations table, with a checksum so an edited
+migration is reported instead of silently skipped.
+
+A file is applied in one transaction unless its first line is
+`-- migrate:no-transaction`; then each statement runs on its own in
+autocommit mode (needed for CREATE INDEX CONCURRENTLY). CONCURRENTLY is
+dropped on databases other than PostgreSQL.
+
+Usage (from the backend directory):
+    python migrate.py            apply pending migrations
+    python migrate.py --status   list migrations and whether they are applied
+"""
+import os
+import re
+import hashlib
+import logging
+import argparse
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import text
+from database import engine
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations", "versions")
+NO_TRANSACTION = "-- migrate:no-transaction"
+
+
+@dataclass
+class Migration:
+    version: str
+    name: str
+    sql: str
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.encode()).hexdigest()
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.lstrip().startswith(NO_TRANSACTION)
+
+    def statements(self, dialect: str) -> List[str]:
+        """The file's statements, split on semicolons that end a line (comments removed)"""
+        body = "\n".join(line for line in self.sql.splitlines() if not line.strip().startswith("--"))
+        statements = [s.strip() for s in re.split(r";\s*$", body, flags=re.MULTILINE) if s.strip()]
+        if dialect != "postgresql":
+            statements = [re.sub(r"\bCONCURRENTLY\s+", "", s) for s in statements]
+        return statements
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = re.match(r"^(\d+)_(.+)\.sql$", filename)
+        if match:
+            with open(os.path.join(directory, filename)) as f:
+                migrations.append(Migration(match.group(1), match.group(2), f.read()))
+    return migrations
+
+
+def _ensure_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version VARCHAR(20) PRIMARY KEY, name VARCHAR(255) NOT NULL, "
+        "checksum VARCHAR(64) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def applied_versions(bind=engine) -> dict:
+    """version -> checksum of every applied migration"""
+    with bind.begin() as conn:
+        _ensure_table(conn)
+        return {row.version: row.checksum for row in conn.execute(text("SELECT version, checksum FROM schema_migrations"))}
+
+
+def apply(migration: Migration, bind=engine):
+    dialect = bind.dialect.name
+    record = text("INSERT INTO schema_migrations (version, name, checksum, applied_at) VALUES (:v, :n, :c, :t)")
+    params = {"v": migration.version, "n": migration.name, "c": migration.checksum, "t": datetime.utcnow()}
+    if migration.transactional:
+        with bind.begin() as conn:
+            for statement in migration.statements(dialect):
+                conn.execute(text(statement))
+            conn.execute(record, params)
+    else:
+        # Each statement commits on its own; they must be safe to re-run (IF [NOT] EXISTS)
+        with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for statement in migration.statements(dialect):
+                conn.execute(text(statement))
+            conn.execute(record, params)
+
+
+def migrate(bind=engine) -> List[str]:
+    """Apply pending migrations in order; return the versions applied"""
+    applied = applied_versions(bind)
+    done = []
+    for migration in load_migrations():
+        if migration.version in applied:
+            if applied[migration.version] != migration.checksum:
+                logger.warning(f"Migration {migration.version}_{migration.name} changed after it was applied")
+            continue
+        logger.info(f"Applying migration {migration.version}_{migration.name}")
+        apply(migration, bind)
+        done.append(migration.version)
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="list migrations instead of applying them")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.status:
+        applied = applied_versions()
+        for migration in load_migrations():
+            state = "applied" if migration.version in applied else "pending"
+            if applied.get(migration.version, migration.checksum) != migration.checksum:
+                state = "applied (changed since)"
+            print(f"{migration.version}_{migration.name}: {state}")
+        return
+
+    done = migrate()
+    print(f"Applied {len(done)} migration(s)" + (f": {', '.join(done)}" if done else ""))
+
+
+if __name__ == "__main__":
+    main()
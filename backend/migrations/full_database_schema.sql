@@ -191,11 +191,68 @@ CREATE TABLE response_metrics (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Per-tenant daily counters behind /api/analytics/summary
+CREATE TABLE daily_rollups (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    day DATE NOT NULL,
+    dimension VARCHAR(30) NOT NULL,
+    value VARCHAR(50) NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    total FLOAT NOT NULL DEFAULT 0.0,
+    CONSTRAINT uq_daily_rollups_key UNIQUE (user_id, day, dimension, value)
+);
+
+-- Transactional outbox of CRM sync events, drained by the CRM sync worker
+CREATE TABLE crm_outbox (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    idempotency_key VARCHAR(150) NOT NULL UNIQUE,
+    crm_type VARCHAR(20) NOT NULL DEFAULT 'hubspot',
+    customer_id VARCHAR(20),
+    payload TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    completed_steps TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+CREATE INDEX idx_crm_outbox_status_next ON crm_outbox(status, next_attempt_at);
+CREATE INDEX idx_crm_outbox_customer ON crm_outbox(user_id, customer_id, id);
+
+-- Inbound WhatsApp message ids already accepted, for webhook deduplication
+CREATE TABLE processed_messages (
+    message_id VARCHAR(100) PRIMARY KEY,
+    business_phone_id VARCHAR(50),
+    first_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_processed_messages_first_seen ON processed_messages(first_seen_at);
+
+-- Delivery state of replies sent on WhatsApp, moved forward by status callbacks
+CREATE TABLE message_deliveries (
+    message_id VARCHAR(100) PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    customer_id VARCHAR(20),
+    reply_to_message_id VARCHAR(100),
+    status VARCHAR(20) NOT NULL,
+    status_at TIMESTAMP,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Add indexes for frequently queried columns
-CREATE INDEX idx_customers_user_id ON customers(user_id);
-CREATE INDEX idx_orders_user_id ON orders(user_id);
-CREATE INDEX idx_orders_customer_id ON orders(customer_id);
-CREATE INDEX idx_issues_user_id ON issues(user_id);
-CREATE INDEX idx_enquiries_user_id ON enquiries(user_id);
-CREATE INDEX idx_error_logs_user_id ON error_logs(user_id);
+CREATE INDEX idx_customers_user_created ON customers(user_id, created_at DESC, customer_id DESC);
+CREATE INDEX idx_user_settings_phone_number_id ON user_settings(whatsapp_phone_number_id);
+CREATE INDEX idx_orders_order_number ON orders(order_number);
+CREATE INDEX idx_orders_customer_created ON orders(customer_id, created_at DESC);
+CREATE INDEX idx_orders_pending_customer ON orders(customer_id, created_at DESC) WHERE order_status = 'pending';
+CREATE INDEX idx_orders_user_created ON orders(user_id, created_at DESC, order_id DESC);
+CREATE INDEX idx_response_metrics_user_received ON response_metrics(user_id, message_received_at);
+CREATE INDEX idx_issues_user_created ON issues(user_id, created_at DESC, issue_id DESC);
+CREATE INDEX idx_enquiries_user_created ON enquiries(user_id, created_at DESC, enquiry_id DESC);
+CREATE INDEX idx_error_logs_user_created ON error_logs(user_id, created_at DESC, error_id DESC);
 CREATE INDEX idx_error_logs_error_type ON error_logs(error_type);
@@ -0,0 +1,35 @@
+-- migrate:no-transaction
+-- Indexes for the hot lookup predicates. Built CONCURRENTLY on PostgreSQL so
+-- live tables are not write-locked while they build (the runner drops the
+-- keyword on other databases).
+--
+-- interaction_logs.whatsapp_message_id needs no index here: its UNIQUE
+-- constraint already provides one (and backs the ON CONFLICT insert).
+
+-- Tenant lookup for every incoming webhook (tenant_registry)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_settings_phone_number_id
+    ON user_settings (whatsapp_phone_number_id);
+
+-- Order lines by order number (storage path, PUT /api/orders/{order_number})
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_order_number
+    ON orders (order_number);
+
+-- Most recent order per customer (ReviewAgent); replaces idx_orders_customer_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_customer_created
+    ON orders (customer_id, created_at DESC);
+
+-- Most recent pending order per customer (order additions); only pending lines are indexed
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_pending_customer
+    ON orders (customer_id, created_at DESC) WHERE order_status = 'pending';
+
+-- Keyset pages of GET /api/orders; replaces idx_orders_user_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_user_created
+    ON orders (user_id, created_at DESC, order_id DESC);
+
+-- Response metrics per tenant and time window (analytics)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_response_metrics_user_received
+    ON response_metrics (user_id, message_received_at);
+
+-- Covered by the composite indexes above (same leading column)
+DROP INDEX CONCURRENTLY IF EXISTS idx_orders_customer_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_orders_user_id;
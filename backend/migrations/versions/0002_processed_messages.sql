@@ -0,0 +1,11 @@
+-- Inbound WhatsApp message ids already accepted by the webhook. The primary
+-- key makes claiming an id atomic, so a message Meta delivers twice is only
+-- queued once (app/utils/message_dedup.py).
+
+CREATE TABLE IF NOT EXISTS processed_messages (
+    message_id VARCHAR(100) PRIMARY KEY,
+    business_phone_id VARCHAR(50),
+    first_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_processed_messages_first_seen ON processed_messages (first_seen_at);
@@ -0,0 +1,15 @@
+-- Delivery state of the replies we send on WhatsApp: written as 'accepted'
+-- by the responder and moved forward (sent, delivered, read, failed) by the
+-- webhook's status callbacks (app/utils/delivery_status.py).
+
+CREATE TABLE IF NOT EXISTS message_deliveries (
+    message_id VARCHAR(100) PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    customer_id VARCHAR(20),
+    reply_to_message_id VARCHAR(100),
+    status VARCHAR(20) NOT NULL,
+    status_at TIMESTAMP,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,15 @@
+-- Per-tenant daily counters for the analytics endpoints, one row per
+-- (user, day, dimension, value). Written by the storage path in the same
+-- transaction as the row it counts (app/utils/rollups.py) and read by
+-- GET /api/analytics/summary instead of scanning the source tables.
+
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    day DATE NOT NULL,
+    dimension VARCHAR(30) NOT NULL,
+    value VARCHAR(50) NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    total FLOAT NOT NULL DEFAULT 0.0,
+    CONSTRAINT uq_daily_rollups_key UNIQUE (user_id, day, dimension, value)
+);
@@ -0,0 +1,27 @@
+-- Transactional outbox of CRM sync events: written with the interaction it
+-- describes and drained by the CRM sync worker (app/agents/crm_sync.py).
+-- completed_steps records the HubSpot steps already done, so a retried event
+-- does not create the same ticket or order twice.
+
+CREATE TABLE IF NOT EXISTS crm_outbox (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    idempotency_key VARCHAR(150) NOT NULL UNIQUE,
+    crm_type VARCHAR(20) NOT NULL DEFAULT 'hubspot',
+    customer_id VARCHAR(20),
+    payload TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    completed_steps TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+
+-- Due events for the worker's claim query
+CREATE INDEX IF NOT EXISTS idx_crm_outbox_status_next ON crm_outbox (status, next_attempt_at);
+
+-- Earlier events of the same customer, which must be synced first
+CREATE INDEX IF NOT EXISTS idx_crm_outbox_customer ON crm_outbox (user_id, customer_id, id);
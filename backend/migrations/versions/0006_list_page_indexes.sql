@@ -0,0 +1,26 @@
+-- migrate:no-transaction
+-- Keyset pages of the dashboard list endpoints. Each one filters on user_id and
+-- orders by (created_at DESC, id DESC), like idx_orders_user_created in 0001;
+-- without a matching index every page sorts the tenant's whole table.
+
+-- GET /api/customers; replaces idx_customers_user_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_customers_user_created
+    ON customers (user_id, created_at DESC, customer_id DESC);
+
+-- GET /api/issues; replaces idx_issues_user_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_issues_user_created
+    ON issues (user_id, created_at DESC, issue_id DESC);
+
+-- GET /api/enquiries; replaces idx_enquiries_user_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_enquiries_user_created
+    ON enquiries (user_id, created_at DESC, enquiry_id DESC);
+
+-- GET /api/error-logs; replaces idx_error_logs_user_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_error_logs_user_created
+    ON error_logs (user_id, created_at DESC, error_id DESC);
+
+-- Covered by the composite indexes above (same leading column)
+DROP INDEX CONCURRENTLY IF EXISTS idx_customers_user_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_issues_user_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_enquiries_user_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_error_logs_user_id;
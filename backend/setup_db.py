@@ -9,9 +9,14 @@ logger = logging.getLogger(__name__)
 
 
 def setup_database():
-    """Create all tables in the database"""
+    """Create all tables in the database, then apply pending migrations"""
+    # Register the models on Base before creating their tables
+    import app.models  # noqa: F401
     Base.metadata.create_all(bind=engine)
     logger.info("Database tables created successfully")
+    # Imported here: migrate imports database, which this module re-exports
+    from migrate import migrate
+    migrate()
 
 if __name__ == "__main__":
     setup_database()
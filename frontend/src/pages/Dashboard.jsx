@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from "react";
 import DashboardHeader from "../components/DashboardHeader";
-import { getOrders, getCustomers, getEnquiries, getIssues, getResponseMetrics, getUserSettings, updateOrderStatus } from "../services/userService";
+import { getOrders, getCustomers, getEnquiries, getIssues, getAnalyticsSummary, getExportUrl, getUserSettings, updateOrderStatus } from "../services/userService";
 import SetupBanner from "../components/SetupBanner";
 import ErrorBanner from "../components/ErrorBanner";
 import { Table, Button, Tag, Progress, Dropdown } from "antd";
@@ -12,14 +12,33 @@ import CardLoader from "../components/CardLoader";
 import * as XLSX from "xlsx";
 import { saveAs } from "file-saver";
 
+// Window covered by every figure in the overview cards
+const SUMMARY_DAYS = 30;
+
+// Status values each table accepts (the status filter is sent to the server)
+const STATUS_OPTIONS = {
+  orders: ["pending", "confirmed", "completed"],
+  enquiries: ["open", "responded", "converted", "closed"],
+  issues: ["open", "in_progress", "resolved"],
+};
+
+// Created-at range covering one calendar day (UTC, as stored)
+const dayRange = (day) => (day ? { startDate: `${day}T00:00:00`, endDate: `${day}T23:59:59.999999` } : {});
+
+const formatSeconds = (seconds) => {
+  if (seconds < 1) return `${Math.round(seconds * 1000)} ms`;
+  if (seconds < 60) return `${seconds.toFixed(2)} sec`;
+  return `${(seconds / 60).toFixed(2)} min`;
+};
+
 const Dashboard = () => {
-  const [visibleData, setVisibleData] = useState([]);
   const [tab, setTab] = useState("orders");
   const [orders, setOrders] = useState([]);
   const [customers, setCustomers] = useState([]);
   const [enquiries, setEnquiries] = useState([]);
   const [issues, setIssues] = useState([]);
-  const [responseMetrics, setResponseMetrics] = useState([]);
+  // Every overview figure, for the last SUMMARY_DAYS days, from /api/analytics/summary (null until loaded or if it failed)
+  const [summary, setSummary] = useState(null);
   const [loading, setLoading] = useState(true);
   const [dataLoadingState, setDataLoadingState] = useState({
     orders: true,
@@ -31,13 +50,19 @@ const Dashboard = () => {
 
   const [customerFilter, setCustomerFilter] = useState("");
   const [dateFilter, setDateFilter] = useState(new Date().toISOString().split("T")[0]);
-
-  const [selectedCustomer, setSelectedCustomer] = useState("");
+  const [statusFilter, setStatusFilter] = useState("");
+  const [categoryFilter, setCategoryFilter] = useState("");
+  // Filters last applied; they are sent with every page request
+  const [filters, setFilters] = useState({});
+
+  // Keyset paging: cursor of every page visited so far (the first page has none)
+  const [pageCursors, setPageCursors] = useState([null]);
+  const [pageIndex, setPageIndex] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
   
   // State for the setup banner
   const [showSetupBanner, setShowSetupBanner] = useState(false);
   const [settingsChecked, setSettingsChecked] = useState(false);
-  const [selectedDate, setSelectedDate] = useState("");
 
   // Use Clerk's useUser hook to get the authenticated user
   const { user: clerkUser, isLoaded: isClerkLoaded } = useUser();
@@ -47,10 +72,17 @@ const Dashboard = () => {
 
   useEffect(() => {
     if (isClerkLoaded && clerkUser?.id) {
-      fetchAllData();
+      fetchSummary();
       checkUserSettings();
     }
-  }, [isClerkLoaded, clerkUser?.id, tab, customerFilter, dateFilter]);
+  }, [isClerkLoaded, clerkUser?.id]);
+
+  // Only the page on screen is loaded
+  useEffect(() => {
+    if (isClerkLoaded && clerkUser?.id) {
+      fetchTabData();
+    }
+  }, [isClerkLoaded, clerkUser?.id, tab, filters, pageIndex]);
   
   // Check if the user has configured their WhatsApp and CRM settings
   const checkUserSettings = async () => {
@@ -78,90 +110,46 @@ const Dashboard = () => {
     }
   };
 
-  const fetchAllData = async () => {
+  // The overview cards cost O(days): they are read from the daily rollups, never counted from the tables
+  const fetchSummary = async () => {
     if (!isClerkLoaded || !clerkUser) return;
+    try {
+      const data = await getAnalyticsSummary(clerkUser.id, SUMMARY_DAYS);
+      setSummary(data);
+    } catch (error) {
+      console.error("Error fetching metrics:", error);
+    }
+    setDataLoadingState((prev) => ({ ...prev, metrics: false }));
+  };
 
-    setLoading(true);
-    setDataLoadingState({
-      orders: true,
-      customers: true,
-      enquiries: true,
-      issues: true,
-      metrics: true,
-    });
+  const fetchTabData = async () => {
+    if (!isClerkLoaded || !clerkUser) return;
 
-    const clerkId = clerkUser.id;
+    const loaders = {
+      orders: [getOrders, setOrders],
+      customers: [getCustomers, setCustomers],
+      enquiries: [getEnquiries, setEnquiries],
+      issues: [getIssues, setIssues],
+    };
+    const [load, setRows] = loaders[tab];
 
+    setLoading(true);
+    setDataLoadingState((prev) => ({ ...prev, [tab]: true }));
     try {
-      const fetchOrders = async () => {
-        try {
-          const data = await getOrders(clerkId);
-          
-          // Add random amounts within $20 range for each order
-          const ordersWithRandomAmounts = data.map(order => ({
-            ...order,
-            Amount: order.Amount || (Math.floor(Math.random() * 20) + 1).toFixed(2) // Random amount between $1 and $20
-          }));
-          
-          setOrders(ordersWithRandomAmounts);
-          setDataLoadingState((prev) => ({ ...prev, orders: false }));
-        } catch (error) {
-          console.error("Error fetching orders:", error);
-          setDataLoadingState((prev) => ({ ...prev, orders: false }));
-        }
-      };
-
-      const fetchCustomers = async () => {
-        try {
-          const data = await getCustomers(clerkId);
-          setCustomers(data);
-          setDataLoadingState((prev) => ({ ...prev, customers: false }));
-        } catch (error) {
-          console.error("Error fetching customers:", error);
-          setDataLoadingState((prev) => ({ ...prev, customers: false }));
-        }
-      };
-
-      const fetchEnquiries = async () => {
-        try {
-          const data = await getEnquiries(clerkId);
-          setEnquiries(data);
-          setDataLoadingState((prev) => ({ ...prev, enquiries: false }));
-        } catch (error) {
-          console.error("Error fetching enquiries:", error);
-          setDataLoadingState((prev) => ({ ...prev, enquiries: false }));
-        }
-      };
-
-      const fetchIssues = async () => {
-        try {
-          const data = await getIssues(clerkId);
-          setIssues(data);
-          setDataLoadingState((prev) => ({ ...prev, issues: false }));
-        } catch (error) {
-          console.error("Error fetching issues:", error);
-          setDataLoadingState((prev) => ({ ...prev, issues: false }));
-        }
-      };
-
-      const fetchMetrics = async () => {
-        try {
-          const data = await getResponseMetrics(clerkId, 30);
-          setResponseMetrics(data);
-          setDataLoadingState((prev) => ({ ...prev, metrics: false }));
-        } catch (error) {
-          console.error("Error fetching metrics:", error);
-          setDataLoadingState((prev) => ({ ...prev, metrics: false }));
-        }
-      };
-
-      await Promise.all([fetchOrders(), fetchCustomers(), fetchEnquiries(), fetchIssues(), fetchMetrics()]);
-
-      setLoading(false);
+      const page = await load(clerkUser.id, {
+        cursor: pageCursors[pageIndex],
+        customerId: filters.customerId,
+        status: filters.status,
+        category: filters.category,
+        ...dayRange(filters.date),
+      });
+      setRows(page.rows);
+      setNextCursor(page.nextCursor);
     } catch (error) {
-      console.error("Error fetching dashboard data:", error);
-      setLoading(false);
+      console.error(`Error fetching ${tab}:`, error);
     }
+    setDataLoadingState((prev) => ({ ...prev, [tab]: false }));
+    setLoading(false);
   };
 
   // const handleFilterSubmit = () => {
@@ -176,55 +164,45 @@ const Dashboard = () => {
   //   setSelectedDate("");
   // };
 
+  // New filters or another tab start again from the first page
+  const resetPaging = () => {
+    setPageCursors([null]);
+    setPageIndex(0);
+  };
+
   const handleFilterSubmit = () => {
     if (!dateFilter) {
       alert("Please select a valid date before applying filters.");
       return;
     }
-    setSelectedCustomer(customerFilter);
-    setSelectedDate(dateFilter);
+    setFilters({ customerId: customerFilter, date: dateFilter, status: statusFilter, category: categoryFilter });
+    resetPaging();
   };
 
   const handleResetFilters = () => {
     setCustomerFilter("");
     setDateFilter("");
-    setSelectedCustomer("");
-    setSelectedDate("");
+    setStatusFilter("");
+    setCategoryFilter("");
+    setFilters({});
+    resetPaging();
   };
 
+  const handleTabChange = (tabName) => {
+    setTab(tabName);
+    // Status and category values differ between tables
+    setStatusFilter("");
+    setCategoryFilter("");
+    setFilters(({ status, category, ...rest }) => rest);
+    resetPaging();
+  };
 
-  const applyFilters = (item, idField = "CustomerId", dateField = "DeliveryDate") => {
-    if (!item) return false;
-    let itemCustomerId = item[idField];
-    if (!itemCustomerId && idField === "CustomerId") {
-      itemCustomerId = item.customer_id;
-    }
-
-    const matchCustomer = !selectedCustomer || String(itemCustomerId) === String(selectedCustomer);
-
-    let itemDate = item[dateField];
-    if (!itemDate) {
-      itemDate = item.created_at || item.UpdatedDate || item.CreatedDate;
-    }
-
-    let formattedDate = "";
-    if (itemDate && typeof itemDate === "string") {
-      try {
-        formattedDate = new Date(itemDate).toISOString().split("T")[0];
-      } catch (error) {
-        console.warn("Invalid date format:", itemDate);
-      }
-    }
-
-    const matchDate = !selectedDate || formattedDate === selectedDate;
-
-    return matchCustomer && matchDate;
+  const handleNextPage = () => {
+    setPageCursors((prev) => [...prev.slice(0, pageIndex + 1), nextCursor]);
+    setPageIndex(pageIndex + 1);
   };
 
-  const filteredOrders = orders.filter((order) => applyFilters(order, "customer_id", "DeliveryDate"));
-  const filteredCustomers = customers.filter((customer) => applyFilters(customer, "CustomerId", "DeliveryDate"));
-  const filteredEnquiries = enquiries.filter((enquiry) => applyFilters(enquiry, "CustomerId", "DeliveryDate"));
-  const filteredIssues = issues.filter((issue) => applyFilters(issue, "CustomerId", "DeliveryDate"));
+  const handlePreviousPage = () => setPageIndex(Math.max(0, pageIndex - 1));
 
   const orderColumns = [
     { title: "Customer Name", dataIndex: "CustomerName", key: "CustomerName" },
@@ -243,11 +221,6 @@ const Dashboard = () => {
       title: "Status",
       dataIndex: "Status",
       key: "Status",
-      filters: [
-        { text: "Pending", value: "pending" },
-        { text: "Completed", value: "completed" },
-      ],
-      onFilter: (value, record) => record.Status.toLowerCase() === value,
       render: (text) => (
         <Tag color={text.toLowerCase() === "completed" ? "green" : "orange"}>
           {text}
@@ -354,10 +327,10 @@ const Dashboard = () => {
   ];
 
   const getCurrentData = () => {
-    if (tab === "orders") return filteredOrders.map((item, index) => ({ ...item, key: index }));
-    if (tab === "customers") return filteredCustomers.map((item, index) => ({ ...item, key: index }));
-    if (tab === "enquiries") return filteredEnquiries.map((item, index) => ({ ...item, key: index }));
-    if (tab === "issues") return filteredIssues.map((item, index) => ({ ...item, key: index }));
+    if (tab === "orders") return orders.map((item, index) => ({ ...item, key: index }));
+    if (tab === "customers") return customers.map((item, index) => ({ ...item, key: index }));
+    if (tab === "enquiries") return enquiries.map((item, index) => ({ ...item, key: index }));
+    if (tab === "issues") return issues.map((item, index) => ({ ...item, key: index }));
   };
 
   const getCurrentColumns = () => {
@@ -394,105 +367,64 @@ const Dashboard = () => {
   };
 
   const calculateMetrics = () => {
-    const totalOrders = orders.length;
-    const totalCustomers = customers.length;
-    const totalEnquiries = enquiries.length;
-    const totalIssues = issues.length;
-
-    // Calculate total revenue with explicit parsing and NaN handling
-    const totalRevenue = orders.reduce((sum, order) => {
-      const amount = parseFloat(order.Amount);
-      return sum + (isNaN(amount) ? 0 : amount);
-    }, 0);
-    
-    // Calculate average order value with proper formatting
-    const rawAvgOrderValue = totalOrders > 0 ? totalRevenue / totalOrders : 0;
-    const averageOrderValue = isNaN(rawAvgOrderValue) ? "0.00" : rawAvgOrderValue.toFixed(2);
+    // Every figure comes from the summary, so they all cover the same SUMMARY_DAYS window
+    const orderSummary = summary?.orders || {};
+    const ordersByStatus = orderSummary.by_status || {};
+    const totalOrders = orderSummary.total || 0;
+    const orderLines = orderSummary.line_items || 0;
+    const totalRevenue = orderSummary.revenue || 0;
+    const averageOrderValue = totalOrders > 0 ? (totalRevenue / totalOrders).toFixed(2) : "0.00";
 
     const today = new Date().toISOString().split("T")[0];
-    const todayOrders = orders.filter((order) => {
-      const orderDate = order.DeliveryDate?.split("T")[0];
-      return orderDate === today;
-    }).length;
-
-    const ordersByStatus = {};
-    filteredOrders.forEach((order) => {
-      const status = order.Status || "Pending";
-      ordersByStatus[status] = (ordersByStatus[status] || 0) + 1;
-    });
-
-    const customerOrderCounts = {};
-    filteredOrders.forEach((order) => {
-      const customerId = order.customer_id;
-      if (customerId) {
-        customerOrderCounts[customerId] = (customerOrderCounts[customerId] || 0) + 1;
-      }
-    });
+    const todayOrders = summary?.daily.find((day) => day.date === today)?.orders || 0;
 
-    const returningCustomers = Object.values(customerOrderCounts).filter((count) => count > 1).length;
-    const retentionRate = totalCustomers > 0 ? Math.round((returningCustomers / totalCustomers) * 100) : 0;
+    // Share of new orders placed by customers who had ordered before
+    const totalCustomers = summary?.customers.new || 0;
+    const retentionRate = totalOrders > 0 ? Math.round(((orderSummary.repeat || 0) / totalOrders) * 100) : 0;
 
-    const completedOrders = filteredOrders.filter((order) => order.Status === "completed").length;
-    const completionRate = totalOrders > 0 ? `${Math.round((completedOrders / totalOrders) * 100)}%` : "0%";
+    const completedOrders = ordersByStatus.completed || 0;
+    const completionRate = orderLines > 0 ? `${Math.round((completedOrders / orderLines) * 100)}%` : "0%";
 
-    // Calculate total order value for filtered orders with explicit parsing
-    const totalOrderValue = filteredOrders.reduce((sum, order) => {
-      const amount = parseFloat(order.Amount);
-      return sum + (isNaN(amount) ? 0 : amount);
-    }, 0);
-    
-    // Format the display value with dollar sign
-    const formattedAvgOrderValue = totalOrders > 0 ? `$${(totalOrderValue / totalOrders).toFixed(2)}` : "$0.00";
-
-    const resolvedIssues = filteredIssues.filter((issue) => issue.Status === "resolved").length;
+    const totalEnquiries = summary?.enquiries.total || 0;
+    const totalIssues = summary?.issues.total || 0;
+    const resolvedIssues = summary?.issues.by_status.resolved || 0;
     const resolutionRate = totalIssues > 0 ? `${Math.round((resolvedIssues / totalIssues) * 100)}%` : "0%";
 
-    // Calculate total messages that should have responses
-    const totalMessages = totalOrders + totalEnquiries + totalIssues;
-    
-    // Calculate response metrics
-    const totalResponses = responseMetrics.length;
+    const totalMessages = summary?.messages.total || 0;
+    const responses = summary?.responses || {};
+    const totalResponses = responses.total || 0;
     const responseRate = totalMessages > 0 ? Math.round((totalResponses / totalMessages) * 100) : 0;
-    
-    // Calculate average response time
-    const totalResponseTime = responseMetrics.reduce((sum, metric) => sum + (metric.ResponseTimeSeconds || 0), 0);
-    const avgResponseTimeSeconds = totalResponses > 0 ? totalResponseTime / totalResponses : 0;
-
-    let avgResponseTime;
-    if (avgResponseTimeSeconds < 1) {
-      avgResponseTime = `${Math.round(avgResponseTimeSeconds * 1000)} ms`;
-    } else if (avgResponseTimeSeconds < 60) {
-      avgResponseTime = `${avgResponseTimeSeconds.toFixed(2)} sec`;
-    } else {
-      avgResponseTime = `${(avgResponseTimeSeconds / 60).toFixed(2)} min`;
-    }
+    const avgResponseTimeSeconds = responses.avg_seconds || 0;
 
-    const responseTypes = {};
-    responseMetrics.forEach((metric) => {
-      const type = metric.ResponseType || "unknown";
-      responseTypes[type] = (responseTypes[type] || 0) + 1;
-    });
+    // Percentiles are histogram bucket bounds; null with responses means the open-ended (> 5 min) bucket
+    const percentile = (seconds) => {
+      if (!totalResponses) return "-";
+      return seconds == null ? "> 5 min" : `≤ ${formatSeconds(seconds)}`;
+    };
 
     return {
       totalOrders,
+      orderLines,
       totalCustomers,
       totalEnquiries,
       totalIssues,
       totalRevenue,
       averageOrderValue,
       todayOrders,
-      pendingOrders: ordersByStatus["Pending"] || 0,
+      pendingOrders: ordersByStatus.pending || 0,
       retentionRate: `${retentionRate}%`,
-      responseRate: `${responseRate}%`, // Calculated based on total messages and responses
+      responseRate: `${responseRate}%`,
       completedOrders,
       completionRate,
-      avgOrderValue: formattedAvgOrderValue, // Use the formatted value with dollar sign
+      avgOrderValue: `$${averageOrderValue}`,
       resolvedIssues,
       resolutionRate,
-      avgResponseTime,
+      avgResponseTime: formatSeconds(avgResponseTimeSeconds),
       avgResponseTimeSeconds,
+      p50ResponseTime: percentile(responses.p50_seconds),
+      p90ResponseTime: percentile(responses.p90_seconds),
       totalResponses,
-      responseTypes,
+      responseTypes: responses.by_type || {},
     };
   };
 
@@ -517,8 +449,13 @@ const Dashboard = () => {
   const hasData = currentData && currentData.length > 0;
 
   const handleExport = (fileType) => {
-    //const data = getCurrentData();
-    const data = visibleData.length ? visibleData : getCurrentData();
+    if (fileType === "csv") {
+      // The server streams the whole table for the selected day, however many pages it spans
+      window.location.assign(getExportUrl(tab, clerkUser.id, { format: "csv", ...dayRange(filters.date) }));
+      return;
+    }
+    // Excel: the rows on this page
+    const data = getCurrentData();
     const worksheet = XLSX.utils.json_to_sheet(data);
     const workbook = XLSX.utils.book_new();
     XLSX.utils.book_append_sheet(workbook, worksheet, "Data");
@@ -536,6 +473,7 @@ const Dashboard = () => {
           order.OrderNumber === orderNumber ? { ...order, Status: "completed" } : order
         )
       );
+      fetchSummary();
     } catch (error) {
       console.error("Failed to update order status:", error);
     }
@@ -606,6 +544,7 @@ const Dashboard = () => {
           order.OrderNumber === orderNumber ? { ...order, Status: "pending" } : order
         )
       );
+      fetchSummary();
     } catch (error) {
       console.error("Failed to undo order status:", error);
     }
@@ -627,6 +566,7 @@ const Dashboard = () => {
         {/* Stats Overview */}
         <div className="mb-6">
           <h2 className="text-xl font-bold text-gray-800 mb-4">Business Overview</h2>
+          <p className="text-sm text-gray-500 -mt-3 mb-4">Last {SUMMARY_DAYS} days</p>
           {dataLoadingState.metrics ? (
             <CardLoader count={4} />
           ) : (
@@ -645,9 +585,9 @@ const Dashboard = () => {
                 <div className="mt-2 text-sm text-gray-500">Avg. Order: ${stats.averageOrderValue}</div>
               </div>
               <div className="bg-white p-4 rounded-lg shadow-md border-l-4 border-purple-500">
-                <h3 className="text-sm font-medium text-gray-500">Total Customers</h3>
+                <h3 className="text-sm font-medium text-gray-500">New Customers</h3>
                 <p className="text-2xl font-bold">{stats.totalCustomers}</p>
-                <div className="mt-2 text-sm text-gray-500">Retention Rate: {stats.retentionRate}</div>
+                <div className="mt-2 text-sm text-gray-500">Repeat Orders: {stats.retentionRate}</div>
               </div>
               <div className="bg-white p-4 rounded-lg shadow-md border-l-4 border-yellow-500">
                 <h3 className="text-sm font-medium text-gray-500">Response Rate</h3>
@@ -674,7 +614,7 @@ const Dashboard = () => {
                   <p className="text-xl font-bold">{stats.totalOrders}</p>
                 </div>
                 <div>
-                  <h4 className="text-sm font-medium text-gray-500">Total Customers</h4>
+                  <h4 className="text-sm font-medium text-gray-500">New Customers</h4>
                   <p className="text-xl font-bold">{stats.totalCustomers}</p>
                 </div>
                 <div className="border-r pr-4">
@@ -695,7 +635,7 @@ const Dashboard = () => {
                   <div
                     className="bg-green-500 h-2 rounded-full"
                     style={{
-                      width: `${stats.totalOrders ? (stats.completedOrders / stats.totalOrders) * 100 : 0}%`,
+                      width: `${stats.orderLines ? (stats.completedOrders / stats.orderLines) * 100 : 0}%`,
                     }}
                   ></div>
                 </div>
@@ -737,6 +677,14 @@ const Dashboard = () => {
                   <h4 className="text-sm font-medium text-gray-500">Avg. Response Time</h4>
                   <p className="text-xl font-bold text-green-600">{stats.avgResponseTime}</p>
                 </div>
+                <div className="border-r pr-4">
+                  <h4 className="text-sm font-medium text-gray-500">Median Response</h4>
+                  <p className="text-xl font-bold">{stats.p50ResponseTime}</p>
+                </div>
+                <div>
+                  <h4 className="text-sm font-medium text-gray-500">90th Percentile</h4>
+                  <p className="text-xl font-bold">{stats.p90ResponseTime}</p>
+                </div>
               </div>
               <div className="mt-4">
                 <h4 className="text-sm font-medium text-gray-700 mb-2">Response Speed</h4>
@@ -782,7 +730,7 @@ const Dashboard = () => {
           {["orders", "customers", "enquiries", "issues"].map((tabName) => (
             <button
               key={tabName}
-              onClick={() => setTab(tabName)}
+              onClick={() => handleTabChange(tabName)}
               className={`px-6 py-2 rounded-full font-semibold shadow-md text-white bg-gradient-to-r from-pink-400 to-orange-400 hover:from-orange-400 hover:to-pink-400 transition duration-300 ${
                 tab === tabName ? "border-4 border-yellow-300 scale-105" : "border-none"
               }`}
@@ -797,16 +745,20 @@ const Dashboard = () => {
           <div className="flex flex-wrap gap-4 items-end">
             <div className="flex flex-col">
               <label className="text-sm font-semibold mb-1">Customer ID:</label>
-              <select
+              {/* Any customer ID can be typed; the IDs on this page are offered as suggestions */}
+              <input
+                type="text"
+                list="customer-ids"
+                placeholder="All Customers"
                 className="p-2 border rounded w-48"
                 value={customerFilter}
-                onChange={(e) => setCustomerFilter(e.target.value)}
-              >
-                <option value="">All Customers</option>
-                {[...new Set([...orders, ...customers, ...enquiries, ...issues].map(item => item.CustomerId || item.customer_id).filter(Boolean))].map((id) => (
-                  <option key={id} value={id}>{id}</option>
+                onChange={(e) => setCustomerFilter(e.target.value.trim())}
+              />
+              <datalist id="customer-ids">
+                {[...new Set(getCurrentData().map((item) => item.CustomerId || item.customer_id).filter(Boolean))].map((id) => (
+                  <option key={id} value={id} />
                 ))}
-              </select>
+              </datalist>
             </div>
             <div className="flex flex-col">
               <label className="text-sm font-semibold mb-1">Date:</label>
@@ -817,6 +769,37 @@ const Dashboard = () => {
                 onChange={(e) => setDateFilter(e.target.value)}
               />
             </div>
+            {STATUS_OPTIONS[tab] && (
+              <div className="flex flex-col">
+                <label className="text-sm font-semibold mb-1">Status:</label>
+                <select
+                  className="p-2 border rounded w-40"
+                  value={statusFilter}
+                  onChange={(e) => setStatusFilter(e.target.value)}
+                >
+                  <option value="">All</option>
+                  {STATUS_OPTIONS[tab].map((status) => (
+                    <option key={status} value={status}>{status.replace("_", " ")}</option>
+                  ))}
+                </select>
+              </div>
+            )}
+            {(tab === "enquiries" || tab === "issues") && (
+              <div className="flex flex-col">
+                <label className="text-sm font-semibold mb-1">Category:</label>
+                <select
+                  className="p-2 border rounded w-48"
+                  value={categoryFilter}
+                  onChange={(e) => setCategoryFilter(e.target.value)}
+                >
+                  <option value="">All</option>
+                  {/* Categories seen in the summary window */}
+                  {Object.keys(summary?.messages.by_category || {}).map((category) => (
+                    <option key={category} value={category}>{category.replace(/_/g, " ")}</option>
+                  ))}
+                </select>
+              </div>
+            )}
             <div className="flex gap-2">
               <button
                 onClick={handleFilterSubmit}
@@ -835,11 +818,13 @@ const Dashboard = () => {
           <div className="flex gap-2">
             <Button onClick={() => handleExport("excel")}
               disabled={!hasData}
+              title="The rows on this page"
               className={`px-6 py-2 rounded-full font-semibold shadow-md text-white ${hasData ? 'bg-gradient-to-r from-pink-400 to-orange-400 hover:from-orange-400 hover:to-pink-400' : 'bg-gray-300 cursor-not-allowed'}`}>
               Export to Excel
             </Button>
             <Button onClick={() => handleExport("csv")}
               disabled={!hasData}
+              title="Every row for the selected date, not just this page"
               className={`px-6 py-2 rounded-full font-semibold shadow-md text-white ${hasData ? 'bg-gradient-to-r from-pink-400 to-orange-400 hover:from-orange-400 hover:to-pink-400' : 'bg-gray-300 cursor-not-allowed'}`}>
               Export to CSV
             </Button>
@@ -862,11 +847,8 @@ const Dashboard = () => {
           <div className="overflow-x-auto -mx-4 sm:mx-0">
             <Table
               columns={getCurrentColumns()}
-              dataSource={getCurrentData().map((item, index) => ({ ...item, key: index }))}
-              pagination={{ pageSize: 10 }}
-              onChange={(pagination, filters, sorter, extra) => {
-                setVisibleData(extra.currentDataSource);
-              }}
+              dataSource={currentData}
+              pagination={false}
               scroll={{ x: 'max-content' }}
               size="small"
               className="whitespace-nowrap"
@@ -878,6 +860,16 @@ const Dashboard = () => {
                 ),
               }}
             />
+            {/* One page per request; "Next" follows the cursor the server sent with this page */}
+            <div className="flex justify-end items-center gap-2 mt-4">
+              <Button size="small" onClick={handlePreviousPage} disabled={pageIndex === 0}>
+                Previous
+              </Button>
+              <span className="text-sm text-gray-500">Page {pageIndex + 1}</span>
+              <Button size="small" onClick={handleNextPage} disabled={!nextCursor}>
+                Next
+              </Button>
+            </div>
           </div>
         )}
       </div>
@@ -4,6 +4,43 @@
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000/api';
 
+// Rows per page of the dashboard tables (the backend caps it at PAGE_SIZE_MAX)
+export const PAGE_LIMIT = 50;
+
+/**
+ * Build a query string, leaving out empty values and repeating array values
+ * @param {Object} params - Query parameters
+ * @returns {string} - Encoded query string
+ */
+const toQuery = (params) => {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (Array.isArray(value)) {
+      value.forEach((item) => query.append(key, item));
+    } else if (value !== null && value !== undefined && value !== '') {
+      query.append(key, value);
+    }
+  });
+  return query.toString();
+};
+
+/**
+ * Fetch one page of a list endpoint. Filters are applied by the server; the
+ * cursor for the following page comes back in the X-Next-Cursor header.
+ * @param {string} path - List endpoint path, e.g. '/orders'
+ * @param {Object} params - Query parameters, including cursor and limit
+ * @returns {Promise<{rows: Array, nextCursor: (string|null)}>} - The page and the next page's cursor
+ */
+const fetchPage = async (path, params) => {
+  const response = await fetch(`${API_URL}${path}?${toQuery({ limit: PAGE_LIMIT, ...params })}`);
+  if (!response.ok) {
+    throw new Error(`Error: ${response.status}`);
+  }
+  return { rows: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') };
+};
+
+const EMPTY_PAGE = { rows: [], nextCursor: null };
+
 /**
  * Create a user in the database after Clerk signup
  * @param {Object} userData - User data from Clerk
@@ -31,29 +68,16 @@ export const createUser = async (userData) => {
 };
 
 /**
- * Get error logs for a specific user, optionally filtered by error types
+ * Get the most recent error logs for a specific user, optionally filtered by error types
  * @param {string} userId - The user's clerk ID
  * @param {Array<string>} errorTypes - Optional array of error types to filter by (e.g., ['WhatsApp Error', 'HubSpot Error'])
- * @returns {Promise<Array>} - Promise with the error logs
+ * @returns {Promise<Array>} - Promise with the error logs (one page, newest first)
  */
 export const getUserErrorLogs = async (userId, errorTypes = []) => {
   try {
-    let url = `${API_URL}/error-logs?clerk_id=${userId}`;
-    
-    // Add error types to the query if provided
-    if (errorTypes && errorTypes.length > 0) {
-      errorTypes.forEach(type => {
-        url += `&error_types=${encodeURIComponent(type)}`;
-      });
-    }
-    
-    const response = await fetch(url);
-    
-    if (!response.ok) {
-      throw new Error(`Error: ${response.status}`);
-    }
-    
-    return await response.json();
+    // The most recent page is enough for the banner
+    const page = await fetchPage('/error-logs', { clerk_id: userId, error_types: errorTypes || [] });
+    return page.rows;
   } catch (error) {
     console.error('Error fetching error logs:', error);
     return []; // Return empty array on error to prevent UI crashes
@@ -149,89 +173,83 @@ export const getUserSettings = async (clerkId) => {
 
 
 /**
- * Get orders for the current user
- * @param {string} clerkId - Optional Clerk user ID to filter by
- * @returns {Promise} - Promise with the list of orders
+ * Get one page of orders for the current user, newest first
+ * @param {string} clerkId - Clerk user ID
+ * @param {Object} options - cursor, status, customerId, startDate and endDate (ISO strings)
+ * @returns {Promise<{rows: Array, nextCursor: (string|null)}>} - Promise with the page of orders
  */
-export const getOrders = async (clerkId = null) => {
+export const getOrders = async (clerkId, { cursor, status, customerId, startDate, endDate } = {}) => {
   try {
-    const url = clerkId ? `${API_URL}/orders?clerk_id=${clerkId}` : `${API_URL}/orders`;
-    const response = await fetch(url);
-    if (!response.ok) {
-      throw new Error('Failed to fetch orders');
-    }
-    return await response.json();
+    return await fetchPage('/orders', {
+      clerk_id: clerkId, cursor, status, customer_id: customerId, start_date: startDate, end_date: endDate,
+    });
   } catch (error) {
     console.error('Error fetching orders:', error);
-    return [];
+    return EMPTY_PAGE;
   }
 };
 
-
-
 /**
- * Get customers for the current user
- * @param {string} clerkId - Optional Clerk user ID to filter by
- * @returns {Promise} - Promise with the list of customers
+ * Get one page of customers for the current user, newest first
+ * @param {string} clerkId - Clerk user ID
+ * @param {Object} options - cursor, customerId, startDate and endDate (ISO strings)
+ * @returns {Promise<{rows: Array, nextCursor: (string|null)}>} - Promise with the page of customers
  */
-export const getCustomers = async (clerkId = null) => {
+export const getCustomers = async (clerkId, { cursor, customerId, startDate, endDate } = {}) => {
   try {
-    const url = clerkId ? `${API_URL}/customers?clerk_id=${clerkId}` : `${API_URL}/customers`;
-    const response = await fetch(url);
-    if (!response.ok) {
-      throw new Error(`Error: ${response.status}`);
-    }
-    return await response.json();
+    return await fetchPage('/customers', {
+      clerk_id: clerkId, cursor, customer_id: customerId, start_date: startDate, end_date: endDate,
+    });
   } catch (error) {
     console.error('Error fetching customers:', error);
-    return [];
+    return EMPTY_PAGE;
   }
 };
 
-
-
 /**
- * Get enquiries for the current user
- * @param {string} clerkId - Optional Clerk user ID to filter by
- * @returns {Promise} - Promise with the list of enquiries
+ * Get one page of enquiries for the current user, newest first
+ * @param {string} clerkId - Clerk user ID
+ * @param {Object} options - cursor, status, category, customerId, startDate and endDate (ISO strings)
+ * @returns {Promise<{rows: Array, nextCursor: (string|null)}>} - Promise with the page of enquiries
  */
-export const getEnquiries = async (clerkId = null) => {
+export const getEnquiries = async (clerkId, { cursor, status, category, customerId, startDate, endDate } = {}) => {
   try {
-    const url = clerkId ? `${API_URL}/enquiries?clerk_id=${clerkId}` : `${API_URL}/enquiries`;
-    const response = await fetch(url);
-    if (!response.ok) throw new Error(`Error: ${response.status}`);
-    return await response.json();
+    return await fetchPage('/enquiries', {
+      clerk_id: clerkId, cursor, status, category, customer_id: customerId, start_date: startDate, end_date: endDate,
+    });
   } catch (error) {
     console.error('Error fetching enquiries:', error);
-    return [];
+    return EMPTY_PAGE;
   }
 };
 
-
-
 /**
- * Get all issues from the backend
- * @returns {Promise} - Promise with the list of issues
- */
-/**
- * Get issues for the current user
- * @param {string} clerkId - Optional Clerk user ID to filter by
- * @returns {Promise} - Promise with the list of issues
+ * Get one page of issues for the current user, newest first
+ * @param {string} clerkId - Clerk user ID
+ * @param {Object} options - cursor, status, category (issue type), customerId, startDate and endDate (ISO strings)
+ * @returns {Promise<{rows: Array, nextCursor: (string|null)}>} - Promise with the page of issues
  */
-export const getIssues = async (clerkId) => {
+export const getIssues = async (clerkId, { cursor, status, category, customerId, startDate, endDate } = {}) => {
   try {
-    const url = clerkId ? `${API_URL}/issues?clerk_id=${clerkId}` : `${API_URL}/issues`;
-    const response = await fetch(url);
-    if (!response.ok) {
-      throw new Error(`Error fetching issues: ${response.statusText}`);
-    }
-    return await response.json();
+    return await fetchPage('/issues', {
+      clerk_id: clerkId, cursor, status, category, customer_id: customerId, start_date: startDate, end_date: endDate,
+    });
   } catch (error) {
     console.error('Error fetching issues:', error);
-    return [];
+    return EMPTY_PAGE;
   }
 };
 
+/**
+ * URL that streams a whole table as a file, filtered on created_at by the server
+ * @param {string} table - Export table, e.g. 'orders'
+ * @param {string} clerkId - Clerk user ID
+ * @param {Object} options - format ('csv', 'ndjson' or 'parquet'), startDate and endDate (ISO strings)
+ * @returns {string} - Download URL
+ */
+export const getExportUrl = (table, clerkId, { format = 'csv', startDate, endDate } = {}) =>
+  `${API_URL}/export/${table}?${toQuery({ clerk_id: clerkId, format, start_date: startDate, end_date: endDate })}`;
+
 export const getResponseMetrics = async (clerkId, days = 30) => {
   try {
     const url = clerkId 
@@ -248,6 +266,25 @@ export const getResponseMetrics = async (clerkId, days = 30) => {
   }
 };
 
+/**
+ * Get the dashboard summary (orders, messages, responses) built from the daily rollups
+ * @param {string} clerkId - Clerk user ID
+ * @param {number} days - Number of days to summarize, ending today
+ * @returns {Promise} - Promise with the summary or null on error
+ */
+export const getAnalyticsSummary = async (clerkId, days = 30) => {
+  try {
+    const response = await fetch(`${API_URL}/analytics/summary?clerk_id=${clerkId}&days=${days}`);
+    if (!response.ok) {
+      throw new Error(`Error fetching analytics summary: ${response.statusText}`);
+    }
+    return await response.json();
+  } catch (error) {
+    console.error('Error fetching analytics summary:', error);
+    return null;
+  }
+};
+
 /**
  * Get WhatsApp access token from user settings
  * @param {string} clerkId - Clerk user ID